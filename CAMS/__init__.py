@@ -1 +1 @@
-from .fetch_CAMS_data import get_cams_data 
+from .fetch_CAMS_data import get_cams_data, get_cams_data_async
@@ -1,32 +1,129 @@
-import pandas as pd
-import pvlib
+import asyncio
+import io
+import os
+from urllib.parse import urlencode
+
+import requests
+import httpx
 from datetime import datetime
 
+from lazy_imports import lazy_import
+from metrics import upstream_call
+from timeseries import TimeSeries
+from tracing import span
+
+pd = lazy_import('pandas')
+pvlib = lazy_import('pvlib')
+
+# The host is pvlib.iotools.sodapro.URL, spelled out so that importing this
+# module does not load pvlib
+CAMS_SERVICE_URL = os.getenv('CAMS_SERVICE_URL', "https://api.soda-solardata.com/service/wps")
+CAMS_TIMEOUT = 180
+
+
+@span('cams.reshape')
+def _to_result(raw_df, metadata):
+    """Shape a parsed CAMS DataFrame into the dict returned by the fetch functions"""
+    series = TimeSeries.from_frame(raw_df)
+    return {
+        'series': series,
+        'columns': ['timestamp', *series.names],
+        'metadata': metadata,
+        'error': None
+    }
+
+
 def get_cams_data(latitude, longitude, start_date, end_date, email, time_step):
     """Fetch CAMS radiation data and return processed DataFrame"""
     try:
-        # Get raw data
-        raw_df, metadata = pvlib.iotools.get_cams(
-            latitude=latitude,
-            longitude=longitude,
-            start=start_date,
-            end=end_date,
-            email=email,
-            time_step=time_step,
-            timeout=180,
-            identifier='cams_radiation'
-        )
-        
-     
-        processed_df = raw_df.reset_index().rename(columns={'index': 'timestamp'})
-        processed_df['timestamp'] = processed_df['timestamp'].dt.strftime('%Y-%m-%dT%H:%M:%SZ')
-        
-        return {
-            'data': processed_df.to_dict(orient='records'),
-            'columns': list(processed_df.columns),
-            'metadata': metadata,
-            'error': None
-        }
-        
+        # Same request and parsing as pvlib.iotools.get_cams, but sent to
+        # CAMS_SERVICE_URL so the service can be swapped for a local stand-in
+        url = cams_request_url(latitude, longitude, start_date, end_date, email, time_step)
+        with upstream_call('cams'), span('cams.fetch') as fetch:
+            response = requests.get(url, timeout=CAMS_TIMEOUT)
+            fetch.add_bytes(len(response.content))
+            if not response.ok:
+                # SoDa reports the reason inside an OWS exception document
+                parts = response.text.split('ows:ExceptionText')
+                reason = parts[1][1:-2] if len(parts) > 1 else response.text
+                response.reason = f"{response.reason}: <{reason}>"
+                response.raise_for_status()
+
+        return _parse_result(response.content)
+
+    except Exception as e:
+        return {'series': None, 'columns': None, 'metadata': None, 'error': str(e)}
+
+
+@span('cams.parse')
+def _parse_response(content):
+    """CAMS CSV response body -> (DataFrame, metadata), as pvlib.iotools.get_cams returns them"""
+    return pvlib.iotools.parse_cams(io.StringIO(content.decode('utf-8')), integrated=False,
+                                    label=None, map_variables=True)
+
+
+def _parse_result(content):
+    """CAMS CSV response body -> the dict returned by the fetch functions"""
+    return _to_result(*_parse_response(content))
+
+
+def cams_request_url(latitude, longitude, start_date, end_date, email, time_step):
+    """
+    Build the SoDa WPS request URL for CAMS radiation, formatted exactly as
+    pvlib.iotools.get_cams does.
+    """
+    try:
+        time_step_str = pvlib.iotools.sodapro.TIME_STEPS_MAP[time_step]
+    except KeyError:
+        raise ValueError(f'Time step not recognized. Must be one of '
+                         f'{list(pvlib.iotools.sodapro.TIME_STEPS_MAP.keys())}')
+
+    data_inputs = ";".join(f"{key}={value}" for key, value in {
+        'latitude': latitude,
+        'longitude': longitude,
+        'altitude': -999,  # Let SoDa look up the elevation
+        'date_begin': pd.to_datetime(start_date).strftime('%Y-%m-%d'),
+        'date_end': pd.to_datetime(end_date).strftime('%Y-%m-%d'),
+        'time_ref': 'UT',
+        'summarization': time_step_str,
+        'username': email.replace('@', '%2540'),
+        'verbose': 'false',
+    }.items())
+    params = urlencode({
+        'Service': 'WPS',
+        'Request': 'Execute',
+        'Identifier': 'get_cams_radiation',
+        'version': '1.0.0',
+        'RawDataOutput': 'irradiation',
+    })
+    # DataInputs holds semicolon-separated sub-parameters and must not be re-encoded
+    return f"{CAMS_SERVICE_URL}?DataInputs={data_inputs}&{params}"
+
+
+async def get_cams_data_async(latitude, longitude, start_date, end_date, email, time_step, client=None):
+    """Fetch CAMS radiation data on an async HTTP client; same result as get_cams_data"""
+    try:
+        # Building the URL and parsing the response import and run pvlib, which
+        # would stall every other request on the event loop
+        url = await asyncio.to_thread(cams_request_url, latitude, longitude, start_date, end_date, email, time_step)
+        async with upstream_call('cams'):
+            with span('cams.fetch') as fetch:
+                if client is None:
+                    async with httpx.AsyncClient(timeout=CAMS_TIMEOUT) as own_client:
+                        response = await own_client.get(url)
+                else:
+                    response = await client.get(url, timeout=CAMS_TIMEOUT)
+                fetch.add_bytes(len(response.content))
+
+            if not response.is_success:
+                # SoDa reports the reason inside an OWS exception document
+                parts = response.text.split('ows:ExceptionText')
+                reason = parts[1][1:-2] if len(parts) > 1 else response.text
+                raise httpx.HTTPStatusError(
+                    f"{response.status_code} {response.reason_phrase}: <{reason}>",
+                    request=response.request, response=response)
+
+        return await asyncio.to_thread(_parse_result, response.content)
+
     except Exception as e:
-        return {'data': None, 'columns': None, 'metadata': None, 'error': str(e)}
+        return {'series': None, 'columns': None, 'metadata': None, 'error': str(e)}
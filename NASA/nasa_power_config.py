@@ -1,12 +1,16 @@
+import os
 from datetime import datetime
 from .nasa_products import NASAPowerProducts , TemporalResolution
-from geopy import location as Glocation
 from typing import List, Union
 
+from lazy_imports import lazy_import
+
+Glocation = lazy_import('geopy.location')
+
 
 class NASAPowerConfig:
 
-    BASE_URL = 'https://power.larc.nasa.gov/api/temporal'
+    BASE_URL = os.getenv('NASA_POWER_URL', 'https://power.larc.nasa.gov/api/temporal')
 
     @staticmethod
     def generate_download_link(
@@ -15,7 +19,8 @@ class NASAPowerConfig:
         end_date: datetime,
         location: Glocation,
         products: Union[NASAPowerProducts, List[NASAPowerProducts]],
-        format: str = 'JSON'
+        format: str = 'JSON',
+        time_standard: str = None
     ) -> str:
         start_date_str = start_date.strftime("%Y%m%d")
         end_date_str = end_date.strftime("%Y%m%d")
@@ -25,9 +30,13 @@ class NASAPowerConfig:
         else:
             param_str = ','.join([p.value for p in products])
             
-        return (
+        url = (
             f"{NASAPowerConfig.BASE_URL}/{temporal_resolution.value}/point?"
             f"parameters={param_str}&community=RE&"
             f"longitude={location.longitude}&latitude={location.latitude}&"
             f"start={start_date_str}&end={end_date_str}&format={format}"
         )
+        # Hourly data defaults to local solar time; 'UTC' requests UTC hours
+        if time_standard:
+            url += f"&time-standard={time_standard}"
+        return url
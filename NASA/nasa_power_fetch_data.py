@@ -1,7 +1,25 @@
+import asyncio
+import json
+
 from .nasa_power_config import NASAPowerConfig
 from .nasa_products import NASAPowerProducts
 import requests
+import httpx
 from .nasa_power_result import NASAPowerDataResult, NASAPowerMultiDataResult
+from metrics import upstream_call
+from tracing import span
+
+# Seconds to connect to NASA POWER and to wait for each read; multi-year
+# hourly requests can take minutes to start streaming
+NASA_CONNECT_TIMEOUT = 10.0
+NASA_READ_TIMEOUT = 180.0
+NASA_TIMEOUT = httpx.Timeout(NASA_READ_TIMEOUT, connect=NASA_CONNECT_TIMEOUT)
+
+
+@span('nasa.decode')
+def _decode_parameters(content):
+    """The parameter dict of a NASA POWER JSON response body."""
+    return json.loads(content)['properties']['parameter']
 
 
 class NASAPowerFetchData:
@@ -28,13 +46,33 @@ class NASAPowerFetchData:
         )
 
     def fetch_multiple_parameters(self, temporal_resolution, start_date, end_date, 
-                                location, products):
+                                location, products, time_standard=None):
         """Fetch multiple parameters in one request"""
         url = NASAPowerConfig.generate_download_link(
-            temporal_resolution, start_date, end_date, location, products
+            temporal_resolution, start_date, end_date, location, products,
+            time_standard=time_standard
         )
-        response = requests.get(url)
-        response.raise_for_status()
-        json_data = response.json()
-        all_parameters = json_data['properties']['parameter']
-        return all_parameters
\ No newline at end of file
+        with upstream_call('nasa'), span('nasa.fetch') as fetch:
+            response = requests.get(url, timeout=(NASA_CONNECT_TIMEOUT, NASA_READ_TIMEOUT))
+            response.raise_for_status()
+            fetch.add_bytes(len(response.content))
+        return _decode_parameters(response.content)
+
+    async def fetch_multiple_parameters_async(self, temporal_resolution, start_date, end_date,
+                                location, products, client=None, time_standard=None):
+        """Fetch multiple parameters in one request without blocking the event loop"""
+        url = NASAPowerConfig.generate_download_link(
+            temporal_resolution, start_date, end_date, location, products,
+            time_standard=time_standard
+        )
+        async with upstream_call('nasa'):
+            with span('nasa.fetch') as fetch:
+                if client is None:
+                    async with httpx.AsyncClient(timeout=NASA_TIMEOUT) as own_client:
+                        response = await own_client.get(url)
+                else:
+                    response = await client.get(url)
+                response.raise_for_status()
+                fetch.add_bytes(len(response.content))
+        # A multi-year hourly body takes long enough to decode to stall the event loop
+        return await asyncio.to_thread(_decode_parameters, response.content)
@@ -1,9 +1,12 @@
 from datetime import datetime
-import numpy as np
-from geopy import location as Glocation
 from .nasa_products import NASAPowerProducts
 from typing import List
-import pandas as pd
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+Glocation = lazy_import('geopy.location')
 
 class NASAPowerDataResult:
     def __init__(
@@ -68,7 +71,7 @@ class NASAPowerMultiDataResult:
         sorted_ts = sorted(data.keys())
         return np.array([data[ts] for ts in sorted_ts])
 
-    def to_dataframe(self) -> pd.DataFrame:
+    def to_dataframe(self) -> 'pd.DataFrame':
         """
         Return all requested parameters as a DataFrame indexed by timestamp.
         
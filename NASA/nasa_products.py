@@ -5,7 +5,7 @@ class NASAPowerProducts(Enum):
 
     GHI = 'ALLSKY_SFC_SW_DWN' #Global Horizontal Irradiance
     DHI = 'ALLSKY_SFC_SW_DIFF' #Direct Horizontal Irradiance
-    GTI = '' #Global Tilted Irradiance
+    GTI = '' #Global Tilted Irradiance (not a POWER parameter; transposed in gti.py)
     DNI = 'ALLSKY_SFC_SW_DNI' #Direct Normal Irradiance
     LONGWAVE_DOWNARD_IRR = 'CLRSKY_SFC_LW_DWN'
 
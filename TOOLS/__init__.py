@@ -1 +1 @@
-from .tools import meanGHI
+from .tools import meanGHI, grid_cell, cell_centre
@@ -0,0 +1,224 @@
+"""
+Single-pass, mergeable statistics of a time series per day, month or year.
+
+PeriodStats consumes a series in chunks of (timestamps, values) arrays and
+keeps, for every period seen, the count, sum, mean, sum of squared
+deviations (for the standard deviation), min and max, and optionally a
+fixed-bin histogram from which percentiles are estimated. Only these
+per-period summaries are held, never the values, so a multi-decade hourly
+series aggregates in bounded memory; and PeriodStats built from different
+parts of a series, e.g. by parallel workers, merge into the statistics of
+the whole.
+
+Within a chunk the statistics are computed exactly, in two passes over the
+chunk; chunks are combined with the pairwise update of Chan et al., the
+chunked form of Welford's algorithm, so no step subtracts large sums.
+"""
+import numpy as np
+
+# Period of each frequency, as the numpy datetime unit timestamps are floored to
+FREQS = {'h': 'datetime64[h]', 'D': 'datetime64[D]', 'M': 'datetime64[M]', 'Y': 'datetime64[Y]'}
+# pandas resample aliases that label periods by their start, like FREQS
+RESAMPLE_FREQS = {'h': 'h', 'H': 'h', 'D': 'D', 'MS': 'M', 'YS': 'Y', 'AS': 'Y'}
+
+
+def resample_freq(rule):
+    """
+    The FREQS key for a pandas resample rule labelled by period start, or None
+    for rules whose periods PeriodStats does not produce, such as 'W', the
+    end-labelled 'ME' and 'YE', or multiples like '6h'.
+    """
+    return RESAMPLE_FREQS.get(rule)
+
+
+def period_mean_std(timestamps, values, rule='D'):
+    """
+    (period labels as datetime64[ns], mean, std) of a series for every period
+    of the pandas resample `rule` from the first to the last. Rules with a
+    FREQS key are aggregated by PeriodStats; any other rule pandas accepts is
+    resampled by pandas, with pandas' labels. NaN values are skipped.
+    """
+    freq = resample_freq(rule)
+    if freq is not None:
+        columns = PeriodStats(freq).update(timestamps, values).result()
+        # Like pandas, span every timestamp, including those with NaN values
+        periods = np.asarray(timestamps).astype(FREQS[freq])
+        every = np.arange(periods.min(), periods.max() + 1) if len(periods) else periods
+        index = np.searchsorted(every, columns['period'])
+        mean, std = np.full(len(every), np.nan), np.full(len(every), np.nan)
+        mean[index], std[index] = columns['mean'], columns['std']
+        return every.astype('datetime64[ns]'), mean, std
+
+    import pandas as pd
+    series = pd.Series(np.asarray(values, dtype=float), index=pd.DatetimeIndex(np.asarray(timestamps)))
+    stats = series.resample(rule).agg(['mean', 'std'])
+    return stats.index.to_numpy(), stats['mean'].to_numpy(), stats['std'].to_numpy()
+
+
+class PeriodStats:
+    """
+    Per-period count, sum, mean, std, min, max and, when `percentiles` is
+    given (e.g. (5, 50, 95)), percentile estimates from a histogram of
+    `bins` equal bins over `value_range`; values outside the range count in
+    the edge bins. Timestamps are naive (wall-clock) datetimes, in any form
+    numpy converts to datetime64. NaN values are skipped.
+    """
+
+    def __init__(self, freq='D', percentiles=None, value_range=(0.0, 1500.0), bins=300):
+        if freq not in FREQS:
+            raise ValueError(f"Unsupported frequency: {freq!r}; use one of {sorted(FREQS)}")
+        self.freq = freq
+        self.percentiles = tuple(percentiles or ())
+        self.edges = np.linspace(value_range[0], value_range[1], bins + 1) if self.percentiles else None
+        self._set(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in range(6)),
+                  np.empty((0, bins), dtype=np.int64) if self.percentiles else None)
+
+    def _set(self, periods, count, total, mean, m2, low, high, hist=None):
+        self.periods = periods  # period starts, as integer datetime64 units of FREQS[freq]
+        self.count = count
+        self.sum = total
+        self.mean = mean
+        self.m2 = m2  # sum of squared deviations from the mean
+        self.min = low
+        self.max = high
+        self.hist = hist
+
+    def _arrays(self):
+        arrays = (self.periods, self.count, self.sum, self.mean, self.m2, self.min, self.max)
+        return arrays + ((self.hist,) if self.hist is not None else ())
+
+    def _empty_like(self):
+        partial = PeriodStats.__new__(PeriodStats)
+        partial.freq, partial.percentiles, partial.edges = self.freq, self.percentiles, self.edges
+        return partial
+
+    def __len__(self):
+        return len(self.periods)
+
+    def update(self, timestamps, values):
+        """Add a chunk of the series. Returns self, so calls chain."""
+        return self.merge(self._summarize(timestamps, values))
+
+    def _summarize(self, timestamps, values):
+        """PeriodStats of one chunk, computed exactly."""
+        codes = np.asarray(timestamps).astype(FREQS[self.freq]).astype(np.int64)
+        values = np.asarray(values, dtype=float)
+        present = ~np.isnan(values)
+        codes, values = codes[present], values[present]
+        partial = self._empty_like()
+        if not len(values):
+            partial._set(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in range(6)), None)
+            return partial
+        if np.any(codes[1:] < codes[:-1]):
+            order = np.argsort(codes, kind='stable')
+            codes, values = codes[order], values[order]
+        starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+        count = np.diff(np.r_[starts, len(values)])
+        total = np.add.reduceat(values, starts)
+        mean = total / count
+        deviations = values - np.repeat(mean, count)
+        hist = None
+        if self.percentiles:
+            bins = len(self.edges) - 1
+            index = np.clip(np.searchsorted(self.edges, values, side='right') - 1, 0, bins - 1)
+            flat = np.repeat(np.arange(len(starts)), count) * bins + index
+            hist = np.bincount(flat, minlength=len(starts) * bins).reshape(len(starts), bins)
+        partial._set(codes[starts], count.astype(float), total, mean,
+                     np.add.reduceat(deviations * deviations, starts),
+                     np.minimum.reduceat(values, starts), np.maximum.reduceat(values, starts), hist)
+        return partial
+
+    def merge(self, other):
+        """Fold another PeriodStats of the same frequency into this one. Returns self."""
+        if other.freq != self.freq or other.percentiles != self.percentiles:
+            raise ValueError("Cannot merge PeriodStats with different frequencies or percentiles")
+        if not len(other):
+            return self
+        if not len(self):
+            self._set(other.periods, other.count, other.sum, other.mean, other.m2, other.min, other.max,
+                      other.hist)
+            return self
+        if other.periods[0] > self.periods[-1]:
+            # Chunks of a series in time order share no periods: append
+            self._set(*(np.concatenate(pair) for pair in zip(self._arrays(), other._arrays())))
+            return self
+
+        periods = np.union1d(self.periods, other.periods)
+        mine, theirs = np.searchsorted(periods, self.periods), np.searchsorted(periods, other.periods)
+
+        def spread(index, values, fill=0.0):
+            out = np.full(len(periods), fill)
+            out[index] = values
+            return out
+
+        count_a, count_b = spread(mine, self.count), spread(theirs, other.count)
+        mean_a, mean_b = spread(mine, self.mean), spread(theirs, other.mean)
+        count = count_a + count_b
+        delta = mean_b - mean_a
+        hist = None
+        if self.hist is not None:
+            hist = np.zeros((len(periods), self.hist.shape[1]), dtype=np.int64)
+            hist[mine] += self.hist
+            hist[theirs] += other.hist
+        self._set(
+            periods, count,
+            spread(mine, self.sum) + spread(theirs, other.sum),
+            mean_a + delta * count_b / count,
+            spread(mine, self.m2) + spread(theirs, other.m2) + delta * delta * count_a * count_b / count,
+            np.minimum(spread(mine, self.min, np.inf), spread(theirs, other.min, np.inf)),
+            np.maximum(spread(mine, self.max, -np.inf), spread(theirs, other.max, -np.inf)),
+            hist,
+        )
+        return self
+
+    def std(self, ddof=1):
+        """Standard deviation per period; NaN where a period has ddof values or fewer."""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.count > ddof, np.sqrt(self.m2 / (self.count - ddof)), np.nan)
+
+    def percentile(self, q):
+        """Estimate of the q-th percentile per period, interpolated within histogram bins."""
+        if self.hist is None:
+            raise ValueError("PeriodStats was created without percentiles")
+        cumulative = np.cumsum(self.hist, axis=1)
+        target = q / 100 * self.count
+        index = np.minimum((cumulative < target[:, None]).sum(axis=1), self.hist.shape[1] - 1)
+        rows = np.arange(len(self))
+        before = np.where(index > 0, cumulative[rows, np.maximum(index - 1, 0)], 0)
+        in_bin = self.hist[rows, index]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            fraction = np.where(in_bin > 0, (target - before) / in_bin, 0.0)
+        width = self.edges[1] - self.edges[0]
+        estimate = self.edges[index] + np.clip(fraction, 0, 1) * width
+        return np.clip(estimate, self.min, self.max)
+
+    def result(self, fill=False):
+        """
+        {'period', 'count', 'sum', 'mean', 'std', 'min', 'max', 'p<q>'...} as
+        arrays, 'period' holding datetime64 period starts. With fill=True,
+        periods between the first and last one that had no values are
+        included, with a count of 0 and NaN statistics.
+        """
+        columns = {'count': self.count, 'sum': self.sum, 'mean': self.mean, 'std': self.std(),
+                   'min': self.min, 'max': self.max}
+        for q in self.percentiles:
+            columns[f'p{q:g}'] = self.percentile(q)
+        periods = self.periods
+        if fill and len(periods):
+            every = np.arange(periods[0], periods[-1] + 1)
+            index = np.searchsorted(every, periods)
+            for name, values in columns.items():
+                full = np.full(len(every), 0.0 if name in ('count', 'sum') else np.nan)
+                full[index] = values
+                columns[name] = full
+            periods = every
+        columns['count'] = columns['count'].astype(np.int64)
+        return {'period': periods.astype(FREQS[self.freq]), **columns}
+
+    def records(self, fill=False):
+        """result() as a list of dicts, with each period start as a datetime.datetime under 'datetime'."""
+        columns = self.result(fill)
+        starts = columns.pop('period').astype('datetime64[s]').tolist()
+        names = list(columns)
+        rows = zip(starts, *(columns[name].tolist() for name in names))
+        return [dict(zip(['datetime'] + names, row)) for row in rows]
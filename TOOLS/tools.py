@@ -1,17 +1,42 @@
 import numpy as np
-import pandas as pd 
+import pandas as pd
+
+from .aggregate import period_mean_std
+
 
 def meanGHI(df, resample='D'):
     """
     Calculate the mean Global Horizontal Irradiance (GHI) from a DataFrame.
-    """
-    df['datetime'] = pd.to_datetime(df['datetime'])
-    df.set_index('datetime', inplace=True)
-
-    # Resample by calendar day: compute mean and std of the 24 hourly values
-    daily_stats = df['Irradiance'].resample(resample).agg(['mean', 'std']).reset_index()
 
-    # compute upper & lower for quick inspection
+    Returns a DataFrame of datetime, mean, std, upper (mean + std) and lower
+    (mean - std) per `resample` period; `df` is not modified.
+    """
+    periods, mean, std = period_mean_std(pd.to_datetime(df['datetime']).to_numpy(), df['Irradiance'].to_numpy(),
+                                         resample)
+    daily_stats = pd.DataFrame({'datetime': periods, 'mean': mean, 'std': std})
     daily_stats['upper'] = daily_stats['mean'] + daily_stats['std']
-    daily_stats['lower'] = daily_stats['mean'] - daily_stats['std'] 
+    daily_stats['lower'] = daily_stats['mean'] - daily_stats['std']
     return daily_stats
+
+
+def grid_cell(latitude, longitude, lat_step, lon_step):
+    """
+    Snap a point to the index of the nearest cell centre on a regular grid.
+
+    Two points in the same cell receive identical values from gridded sources
+    such as NASA POWER, so the returned (row, col) pair can be used to
+    dedupe upstream requests.
+    """
+    return (int(round(float(latitude) / lat_step)),
+            int(round(float(longitude) / lon_step)))
+
+
+def cell_centre(cell, lat_step, lon_step):
+    """
+    (latitude, longitude) of the centre of a `grid_cell` index, clamped to
+    the valid range. Fetching a cell at its centre makes the values a cell
+    is served independent of which of its sites asked first.
+    """
+    row, col = cell
+    return (round(max(-90.0, min(90.0, row * lat_step)), 6),
+            round(max(-180.0, min(180.0, col * lon_step)), 6))
@@ -1,23 +1,235 @@
-from flask import Flask, render_template, request, jsonify, send_file
-from datetime import datetime, timezone
-import pandas as pd
-import numpy as np
+from flask import Flask, Response, abort, g, render_template, request, jsonify, send_file, send_from_directory, url_for
+from datetime import datetime
 import csv
 import io
 import json
-from model import SolarIrradianceCalculator
+import logging
+import mimetypes
+import time
 import traceback
-from geopy import Point
 
 
-from NASA import NASAPowerFetchData, NASAPowerProducts, TemporalResolution
-from CAMS import get_cams_data
-from rf_model import GHIPredictor
+from services import (
+    ServiceError, error_body, nasa_payload, compare_payload, gti_payload, gti_optimum_payload,
+    cached_body, cached_result,
+    cache_control, etag_matches, CACHE_CONTROL_ERROR, CACHE_CONTROL_REVALIDATE,
+    climatology_info, climatology_point_payload, tile_result, tile_cache_control,
+)
+from cache import body_etag, get_result_cache
+from compression import choose_encoding, compress, should_compress
+from jobs import get_job_queue
+from bulk import BulkRun, read_sites, sites_from_rows, submit_bulk
+from metrics import observe_request, render as render_metrics
+from tracing import end_trace, span, start_trace
+import assets
+import profiling
 import os
 
+# Diagnostics below this level (e.g. the predictor's DEBUG messages) are skipped
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'WARNING'),
+                    format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
 app = Flask(__name__)
 
 
+def route_label():
+    # The URL rule rather than the path, so job IDs do not create new series
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if request.endpoint not in ('static', 'built_asset', 'metrics'):
+        g.trace, g.trace_token = start_trace(route_label(), request.method)
+
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        observe_request(route_label(), request.method, response.status_code,
+                        time.perf_counter() - started, response.content_length)
+    trace = g.pop('trace', None)
+    if trace is not None:
+        response.headers['Server-Timing'] = trace.server_timing()
+        trace.log(response.status_code, response.content_length)
+    return response
+
+
+@app.teardown_request
+def stop_trace(exc):
+    token = g.pop('trace_token', None)
+    if token is not None:
+        end_trace(token)
+
+
+@app.before_request
+def start_request_profile():
+    mode = request.args.get('profile')
+    if mode is None or request.endpoint == 'static':
+        return None
+    if not profiling.enabled():
+        return None
+    profiler, reason = profiling.start_profile(mode, request.headers.get('X-Profile-Token'), route_label())
+    if reason == "not authorized":
+        return jsonify({"error": "Profiling requires a valid X-Profile-Token"}), 403
+    g.profiler, g.profile_skipped = profiler, reason
+    return None
+
+
+@app.after_request
+def finish_request_profile(response):
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        name = profiling.finish_profile(profiler)
+        response.headers['X-Profile'] = url_for('download_profile', name=name)
+    elif g.get('profile_skipped'):
+        response.headers['X-Profile'] = f"skipped: {g.profile_skipped}"
+    return response
+
+
+@app.teardown_request
+def abandon_request_profile(exc):
+    # after_request does not run if the response could not be built
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiling.finish_profile(profiler)
+
+
+@app.after_request
+def add_cache_headers(response):
+    """
+    Give every /api response an ETag and Cache-Control, compress it when the
+    client accepts that, and answer a GET whose If-None-Match matches with
+    304 Not Modified.
+    """
+    if not request.path.startswith('/api/'):
+        return response
+    if response.status_code != 200:
+        response.headers.setdefault('Cache-Control', CACHE_CONTROL_ERROR)
+        return response
+    response.headers.setdefault('Cache-Control', CACHE_CONTROL_REVALIDATE)
+    if response.direct_passthrough or response.is_streamed:
+        return response
+    response.vary.add('Accept-Encoding')
+    if 'ETag' not in response.headers:
+        # Not from the result cache, which stores bodies compressed and tagged
+        body = response.get_data()
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is not None and should_compress(body):
+            body = compress(body, encoding)
+            response.set_data(body)
+            response.headers['Content-Encoding'] = encoding
+        response.headers['ETag'] = body_etag(body)
+    if request.method in ('GET', 'HEAD') and etag_matches(request.headers.get('If-None-Match'),
+                                                          response.headers['ETag']):
+        response.status_code = 304
+        # Werkzeug also drops Content-Length and Content-Type from a 304
+        response.set_data(b'')
+    return response
+
+
+def require_profile_token():
+    """Error response unless the request carries the profiling token."""
+    if not profiling.enabled():
+        return jsonify({"error": "Not found"}), 404
+    if not profiling.authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({"error": "Profiling requires a valid X-Profile-Token"}), 403
+    return None
+
+
+@app.route('/admin/profiles')
+def list_profiles():
+    """Stored request profiles, newest first."""
+    denied = require_profile_token()
+    if denied:
+        return denied
+    profiles = profiling.list_profiles()
+    for profile in profiles:
+        profile['url'] = url_for('download_profile', name=profile['name'])
+    return jsonify(profiles)
+
+
+@app.route('/admin/profiles/<name>')
+def download_profile(name):
+    """Download one profile (.prof for pstats, .txt for collapsed stacks)."""
+    denied = require_profile_token()
+    if denied:
+        return denied
+    path = profiling.profile_path(name)
+    if path is None:
+        return jsonify({"error": "Profile not found"}), 404
+    return send_file(os.path.abspath(path), as_attachment=True, download_name=name)
+
+
+def json_response(payload):
+    """jsonify, timed as the request's serialization stage."""
+    with span('serialize') as serialize:
+        response = jsonify(payload)
+        serialize.add_bytes(response.content_length)
+    return response
+
+
+def request_params():
+    """Parameters of a data request: the JSON body of a POST, the query string of a GET."""
+    if request.method == 'POST':
+        return request.get_json()
+    return request.args.to_dict()
+
+
+def cached_json_response(source, request_data, compute=None):
+    """
+    The JSON response for a request, from the result cache when present and
+    already compressed in the encoding the client prefers. A cache hit
+    carries the stored ETag, so a matching conditional GET is answered with
+    304 without computing anything.
+    """
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    result = cached_result(source, request_data, compute, encoding)
+    response = app.response_class(result.body, mimetype='application/json')
+    response.headers['ETag'] = result.etag
+    response.headers['Cache-Control'] = cache_control(source, request_data)
+    if result.encoding is not None:
+        response.headers['Content-Encoding'] = result.encoding
+    return response
+
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file: its fingerprinted build when one exists, /static/ otherwise."""
+    built = assets.manifest().get(filename)
+    if built is None:
+        return url_for('static', filename=filename)
+    return url_for('built_asset', filename=built)
+
+
+@app.route('/assets/<path:filename>')
+def built_asset(filename):
+    """A fingerprinted asset, precompressed in the encoding the client accepts."""
+    if not assets.is_built(filename):
+        abort(404)
+    directory = os.path.abspath(assets.ASSETS_DIR)
+    available = [encoding for encoding, suffix in assets.PRECOMPRESSED.items()
+                 if os.path.exists(os.path.join(directory, filename + suffix))]
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'), available)
+    path = filename if encoding is None else filename + assets.PRECOMPRESSED[encoding]
+    response = send_from_directory(directory, path, mimetype=mimetypes.guess_type(filename)[0])
+    if encoding is not None:
+        response.headers['Content-Encoding'] = encoding
+    if available:
+        response.vary.add('Accept-Encoding')
+    response.headers['Cache-Control'] = assets.IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics aggregated over every worker process."""
+    body, content_type = render_metrics()
+    return Response(body, content_type=content_type)
+
+
 @app.route('/')
 def home():
     return render_template('home.html', datetime=datetime)
@@ -38,360 +250,122 @@ def help():
     return render_template('help.html')
 
 
-@app.route('/api/model', methods=['POST'])
+@app.route('/api/model', methods=['GET', 'POST'])
 def fetch_model_data():
     """Fetch solar irradiance data from the custom model."""
-    data = request.get_json()
-    if not data:
-        return jsonify({"error": "Invalid JSON payload"}), 400
-
-    mode = data.get('mode')
-    latitude = data.get('latitude')
-    longitude = data.get('longitude')
+    try:
+        return cached_json_response('model', request_params())
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
 
-    if latitude is None or longitude is None:
-        return jsonify({"error": "Missing latitude or longitude"}), 400
 
-    try:
-        latitude = float(latitude)
-        longitude = float(longitude)
-        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
-            raise ValueError("Invalid coordinate range")
-    except ValueError as e:
-        return jsonify({"error": f"Invalid latitude/longitude: {e}"}), 400
-
-    if mode == 'year':
-        start_year_str = data.get('startyear')
-        end_year_str = data.get('endyear')
-
-        if not start_year_str or not end_year_str:
-            return jsonify({"error": "Missing startyear or endyear for 'year' mode"}), 400
-        try:
-            start_year = int(start_year_str)
-            end_year = int(end_year_str)
-            # Add reasonable year validation if needed, e.g.,
-            # if not (1900 < start_year < 2100 and 1900 < end_year < 2100 and start_year <= end_year):
-            #     raise ValueError("Invalid year range")
-        except ValueError:
-            return jsonify({"error": "Invalid year format"}), 400
-
-        start_date_str = f"{start_year}-01-01"
-        end_date_str = f"{end_year}-12-31"
-
-        try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-        except ValueError:
-            return jsonify({"error": "Internal error generating dates from years"}), 500
-
-        # start_date might not be used by constructor
-        model = SolarIrradianceCalculator(latitude, longitude, start_date)
-        hourly_series = model.generate_hourly_series(
-            start_date, end_date)  # Pass actual start_date
-
-        # Assuming meanGHI returns a list of dicts with 'datetime', 'mean', 'upper', 'lower'
-        # And 'datetime' is already a string or datetime object that avgChart can handle (e.g., month name)
-        # Or 'M' if that's what frontend expects for year mode labels
-        raw_stats = model.meanGHI(pd.DataFrame(hourly_series), resample='D')
-
-        stats_list = pd.DataFrame(raw_stats).replace(
-            {np.nan: None}).to_dict(orient='records')
-
-        return jsonify({
-            "latitude":   latitude,
-            "longitude":  longitude,
-            "start_date": start_date_str,  # For consistency, though start/end year were inputs
-            "end_date":   end_date_str,
-            "num_points": len(stats_list),
-            # Expected by avgChart: [{datetime (label), mean, upper, lower}, ...]
-            "data":       stats_list,
-        })
-
-    elif mode == 'date':
-        start_date_str = data.get('startDate')
-        end_date_str = data.get('endDate')
-        time_granularity = data.get('timeGranularity', 'Daily')
-
-        if not start_date_str or not end_date_str:
-            return jsonify({"error": "Invalid or missing start/end date for 'date' mode"}), 400
-
-        try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-            if end_date < start_date:
-                return jsonify({"error": "End date cannot be before start date"}), 400
-        except ValueError:
-            return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
-
-        # start_date might not be used by constructor
-        model = SolarIrradianceCalculator(latitude, longitude, start_date)
-        hourly_series = model.generate_hourly_series(start_date, end_date)
-
-        results = []
-        if time_granularity == 'Hourly':
-            series_to_process = hourly_series  # Already hourly
-            for h in series_to_process:
-                results.append({
-                    "datetime": h['datetime'].isoformat() if isinstance(h['datetime'], datetime) else h['datetime'],
-                    "GHI": h.get('irradiance'),  # Use .get for safety
-                    "DHI": None,
-                    "DNI": None
-                })
-        elif time_granularity == 'Daily':
-            daily_series = model.resample_daily(hourly_series)
-            for d in daily_series:
-                results.append({
-                    "datetime": d['datetime'].isoformat() if isinstance(d['datetime'], datetime) else d['datetime'],
-                    "GHI": d.get('irradiance'),
-                    "DHI": None,
-                    "DNI": None
-                })
-        elif time_granularity == 'Monthly':
-            monthly_series = model.resample_monthly(hourly_series)
-            for m in monthly_series:
-                # Construct a datetime object for the first day of the month
-                month_dt = datetime(int(m['year']), int(
-                    m['month']), 1, tzinfo=timezone.utc)
-                results.append({
-                    "datetime": month_dt.isoformat(),
-                    "GHI": m.get('irradiance'),
-                    "DHI": None,
-                    "DNI": None
-                })
-        else:
-            return jsonify({"error": "Invalid timeGranularity for 'date' mode"}), 400
-
-        return jsonify({
-            "latitude": latitude,
-            "longitude": longitude,
-            "start_date": start_date_str,
-            "end_date": end_date_str,
-            "time_granularity": time_granularity,
-            "num_points": len(results),
-            # Standardized data: [{"datetime":..., "GHI":..., "DHI":null, "DNI":null}, ...]
-            "data": results,
-        })
-    else:
-        return jsonify({"error": "Invalid mode selected"}), 400
-
-
-@app.route('/api/cams', methods=['POST'])
+@app.route('/api/cams', methods=['GET', 'POST'])
 def handle_cams_request():
     """Handles requests to the CAMS data API."""
     try:
-        request_data = request.get_json()
-        if not request_data:
-            return jsonify({"error": "Invalid JSON payload"}), 400
-
-        required_fields = ['latitude', 'longitude',
-                           'startDate', 'endDate', 'mode']
-        for field in required_fields:
-            if field not in request_data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-
-        # CAMS typically provides time series, so 'mode' should usually be 'date'
-        if request_data['mode'] != 'date':
-            return jsonify({"error": "CAMS API currently only supports 'date' mode for time series."}), 400
-
-        params = {
-            'latitude': float(request_data['latitude']),
-            'longitude': float(request_data['longitude']),
-            'start_date': request_data['startDate'],
-            'end_date': request_data['endDate'],
-            'time_step': request_data.get('timeGranularity', 'Hourly'),
-            'email': os.getenv('CAMS_EMAIL', 'default@example.com')
-        }
-
-        # Map frontend timeGranularity to CAMS expected time_step if necessary
-        cams_time_step_map = {
-            "Hourly": "1h",
-            "Daily": "1d",
-            "Monthly": "1M"
-        }
-        params['time_step'] = cams_time_step_map.get(
-            request_data.get('timeGranularity', 'Hourly'), '1h')
-
-        if not (-90 <= params['latitude'] <= 90) or not (-180 <= params['longitude'] <= 180):
-            return jsonify({"error": "Invalid coordinates"}), 400
-
-        # Validate dates
-        datetime.strptime(params['start_date'], "%Y-%m-%d")
-        datetime.strptime(params['end_date'], "%Y-%m-%d")
-
-        # Get data from CAMS service
-        # Assuming get_cams_data returns a dict like:
-        # {'error': None, 'data': [{'timestamp': '...', 'ghi': ..., 'dhi': ..., 'dni': ...}, ...], 'metadata': ...}
-        cams_result = get_cams_data(**params)
-
-        if cams_result.get('error'):
-            return jsonify({"error": f"CAMS API Error: {cams_result['error']}"}), 500
-
-        if not cams_result.get('data') or not isinstance(cams_result['data'], list):
-            return jsonify({"error": "CAMS API returned no data or invalid data format"}), 500
-
-        # Standardize the output for the frontend
-        formatted_data = []
-        for item in cams_result['data']:
-            formatted_data.append({
-                # Assuming CAMS 'timestamp' is ISO string
-                "datetime": item.get('timestamp'),
-                "GHI": item.get('ghi'),
-                "DHI": item.get('dhi'),
-                "DNI": item.get('dni')
-            })
-
-        return jsonify({
-            "latitude": params['latitude'],
-            "longitude": params['longitude'],
-            "start_date": params['start_date'],
-            "end_date": params['end_date'],
-            "time_granularity": request_data.get('timeGranularity', 'Hourly'),
-            "num_points": len(formatted_data),
-            "data": formatted_data,  # Standardized data
-            # Optional: pass along CAMS specific metadata
-            "metadata_cams": cams_result.get('metadata')
-        })
-
-    except ValueError as e:
-        return jsonify({"error": f"Invalid parameter format: {str(e)}"}), 400
+        return cached_json_response('cams', request_params())
     except Exception as e:
-        app.logger.error(f"CAMS API request error: {
-                         str(e)}\n{traceback.format_exc()}")
-        return jsonify({"error": f"Server error processing CAMS request: {str(e)}"}), 500
+        body, status = error_body(e, 'CAMS')
+        if status >= 500 and not isinstance(e, ServiceError):
+            app.logger.error(f"CAMS API request error: {
+                             str(e)}\n{traceback.format_exc()}")
+        return jsonify(body), status
 
 
-@app.route('/api/nasa', methods=['POST'])
+@app.route('/api/nasa', methods=['GET', 'POST'])
 def handle_nasa_request():
     """
     Handles requests to the NASA POWER API.
     """
     try:
-        request_data = request.get_json()
-        if not request_data:
-            return jsonify({"error": "Invalid JSON payload"}), 400
-
-        required_fields = ['latitude', 'longitude',
-                           'startDate', 'endDate', 'mode']
-        for field in required_fields:
-            if field not in request_data:
-                return jsonify({"error": f"Missing required field: {field}"}), 400
-
-        # NASA POWER API typically provides time series, so 'mode' should usually be 'date'
-        if request_data['mode'] != 'date':
-            return jsonify({"error": "NASA API currently only supports 'date' mode for time series."}), 400
-
-        start_date_str = request_data['startDate']
-        end_date_str = request_data['endDate']
-
-        try:
-            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
-            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
-            if end_date < start_date:
-                return jsonify({"error": "End date cannot be before start date"}), 400
-        except ValueError:
-            return jsonify({"error": "Dates must be in YYYY-MM-DD format"}), 400
-
-        location = Point(
-            latitude=float(request_data['latitude']),
-            longitude=float(request_data['longitude'])
-        )
-        if not (-90 <= location.latitude <= 90 and -180 <= location.longitude <= 180):
-            return jsonify({"error": "Invalid coordinates"}), 400
-
-        # Determine temporal resolution for NASA API from frontend's timeGranularity
-        nasa_temporal_resolution_map = {
-            "Hourly": TemporalResolution.HOURLY,
-            "Daily": TemporalResolution.DAILY,
-            "Monthly": TemporalResolution.MONTHLY
-        }
-        time_granularity_frontend = request_data.get(
-            'timeGranularity', 'Hourly')
-        nasa_temporal_res = nasa_temporal_resolution_map.get(
-            time_granularity_frontend)
-
-        if not nasa_temporal_res:
-            return jsonify({"error": f"Unsupported timeGranularity for NASA: {time_granularity_frontend}"}), 400
-
-        nasa_data_fetcher = NASAPowerFetchData()
-
-        # Fetch GHI, DHI, DNI. NASAPowerProducts should map to API parameter names.
-        nasa_api_result = nasa_data_fetcher.fetch_multiple_parameters(
-            temporal_resolution=nasa_temporal_res,
-            start_date=start_date,  # Pass datetime objects
-            end_date=end_date,     # Pass datetime objects
-            location=location,
-            products=[
-                NASAPowerProducts.GHI,
-                NASAPowerProducts.DHI,
-                NASAPowerProducts.DNI
-            ]
-        )
+        return cached_json_response('nasa', request_params(),
+                                    compute=lambda data: nasa_payload(data, logger=app.logger))
+    except Exception as e:
+        body, status = error_body(e, 'NASA')
+        if status >= 500 and not isinstance(e, ServiceError):
+            app.logger.error(f"NASA API request {type(e).__name__}: {
+                             str(e)}\n{traceback.format_exc()}")
+        return jsonify(body), status
 
-        # Create a DataFrame from the Series dictionary
-        df = pd.DataFrame(nasa_api_result)
-
-        # Rename columns to GHI, DHI, DNI based on NASAPowerProducts mapping if necessary
-        column_mapping = {
-            NASAPowerProducts.GHI.value if hasattr(NASAPowerProducts.GHI, 'value') else 'ALLSKY_SFC_SW_DWN': 'GHI',
-            NASAPowerProducts.DHI.value if hasattr(NASAPowerProducts.DHI, 'value') else 'ALLSKY_SFC_SW_DIFF': 'DHI',
-            NASAPowerProducts.DNI.value if hasattr(NASAPowerProducts.DNI, 'value') else 'ALLSKY_SFC_SW_DNI': 'DNI',
-        }
-        df.rename(columns=column_mapping, inplace=True)
-
-        # Handle missing data (NASA uses -999)
-        # Replace with None (becomes null in JSON)
-        df.replace({-999.0: None, -999: None}, inplace=True)
-
-        # Reset index to make datetime a column
-        df.index.name = 'datetime_pd'  # Name the index before resetting
-        df.reset_index(inplace=True)
-
-        try:
-            df['datetime_pd'] = pd.to_datetime(
-                df['datetime_pd'])  # Attempt automatic parsing
-        except Exception as e:
-            app.logger.error(
-                f"Error converting NASA datetime strings to Timestamp objects: {e}")
-
-        # Convert pandas Timestamp to ISO 8601 string
-        # Now that df['datetime_pd'] should contain Timestamp objects, this should work.
-        df['datetime'] = df['datetime_pd'].apply(lambda x: pd.to_datetime(
-            x,  format='%Y%m%d%H').isoformat() if pd.notnull(x) else None)
-
-        # Select only the required columns for the final output
-        output_columns = ['datetime', 'GHI', 'DHI', 'DNI']
-        # Filter out columns not present in the DataFrame (e.g., if DNI wasn't fetched or available)
-        final_columns = [col for col in output_columns if col in df.columns]
-
-        # Ensure GHI, DHI, DNI columns exist, if not, add them with None
-        for col in ['GHI', 'DHI', 'DNI']:
-            if col not in df.columns:
-                df[col] = None
-                if col not in final_columns:
-                    final_columns.append(col)
-
-        formatted_data = df[final_columns].to_dict(orient='records')
-
-        return jsonify({
-            "latitude":   location.latitude,
-            "longitude":  location.longitude,
-            "time_granularity": time_granularity_frontend,
-            "start_date": start_date_str,
-            "end_date":   end_date_str,
-            "num_points": len(formatted_data),
-            "data":       formatted_data,
-        })
-
-    except ValueError as e:
-        return jsonify({"error": f"Invalid parameter format: {str(e)}"}), 400
-    except AttributeError as e_attr:  # Catch attribute errors specifically if needed
-        app.logger.error(f"NASA API request AttributeError: {
-                         str(e_attr)}\n{traceback.format_exc()}")
-        return jsonify({"error": f"Data processing error for NASA data: {str(e_attr)}"}), 500
+
+@app.route('/api/compare', methods=['GET', 'POST'])
+def handle_compare_request():
+    """
+    Model, NASA, CAMS and corrected GHI for one site and period, aligned on
+    one UTC index with bias/RMSE against a reference source.
+    """
+    try:
+        return json_response(compare_payload(request_params()))
+    except Exception as e:
+        body, status = error_body(e, 'comparison')
+        if status >= 500 and not isinstance(e, ServiceError):
+            app.logger.error(f"Compare request error: {
+                             str(e)}\n{traceback.format_exc()}")
+        return jsonify(body), status
+
+
+@app.route('/api/gti', methods=['GET', 'POST'])
+def handle_gti_request():
+    """
+    Plane-of-array (tilted) irradiance for one site, period and orientation,
+    transposed from the model, NASA or CAMS components.
+    """
+    try:
+        return json_response(gti_payload(request_params()))
     except Exception as e:
-        app.logger.error(f"NASA API request error: {
-                         str(e)}\n{traceback.format_exc()}")
-        return jsonify({"error": f"Server error processing NASA request: {str(e)}"}), 500
+        body, status = error_body(e, 'GTI')
+        if status >= 500 and not isinstance(e, ServiceError):
+            app.logger.error(f"GTI request error: {
+                             str(e)}\n{traceback.format_exc()}")
+        return jsonify(body), status
+
+
+@app.route('/api/gti/optimum', methods=['GET', 'POST'])
+def handle_gti_optimum_request():
+    """Yearly plane-of-array energy over a tilt x azimuth grid, and the best orientation."""
+    try:
+        return json_response(gti_optimum_payload(request_params()))
+    except Exception as e:
+        body, status = error_body(e, 'GTI')
+        if status >= 500 and not isinstance(e, ServiceError):
+            app.logger.error(f"GTI optimum request error: {
+                             str(e)}\n{traceback.format_exc()}")
+        return jsonify(body), status
+
+
+@app.route('/api/climatology', methods=['GET'])
+def climatology_metadata():
+    """Sources, periods, value ranges and tile URL of the climatology map overlays."""
+    try:
+        return json_response(climatology_info())
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
+
+
+@app.route('/api/climatology/point', methods=['GET'])
+def climatology_point():
+    """Monthly and annual climatology at a point, read from the precomputed raster."""
+    try:
+        return json_response(climatology_point_payload(request.args.to_dict()))
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
+
+
+@app.route('/tiles/<int:z>/<int:x>/<int:y>.png')
+def climatology_tile(z, x, y):
+    """A climatology map tile (?source=model|nasa&period=annual|jan..dec), rendered once and cached."""
+    params = request.args.to_dict()
+    try:
+        result = tile_result(params, z, x, y)
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status, {'Cache-Control': CACHE_CONTROL_ERROR}
+    response = app.response_class(result.body, mimetype='image/png')
+    response.headers['ETag'] = result.etag
+    response.headers['Cache-Control'] = tile_cache_control(params)
+    if etag_matches(request.headers.get('If-None-Match'), result.etag):
+        response.status_code = 304
+        response.set_data(b'')
+    return response
 
 
 # @app.route('/api/rf', method=['POST'])
@@ -402,6 +376,68 @@ def handle_nasa_request():
 #     pass
 #
 
+# Frontend dataSource values and the service that produces each one
+EXPORT_SOURCES = {
+    "model": "model",
+    "CAMS_RAD": "cams",
+    "NASA": "nasa",
+    "RF": "predict",
+}
+
+
+def export_response(payload, data_source, format_type):
+    """Build the CSV or JSON attachment for an API payload."""
+    api_data_points = payload.get('data') or []
+    if not api_data_points:
+        return jsonify({"error": "No data to export or data fetching for export failed"}), 500
+
+    # Prepare export data (flattened for CSV). Year-mode payloads carry daily
+    # statistics instead of irradiance components.
+    export_list = []
+    for entry in api_data_points:
+        if 'mean' in entry:
+            export_list.append({
+                "Timestamp": entry.get('datetime'),
+                "Mean GHI (W/m²)": entry.get('mean'),
+                "Upper (W/m²)": entry.get('upper'),
+                "Lower (W/m²)": entry.get('lower')
+            })
+        else:
+            export_list.append({
+                "Timestamp": entry.get('datetime'),
+                "GHI (W/m²)": entry.get('GHI'),
+                "DHI (W/m²)": entry.get('DHI'),
+                "DNI (W/m²)": entry.get('DNI')
+            })
+
+    # Generate CSV or JSON
+    timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename_base = f"solar_data_{data_source}_{timestamp_str}"
+
+    if format_type == 'CSV':
+        output = io.StringIO()
+        # Use the keys from the first item as headers, ensures correct order and all keys
+        writer = csv.DictWriter(
+            output, fieldnames=export_list[0].keys())
+        writer.writeheader()
+        writer.writerows(export_list)
+
+        return send_file(
+            io.BytesIO(output.getvalue().encode('utf-8')),
+            mimetype='text/csv',
+            as_attachment=True,
+            download_name=f"{filename_base}.csv"
+        )
+    else:  # JSON
+        return send_file(
+            io.BytesIO(json.dumps(api_data_points, indent=2).encode(
+                'utf-8')),  # Export original structure for JSON
+            mimetype='application/json',
+            as_attachment=True,
+            download_name=f"{filename_base}.json"
+        )
+
+
 @app.route('/api/export', methods=['POST'])
 def export_data():
     """Exports data in CSV or JSON format."""
@@ -415,119 +451,179 @@ def export_data():
         if format_type not in ['CSV', 'JSON']:
             return jsonify({"error": "Unsupported format for export"}), 400
 
-        # Reuse the data fetching logic based on dataSource
-        # This requires dataSource to be part of the request_data for export
         data_source = request_data.get('dataSource')
         if not data_source:
             return jsonify({"error": "dataSource is required for export"}), 400
-
-        # Simulate a fetch call to get the standardized data
-        # We need to ensure the parameters for each API are correctly passed
-        # For simplicity, this example assumes the frontend sends all necessary params
-        # for the selected dataSource. A more robust solution might call the
-        # respective /api/<dataSource> endpoint internally or refactor data fetching.
-
-        fetched_api_response = {}
-        # This is a simplified way; ideally, you'd refactor data fetching into common functions.
-        if data_source == "model":
-            # Slightly risky to call another endpoint like this, but for demonstration:
-            # Consider refactoring the core logic of fetch_model_data into a helper.
-            # For now, we'll assume the export request has all params fetch_model_data needs.
-            # This part needs careful implementation to avoid re-validating etc.
-            # Let's assume we get the data directly for now.
-            # This section would need to replicate the logic of fetch_model_data
-            # or call a refactored internal function.
-            # For this example, we'll just show the structure.
-            # This is a placeholder for actual data retrieval logic.
-            return jsonify({"error": "Export for 'model' data needs refactoring to reuse data fetching logic."}), 500
-
-        elif data_source == "CAMS_RAD":
-            # Placeholder - replicate CAMS data fetching logic or call refactored function
-            # For now, assume `handle_cams_request` could be refactored to return data internally
-            return jsonify({"error": "Export for 'CAMS_RAD' data needs refactoring."}), 500
-
-        elif data_source == "NASA":
-            # Placeholder - replicate NASA data fetching logic or call refactored function
-            return jsonify({"error": "Export for 'NASA' data needs refactoring."}), 500
-        else:
+        if data_source not in EXPORT_SOURCES:
             return jsonify({"error": "Invalid dataSource for export"}), 400
 
-        # --- The following export logic assumes `api_data_points` is populated correctly ---
-        # --- with the standardized list of {"datetime", "GHI", "DHI", "DNI"} dicts ---
-        # --- You MUST replace the above placeholder sections with actual data fetching ---
-        # --- For example, by refactoring the core logic of your /api/model, /api/cams, /api/nasa routes ---
-        # --- into helper functions that can be called by both the API routes and this export route. ---
-
-        # Let's assume `api_data_points` is now a list of dicts like:
-        # api_data_points = [{"datetime": "...", "GHI": ..., "DHI": ..., "DNI": ...}, ...]
-        # This part is CRITICAL and is currently NOT fully implemented above.
-
-        # For demonstration, let's create dummy api_data_points if the above isn't implemented
-        # REMOVE THIS DUMMY DATA ONCE ACTUAL FETCHING IS IN PLACE FOR EXPORT
-        if 'api_data_points' not in locals():  # Check if it was populated by (currently missing) logic
-            # This is a fallback if the above data source logic isn't filled yet for export
-            # You should replace this with actual data fetching based on dataSource
-            # For example, by calling the refactored data fetching functions.
-            # This is just to make the export function runnable with dummy data.
-            # Only proceed if it's date mode for this dummy
-            if request_data.get("mode") == "date":
-                api_data_points = [{
-                    "datetime": datetime.now(timezone.utc).isoformat(),
-                    "GHI": 100, "DHI": 50, "DNI": 800
-                }]
-            else:  # Year mode export would also need its specific data structure
-                return jsonify({"error": "Export logic for 'year' mode data structure not shown in this dummy example."}), 500
-
-        if not api_data_points:
-            return jsonify({"error": "No data to export or data fetching for export failed"}), 500
-
-        # Prepare export data (flattened for CSV)
-        export_list = []
-        for entry in api_data_points:
-            export_list.append({
-                "Timestamp": entry.get('datetime'),
-                "GHI (W/m²)": entry.get('GHI'),
-                "DHI (W/m²)": entry.get('DHI'),
-                "DNI (W/m²)": entry.get('DNI')
-            })
-
-        if not export_list:
-            return jsonify({"error": "No valid data could be prepared for export"}), 500
-
-        # Generate CSV or JSON
-        timestamp_str = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename_base = f"solar_data_{data_source}_{timestamp_str}"
-
-        if format_type == 'CSV':
-            output = io.StringIO()
-            # Use the keys from the first item as headers, ensures correct order and all keys
-            if export_list:
-                writer = csv.DictWriter(
-                    output, fieldnames=export_list[0].keys())
-                writer.writeheader()
-                writer.writerows(export_list)
-
-            return send_file(
-                io.BytesIO(output.getvalue().encode('utf-8')),
-                mimetype='text/csv',
-                as_attachment=True,
-                download_name=f"{filename_base}.csv"
-            )
-        else:  # JSON
-            return send_file(
-                io.BytesIO(json.dumps(api_data_points, indent=2).encode(
-                    'utf-8')),  # Export original structure for JSON
-                mimetype='application/json',
-                as_attachment=True,
-                download_name=f"{filename_base}.json"
-            )
+        # Same parameters as the matching /api/<source> request, so both share
+        # one result-cache entry.
+        # Exports are always full resolution
+        params = {k: v for k, v in request_data.items() if k not in ('dataSource', 'maxPoints')}
+        body = cached_body(EXPORT_SOURCES[data_source], params)
+        return export_response(json.loads(body), data_source, format_type)
 
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
     except Exception as e:
         app.logger.error(f"Error in export: {str(e)}\n{
                          traceback.format_exc()}")
         return jsonify({"error": f"An unexpected error occurred during export: {str(e)}"}), 500
 
 
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    """
+    Queue a long-running data request. Body: {"source": "model" | "nasa" |
+    "cams" | "predict", "params": {...same payload as the matching route...}}.
+    """
+    request_data = request.get_json(silent=True)
+    if not request_data or not isinstance(request_data.get('params'), dict):
+        return jsonify({"error": "Expected a JSON body with 'source' and 'params'"}), 400
+
+    try:
+        job_id = get_job_queue().submit(request_data.get('source'), request_data['params'])
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
+
+    return jsonify({
+        "job_id": job_id,
+        "status_url": url_for('job_status', job_id=job_id),
+        "result_url": url_for('job_result', job_id=job_id),
+    }), 202
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Status and progress (0-1) of a job."""
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    return jsonify({
+        "job_id": job['id'],
+        "source": job['source'],
+        "status": job['status'],
+        "progress": job['progress'],
+        "error": job['error'],
+        "created_at": job['created_at'],
+        "started_at": job['started_at'],
+        "finished_at": job['finished_at'],
+        "result_url": url_for('job_result', job_id=job_id) if job['status'] == 'done' else None,
+    })
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    Result of a finished job: the API JSON by default, or an export file with
+    ?format=CSV or ?format=JSON.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job['status'] == 'failed':
+        return jsonify({"error": job['error']}), job['error_status'] or 500
+    if job['status'] != 'done':
+        return jsonify({"error": f"Job is {job['status']}", "progress": job['progress']}), 409
+
+    body = get_result_cache().get(job['result_key'])
+    if body is None:
+        return jsonify({"error": "Job result has expired; submit the job again"}), 410
+
+    format_type = request.args.get('format')
+    if format_type is None:
+        return app.response_class(body, mimetype='application/json')
+    format_type = format_type.upper()
+    if format_type not in ['CSV', 'JSON']:
+        return jsonify({"error": "Unsupported format for export"}), 400
+    return export_response(json.loads(body), job['source'], format_type)
+
+
+@app.route('/api/bulk', methods=['POST'])
+def submit_bulk_run():
+    """
+    Queue a bulk run for a list of sites. Either multipart form data with the
+    site list CSV as file 'sites', or a JSON body whose 'sites' is the CSV
+    text or a list of {latitude, longitude, name} objects; with startDate,
+    endDate, timeGranularity, sources (e.g. "model,nasa,cams,predict") and
+    format ("parquet" or "csv") as fields of either.
+    """
+    try:
+        if request.files.get('sites') is not None:
+            fields = request.form.to_dict()
+            sites = read_sites(request.files['sites'].read().decode('utf-8-sig'))
+        else:
+            fields = request.get_json(silent=True)
+            if not isinstance(fields, dict) or not fields.get('sites') or not isinstance(fields['sites'], (str, list)):
+                return jsonify({"error": "Expected a site list CSV as file 'sites', or a JSON body with 'sites'"}), 400
+            sites = fields['sites']
+            sites = read_sites(sites) if isinstance(sites, str) else sites_from_rows(sites)
+        run, job_id = submit_bulk(get_job_queue(), sites, fields)
+    except UnicodeDecodeError:
+        return jsonify({"error": "The site list must be UTF-8 text"}), 400
+    except ServiceError as e:
+        return jsonify({"error": e.message}), e.status
+
+    return jsonify({
+        "bulk_id": run.bulk_id,
+        "job_id": job_id,
+        "sites": len(sites),
+        "status_url": url_for('bulk_status', job_id=job_id),
+        "bundle_url": url_for('bulk_bundle', job_id=job_id),
+    }), 202
+
+
+def bulk_job(job_id):
+    """(job, BulkRun) of a bulk job ID, or (None, None)."""
+    job = get_job_queue().get(job_id)
+    if job is None or job['source'] != 'bulk':
+        return None, None
+    return job, BulkRun(job['params']['bulk_id'])
+
+
+@app.route('/api/bulk/<job_id>', methods=['GET'])
+def bulk_status(job_id):
+    """Status of a bulk run: job progress, sites done and throughput in sites per minute."""
+    job, run = bulk_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown bulk run"}), 404
+
+    progress = run.progress()
+    return jsonify({
+        "job_id": job['id'],
+        "bulk_id": run.bulk_id,
+        "status": job['status'],
+        "progress": job['progress'],
+        "error": job['error'],
+        "sites": progress.get('sites'),
+        "sites_done": progress.get('sites_done'),
+        "sites_per_minute": progress.get('sites_per_minute'),
+        "errors": progress.get('errors'),
+        "created_at": job['created_at'],
+        "started_at": job['started_at'],
+        "finished_at": job['finished_at'],
+        "bundle_url": url_for('bulk_bundle', job_id=job_id) if job['status'] == 'done' else None,
+    })
+
+
+@app.route('/api/bulk/<job_id>/bundle', methods=['GET'])
+def bulk_bundle(job_id):
+    """ZIP of a finished bulk run's result files, site list and manifest."""
+    job, run = bulk_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown bulk run"}), 404
+    if job['status'] == 'failed':
+        return jsonify({"error": job['error']}), job['error_status'] or 500
+    if job['status'] != 'done':
+        return jsonify({"error": f"Bulk run is {job['status']}", "progress": job['progress']}), 409
+    if not run.complete:
+        return jsonify({"error": "Bulk run has expired; upload the site list again"}), 410
+    return send_file(run.bundle_path, mimetype='application/zip', as_attachment=True,
+                     download_name=f"bulk-{run.bulk_id}.zip")
+
+
 if __name__ == '__main__':
     app.run(debug=True)
     app.run(debug=True)
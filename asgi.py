@@ -0,0 +1,282 @@
+"""
+ASGI entry point for the portal.
+
+The upstream-bound API routes are served by async handlers: NASA and CAMS
+requests are awaited on a shared async HTTP client, so thousands of slow
+upstream calls can wait concurrently inside one worker process instead of
+each pinning a sync worker. CPU-bound work is moved off the event loop to a
+thread pool; long model ranges are split from there across the worker's
+process pool (cpu_pool.py). Every other route is served by the Flask app
+unchanged.
+
+Run with:
+    gunicorn asgi:app -k uvicorn_worker.UvicornWorker
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import os
+import time
+import traceback
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+from starlette.middleware import Middleware
+from starlette.routing import Mount, Route
+
+from app import app as flask_app
+from cache import CachedResult, body_etag, get_result_cache
+from compression import choose_encoding
+from cpu_pool import shutdown_cpu_pool
+from metrics import observe_request
+from tracing import end_trace, start_trace
+from services import (
+    ServiceError, error_body, dump_payload, model_payload, request_key, store_payload, encode_result, log_lookup,
+    max_points, full_request, downsample_payload,
+    cache_control, etag_matches, CACHE_CONTROL_ERROR, CACHE_CONTROL_REVALIDATE,
+    cams_params, fetch_cams_async, format_cams,
+    nasa_params, fetch_nasa_async, format_nasa,
+    compare_params, model_series, nasa_series, cams_series, predict_series, format_compare,
+)
+
+# Total simultaneous upstream connections per worker process.
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv('UPSTREAM_MAX_CONNECTIONS', '1000'))
+# Default timeouts of upstream calls, so a hung upstream cannot hold a
+# request and a connection slot forever
+UPSTREAM_TIMEOUT = httpx.Timeout(float(os.getenv('UPSTREAM_READ_TIMEOUT', '180')),
+                                 connect=float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', '10')))
+# Threads used to serve the Flask routes mounted below the async ones.
+WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', '10'))
+
+
+def json_response(payload, status=200):
+    """Serialize like Flask's jsonify so both front ends emit identical bodies."""
+    headers = {'Cache-Control': CACHE_CONTROL_ERROR} if status != 200 else None
+    return Response(dump_payload(payload), status_code=status, media_type='application/json',
+                    headers=headers)
+
+
+def result_response(request, result, cache_control):
+    """
+    Response for a CachedResult with the cache headers the Flask app adds to
+    /api responses, or 304 when the request's If-None-Match matches it.
+    """
+    headers = {'ETag': result.etag, 'Cache-Control': cache_control, 'Vary': 'Accept-Encoding'}
+    if result.encoding is not None:
+        headers['Content-Encoding'] = result.encoding
+    if request.method in ('GET', 'HEAD') and etag_matches(request.headers.get('if-none-match'), result.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(result.body, media_type='application/json', headers=headers)
+
+
+async def cached_json_response(request, source, request_data, compute):
+    """
+    The JSON response for a request, from the result cache when present and
+    already compressed in the encoding the client prefers; on a miss the
+    payload is awaited from compute() and stored. A GET whose If-None-Match
+    matches a cached entry gets 304 without computing anything.
+    """
+    key = request_key(source, request_data)
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
+    result = await run_in_threadpool(get_result_cache().get_entry, key, encoding)
+    points = None if result is not None else max_points(request_data)
+    if points is None:
+        await run_in_threadpool(log_lookup, source, request_data, result is not None)
+    if result is None:
+        if points is None:
+            payload = await compute()
+        else:
+            full = await full_payload(source, request_data, compute)
+            payload = await run_in_threadpool(downsample_payload, full, points)
+        result = await run_in_threadpool(store_payload, source, key, payload, encoding)
+    if encoding is not None and result.encoding is None:
+        # Stored without its compressed copies
+        result = await run_in_threadpool(encode_result, result, encoding)
+    return result_response(request, result, cache_control(source, request_data))
+
+
+async def full_payload(source, request_data, compute):
+    """The full-resolution payload a downsampled request is reduced from, cached like any other."""
+    key = request_key(source, full_request(request_data))
+    body = await run_in_threadpool(get_result_cache().get, key)
+    await run_in_threadpool(log_lookup, source, request_data, body is not None)
+    if body is not None:
+        return await run_in_threadpool(json.loads, body)
+    payload = await compute()
+    await run_in_threadpool(store_payload, source, key, payload)
+    return payload
+
+
+def error_response(exc, source):
+    body, status = error_body(exc, source)
+    if status >= 500 and not isinstance(exc, ServiceError):
+        flask_app.logger.error(f"{source} API request error: {
+                               str(exc)}\n{traceback.format_exc()}")
+    return json_response(body, status)
+
+
+class ProfileViaFlask:
+    """
+    Send ?profile= requests to the Flask app, whose hooks run the profiler.
+    The Flask routes share the services code with the async ones, so the
+    profile shows the same work, run synchronously.
+    """
+
+    def __init__(self, app, flask):
+        self.app = app
+        self.flask = flask
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and b'profile=' in scope.get('query_string', b''):
+            await self.flask(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def observed(route):
+    """
+    Trace an async route and record its request metrics, as the Flask hooks
+    do for Flask routes.
+    """
+    @functools.wraps(route)
+    async def handler(request):
+        started = time.perf_counter()
+        trace, token = start_trace(request.url.path, request.method)
+        try:
+            response = await route(request)
+        finally:
+            end_trace(token)
+        observe_request(request.url.path, request.method, response.status_code,
+                        time.perf_counter() - started, len(response.body))
+        response.headers['Server-Timing'] = trace.server_timing()
+        trace.log(response.status_code, len(response.body))
+        return response
+    return handler
+
+
+async def read_json(request):
+    """Request body as JSON, or None when it is missing or malformed."""
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+
+async def read_params(request):
+    """Parameters of a data request: the JSON body of a POST, the query string of a GET."""
+    if request.method == 'POST':
+        return await read_json(request)
+    return dict(request.query_params)
+
+
+@observed
+async def model_route(request):
+    """Fetch solar irradiance data from the custom model."""
+    data = await read_params(request)
+
+    async def compute():
+        return await run_in_threadpool(model_payload, data)
+
+    try:
+        return await cached_json_response(request, 'model', data, compute)
+    except ServiceError as e:
+        return json_response({"error": e.message}, e.status)
+
+
+@observed
+async def cams_route(request):
+    """Handles requests to the CAMS data API."""
+    request_data = await read_params(request)
+
+    async def compute():
+        params = cams_params(request_data)
+        cams_result = await fetch_cams_async(params, client=request.app.state.http)
+        return await run_in_threadpool(format_cams, request_data, params, cams_result)
+
+    try:
+        return await cached_json_response(request, 'cams', request_data, compute)
+    except Exception as e:
+        return error_response(e, 'CAMS')
+
+
+@observed
+async def nasa_route(request):
+    """Handles requests to the NASA POWER API."""
+    request_data = await read_params(request)
+
+    async def compute():
+        params = nasa_params(request_data)
+        nasa_api_result = await fetch_nasa_async(params, client=request.app.state.http)
+        return await run_in_threadpool(format_nasa, params, nasa_api_result, flask_app.logger)
+
+    try:
+        return await cached_json_response(request, 'nasa', request_data, compute)
+    except Exception as e:
+        return error_response(e, 'NASA')
+
+
+@observed
+async def compare_route(request):
+    """Fetch every comparison source concurrently and align them."""
+    request_data = await read_params(request)
+    try:
+        params = compare_params(request_data)
+    except Exception as e:
+        return error_response(e, 'comparison')
+
+    client = request.app.state.http
+
+    # Only the fetches are awaited on the loop; decoding and alignment run in threads
+    async def nasa():
+        return await run_in_threadpool(nasa_series, params, await fetch_nasa_async(params['nasa'], client=client))
+
+    async def cams():
+        return await run_in_threadpool(cams_series, params, await fetch_cams_async(params['cams'], client=client))
+
+    model, nasa_ghi, cams_ghi, predict = await asyncio.gather(
+        run_in_threadpool(model_series, params),
+        nasa(),
+        cams(),
+        run_in_threadpool(predict_series, params),
+        return_exceptions=True,
+    )
+    results = {'model': model, 'nasa': nasa_ghi, 'cams': cams_ghi, 'predict': predict}
+    try:
+        payload = await run_in_threadpool(format_compare, params, results)
+    except Exception as e:
+        return error_response(e, 'comparison')
+    body = dump_payload(payload)
+    encoding = choose_encoding(request.headers.get('accept-encoding'))
+    result = await run_in_threadpool(encode_result, CachedResult(body, body_etag(body), None), encoding)
+    return result_response(request, result, CACHE_CONTROL_REVALIDATE)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    limits = httpx.Limits(max_connections=UPSTREAM_MAX_CONNECTIONS,
+                          max_keepalive_connections=min(UPSTREAM_MAX_CONNECTIONS, 100))
+    app.state.http = httpx.AsyncClient(timeout=UPSTREAM_TIMEOUT, limits=limits)
+    try:
+        yield
+    finally:
+        await app.state.http.aclose()
+        shutdown_cpu_pool()
+
+
+flask_wsgi = WSGIMiddleware(flask_app, workers=WSGI_THREADS)
+
+app = Starlette(
+    routes=[
+        Route('/api/model', model_route, methods=['GET', 'POST']),
+        Route('/api/cams', cams_route, methods=['GET', 'POST']),
+        Route('/api/nasa', nasa_route, methods=['GET', 'POST']),
+        Route('/api/compare', compare_route, methods=['GET', 'POST']),
+        Mount('/', app=flask_wsgi),
+    ],
+    middleware=[Middleware(ProfileViaFlask, flask=flask_wsgi)],
+    lifespan=lifespan,
+)
@@ -0,0 +1,336 @@
+"""
+Fingerprinted static assets.
+
+`python -m assets build` copies static/ into ASSETS_DIR (default
+build/assets), minifying JS and CSS, compacting SVG and stripping metadata
+from PNG and JPEG files. Each file is renamed with a hash of its content
+(script.js becomes script.3f2a1b9c0d.js) and written with a .gz sibling,
+plus a .br sibling when the optional brotli package is installed.
+manifest.json maps every source path to its built name. The build needs no
+network access or third-party tools.
+
+Templates link assets through asset_url() (see app.py), which resolves them
+through the manifest to the /assets route. Built names change whenever the
+content does, so they are served with `Cache-Control: immutable` and
+browsers never revalidate them. Without a build, asset_url() falls back to
+the plain /static/ URL.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import struct
+import sys
+import zlib
+
+from compression import brotli
+
+STATIC_DIR = 'static'
+ASSETS_DIR = os.getenv('ASSETS_DIR', os.path.join('build', 'assets'))
+MANIFEST_NAME = 'manifest.json'
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Precompressed siblings, by Content-Encoding, preferred first
+PRECOMPRESSED = {'br': '.br', 'gzip': '.gz'}
+# Already-compressed formats gain nothing from gzip or brotli
+COMPRESSIBLE = {'.js', '.css', '.svg', '.json', '.html', '.txt', '.xml'}
+# Source files and archives that pages never link to
+SKIP_SUFFIXES = {'.zip', '.eps', '.txt'}
+DIGEST_LENGTH = 10
+
+_manifest = None
+_built_names = None
+
+
+# --- Serving ---
+
+def manifest():
+    """{source path: built name} from the last build, or {} without one."""
+    global _manifest, _built_names
+    if _manifest is None:
+        try:
+            with open(os.path.join(ASSETS_DIR, MANIFEST_NAME)) as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+        _built_names = set(_manifest.values())
+    return _manifest
+
+
+def is_built(name):
+    """Whether name is a file of the current build."""
+    manifest()
+    return name in _built_names
+
+
+# --- Optimizers ---
+
+def minify_js(source):
+    """
+    Drop comments, indentation and blank lines, and collapse runs of spaces.
+    Line breaks are kept, so automatic semicolon insertion is unaffected, and
+    string, template and regular expression literals are copied unchanged.
+    """
+    out = []
+    last = ''  # last character emitted that is not whitespace
+    i, n = 0, len(source)
+
+    def whitespace(newline):
+        if not out:
+            return
+        if out[-1] in (' ', '\n'):
+            if newline:
+                out[-1] = '\n'
+        else:
+            out.append('\n' if newline else ' ')
+
+    while i < n:
+        c = source[i]
+        if c in '\'"`':
+            j = i + 1
+            while j < n and source[j] != c:
+                j += 2 if source[j] == '\\' else 1
+            out.append(source[i:j + 1])
+            last, i = c, j + 1
+        elif source.startswith('//', i):
+            j = source.find('\n', i)
+            i = n if j < 0 else j
+        elif source.startswith('/*', i):
+            j = source.find('*/', i + 2)
+            whitespace('\n' in source[i:j])
+            i = n if j < 0 else j + 2
+        elif c == '/' and (not last or last in '(,=:[!&|?{};+-*%<>~^'):
+            # A regular expression literal, which may contain quotes and //
+            j, in_class = i + 1, False
+            while j < n and source[j] != '\n':
+                if source[j] == '\\':
+                    j += 1
+                elif source[j] == '[':
+                    in_class = True
+                elif source[j] == ']':
+                    in_class = False
+                elif source[j] == '/' and not in_class:
+                    break
+                j += 1
+            out.append(source[i:j + 1])
+            last, i = '/', j + 1
+        elif c.isspace():
+            j = i
+            while j < n and source[j].isspace():
+                j += 1
+            whitespace('\n' in source[i:j])
+            i = j
+        else:
+            out.append(c)
+            last, i = c, i + 1
+    return ''.join(out).strip() + '\n'
+
+
+def minify_css(source):
+    """Drop comments and the whitespace around braces, semicolons, commas and declaration colons."""
+    text = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    # Only inside declaration blocks: in a selector, "a :hover" differs from "a:hover"
+    text = re.sub(r'\{([^{}]*)\}', lambda m: '{' + re.sub(r'\s*:\s*', ':', m.group(1)) + '}', text)
+    return text.replace(';}', '}').strip() + '\n'
+
+
+# Attributes holding coordinate lists, where 0.5 can be written .5
+SVG_NUMERIC_ATTRIBUTES = {'d', 'points', 'transform', 'viewBox', 'x', 'y', 'width', 'height',
+                          'cx', 'cy', 'r', 'rx', 'ry', 'x1', 'x2', 'y1', 'y2'}
+
+
+def _compact_svg_attribute(match):
+    name, value = match.group(1), match.group(2)
+    if value.startswith('data:'):
+        # Whitespace inside base64 data is ignored by decoders
+        return '%s="%s"' % (name, re.sub(r'\s+', '', value))
+    value = re.sub(r'\s+', ' ', value).strip()
+    if name in SVG_NUMERIC_ATTRIBUTES:
+        value = re.sub(r'\s*,\s*', ',', value)
+        value = re.sub(r'(?<![\d.])0\.(\d)', r'.\1', value)
+        value = re.sub(r' (?=-)', '', value)
+    return f'{name}="{value}"'
+
+
+def optimize_svg(source):
+    """
+    Drop comments and the whitespace between tags, minify <style> blocks and
+    compact attribute values. Documents with text elements are left alone
+    between tags, where whitespace is rendered.
+    """
+    text = re.sub(r'<!--.*?-->', '', source, flags=re.S)
+    text = re.sub(r'(<style[^>]*>)(.*?)(</style>)',
+                  lambda m: m.group(1) + minify_css(m.group(2)).strip() + m.group(3), text, flags=re.S)
+    text = re.sub(r'([\w:-]+)="([^"]*)"', _compact_svg_attribute, text)
+    if '<text' not in text:
+        text = re.sub(r'>\s+<', '><', text)
+    text = re.sub(r'\s+(/?>)', r'\1', text)
+    return text.strip() + '\n'
+
+
+# Ancillary PNG chunks that do not affect rendering
+PNG_DROP_CHUNKS = {b'tEXt', b'zTXt', b'iTXt', b'tIME', b'bKGD', b'hIST', b'sPLT'}
+
+
+def optimize_png(data):
+    """Drop text and timestamp chunks and recompress the image data at the highest zlib level."""
+    signature, pos = data[:8], 8
+    chunks, idat = [], []
+    while pos < len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        body = data[pos + 8:pos + 8 + length]
+        pos += 12 + length
+        if kind == b'IDAT':
+            if not idat:
+                chunks.append((b'IDAT', None))
+            idat.append(body)
+        elif kind not in PNG_DROP_CHUNKS:
+            chunks.append((kind, body))
+    recompressed = zlib.compress(zlib.decompress(b''.join(idat)), 9)
+    if len(recompressed) > sum(len(part) for part in idat):
+        recompressed = b''.join(idat)
+    out = [signature]
+    for kind, body in chunks:
+        body = recompressed if body is None else body
+        out.append(struct.pack('>I4s', len(body), kind) + body
+                   + struct.pack('>I', zlib.crc32(kind + body) & 0xffffffff))
+    return b''.join(out)
+
+
+def optimize_jpeg(data):
+    """
+    Drop comments and the XMP and Photoshop metadata segments. Exif (which
+    may hold the orientation), ICC profiles and the JFIF/Adobe headers stay.
+    """
+    out, pos = [data[:2]], 2
+    while pos + 4 <= len(data) and data[pos] == 0xFF:
+        marker = data[pos + 1]
+        if marker == 0xDA:
+            # Start of scan: the compressed image follows
+            break
+        length = struct.unpack('>H', data[pos + 2:pos + 4])[0]
+        segment = data[pos:pos + 2 + length]
+        payload = segment[4:]
+        is_xmp = marker == 0xE1 and payload.startswith(b'http://ns.adobe.com/xap/')
+        if not (marker == 0xFE or marker == 0xED or is_xmp):
+            out.append(segment)
+        pos += 2 + length
+    out.append(data[pos:])
+    return b''.join(out)
+
+
+def _text(optimize):
+    return lambda data: optimize(data.decode('utf-8')).encode('utf-8')
+
+
+OPTIMIZERS = {
+    '.js': _text(minify_js),
+    '.css': _text(minify_css),
+    '.svg': _text(optimize_svg),
+    '.png': optimize_png,
+    '.jpg': optimize_jpeg,
+    '.jpeg': optimize_jpeg,
+}
+
+
+def sniff_suffix(data):
+    """Suffix for a file saved without one, from its leading bytes."""
+    if data.startswith(b'\xff\xd8\xff'):
+        return '.jpg'
+    if data.startswith(b'\x89PNG\r\n\x1a\n'):
+        return '.png'
+    if data.lstrip().startswith((b'<svg', b'<?xml')):
+        return '.svg'
+    return ''
+
+
+# --- Build ---
+
+def precompress(path, data):
+    """Write .gz and .br siblings of path where they are smaller than data; their sizes."""
+    sizes = {}
+    candidates = {'gzip': lambda: gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        candidates['br'] = lambda: brotli.compress(data, quality=11)
+    for encoding, make in candidates.items():
+        compressed = make()
+        if len(compressed) < len(data):
+            with open(path + PRECOMPRESSED[encoding], 'wb') as f:
+                f.write(compressed)
+            sizes[encoding] = len(compressed)
+    return sizes
+
+
+def build(static_dir=STATIC_DIR, out_dir=ASSETS_DIR):
+    """Build every asset under static_dir into out_dir; [(source, built, sizes)] per asset."""
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    built_manifest, report = {}, []
+    for root, dirs, files in os.walk(static_dir):
+        dirs.sort()
+        for name in sorted(files):
+            source = os.path.relpath(os.path.join(root, name), static_dir).replace(os.sep, '/')
+            stem, suffix = os.path.splitext(name)
+            if suffix.lower() in SKIP_SUFFIXES or name.startswith('.'):
+                continue
+            with open(os.path.join(root, name), 'rb') as f:
+                data = f.read()
+            suffix = suffix.lower() or sniff_suffix(data)
+            optimized = OPTIMIZERS.get(suffix, lambda raw: raw)(data)
+            if len(optimized) > len(data):
+                optimized = data
+            digest = hashlib.sha256(optimized).hexdigest()[:DIGEST_LENGTH]
+            built = posix_join(os.path.dirname(source), f'{stem}.{digest}{suffix}')
+            path = os.path.join(out_dir, built)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(optimized)
+            sizes = {'original': len(data), 'built': len(optimized)}
+            if suffix in COMPRESSIBLE:
+                sizes.update(precompress(path, optimized))
+            built_manifest[source] = built
+            report.append((source, built, sizes))
+    with open(os.path.join(out_dir, MANIFEST_NAME), 'w') as f:
+        json.dump(built_manifest, f, indent=1, sort_keys=True)
+    return report
+
+
+def posix_join(directory, name):
+    return f'{directory}/{name}' if directory else name
+
+
+def print_report(report):
+    totals = {'original': 0, 'built': 0, 'sent': 0}
+    for source, built, sizes in report:
+        sent = min(sizes.get('br', sizes['built']), sizes.get('gzip', sizes['built']))
+        totals['original'] += sizes['original']
+        totals['built'] += sizes['built']
+        totals['sent'] += sent
+        print(f"{source:<40}{sizes['original'] / 1024:>9.1f} KB{sizes['built'] / 1024:>9.1f} KB"
+              f"{sent / 1024:>9.1f} KB sent  {built}")
+    print(f"{'total':<40}{totals['original'] / 1024:>9.1f} KB{totals['built'] / 1024:>9.1f} KB"
+          f"{totals['sent'] / 1024:>9.1f} KB sent")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets.")
+    subcommands = parser.add_subparsers(dest='command', required=True)
+    build_parser = subcommands.add_parser('build', help="Build static/ into the assets directory.")
+    build_parser.add_argument('--static-dir', default=STATIC_DIR)
+    build_parser.add_argument('--out-dir', default=ASSETS_DIR)
+    args = parser.parse_args()
+
+    report = build(args.static_dir, args.out_dir)
+    print_report(report)
+    if brotli is None:
+        print("brotli is not installed: wrote .gz siblings only", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Import-time budget for the web entry points.
+
+Imports each entry point in a fresh interpreter under `python -X importtime`
+and fails when its cumulative import time exceeds the budget, or when it
+loads a dependency that must stay deferred until a route needs it (see
+lazy_imports.py):
+
+    python -m benchmarks.imports            # exit 1 when over budget
+    python -m benchmarks.imports --top 15   # also list the slowest imports
+
+The time is the best of several runs, so a busy machine rarely fails it.
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time per entry point, seconds
+BUDGETS = {
+    'app': 0.6,
+    'asgi': 0.8,
+}
+# Must not be imported by an entry point itself
+DEFERRED = ['pandas', 'numpy', 'pvlib', 'geopy', 'joblib', 'scipy', 'sklearn']
+
+
+def import_profile(module):
+    """({module: (self us, cumulative us)}, modules loaded) for one fresh import of `module`."""
+    code = f"import sys, {module}; print(','.join(sorted(sys.modules)))"
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=REPO_ROOT,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = (part.strip() for part in line[len('import time:'):].split('|'))
+        times[name] = (int(self_us), int(cumulative_us))
+    return times, set(result.stdout.strip().split(','))
+
+
+def measure(module, runs):
+    best, loaded, times = None, set(), {}
+    for _ in range(runs):
+        run_times, loaded = import_profile(module)
+        seconds = run_times[module][1] / 1e6
+        if best is None or seconds < best:
+            best, times = seconds, run_times
+    return best, loaded, times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time budget for the web entry points.")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=0, help="List this many of the slowest imports.")
+    args = parser.parse_args()
+
+    failures = []
+    for module, budget in BUDGETS.items():
+        seconds, loaded, times = measure(module, args.runs)
+        print(f"{module:<6}{seconds * 1000:>8.0f} ms  (budget {budget * 1000:.0f} ms)")
+        if seconds > budget:
+            failures.append(f"{module}: import takes {seconds * 1000:.0f} ms, budget {budget * 1000:.0f} ms")
+        eager = [name for name in DEFERRED if name in loaded]
+        if eager:
+            failures.append(f"{module}: imports {', '.join(eager)} at start-up")
+        slowest = sorted(times.items(), key=lambda item: item[1][0], reverse=True)[:args.top]
+        for name, (self_us, cumulative_us) in slowest:
+            print(f"      {self_us / 1000:>8.1f} ms self {cumulative_us / 1000:>8.1f} ms total  {name}")
+
+    if failures:
+        print(f"\n{len(failures)} failure(s):")
+        for message in failures:
+            print(f"  {message}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,390 @@
+"""
+Hermetic load test of the portal.
+
+Starts the NASA and CAMS stand-ins (benchmarks/standins.py), serves the
+portal with gunicorn against them, with every cache and store in a fresh
+temporary directory, and drives each scenario at a fixed concurrency:
+
+    model    POST /api/model              extraterrestrial model, no upstream
+    nasa     POST /api/nasa               NASA POWER fetch and reshaping
+    cams     POST /api/cams               CAMS fetch and parsing
+    export   POST /api/export?format=CSV  NASA data exported as CSV
+    predict  POST /api/export (RF)        corrected GHI from the RF predictor
+
+Sites are drawn from a seeded pool, so runs with the same options send the
+same requests; a site requested twice is answered from the result cache the
+second time. For each scenario the report has p50/p95/p99 latency, requests
+per second and errors, plus the peak resident memory of the gunicorn
+workers. Results are written as JSON to benchmarks/results/ and two runs can
+be compared:
+
+    python -m benchmarks.load run --server asgi --workers 2 --concurrency 16
+    python -m benchmarks.load compare benchmarks/results/A.json benchmarks/results/B.json
+
+Nothing leaves the machine: the predictor and routes reach NASA and CAMS only
+through NASA_POWER_URL and CAMS_SERVICE_URL. The predict scenario needs a
+trained model (--rf-model-dir) and is reported as skipped when the portal
+answers 503.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+import httpx
+
+from .standins import CAMSStandIn, NASAStandIn
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+SCENARIOS = ['model', 'nasa', 'cams', 'export', 'predict']
+SERVERS = {
+    'asgi': ['asgi:app', '-k', 'uvicorn_worker.UvicornWorker'],
+    'wsgi': ['app:app', '--threads', '4'],
+}
+GRANULARITIES = ['Hourly', 'Daily', 'Monthly']
+
+
+def _period(rng):
+    """Random (start, end, granularity); mostly short periods, like portal users send."""
+    granularity = rng.choice(GRANULARITIES)
+    days = {'Hourly': rng.choice([1, 7, 31]), 'Daily': rng.choice([31, 365]), 'Monthly': 365 * rng.choice([1, 3])}[granularity]
+    start = date(2010, 1, 1) + timedelta(days=rng.randrange(365 * 10))
+    return start.isoformat(), (start + timedelta(days=days - 1)).isoformat(), granularity
+
+
+def build_request(scenario, site, rng):
+    """(path, JSON body) for one request of a scenario."""
+    latitude, longitude = site
+    start, end, granularity = _period(rng)
+    body = {
+        'latitude': latitude, 'longitude': longitude, 'mode': 'date',
+        'startDate': start, 'endDate': end, 'timeGranularity': granularity,
+    }
+    if scenario == 'model':
+        return '/api/model', body
+    if scenario == 'nasa':
+        return '/api/nasa', body
+    if scenario == 'cams':
+        return '/api/cams', body
+    if scenario == 'export':
+        return '/api/export?format=CSV', dict(body, dataSource='NASA')
+    if scenario == 'predict':
+        return '/api/export?format=CSV', dict(body, dataSource='RF', timeGranularity='Daily')
+    raise ValueError(f"Unknown scenario: {scenario}")
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a sorted list."""
+    if not values:
+        return None
+    rank = max(0, min(len(values) - 1, round(q / 100 * len(values) + 0.5) - 1))
+    return values[rank]
+
+
+async def run_scenario(base_url, scenario, sites, requests, concurrency, seed, timeout):
+    rng = random.Random(f"{seed}-{scenario}")
+    planned = [build_request(scenario, rng.choice(sites), rng) for _ in range(requests)]
+    queue = asyncio.Queue()
+    for item in planned:
+        queue.put_nowait(item)
+
+    latencies, statuses, failures = [], {}, 0
+
+    async def worker(client):
+        nonlocal failures
+        while True:
+            try:
+                path, body = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=body)
+                await response.aread()
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 'transport-error'
+            latencies.append(time.perf_counter() - start)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+            if status == 'transport-error' or status >= 400:
+                failures += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - started
+
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        'requests': len(latencies),
+        'errors': failures,
+        'status': statuses,
+        'duration_s': round(duration, 3),
+        'rps': round(len(latencies) / duration, 2) if duration else None,
+        'p50_ms': round(percentile(ms, 50), 2),
+        'p95_ms': round(percentile(ms, 95), 2),
+        'p99_ms': round(percentile(ms, 99), 2),
+        'mean_ms': round(sum(ms) / len(ms), 2),
+        'max_ms': round(ms[-1], 2),
+    }
+
+
+class RSSMonitor(threading.Thread):
+    """Samples the resident memory of a process's children (the gunicorn workers) from /proc."""
+
+    def __init__(self, parent_pid, interval=0.25):
+        super().__init__(name='rss-monitor', daemon=True)
+        self.parent_pid = parent_pid
+        self.interval = interval
+        self.peak_total = 0
+        self.peak_per_worker = {}
+        self._stop_event = threading.Event()
+
+    def children(self):
+        pids = []
+        for entry in os.listdir('/proc'):
+            if not entry.isdigit():
+                continue
+            try:
+                with open(f'/proc/{entry}/stat') as f:
+                    # The command name is parenthesised and may contain spaces
+                    ppid = int(f.read().rsplit(')', 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == self.parent_pid:
+                pids.append(int(entry))
+        return pids
+
+    @staticmethod
+    def rss_bytes(pid):
+        try:
+            with open(f'/proc/{pid}/status') as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        return int(line.split()[1]) * 1024
+        except OSError:
+            pass
+        return 0
+
+    def sample(self):
+        sizes = {pid: self.rss_bytes(pid) for pid in self.children()}
+        self.peak_total = max(self.peak_total, sum(sizes.values()))
+        for pid, size in sizes.items():
+            self.peak_per_worker[pid] = max(self.peak_per_worker.get(pid, 0), size)
+        return sizes
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def report(self, current):
+        mib = 1024 * 1024
+        return {
+            'workers': len(current),
+            'peak_total_mib': round(self.peak_total / mib, 1),
+            'peak_worker_mib': round(max(self.peak_per_worker.values(), default=0) / mib, 1),
+            'end_total_mib': round(sum(current.values()) / mib, 1),
+        }
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _git_revision():
+    try:
+        sha = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                             capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown', False
+    return sha, dirty
+
+
+def start_portal(args, nasa, cams, workdir):
+    """Start gunicorn against the stand-ins; returns (process, base URL)."""
+    port = _free_port()
+    env = dict(
+        os.environ,
+        NASA_POWER_URL=nasa.url,
+        CAMS_SERVICE_URL=cams.url,
+        RESULT_CACHE_PATH=os.path.join(workdir, 'results.sqlite'),
+        FEATURE_STORE_PATH=os.path.join(workdir, 'features.sqlite'),
+        PREDICTION_LEDGER_PATH=os.path.join(workdir, 'predictions.sqlite'),
+        JOBS_PATH=os.path.join(workdir, 'jobs.sqlite'),
+        PROFILE_DIR=os.path.join(workdir, 'profiles'),
+        PROMETHEUS_MULTIPROC_DIR=os.path.join(workdir, 'metrics'),
+        TRACE_LOG_LEVEL='WARNING',
+    )
+    if args.rf_model_dir:
+        env['RF_MODEL_DIR'] = os.path.abspath(args.rf_model_dir)
+    command = [sys.executable, '-m', 'gunicorn', *SERVERS[args.server],
+               '--workers', str(args.workers), '--bind', f'127.0.0.1:{port}',
+               '--timeout', str(int(args.timeout) + 30), '--log-level', 'warning']
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=env)
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            if httpx.get(base_url + '/help', timeout=1).status_code == 200:
+                return process, base_url
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 s")
+
+
+def run(args):
+    scenarios = args.scenarios.split(',')
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    rng = random.Random(args.seed)
+    sites = [(round(rng.uniform(-60, 70), 4), round(rng.uniform(-180, 180), 4)) for _ in range(args.sites)]
+    standin_options = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, seed=args.seed)
+    workdir = tempfile.mkdtemp(prefix='portal-load-')
+
+    results = {}
+    try:
+        with NASAStandIn(**standin_options) as nasa, CAMSStandIn(**standin_options) as cams:
+            process, base_url = start_portal(args, nasa, cams, workdir)
+            monitor = RSSMonitor(process.pid)
+            monitor.sample()
+            monitor.start()
+            try:
+                for scenario in scenarios:
+                    print(f"{scenario}: {args.requests} requests at concurrency {args.concurrency}", file=sys.stderr)
+                    result = asyncio.run(run_scenario(base_url, scenario, sites, args.requests,
+                                                      args.concurrency, args.seed, args.timeout))
+                    if scenario == 'predict' and result['status'].get('503') == result['requests']:
+                        result = {'skipped': 'predictor unavailable (no trained model in RF_MODEL_DIR)'}
+                    results[scenario] = result
+                memory = monitor.report(monitor.sample())
+            finally:
+                monitor.stop()
+                process.terminate()
+                process.wait(timeout=30)
+            upstream = {
+                'nasa': {'requests': nasa.requests, 'injected_errors': nasa.errors},
+                'cams': {'requests': cams.requests, 'injected_errors': cams.errors},
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    sha, dirty = _git_revision()
+    report = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'git': {'sha': sha, 'dirty': dirty},
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'config': {k: v for k, v in vars(args).items() if k not in ('func', 'output')},
+        'scenarios': results,
+        'memory': memory,
+        'upstream': upstream,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{sha}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+        f.write('\n')
+
+    print_report(report)
+    print(f"\nWritten to {output}")
+
+
+def print_report(report):
+    print(f"{'scenario':<10}{'reqs':>6}{'errors':>8}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in report['scenarios'].items():
+        if 'skipped' in result:
+            print(f"{name:<10}  skipped: {result['skipped']}")
+            continue
+        print(f"{name:<10}{result['requests']:>6}{result['errors']:>8}{result['rps']:>9.1f}"
+              f"{result['p50_ms']:>10.1f}{result['p95_ms']:>10.1f}{result['p99_ms']:>10.1f}")
+    memory = report['memory']
+    print(f"workers: {memory['workers']}, peak RSS {memory['peak_total_mib']} MiB total, "
+          f"{memory['peak_worker_mib']} MiB largest worker")
+
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    def change(old, new):
+        if old in (None, 0) or new is None:
+            return '     n/a'
+        return f"{(new - old) / old * 100:+7.1f}%"
+
+    print(f"{before['git']['sha']} -> {after['git']['sha']}")
+    print(f"{'scenario':<10}{'metric':<8}{'before':>10}{'after':>10}{'change':>10}")
+    for name in before['scenarios']:
+        old, new = before['scenarios'][name], after['scenarios'].get(name)
+        if new is None or 'skipped' in old or 'skipped' in new:
+            continue
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'errors'):
+            print(f"{name:<10}{metric:<8}{old[metric]:>10}{new[metric]:>10}{change(old[metric], new[metric]):>10}")
+    for metric in ('peak_total_mib', 'peak_worker_mib'):
+        old, new = before['memory'][metric], after['memory'][metric]
+        print(f"{'memory':<10}{metric[:7]:<8}{old:>10}{new:>10}{change(old, new):>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hermetic load test of the portal.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = sub.add_parser('run', help="Run the load test.")
+    run_parser.add_argument('--server', choices=sorted(SERVERS), default='asgi')
+    run_parser.add_argument('--workers', type=int, default=2)
+    run_parser.add_argument('--concurrency', type=int, default=16)
+    run_parser.add_argument('--requests', type=int, default=200, help="Requests per scenario.")
+    run_parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    run_parser.add_argument('--sites', type=int, default=50, help="Size of the site pool.")
+    run_parser.add_argument('--latency-ms', type=float, default=200.0, help="Stand-in response delay.")
+    run_parser.add_argument('--jitter-ms', type=float, default=50.0)
+    run_parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of upstream calls that fail.")
+    run_parser.add_argument('--timeout', type=float, default=120.0, help="Client timeout per request, seconds.")
+    run_parser.add_argument('--rf-model-dir', help="Trained model for the predict scenario.")
+    run_parser.add_argument('--seed', type=int, default=0)
+    run_parser.add_argument('--output', help="Result file (default benchmarks/results/<time>-<sha>.json).")
+    run_parser.set_defaults(func=run)
+
+    compare_parser = sub.add_parser('compare', help="Compare two result files.")
+    compare_parser.add_argument('before')
+    compare_parser.add_argument('after')
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
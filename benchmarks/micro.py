@@ -0,0 +1,516 @@
+"""
+Microbenchmarks for the portal's compute kernels.
+
+Each case times one kernel on a fixed, synthetic input and records its peak
+Python-level allocation (tracemalloc, which also sees numpy and pandas
+buffers). Inputs range from one day to 40 years and from 1 to 10k sites;
+the 'quick' tier covers the sizes requests usually have and runs in well
+under a minute, the 'full' tier adds the 40-year and 10k-site cases.
+
+    python -m benchmarks.micro run                        # quick tier
+    python -m benchmarks.micro run --tier full -k meanGHI
+    python -m benchmarks.micro run --update-baseline      # store as the baseline
+    python -m benchmarks.micro check                      # exit 1 on regression
+
+`check` runs the cases in the stored baseline (benchmarks/micro_baseline.json)
+and fails when a case is slower or allocates more than the baseline by more
+than the thresholds. Cases are timed in process CPU time, so other work on
+the host does not count against them, and between runs of a fixed
+calibration kernel, so they compare in units of it: a slower machine slows
+both alike. A case over the threshold is measured again (--retries) before
+it counts, which rides out short bursts of load. Absolute times are
+reported but never fail.
+"""
+import argparse
+import datetime
+import fnmatch
+import gc
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import warnings
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.standins import synthetic_cams, synthetic_nasa  # noqa: E402
+
+BASELINE_PATH = os.path.join(REPO_ROOT, 'benchmarks', 'micro_baseline.json')
+TIERS = ['quick', 'full']
+# Each case repeats until this much CPU time is spent (MIN_REPEATS to MAX_REPEATS times)
+MIN_SECONDS = 0.5
+MIN_REPEATS = 5
+MAX_REPEATS = 20
+# The calibration kernel repeats for this long before and after each case
+CALIBRATION_SECONDS = 0.25
+
+# prepare() builds the input once and returns (kernel, make_args); make_args()
+# is called untimed before every repetition, so kernels that modify their
+# input get a fresh copy each time.
+Case = namedtuple('Case', ['name', 'tier', 'prepare'])
+
+CASES = []
+
+
+def case(name, tier='quick'):
+    def register(prepare):
+        CASES.append(Case(name, tier, prepare))
+        return prepare
+    return register
+
+
+START = datetime.datetime(1985, 1, 1)
+SPANS = {'1d': 1, '1y': 365, '10y': 3652, '40y': 14610}
+
+
+def _end(span, hourly=True):
+    """Inclusive end of a span starting at START; hourly spans end at the last hour."""
+    end = START + datetime.timedelta(days=SPANS[span])
+    return end - datetime.timedelta(hours=1) if hourly else end - datetime.timedelta(days=1)
+
+
+def _sites(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return list(zip(rng.uniform(-60, 70, n).round(4), rng.uniform(-180, 180, n).round(4)))
+
+
+def _hourly_records(span):
+    """Hourly model output shaped like generate_hourly_series() returns it."""
+    index = pd.date_range(START, _end(span), freq='h')
+    hours = index.hour.to_numpy()
+    irradiance = np.clip(np.sin((hours - 6) / 12 * np.pi), 0, None) * 1200
+    return [{'datetime': t, 'irradiance': float(v)} for t, v in zip(index.to_pydatetime(), irradiance)]
+
+
+# --- Solar model ---
+
+def _hourly_series_case(span, n_sites):
+    def prepare():
+        from model import SolarIrradianceCalculator
+        sites = _sites(n_sites)
+
+        def kernel():
+            for latitude, longitude in sites:
+                SolarIrradianceCalculator(latitude, longitude, START).generate_hourly_series(START, _end(span))
+        return kernel, tuple
+    return prepare
+
+
+for _span, _n, _tier in [('1d', 1, 'quick'), ('1y', 1, 'quick'), ('40y', 1, 'full'),
+                         ('1d', 100, 'quick'), ('1d', 10000, 'full')]:
+    case(f"model.generate_hourly_series[{_span}x{_n}]", _tier)(_hourly_series_case(_span, _n))
+
+
+def _resample_case(method, span):
+    def prepare():
+        from model import SolarIrradianceCalculator
+        calculator = SolarIrradianceCalculator(45.0, 7.0, START)
+        records = _hourly_records(span)
+        return getattr(calculator, method), lambda: (records,)
+    return prepare
+
+
+def _model_mean_case(span, resample):
+    def prepare():
+        from model import SolarIrradianceCalculator
+        calculator = SolarIrradianceCalculator(45.0, 7.0, START)
+        frame = pd.DataFrame(_hourly_records(span))
+        return calculator.meanGHI, lambda: (frame.copy(), resample)
+    return prepare
+
+
+def _tools_mean_case(span, resample):
+    def prepare():
+        from TOOLS import meanGHI
+        frame = pd.DataFrame(_hourly_records(span)).rename(columns={'irradiance': 'Irradiance'})
+        return meanGHI, lambda: (frame.copy(), resample)
+    return prepare
+
+
+for _span, _tier in [('1d', 'quick'), ('1y', 'quick'), ('40y', 'full')]:
+    case(f"model.resample_daily[{_span}]", _tier)(_resample_case('resample_daily', _span))
+    case(f"model.resample_monthly[{_span}]", _tier)(_resample_case('resample_monthly', _span))
+    case(f"model.meanGHI[{_span}]", _tier)(_model_mean_case(_span, 'D'))
+    case(f"TOOLS.meanGHI[{_span}]", _tier)(_tools_mean_case(_span, 'D'))
+
+
+# --- Upstream payload decoding ---
+
+def _nasa_decode_case(span, granularity):
+    def prepare():
+        import services
+        resolution = {'Hourly': 'hourly', 'Daily': 'daily', 'Monthly': 'monthly'}[granularity]
+        end = _end(span, hourly=False)
+        request = {'latitude': 45.0, 'longitude': 7.0, 'mode': 'date', 'timeGranularity': granularity,
+                   'startDate': START.strftime('%Y-%m-%d'), 'endDate': end.strftime('%Y-%m-%d')}
+        params = services.nasa_params(request)
+        query = {'parameters': [','.join(p.value for p in services.NASA_PRODUCTS)],
+                 'latitude': ['45.0'], 'longitude': ['7.0'],
+                 'start': [START.strftime('%Y%m%d')], 'end': [end.strftime('%Y%m%d')]}
+        body = json.dumps(synthetic_nasa(resolution, query)).encode('utf-8')
+
+        def kernel(content):
+            return services.format_nasa(params, json.loads(content)['properties']['parameter'])
+        return kernel, lambda: (body,)
+    return prepare
+
+
+def _cams_decode_case(span, time_step):
+    def prepare():
+        import services
+        from CAMS.fetch_CAMS_data import _parse_response, _to_result
+        summarization = {'1h': 'PT01H', '1d': 'P01D', '1M': 'P01M'}[time_step]
+        params = {'latitude': 45.0, 'longitude': 7.0, 'start_date': START.strftime('%Y-%m-%d'),
+                  'end_date': _end(span, hourly=False).strftime('%Y-%m-%d'), 'time_step': time_step}
+        body = synthetic_cams({
+            'latitude': '45.0', 'longitude': '7.0', 'summarization': summarization,
+            'date_begin': params['start_date'], 'date_end': params['end_date'],
+        }).encode('utf-8')
+
+        def kernel(content):
+            # Parsing plus formatting into the /api/cams response rows
+            return services.format_cams({}, params, _to_result(*_parse_response(content)))
+        return kernel, lambda: (body,)
+    return prepare
+
+
+for _span, _granularity, _tier in [('1d', 'Hourly', 'quick'), ('1y', 'Hourly', 'quick'), ('1y', 'Daily', 'quick'),
+                                   ('10y', 'Hourly', 'full'), ('40y', 'Daily', 'full')]:
+    case(f"nasa.decode[{_span} {_granularity}]", _tier)(_nasa_decode_case(_span, _granularity))
+
+for _span, _step, _tier in [('1d', '1h', 'quick'), ('1y', '1h', 'quick'), ('1y', '1d', 'quick'),
+                            ('10y', '1h', 'full'), ('40y', '1d', 'full')]:
+    case(f"cams.decode[{_span} {_step}]", _tier)(_cams_decode_case(_span, _step))
+
+
+# --- Predictor feature engineering ---
+
+def _predictor():
+    """
+    A GHIPredictor with the repository's model metadata but no estimator, so
+    feature engineering can run without trained model files, stores or an
+    elevation index.
+    """
+    import joblib
+    from rf_model import GHIPredictor
+    predictor = GHIPredictor.__new__(GHIPredictor)
+    predictor.metadata = joblib.load(os.path.join(REPO_ROOT, 'RF_MODEL', 'random_forest_metadata.joblib'))
+    predictor.is_loaded = True
+    predictor.elevation_index = None
+    predictor.feature_store = None
+    return predictor
+
+
+def _merged_frame(span):
+    """Daily merged NASA + CAMS inputs, as _merge_sources() returns them."""
+    from rf_model import SITE_FEATURE_COLS
+    index = pd.date_range(START, _end(span, hourly=False), freq='D', tz='UTC', name='datetime')
+    engineered = {'day_of_year', 'dayofyear_sin', 'dayofyear_cos', 'Month', 'kt_cams', 'kt_nasa'}
+    metadata = _predictor().metadata
+    columns = [c for c in metadata['feature_cols'] if c not in engineered and c not in SITE_FEATURE_COLS]
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(rng.uniform(0, 10, (len(index), len(columns))), index=index, columns=columns)
+
+
+def _features_case(span, n_sites):
+    def prepare():
+        predictor = _predictor()
+        merged = _merged_frame(span)
+        sites = _sites(n_sites)
+
+        def kernel():
+            cell = predictor._engineer_cell_features(merged)
+            altitudes = predictor._site_altitudes(sites)
+            return [predictor._add_site_features(cell, latitude, longitude, altitude)
+                    for (latitude, longitude), altitude in zip(sites, altitudes)]
+        return kernel, tuple
+    return prepare
+
+
+for _span, _n, _tier in [('1d', 1, 'quick'), ('1y', 1, 'quick'), ('40y', 1, 'full'),
+                         ('1y', 100, 'quick'), ('1y', 10000, 'full')]:
+    case(f"predictor.features[{_span}x{_n}]", _tier)(_features_case(_span, _n))
+
+
+# --- Chart downsampling ---
+
+def _lttb_case(span, max_points):
+    def prepare():
+        from downsample import lttb_indices
+        ghi = np.array([record['irradiance'] for record in _hourly_records(span)])
+        # GHI, DHI and DNI-like columns with gaps, as in NASA and CAMS payloads
+        values = np.column_stack([ghi, ghi * 0.3, np.where(np.arange(len(ghi)) % 97 == 0, np.nan, ghi * 0.8)])
+        return (lambda: lttb_indices(values, max_points)), tuple
+    return prepare
+
+
+for _span, _tier in [('1y', 'quick'), ('40y', 'full')]:
+    case(f"downsample.lttb[{_span}->2000]", _tier)(_lttb_case(_span, 2000))
+
+
+
+# --- Tilted irradiance ---
+
+def _gti_components(span):
+    """Hourly UTC index, solar geometry and clear-sky GHI, DHI and DNI at 45°N."""
+    import pvlib
+    from gti import solar_geometry
+    index = pd.date_range(START, _end(span), freq='h', tz='UTC')
+    clearsky = pvlib.location.Location(45.0, 7.0).get_clearsky(index + pd.Timedelta(minutes=30))
+    geometry = solar_geometry(index.as_unit('s').asi8, 45.0, 7.0, 1800)
+    return geometry, clearsky['ghi'].to_numpy(), clearsky['dhi'].to_numpy(), clearsky['dni'].to_numpy()
+
+
+def _poa_case(span, model):
+    def prepare():
+        from gti import poa_global
+        geometry, ghi, dhi, dni = _gti_components(span)
+        return (lambda: poa_global(geometry, ghi, dhi, dni, 30.0, 180.0, model)), tuple
+    return prepare
+
+
+def _sweep_case(span, model):
+    def prepare():
+        from gti import orientation_yield
+        geometry, ghi, dhi, dni = _gti_components(span)
+        # The /api/gti/optimum default grid: 19 tilts x 36 azimuths
+        tilts, azimuths = np.arange(0, 91, 5), np.arange(0, 360, 10)
+        return (lambda: orientation_yield(geometry, ghi, dhi, dni, tilts, azimuths, model)), tuple
+    return prepare
+
+
+case("gti.poa_global[1y perez]")(_poa_case('1y', 'perez'))
+for _model in ['isotropic', 'perez']:
+    case(f"gti.orientation_sweep[1y {_model}]")(_sweep_case('1y', _model))
+
+
+# --- Runner ---
+
+def measure(kernel, make_args):
+    """(seconds per repetition, peak traced bytes) for one kernel."""
+    # Untimed warm-up: lazy imports and first-call caches are not the kernel's cost
+    kernel(*make_args())
+    timings = []
+    spent = 0.0
+    while len(timings) < MAX_REPEATS and (len(timings) < MIN_REPEATS or spent < MIN_SECONDS):
+        args = make_args()
+        gc.collect()
+        start = time.process_time()
+        kernel(*args)
+        elapsed = time.process_time() - start
+        timings.append(elapsed)
+        spent += elapsed
+
+    # Separate run: tracing allocations slows the kernel down
+    args = make_args()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        kernel(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return timings, peak
+
+
+def _calibration_kernel():
+    """Fixed numpy and interpreter work, the unit case timings are compared in."""
+    # 8 MB arrays, past the CPU caches like the larger cases
+    values = np.sort(np.sin(np.arange(1_000_000) * 0.001))
+    rows = [{'datetime': i, 'value': i * 0.5} for i in range(20_000)]
+    return sum(row['value'] for row in rows) + values[0]
+
+
+def calibrate():
+    """CPU timings of the calibration kernel over CALIBRATION_SECONDS, in seconds."""
+    _calibration_kernel()
+    timings = []
+    while sum(timings) < CALIBRATION_SECONDS:
+        gc.collect()
+        start = time.process_time()
+        _calibration_kernel()
+        timings.append(time.process_time() - start)
+    return timings
+
+
+def select(tier, patterns):
+    tiers = TIERS[:TIERS.index(tier) + 1]
+    cases = [c for c in CASES if c.tier in tiers]
+    if patterns:
+        cases = [c for c in cases if any(fnmatch.fnmatch(c.name, f"*{p}*") for p in patterns)]
+    return cases
+
+
+def run_cases(cases):
+    results = {}
+    for bench in cases:
+        kernel, make_args = bench.prepare()
+        before = calibrate()
+        timings, peak = measure(kernel, make_args)
+        calibration = min(before + calibrate())
+        results[bench.name] = {
+            'tier': bench.tier,
+            'repeats': len(timings),
+            'min_s': min(timings),
+            'median_s': statistics.median(timings),
+            'calibration_s': calibration,
+            # min_s in units of the calibration kernel
+            'relative': min(timings) / calibration,
+            'peak_bytes': peak,
+        }
+        print(f"{bench.name:<46}{_format_seconds(min(timings)):>12}{min(timings) / calibration:>10.3g}x"
+              f"{_format_bytes(peak):>12}", flush=True)
+    return results
+
+
+def _format_seconds(seconds):
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+
+def _format_bytes(nbytes):
+    for unit in ('B', 'KiB', 'MiB'):
+        if nbytes < 1024:
+            return f"{nbytes:.0f} {unit}"
+        nbytes /= 1024
+    return f"{nbytes:.1f} GiB"
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'processor': platform.processor() or None,
+        'cpus': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+
+
+def regressions(baseline, results, time_threshold, memory_threshold):
+    """
+    Messages for every case slower (relative to the calibration kernel) or
+    larger than the baseline beyond the thresholds, by case name.
+    """
+    found = {}
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        slower = result['relative'] / base['relative'] - 1 if base.get('relative') else 0
+        larger = result['peak_bytes'] / base['peak_bytes'] - 1 if base['peak_bytes'] else 0
+        if slower > time_threshold:
+            found.setdefault(name, []).append(
+                f"{name}: {result['relative']:.3g} vs {base['relative']:.3g} calibration units, "
+                f"{_format_seconds(result['min_s'])} vs {_format_seconds(base['min_s'])} "
+                f"({slower:+.0%}, threshold {time_threshold:.0%})")
+        if larger > memory_threshold:
+            found.setdefault(name, []).append(
+                f"{name}: peak {_format_bytes(result['peak_bytes'])} vs {_format_bytes(base['peak_bytes'])} "
+                f"({larger:+.0%}, threshold {memory_threshold:.0%})")
+    return found
+
+
+def load_baseline(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_report(path, results):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'cases': results}, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+
+def run(args):
+    results = run_cases(select(args.tier, args.k))
+    if args.output:
+        write_report(args.output, results)
+    if args.update_baseline:
+        merged = {}
+        if os.path.exists(args.baseline):
+            merged = load_baseline(args.baseline)['cases']
+        merged.update(results)
+        write_report(args.baseline, merged)
+        print(f"Baseline updated: {args.baseline}")
+
+
+def check(args):
+    baseline = load_baseline(args.baseline)
+    if baseline.get('environment') != environment():
+        print("Warning: baseline was recorded in a different environment:", file=sys.stderr)
+        print(f"  baseline {baseline.get('environment')}\n  current  {environment()}", file=sys.stderr)
+
+    uncalibrated = [name for name, base in baseline['cases'].items() if 'relative' not in base]
+    if uncalibrated:
+        print(f"Warning: {len(uncalibrated)} baseline case(s) predate calibration; only their memory is checked. "
+              "Refresh the baseline with `run --update-baseline`.", file=sys.stderr)
+
+    cases = [c for c in select(args.tier, args.k) if c.name in baseline['cases']]
+    results = run_cases(cases)
+    found = regressions(baseline['cases'], results, args.time_threshold, args.memory_threshold)
+    # A burst of load on the host can slow one case past the threshold; a
+    # real regression survives being measured again, a burst does not.
+    for _ in range(args.retries):
+        if not found:
+            break
+        print(f"\nMeasuring {len(found)} case(s) again:")
+        for name, result in run_cases([c for c in cases if c.name in found]).items():
+            if result['relative'] < results[name]['relative']:
+                results[name] = result
+        found = regressions(baseline['cases'], results, args.time_threshold, args.memory_threshold)
+    if found:
+        messages = [message for name in found for message in found[name]]
+        print(f"\n{len(messages)} regression(s):")
+        for message in messages:
+            print(f"  {message}")
+        sys.exit(1)
+    print(f"\nNo regressions in {len(results)} cases.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks for the portal's compute kernels.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    def common(p):
+        p.add_argument('--tier', choices=TIERS, default='quick')
+        p.add_argument('-k', action='append', help="Only cases whose name contains this (repeatable).")
+        p.add_argument('--baseline', default=BASELINE_PATH)
+
+    run_parser = sub.add_parser('run', help="Run the benchmarks and print the results.")
+    common(run_parser)
+    run_parser.add_argument('--output', help="Also write the results to this JSON file.")
+    run_parser.add_argument('--update-baseline', action='store_true', help="Store the results as the baseline.")
+    run_parser.set_defaults(func=run)
+
+    check_parser = sub.add_parser('check', help="Fail when a case regressed against the baseline.")
+    common(check_parser)
+    check_parser.add_argument('--time-threshold', type=float, default=0.25, help="Allowed slowdown (0.25 = 25%%).")
+    check_parser.add_argument('--memory-threshold', type=float, default=0.10, help="Allowed peak allocation growth.")
+    check_parser.add_argument('--retries', type=int, default=2,
+                              help="Times a case that regressed is measured again before it counts.")
+    check_parser.set_defaults(func=check)
+
+    args = parser.parse_args()
+    # Kernel diagnostics would interleave with the results table
+    warnings.simplefilter('ignore')
+    logging.getLogger('rf_model').setLevel(logging.ERROR)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
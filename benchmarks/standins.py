@@ -0,0 +1,351 @@
+"""
+Local stand-ins for the NASA POWER and CAMS (SoDa WPS) services.
+
+Each stand-in is a threaded HTTP server on 127.0.0.1 that answers the same
+requests as the real service, in the same format:
+
+    NASA  GET /api/temporal/{hourly,daily,monthly}/point?parameters=...  -> JSON
+    CAMS  GET /service/wps?DataInputs=...                                -> CSV
+
+A request is answered from a recorded response when one exists in the
+fixtures directory (see `record` below); otherwise a deterministic synthetic
+response is generated for the requested site, period and parameters. Every
+response can be delayed (latency plus uniform jitter) and a fraction of them
+replaced by upstream errors, to measure the portal under slow or failing
+upstreams.
+
+Recording a real response for replay (needs network once):
+
+    python -m benchmarks.standins record "https://power.larc.nasa.gov/api/temporal/daily/point?..."
+"""
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from urllib.request import urlopen
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+NASA_UNITS = {
+    'ALLSKY_SFC_SW_DWN': 'kW-hr/m^2/day',
+    'ALLSKY_SFC_SW_DIFF': 'kW-hr/m^2/day',
+    'ALLSKY_SFC_SW_DNI': 'kW-hr/m^2/day',
+    'CLRSKY_SFC_SW_DWN': 'kW-hr/m^2/day',
+}
+
+
+def fixture_key(path_and_query):
+    """Recorded responses are stored under a hash of the request path and query."""
+    return hashlib.sha1(path_and_query.encode('utf-8')).hexdigest()
+
+
+def _clear_sky_ghi(latitude, when):
+    """Rough clear-sky GHI in W/m² at a UTC hour; enough to look like real data."""
+    day = when.timetuple().tm_yday
+    declination = 23.45 * math.sin(math.radians(360 * (284 + day) / 365))
+    hour_angle = 15 * (when.hour + 0.5 - 12)
+    lat = math.radians(latitude)
+    dec = math.radians(declination)
+    cos_zenith = math.sin(lat) * math.sin(dec) + math.cos(lat) * math.cos(dec) * math.cos(math.radians(hour_angle))
+    return max(0.0, 1000 * cos_zenith)
+
+
+def _noise(*parts):
+    """Deterministic value in [0, 1) for the given key parts."""
+    digest = hashlib.md5(repr(parts).encode('utf-8')).digest()
+    return int.from_bytes(digest[:4], 'big') / 2 ** 32
+
+
+def synthetic_nasa(resolution, query):
+    parameters = query['parameters'][0].split(',')
+    latitude, longitude = float(query['latitude'][0]), float(query['longitude'][0])
+    start = datetime.strptime(query['start'][0], '%Y%m%d')
+    end = datetime.strptime(query['end'][0], '%Y%m%d')
+
+    if resolution == 'hourly':
+        stamps = [start + timedelta(hours=h) for h in range(int((end - start).days + 1) * 24)]
+        keys = [t.strftime('%Y%m%d%H') for t in stamps]
+    elif resolution == 'daily':
+        stamps = [start + timedelta(days=d) for d in range((end - start).days + 1)]
+        keys = [t.strftime('%Y%m%d') for t in stamps]
+    else:
+        stamps, keys = [], []
+        for year in range(start.year, end.year + 1):
+            for month in range(1, 14):
+                stamps.append(datetime(year, min(month, 12), 1))
+                keys.append(f"{year}{month:02d}")
+
+    values = {}
+    for parameter in parameters:
+        series = {}
+        for key, when in zip(keys, stamps):
+            cloud = _noise(parameter, latitude, longitude, key)
+            if parameter.startswith(('ALLSKY_SFC_SW', 'CLRSKY_SFC_SW')):
+                if resolution == 'hourly':
+                    value = _clear_sky_ghi(latitude, when)
+                else:
+                    value = sum(_clear_sky_ghi(latitude, when.replace(hour=h)) for h in range(24)) / 1000
+                value *= 1.0 if parameter.startswith('CLRSKY') else (0.4 + 0.6 * cloud)
+            else:
+                value = 100 * cloud
+            series[key] = round(value, 2)
+        values[parameter] = series
+
+    return {
+        'type': 'Feature',
+        'geometry': {'type': 'Point', 'coordinates': [longitude, latitude, 0.0]},
+        'properties': {'parameter': values},
+        'header': {'title': 'NASA/POWER stand-in', 'start': query['start'][0], 'end': query['end'][0]},
+        'parameters': {p: {'units': NASA_UNITS.get(p, '-'), 'longname': p} for p in parameters},
+    }
+
+
+CAMS_STEPS = {
+    'PT01M': (timedelta(minutes=1), '0 year 0 month 0 day 0 h 1 min 0 s'),
+    'PT15M': (timedelta(minutes=15), '0 year 0 month 0 day 0 h 15 min 0 s'),
+    'PT01H': (timedelta(hours=1), '0 year 0 month 0 day 1 h 0 min 0 s'),
+    'P01D': (timedelta(days=1), '0 year 0 month 1 day 0 h 0 min 0 s'),
+    'P01M': (None, '0 year 1 month 0 day 0 h 0 min 0 s'),
+}
+CAMS_COLUMNS = ['TOA', 'Clear sky GHI', 'Clear sky BHI', 'Clear sky DHI', 'Clear sky BNI',
+                'GHI', 'BHI', 'DHI', 'BNI', 'Reliability']
+
+
+def synthetic_cams(data_inputs):
+    latitude, longitude = float(data_inputs['latitude']), float(data_inputs['longitude'])
+    begin = datetime.strptime(data_inputs['date_begin'], '%Y-%m-%d')
+    end = datetime.strptime(data_inputs['date_end'], '%Y-%m-%d') + timedelta(days=1)
+    step, period_text = CAMS_STEPS[data_inputs['summarization']]
+
+    periods = []
+    current = begin
+    while current < end:
+        if step is None:
+            following = datetime(current.year + current.month // 12, current.month % 12 + 1, 1)
+        else:
+            following = current + step
+        periods.append((current, min(following, end)))
+        current = following
+
+    lines = [
+        '# Coding: utf-8',
+        '# File format version: 4',
+        '# Title: CAMS Radiation Service stand-in',
+        f"# Date begin (ISO 8601): {begin.isoformat()}.0",
+        f"# Date end (ISO 8601): {end.isoformat()}.0",
+        f"# Latitude (positive North, ISO 19115): {latitude:.4f}",
+        f"# Longitude (positive East, ISO 19115): {longitude:.4f}",
+        '# Altitude (m): 0.00',
+        '# Time reference: Universal time (UT)',
+        f"# Summarization (integration) period: {period_text}",
+        '# Observation period;' + ';'.join(CAMS_COLUMNS),
+    ]
+    for first, last in periods:
+        hours = int((last - first).total_seconds() // 3600) or 1
+        # Irradiation in Wh/m² over the period, as the service reports it
+        clear = sum(_clear_sky_ghi(latitude, first + timedelta(hours=h)) for h in range(hours))
+        if (last - first) < timedelta(hours=1):
+            clear *= (last - first).total_seconds() / 3600
+        cloud = 0.4 + 0.6 * _noise('cams', latitude, longitude, first.isoformat())
+        ghi = clear * cloud
+        row = [clear * 1.3, clear, clear * 0.8, clear * 0.2, clear * 0.9,
+               ghi, ghi * 0.7, ghi * 0.3, ghi * 0.8, 1.0]
+        lines.append(f"{first.isoformat()}.0/{last.isoformat()}.0;" + ';'.join(f"{v:.4f}" for v in row))
+    return '\n'.join(lines) + '\n'
+
+
+class StandIn:
+    """
+    One stand-in service on a background thread.
+
+    Parameters:
+    latency_ms (float): Delay added to every response
+    jitter_ms (float): Extra uniform random delay, 0..jitter_ms
+    error_rate (float): Fraction of requests answered with an upstream error
+    fixtures_dir (str): Recorded responses to replay, when present
+    seed (int): Seed for jitter and error injection
+    """
+    service = None
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, fixtures_dir=FIXTURES_DIR, seed=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.fixtures_dir = fixtures_dir
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name=f'{self.service}-standin', daemon=True)
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _plan(self):
+        """(delay seconds, inject an error?) for the next request."""
+        with self._lock:
+            self.requests += 1
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        return delay, fail
+
+    def _recorded(self, path_and_query):
+        path = os.path.join(self.fixtures_dir, self.service, fixture_key(path_and_query))
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                return f.read()
+        return None
+
+    def respond(self, path_and_query):
+        """(status, content type, body) for a successful request."""
+        raise NotImplementedError
+
+    def error(self):
+        """(status, content type, body) for an injected upstream error."""
+        raise NotImplementedError
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                delay, fail = standin._plan()
+                time.sleep(delay)
+                try:
+                    status, content_type, body = standin.error() if fail else standin.respond(self.path)
+                except Exception as e:
+                    status, content_type, body = 400, 'text/plain', f"Bad stand-in request: {e}".encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+
+class NASAStandIn(StandIn):
+    service = 'nasa'
+
+    @property
+    def url(self):
+        """Value for NASA_POWER_URL."""
+        return f"http://127.0.0.1:{self.port}/api/temporal"
+
+    def respond(self, path_and_query):
+        recorded = self._recorded(path_and_query)
+        if recorded is not None:
+            return 200, 'application/json', recorded
+        parts = urlsplit(path_and_query)
+        resolution = parts.path.rstrip('/').split('/')[-2]
+        body = synthetic_nasa(resolution, parse_qs(parts.query))
+        return 200, 'application/json', json.dumps(body).encode('utf-8')
+
+    def error(self):
+        body = {'header': 'Stand-in injected error', 'messages': ['Service temporarily unavailable']}
+        return 503, 'application/json', json.dumps(body).encode('utf-8')
+
+
+class CAMSStandIn(StandIn):
+    service = 'cams'
+
+    @property
+    def url(self):
+        """Value for CAMS_SERVICE_URL."""
+        return f"http://127.0.0.1:{self.port}/service/wps"
+
+    def respond(self, path_and_query):
+        recorded = self._recorded(path_and_query)
+        if recorded is not None:
+            return 200, 'text/csv', recorded
+        query = urlsplit(path_and_query).query
+        # DataInputs is a raw ';'-separated list, not form-encoded
+        raw_inputs = query.split('DataInputs=', 1)[1].split('&', 1)[0]
+        data_inputs = dict(item.split('=', 1) for item in raw_inputs.split(';') if '=' in item)
+        return 200, 'text/csv', synthetic_cams(data_inputs).encode('utf-8')
+
+    def error(self):
+        body = ('<?xml version="1.0" encoding="UTF-8"?><ows:ExceptionReport><ows:Exception>'
+                '<ows:ExceptionText>Stand-in injected error</ows:ExceptionText></ows:Exception></ows:ExceptionReport>')
+        return 400, 'text/xml', body.encode('utf-8')
+
+
+def record(url, fixtures_dir=FIXTURES_DIR):
+    """Fetch a real NASA POWER or CAMS URL and store the response for replay."""
+    parts = urlsplit(url)
+    service = 'cams' if parts.path.endswith('/wps') else 'nasa'
+    path_and_query = parts.path + ('?' + parts.query if parts.query else '')
+    if service == 'nasa':
+        # The stand-in serves under /api/temporal like the real service
+        path_and_query = path_and_query[path_and_query.index('/api/temporal'):]
+    with urlopen(url, timeout=300) as response:
+        body = response.read()
+    directory = os.path.join(fixtures_dir, service)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, fixture_key(path_and_query))
+    with open(path, 'wb') as f:
+        f.write(body)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="NASA POWER and CAMS stand-in servers.")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    rec = sub.add_parser('record', help="Store a real upstream response for replay.")
+    rec.add_argument('url')
+
+    serve = sub.add_parser('serve', help="Run both stand-ins until interrupted.")
+    serve.add_argument('--latency-ms', type=float, default=0.0)
+    serve.add_argument('--jitter-ms', type=float, default=0.0)
+    serve.add_argument('--error-rate', type=float, default=0.0)
+
+    args = parser.parse_args()
+    if args.command == 'record':
+        print(record(args.url))
+        return
+
+    options = dict(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate)
+    with NASAStandIn(**options) as nasa, CAMSStandIn(**options) as cams:
+        print(f"NASA_POWER_URL={nasa.url}")
+        print(f"CAMS_SERVICE_URL={cams.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
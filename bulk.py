@@ -0,0 +1,464 @@
+"""
+Bulk site lists: one period and a set of sources for hundreds of sites.
+
+A bulk run is given a CSV of sites (a latitude and a longitude column, and
+optionally a name) and writes one long-format result file per source and
+part of BULK_PART_SITES sites, partitioned by source:
+
+    <BULK_DIR>/<bulk id>/source=nasa/part-00000.parquet
+
+NASA POWER and CAMS values are constant over a grid cell (see rf_model.py),
+so the sites of a part are fetched once per cell, at the cell centre, through
+the result cache. Cells shared with other parts, other runs or the portal are
+fetched only once. Up to BULK_WORKERS requests of a part run in parallel; the
+predictor runs once per part over all its sites.
+
+A part file is written only once complete, and the run skips parts whose file
+exists, so an interrupted run resumes where it stopped. The bulk id is a hash
+of the sites and the request, so submitting the same list again resumes it
+too. When every part is written, the run bundles them with the site list and
+a manifest into bundle.zip.
+
+Runs submitted through /api/bulk are jobs of the JobQueue, which bounds how
+many run at once and requeues those a dead worker left behind. From the
+command line:
+    python -m bulk run sites.csv --start 2023-01-01 --end 2023-12-31 --sources nasa,cams
+"""
+import argparse
+import csv
+import functools
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from lazy_imports import lazy_import
+from jobs import run_chunked
+from services import PAYLOADS, ServiceError, cached_body, get_predictor, predict_records
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+
+logger = logging.getLogger(__name__)
+
+BULK_DIR = os.getenv('BULK_DIR', os.path.join('cache', 'bulk'))
+# Upstream requests or model runs in flight per bulk run
+BULK_WORKERS = int(os.getenv('BULK_WORKERS', '4'))
+BULK_MAX_SITES = int(os.getenv('BULK_MAX_SITES', '5000'))
+# Sites per result file, and per checkpoint
+BULK_PART_SITES = int(os.getenv('BULK_PART_SITES', '100'))
+# Runs not touched for this long are removed
+BULK_RETENTION_DAYS = 7
+
+BULK_SOURCES = ['model', 'nasa', 'cams', 'predict']
+DEFAULT_SOURCES = ['model', 'nasa', 'cams']
+FORMATS = ['parquet', 'csv']
+GRANULARITIES = ['Hourly', 'Daily', 'Monthly']
+
+# Accepted headers of the site list, compared case-insensitively
+LATITUDE_COLUMNS = ('latitude', 'lat')
+LONGITUDE_COLUMNS = ('longitude', 'lon', 'lng', 'long')
+NAME_COLUMNS = ('name', 'site', 'id')
+SITE_COLUMNS = ['site_id', 'name', 'latitude', 'longitude']
+
+
+def parquet_available():
+    """Whether pandas has a Parquet engine (pyarrow or fastparquet) to write with."""
+    return any(importlib.util.find_spec(engine) is not None for engine in ('pyarrow', 'fastparquet'))
+
+
+# --- Requests ---
+
+def sites_from_rows(rows):
+    """
+    Validated sites, [{site_id, name, latitude, longitude}], from dicts keyed
+    by the site list's headers; site_id is the 1-based position in the list.
+    """
+    sites = []
+    for line, row in enumerate(rows, start=2):
+        if not isinstance(row, dict):
+            raise ServiceError(f"Site {line - 1} must be an object with latitude and longitude")
+        fields = {str(key).strip().lower(): value for key, value in row.items() if key is not None}
+        latitude = next((fields[name] for name in LATITUDE_COLUMNS if name in fields), None)
+        longitude = next((fields[name] for name in LONGITUDE_COLUMNS if name in fields), None)
+        name = next((fields[name] for name in NAME_COLUMNS if name in fields), None)
+        if latitude is None or longitude is None:
+            raise ServiceError("The site list needs a latitude and a longitude column")
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            raise ServiceError(f"Invalid coordinates for site {line - 1} (line {line})")
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ServiceError(f"Coordinates out of range for site {line - 1} (line {line})")
+        sites.append({'site_id': len(sites) + 1, 'name': str(name or '').strip(),
+                      'latitude': latitude, 'longitude': longitude})
+    if not sites:
+        raise ServiceError("The site list has no sites")
+    if len(sites) > BULK_MAX_SITES:
+        raise ServiceError(f"The site list has {len(sites)} sites; at most {BULK_MAX_SITES} are allowed")
+    return sites
+
+
+def read_sites(text):
+    """Validated sites of a CSV site list, separated by commas, semicolons or tabs."""
+    text = text.lstrip('\ufeff')
+    try:
+        dialect = csv.Sniffer().sniff(text.split('\n', 1)[0], delimiters=',;\t')
+    except csv.Error:
+        dialect = csv.excel
+    return sites_from_rows(csv.DictReader(io.StringIO(text), dialect=dialect))
+
+
+def bulk_request(request_data):
+    """Validated period, sources and output format of a bulk request."""
+    try:
+        start = datetime.strptime(request_data['startDate'], "%Y-%m-%d")
+        end = datetime.strptime(request_data['endDate'], "%Y-%m-%d")
+    except KeyError as e:
+        raise ServiceError(f"Missing required field: {e.args[0]}")
+    except (TypeError, ValueError):
+        raise ServiceError("Dates must be in YYYY-MM-DD format")
+    if end < start:
+        raise ServiceError("End date cannot be before start date")
+
+    granularity = request_data.get('timeGranularity') or 'Daily'
+    if granularity not in GRANULARITIES:
+        raise ServiceError(f"Unsupported timeGranularity: {granularity}")
+
+    sources = request_data.get('sources') or DEFAULT_SOURCES
+    if isinstance(sources, str):
+        sources = [source.strip() for source in sources.split(',') if source.strip()]
+    unknown = [source for source in sources if source not in BULK_SOURCES]
+    if unknown:
+        raise ServiceError(f"Unsupported sources: {', '.join(unknown)}")
+
+    fmt = (request_data.get('format') or ('parquet' if parquet_available() else 'csv')).lower()
+    if fmt not in FORMATS:
+        raise ServiceError(f"Unsupported format: {fmt}")
+    if fmt == 'parquet' and not parquet_available():
+        raise ServiceError("Parquet output needs the pyarrow package; ask for format=csv", 501)
+
+    return {
+        'startDate': request_data['startDate'],
+        'endDate': request_data['endDate'],
+        'timeGranularity': granularity,
+        # In a fixed order, so equal requests share one bulk id
+        'sources': [source for source in BULK_SOURCES if source in sources],
+        'format': fmt,
+    }
+
+
+# --- Result rows ---
+
+def _site_request(site, request):
+    return {'mode': 'date', 'latitude': site['latitude'], 'longitude': site['longitude'],
+            'startDate': request['startDate'], 'endDate': request['endDate'],
+            'timeGranularity': request['timeGranularity']}
+
+
+@functools.cache
+def _cell_sizes():
+    # Imported here: rf_model loads the predictor's dependencies
+    from rf_model import CAMS_GRID_DEG, NASA_GRID_LAT_DEG, NASA_GRID_LON_DEG
+    return {'nasa': (NASA_GRID_LAT_DEG, NASA_GRID_LON_DEG), 'cams': (CAMS_GRID_DEG, CAMS_GRID_DEG)}
+
+
+def cell_request(source, site, request):
+    """The request for the centre of the `source` grid cell `site` is in."""
+    from TOOLS import cell_centre, grid_cell
+    lat_step, lon_step = _cell_sizes()[source]
+    latitude, longitude = cell_centre(grid_cell(site['latitude'], site['longitude'], lat_step, lon_step),
+                                      lat_step, lon_step)
+    return dict(_site_request(site, request), latitude=latitude, longitude=longitude)
+
+
+def _data_rows(compute, request_data):
+    """(data rows, None) of a response, or ([], error message) when it cannot be served."""
+    try:
+        return compute(request_data)['data'], None
+    except ServiceError as e:
+        return [], e.message
+
+
+def _cell_rows(source, sites, request, pool):
+    """
+    (rows, errors) of the sites: each site's rows are its cell's cached
+    response, fetched once per cell; errors maps site_id to the message of
+    a cell that could not be fetched.
+    """
+    requests = [cell_request(source, site, request) for site in sites]
+    cells = list({json.dumps(cell, sort_keys=True): cell for cell in requests}.values())
+    compute = functools.partial(cached_body, source, compute=functools.partial(run_chunked, source))
+    results = pool.map(functools.partial(_data_rows, lambda cell: json.loads(compute(cell))), cells)
+    by_cell = {json.dumps(cell, sort_keys=True): result for cell, result in zip(cells, results)}
+    return _split_results(sites, [by_cell[json.dumps(cell, sort_keys=True)] for cell in requests])
+
+
+def _model_rows(sites, request, pool):
+    """(rows, errors) of the sites from the solar model; not cached, as it is cheap to recompute."""
+    return _split_results(sites, pool.map(functools.partial(_data_rows, PAYLOADS['model']),
+                                          [_site_request(site, request) for site in sites]))
+
+
+def _predict_rows(sites, request, pool):
+    """(rows, errors) of the sites' daily corrected GHI, predicted in one batch."""
+    series = get_predictor().predict_ghi_many([(site['latitude'], site['longitude']) for site in sites],
+                                              request['startDate'], request['endDate'])
+    return [predict_records(corrected_ghi) for corrected_ghi in series], {}
+
+
+def _split_results(sites, results):
+    rows, errors = [], {}
+    for site, (site_rows, error) in zip(sites, results):
+        rows.append(site_rows)
+        if error is not None:
+            errors[str(site['site_id'])] = error
+    return rows, errors
+
+
+SOURCE_ROWS = {
+    'model': _model_rows,
+    'nasa': functools.partial(_cell_rows, 'nasa'),
+    'cams': functools.partial(_cell_rows, 'cams'),
+    'predict': _predict_rows,
+}
+
+
+def sites_frame(sites, rows):
+    """Long-format frame of every site's rows, led by the site's columns."""
+    counts = [len(site_rows) for site_rows in rows]
+    frame = pd.DataFrame.from_records([row for site_rows in rows for row in site_rows])
+    if 'datetime' in frame:
+        frame.insert(0, 'datetime', frame.pop('datetime'))
+    for position, column in enumerate(SITE_COLUMNS):
+        frame.insert(position, column, np.repeat([site[column] for site in sites], counts))
+    return frame
+
+
+# --- Runs ---
+
+def _write_atomic(path, write):
+    """Write a file through `write(tmp_path)` and move it into place, so readers never see part of it."""
+    tmp = f"{path}.tmp"
+    write(tmp)
+    os.replace(tmp, path)
+
+
+class BulkRun:
+    """
+    The files of one bulk run under BULK_DIR/<bulk id>: its request and site
+    list, one result file per source and part, progress.json while running,
+    and manifest.json and bundle.zip once complete.
+    """
+
+    def __init__(self, bulk_id, root=BULK_DIR):
+        if not bulk_id or not bulk_id.isalnum():
+            raise ServiceError("Invalid bulk id")
+        self.bulk_id = bulk_id
+        self.path = os.path.abspath(os.path.join(root, bulk_id))
+
+    @classmethod
+    def create(cls, sites, request, root=BULK_DIR):
+        """The run of `sites` and a validated request, created unless it already exists."""
+        bulk_id = hashlib.sha256(json.dumps([sites, request], sort_keys=True).encode('utf-8')).hexdigest()[:24]
+        run = cls(bulk_id, root)
+        if not os.path.exists(run.file('request.json')):
+            os.makedirs(run.path, exist_ok=True)
+            _write_atomic(run.file('sites.csv'), functools.partial(_write_sites, sites))
+            _write_atomic(run.file('request.json'), functools.partial(_dump_json, data=request))
+        else:
+            # Touched, so retention counts from the latest submission
+            os.utime(run.file('request.json'))
+        return run
+
+    def file(self, *names):
+        return os.path.join(self.path, *names)
+
+    @property
+    def exists(self):
+        return os.path.exists(self.file('request.json'))
+
+    @property
+    def bundle_path(self):
+        return self.file('bundle.zip')
+
+    @property
+    def complete(self):
+        return os.path.exists(self.bundle_path)
+
+    def request(self):
+        with open(self.file('request.json')) as f:
+            return json.load(f)
+
+    def sites(self):
+        with open(self.file('sites.csv'), newline='', encoding='utf-8') as f:
+            return sites_from_rows(csv.DictReader(f))
+
+    def part_path(self, source, index, fmt):
+        return self.file(f"source={source}", f"part-{index:05d}.{fmt}")
+
+    def errors_path(self, source, index):
+        return self.file(f"source={source}", f"part-{index:05d}.errors.json")
+
+    def progress(self):
+        """The manifest once complete, else the latest progress.json, or {} before the first part."""
+        try:
+            with open(self.file('manifest.json' if self.complete else 'progress.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def run(self, progress=None, workers=BULK_WORKERS):
+        """
+        Write every missing part, then the bundle; returns the bundle's path.
+        `progress` is called with the fraction of parts done after each part.
+        """
+        if self.complete:
+            return self.bundle_path
+        request, sites = self.request(), self.sites()
+        parts = [sites[first:first + BULK_PART_SITES] for first in range(0, len(sites), BULK_PART_SITES)]
+        fmt = request['format']
+        started = time.monotonic()
+        counts = {'sites': len(sites), 'sites_done': 0, 'sites_resumed': 0, 'sites_computed': 0}
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bulk') as pool:
+            for index, part in enumerate(parts):
+                missing = [source for source in request['sources']
+                           if not os.path.exists(self.part_path(source, index, fmt))]
+                for source in missing:
+                    rows, errors = SOURCE_ROWS[source](part, request, pool)
+                    path = self.part_path(source, index, fmt)
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    # Written first: the part file marks the part as done
+                    if errors:
+                        _write_atomic(self.errors_path(source, index), functools.partial(_dump_json, data=errors))
+                    _write_atomic(path, functools.partial(_write_frame, sites_frame(part, rows), fmt))
+                counts['sites_done'] += len(part)
+                counts['sites_computed' if missing else 'sites_resumed'] += len(part)
+                status = self._write_progress(counts, time.monotonic() - started)
+                logger.info("Bulk %s: %d/%d sites (%s sites/min)", self.bulk_id, counts['sites_done'],
+                            counts['sites'], status['sites_per_minute'])
+                if progress:
+                    progress((index + 1) / len(parts))
+
+        self._bundle(request, len(parts))
+        return self.bundle_path
+
+    def _write_progress(self, counts, elapsed):
+        # Throughput of the sites computed in this run, not of the ones resumed
+        minutes = elapsed / 60
+        status = dict(counts, elapsed_seconds=round(elapsed, 1), updated_at=time.time(),
+                      sites_per_minute=round(counts['sites_computed'] / minutes, 1) if minutes > 0 else None)
+        _write_atomic(self.file('progress.json'), functools.partial(_dump_json, data=status))
+        return status
+
+    def _bundle(self, request, part_count):
+        files, errors = [], {}
+        for source in request['sources']:
+            for index in range(part_count):
+                files.append(os.path.relpath(self.part_path(source, index, request['format']), self.path))
+                if os.path.exists(self.errors_path(source, index)):
+                    with open(self.errors_path(source, index)) as f:
+                        errors.setdefault(source, {}).update(json.load(f))
+        # Sites without rows for a source, with the reason
+        manifest = dict(self.progress(), bulk_id=self.bulk_id, request=request, parts=part_count,
+                        files=files, errors=errors)
+        _write_atomic(self.file('manifest.json'), functools.partial(_dump_json, data=manifest))
+        # Parquet files are compressed already
+        compression = zipfile.ZIP_STORED if request['format'] == 'parquet' else zipfile.ZIP_DEFLATED
+
+        def write(tmp):
+            with zipfile.ZipFile(tmp, 'w', compression) as bundle:
+                for name in ['manifest.json', 'request.json', 'sites.csv', *manifest['files']]:
+                    bundle.write(self.file(name), name)
+        _write_atomic(self.bundle_path, write)
+
+
+def _dump_json(path, data):
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+
+def _write_sites(sites, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, SITE_COLUMNS)
+        writer.writeheader()
+        writer.writerows(sites)
+
+
+def _write_frame(frame, fmt, path):
+    if fmt == 'parquet':
+        frame.to_parquet(path, index=False)
+    else:
+        frame.to_csv(path, index=False)
+
+
+def purge_runs(root=BULK_DIR, days=BULK_RETENTION_DAYS):
+    """Remove runs whose request was last submitted more than `days` days ago."""
+    cutoff = time.time() - days * 86400
+    for bulk_id in os.listdir(root) if os.path.isdir(root) else []:
+        request_path = os.path.join(root, bulk_id, 'request.json')
+        if os.path.exists(request_path) and os.path.getmtime(request_path) < cutoff:
+            shutil.rmtree(os.path.join(root, bulk_id), ignore_errors=True)
+
+
+def submit_bulk(queue, sites, request_data):
+    """Create (or resume) the run of validated sites and a request and queue it; returns (run, job ID)."""
+    purge_runs()
+    run = BulkRun.create(sites, bulk_request(request_data))
+    return run, queue.submit('bulk', {'bulk_id': run.bulk_id})
+
+
+def run_bulk_job(request_data, progress):
+    """JobQueue runner of bulk jobs; the result key is the bulk id."""
+    run = BulkRun(request_data['bulk_id'])
+    if not run.exists:
+        raise ServiceError("Bulk run not found; upload the site list again", 410)
+    run.run(progress)
+    return run.bulk_id
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Fetch results for a CSV list of sites into partitioned files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help="Run (or resume) a bulk run and bundle its results")
+    run_parser.add_argument('sites', help="CSV with latitude and longitude columns, and optionally name")
+    run_parser.add_argument('--start', required=True, help="First day, YYYY-MM-DD")
+    run_parser.add_argument('--end', required=True, help="Last day, YYYY-MM-DD")
+    run_parser.add_argument('--granularity', default='Daily', choices=GRANULARITIES)
+    run_parser.add_argument('--sources', default=','.join(DEFAULT_SOURCES),
+                            help=f"Comma-separated, of {', '.join(BULK_SOURCES)}")
+    run_parser.add_argument('--format', choices=FORMATS)
+    run_parser.add_argument('--dir', default=BULK_DIR, help="Directory of bulk runs")
+    run_parser.add_argument('--workers', type=int, default=BULK_WORKERS)
+
+    status_parser = subparsers.add_parser('status', help="Show the progress of a bulk run")
+    status_parser.add_argument('bulk_id')
+    status_parser.add_argument('--dir', default=BULK_DIR)
+
+    args = parser.parse_args()
+    try:
+        if args.command == 'run':
+            with open(args.sites, newline='', encoding='utf-8-sig') as f:
+                sites = read_sites(f.read())
+            request = bulk_request({'startDate': args.start, 'endDate': args.end, 'timeGranularity': args.granularity,
+                                    'sources': args.sources, 'format': args.format})
+            run = BulkRun.create(sites, request, args.dir)
+            print(f"Bulk run {run.bulk_id}: {len(sites)} sites")
+            bundle = run.run(workers=args.workers)
+            status = run.progress()
+            print(f"Wrote {bundle} ({status['sites_computed']} sites computed, {status['sites_resumed']} resumed,"
+                  f" {status['sites_per_minute']} sites/min)")
+        else:
+            print(json.dumps(BulkRun(args.bulk_id, args.dir).progress(), indent=2, sort_keys=True))
+    except ServiceError as e:
+        parser.exit(1, f"{e.message}\n")
@@ -0,0 +1,328 @@
+"""
+Result cache for API responses.
+
+Two tiers: a small LRU inside each worker process in front of a store shared
+by every worker on the host (SQLite in WAL mode by default, or Redis when
+RESULT_CACHE_URL is a redis:// URL). A result computed by one worker is then
+served by all of them, and survives restarts. Entries expire after a TTL
+that depends on their source, and the shared store drops its least recently
+used entries once it grows past RESULT_CACHE_MAX_MB.
+"""
+import collections
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from compression import ENCODINGS, compress, should_compress
+from metrics import count_cache
+from sqlite_store import SQLiteStore
+from tracing import span
+
+RESULT_CACHE_PATH = os.getenv('RESULT_CACHE_PATH', os.path.join('cache', 'results.sqlite'))
+# redis://host:port/db to share results through Redis instead of SQLite
+RESULT_CACHE_URL = os.getenv('RESULT_CACHE_URL')
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv('RESULT_CACHE_MAX_MB', '1024')) * 1024 * 1024)
+RESULT_MEMORY_MAX_BYTES = int(float(os.getenv('RESULT_MEMORY_CACHE_MB', '64')) * 1024 * 1024)
+
+# Seconds a result stays valid, per source; None keeps it until it is evicted
+# for space. Override with RESULT_TTL_<SOURCE>, e.g. RESULT_TTL_NASA=3600.
+RESULT_TTL_SECONDS = {
+    'model': None,  # a pure function of the request
+    'nasa': 24 * 3600,  # recent days are revised upstream
+    'cams': 24 * 3600,
+    'predict': 24 * 3600,  # also changes when the model is retrained
+    'tiles': None,  # keyed by the climatology build they are rendered from
+}
+DEFAULT_TTL_SECONDS = 24 * 3600
+# Evict down to this fraction of the size limit, so eviction runs rarely
+EVICT_TO = 0.9
+# Puts between checks of the shared store's size
+EVICT_CHECK_EVERY = 32
+
+# A stored body with the ETag it is served with, and its Content-Encoding
+# (None when uncompressed)
+CachedResult = collections.namedtuple('CachedResult', 'body etag encoding')
+
+
+def cache_key(source, params):
+    """
+    Normalized key for a request: the same source and parameters always map to
+    the same key regardless of dict ordering.
+    """
+    normalized = json.dumps({'source': source, 'params': params}, sort_keys=True, default=str)
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def body_etag(body):
+    """Strong ETag for a response body."""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+
+def encoded_key(key, encoding):
+    """Key of the copy of an entry compressed with `encoding`."""
+    return key if encoding is None else f'{key}.{encoding}'
+
+
+def ttl_seconds(source):
+    override = os.getenv(f'RESULT_TTL_{source.upper()}')
+    if override is not None:
+        return float(override) or None
+    return RESULT_TTL_SECONDS.get(source, DEFAULT_TTL_SECONDS)
+
+
+class MemoryLRU:
+    """
+    CachedResults held in this process, least recently used dropped first
+    beyond max_bytes.
+    """
+
+    def __init__(self, max_bytes=RESULT_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        entry = self.get_expiring(key)
+        return None if entry is None else entry[0]
+
+    def get_expiring(self, key):
+        """(CachedResult, expires_at) for key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            result, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                self.size -= len(result.body)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, result, expires_at):
+        if len(result.body) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous[0].body)
+            self._entries[key] = (result, expires_at)
+            self.size += len(result.body)
+            while self.size > self.max_bytes:
+                _, (dropped, _) = self._entries.popitem(last=False)
+                self.size -= len(dropped.body)
+
+
+class ResultCache(SQLiteStore):
+    """
+    Serialized API results keyed by cache_key(), shared by every worker on
+    the host. Bodies are stored exactly as they are sent to clients, so a hit
+    can be returned without re-serializing.
+    """
+
+    def __init__(self, path=RESULT_CACHE_PATH, max_bytes=RESULT_CACHE_MAX_BYTES):
+        super().__init__(path, """
+            CREATE TABLE IF NOT EXISTS results (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                body BLOB NOT NULL,
+                created_at REAL NOT NULL
+            );
+        """)
+        self.max_bytes = max_bytes
+        self._puts = 0
+        self._migrate()
+
+    def _migrate(self):
+        """Add the expiry and eviction columns to caches created before they existed."""
+        conn = self._connect()
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(results)")}
+        try:
+            with conn:
+                if 'size' not in columns:
+                    conn.execute("ALTER TABLE results ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                    conn.execute("UPDATE results SET size = length(body)")
+                if 'expires_at' not in columns:
+                    conn.execute("ALTER TABLE results ADD COLUMN expires_at REAL")
+                if 'accessed_at' not in columns:
+                    conn.execute("ALTER TABLE results ADD COLUMN accessed_at REAL NOT NULL DEFAULT 0")
+                    conn.execute("UPDATE results SET accessed_at = created_at")
+        except sqlite3.OperationalError:
+            # Another worker added the columns first
+            pass
+        with conn:
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_accessed ON results (accessed_at)")
+
+    def get(self, key):
+        """(body, expires_at) for key, or None when absent or expired."""
+        conn = self._connect()
+        row = conn.execute("SELECT body, expires_at, accessed_at FROM results WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        body, expires_at, accessed_at = row
+        now = time.time()
+        if expires_at is not None and expires_at <= now:
+            return None
+        if now - accessed_at > 60:
+            # Recency for eviction; coarse, so hits rarely write
+            with conn:
+                conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+        return bytes(body), expires_at
+
+    def put(self, key, source, body, expires_at=None):
+        now = time.time()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, source, body, size, created_at, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, source, body, len(body), now, expires_at, now)
+            )
+        self._puts += 1
+        if self._puts % EVICT_CHECK_EVERY == 1:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then the least recently used ones while over max_bytes."""
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM results WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            excess = total - self.max_bytes * EVICT_TO
+            stale = []
+            for key, size in conn.execute("SELECT key, size FROM results ORDER BY accessed_at"):
+                stale.append((key,))
+                excess -= size
+                if excess <= 0:
+                    break
+            conn.executemany("DELETE FROM results WHERE key = ?", stale)
+
+
+class RedisResultCache:
+    """
+    Shared tier on a Redis server. Expiry uses Redis TTLs; size-based eviction
+    is left to the server's maxmemory policy (e.g. allkeys-lru).
+    """
+    PREFIX = 'portal:result:'
+
+    def __init__(self, url):
+        # Optional dependency, only needed with a redis:// RESULT_CACHE_URL
+        import redis
+        self._redis = redis.Redis.from_url(url)
+
+    def get(self, key):
+        pipe = self._redis.pipeline()
+        pipe.get(self.PREFIX + key)
+        pipe.pttl(self.PREFIX + key)
+        body, pttl = pipe.execute()
+        if body is None:
+            return None
+        return body, (time.time() + pttl / 1000 if pttl > 0 else None)
+
+    def put(self, key, source, body, expires_at=None):
+        ttl = None if expires_at is None else max(1, int(expires_at - time.time()))
+        self._redis.set(self.PREFIX + key, body, ex=ttl)
+
+
+class TieredResultCache:
+    """
+    The per-process MemoryLRU in front of a shared store. The shared store
+    holds bodies only; ETags are computed once per process, when an entry
+    enters the memory tier.
+
+    Bodies large enough to be compressed get a compressed copy for an
+    encoding the first time a client asks for it, stored in both tiers under
+    its own encoded_key().
+    """
+
+    def __init__(self, shared, memory=None):
+        self.shared = shared
+        self.memory = memory if memory is not None else MemoryLRU()
+
+    def get(self, key):
+        """Stored body for key, or None."""
+        result = self.get_entry(key)
+        return None if result is None else result.body
+
+    def get_entry(self, key, encoding=None):
+        """
+        CachedResult for key, compressed with `encoding` when the body is large
+        enough and uncompressed otherwise; None when key is not stored.
+        """
+        if encoding is not None:
+            entry = self._get(encoded_key(key, encoding), encoding)
+            if entry is not None:
+                return entry[0]
+        entry = self._get(key, None)
+        if entry is None:
+            return None
+        result, expires_at = entry
+        if encoding is None or not should_compress(result.body):
+            return result
+        with span('cache.compress', len(result.body)):
+            # The entry's source only labels rows of the shared store
+            return self._put_copy(key, '', result.body, encoding, expires_at)
+
+    def _get(self, key, encoding):
+        """(CachedResult, expires_at) for key from the first tier holding it, or None."""
+        with span('cache.get'):
+            entry = self.memory.get_expiring(key)
+            count_cache('result_memory', int(entry is not None), int(entry is None))
+            if entry is not None:
+                return entry
+            entry = self.shared.get(key)
+            count_cache('result_shared', int(entry is not None), int(entry is None))
+            if entry is None:
+                return None
+            body, expires_at = entry
+            result = CachedResult(body, body_etag(body), encoding)
+            self.memory.put(key, result, expires_at)
+            return result, expires_at
+
+    def _put_copy(self, key, source, body, encoding, expires_at):
+        """Store `body` compressed with `encoding` (None for as is) in both tiers and return its CachedResult."""
+        if encoding is not None:
+            body = compress(body, encoding)
+        result = CachedResult(body, body_etag(body), encoding)
+        self.memory.put(encoded_key(key, encoding), result, expires_at)
+        self.shared.put(encoded_key(key, encoding), source, body, expires_at)
+        return result
+
+    def put(self, key, source, body, encoding=None, compressible=True):
+        """
+        Store body under key and return its CachedResult in `encoding`
+        (uncompressed when body is too small), storing that compressed copy
+        too. Bodies that are already compressed, like PNG images, pass
+        compressible=False and are never compressed.
+        """
+        ttl = ttl_seconds(source)
+        expires_at = None if ttl is None else time.time() + ttl
+        with span('cache.put', len(body)):
+            result = self._put_copy(key, source, body, None, expires_at)
+            if encoding is not None and compressible and should_compress(body):
+                result = self._put_copy(key, source, body, encoding, expires_at)
+        return result
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Process-wide result cache, opened on first use."""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                if RESULT_CACHE_URL and RESULT_CACHE_URL.startswith(('redis://', 'rediss://', 'unix://')):
+                    shared = RedisResultCache(RESULT_CACHE_URL)
+                else:
+                    shared = ResultCache()
+                _result_cache = TieredResultCache(shared)
+    return _result_cache
@@ -0,0 +1,378 @@
+"""
+Irradiance climatology raster for the portal map.
+
+An offline build computes, on a regular latitude/longitude grid, the mean
+daily irradiation of every month and of the whole year from two sources:
+the solar model, evaluated hourly over a reference year, and NASA POWER
+all-sky GHI from the days already held in the predictor's feature store.
+The result is one array of shape (sources, periods, rows, cols) in a .npy
+file that every worker memory-maps, like the elevation index. A point
+lookup reads one value per source and period, and a map tile samples one
+period's plane, so neither touches an upstream API.
+
+Build it with:
+    python -m climatology build [--cellsize 0.25] [--bounds S W N E]
+"""
+import argparse
+import calendar
+import json
+import logging
+import os
+import struct
+import zlib
+from datetime import datetime, timezone
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+CLIMATOLOGY_DIR = os.getenv('CLIMATOLOGY_DIR', os.path.join('data', 'climatology'))
+
+HEADER_FILENAME = 'header.json'
+VALUES_FILENAME = 'values.npy'
+SOURCES = ['model', 'nasa']
+SOURCE_LABELS = {'model': 'Solar model (top of atmosphere)', 'nasa': 'NASA POWER all-sky GHI'}
+PERIODS = ['annual'] + [calendar.month_abbr[month].lower() for month in range(1, 13)]
+UNITS = 'kWh/m²/day'
+# Degrees; a quarter degree puts no cell centre on a boundary of NASA's 0.5° x 0.625° grid
+DEFAULT_CELLSIZE = 0.25
+WORLD_BOUNDS = (-90.0, -180.0, 90.0, 180.0)
+# Non-leap year the model is evaluated over; the model has no year-to-year variation
+REFERENCE_YEAR = 2023
+# Days of NASA data a grid cell needs in a month for that month's mean
+MIN_NASA_DAYS = 10
+
+TILE_SIZE = 256
+# Deepest zoom served; cells are already hundreds of pixels wide there, and
+# the map scales these tiles up for deeper zooms
+MAX_TILE_ZOOM = 10
+# Colour ramp from low to high irradiation, as (position, RGB) stops
+COLOR_STOPS = [(0.0, (49, 54, 149)), (0.25, (116, 173, 209)), (0.5, (254, 224, 144)),
+               (0.75, (244, 109, 67)), (1.0, (165, 0, 38))]
+TILE_ALPHA = 170
+PNG_LEVEL = 6
+
+
+class Climatology:
+    """
+    Read-only climatology raster written by build_climatology(). Values are
+    mean daily irradiation in kWh/m²/day, NaN where a source has no data.
+
+    Parameters:
+    index_dir (str): Directory written by build_climatology()
+    """
+
+    def __init__(self, index_dir=CLIMATOLOGY_DIR):
+        with open(os.path.join(index_dir, HEADER_FILENAME)) as f:
+            header = json.load(f)
+
+        self.index_dir = index_dir
+        self.header = header
+        self.lat_top = header['lat_top']
+        self.lon_left = header['lon_left']
+        self.cellsize = header['cellsize']
+        self.nrows = header['nrows']
+        self.ncols = header['ncols']
+        self.sources = header['sources']
+        self.periods = header['periods']
+        self.version = header['version']
+        self.values = np.load(os.path.join(index_dir, VALUES_FILENAME), mmap_mode='r')
+
+    @property
+    def bounds(self):
+        """(south, west, north, east) of the area the grid cells cover."""
+        half = self.cellsize / 2
+        return (self.lat_top - (self.nrows - 1) * self.cellsize - half, self.lon_left - half,
+                self.lat_top + half, self.lon_left + (self.ncols - 1) * self.cellsize + half)
+
+    def _plane(self, source, period):
+        if source not in self.sources:
+            raise ValueError(f"Unknown climatology source: {source!r}; use one of {self.sources}")
+        if period not in self.periods:
+            raise ValueError(f"Unknown climatology period: {period!r}; use one of {self.periods}")
+        return self.values[self.sources.index(source), self.periods.index(period)]
+
+    def _rows(self, latitudes):
+        """Raster rows of the cells containing `latitudes`, and which fall inside the grid."""
+        rows = np.rint((self.lat_top - np.asarray(latitudes, dtype=np.float64)) / self.cellsize)
+        inside = (rows >= 0) & (rows < self.nrows)
+        return np.where(inside, rows, 0).astype(np.int64), inside
+
+    def _cols(self, longitudes):
+        cols = np.rint((np.asarray(longitudes, dtype=np.float64) - self.lon_left) / self.cellsize)
+        inside = (cols >= 0) & (cols < self.ncols)
+        return np.where(inside, cols, 0).astype(np.int64), inside
+
+    def point(self, latitude, longitude):
+        """
+        {source: {period: value}} for the cell containing a point, None for
+        missing values; None when the point is outside the grid.
+        """
+        row, row_inside = self._rows(latitude)
+        col, col_inside = self._cols(longitude)
+        if not (row_inside and col_inside):
+            return None
+        cell = np.asarray(self.values[:, :, int(row), int(col)], dtype=np.float64)
+        return {source: {period: None if np.isnan(value) else round(float(value), 3)
+                         for period, value in zip(self.periods, values)}
+                for source, values in zip(self.sources, cell)}
+
+    def cell_center(self, latitude, longitude):
+        """(latitude, longitude) of the centre of the cell containing a point."""
+        row, _ = self._rows(latitude)
+        col, _ = self._cols(longitude)
+        return (self.lat_top - int(row) * self.cellsize, self.lon_left + int(col) * self.cellsize)
+
+    def tile(self, source, period, z, x, y):
+        """
+        Values sampled at the pixel centres of Web Mercator tile z/x/y, as a
+        TILE_SIZE x TILE_SIZE array with NaN outside the grid.
+        """
+        plane = self._plane(source, period)
+        pixels = np.arange(TILE_SIZE) + 0.5
+        scale = TILE_SIZE * 2 ** z
+        longitudes = (x * TILE_SIZE + pixels) / scale * 360 - 180
+        latitudes = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * (y * TILE_SIZE + pixels) / scale))))
+        rows, rows_inside = self._rows(latitudes)
+        cols, cols_inside = self._cols(longitudes)
+        values = np.asarray(plane[rows[:, None], cols[None, :]], dtype=np.float32)
+        values[~(rows_inside[:, None] & cols_inside[None, :])] = np.nan
+        return values
+
+    def value_range(self, source):
+        return self.header['ranges'][source]
+
+
+def _palette():
+    """PNG palette: entry 0 is transparent (no data), 1-255 run along COLOR_STOPS."""
+    positions = np.linspace(0, 1, 255)
+    stops = [position for position, _ in COLOR_STOPS]
+    colors = np.stack([np.interp(positions, stops, [rgb[channel] for _, rgb in COLOR_STOPS])
+                       for channel in range(3)], axis=1)
+    rgb = np.vstack([np.zeros((1, 3)), np.rint(colors)]).astype(np.uint8)
+    alpha = np.full(256, TILE_ALPHA, dtype=np.uint8)
+    alpha[0] = 0
+    return rgb, alpha
+
+
+def encode_png(indices, rgb, alpha):
+    """An 8-bit palette PNG of a 2-D array of palette indices."""
+    height, width = indices.shape
+    raw = np.zeros((height, width + 1), dtype=np.uint8)  # each row starts with filter type 0
+    raw[:, 1:] = indices
+
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+    return b''.join([
+        b'\x89PNG\r\n\x1a\n',
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0)),
+        chunk(b'PLTE', rgb.tobytes()),
+        chunk(b'tRNS', alpha.tobytes()),
+        chunk(b'IDAT', zlib.compress(raw.tobytes(), PNG_LEVEL)),
+        chunk(b'IEND', b''),
+    ])
+
+
+def render_tile(climatology, source, period, z, x, y):
+    """PNG of tile z/x/y, coloured over the source's value range."""
+    values = climatology.tile(source, period, z, x, y)
+    low, high = climatology.value_range(source)
+    with np.errstate(invalid='ignore'):
+        scaled = np.clip((values - low) / max(high - low, 1e-9), 0, 1)
+    indices = np.where(np.isnan(values), 0, 1 + np.rint(np.nan_to_num(scaled) * 254)).astype(np.uint8)
+    return encode_png(indices, *_palette())
+
+
+# --- Build ---
+
+def _grid(bounds, cellsize):
+    """Cell-centre latitudes (north to south) and longitudes (west to east) covering bounds."""
+    south, west, north, east = bounds
+    nrows = max(1, int(round((north - south) / cellsize)))
+    ncols = max(1, int(round((east - west) / cellsize)))
+    latitudes = north - cellsize / 2 - np.arange(nrows) * cellsize
+    longitudes = west + cellsize / 2 + np.arange(ncols) * cellsize
+    return latitudes, longitudes
+
+
+def _model_part(latitudes, longitudes, year):
+    """Model climatology (periods, rows, cols) for some rows of the grid, in a pool process."""
+    from model import extraterrestrial_irradiance_array
+
+    hours = np.arange(24, dtype=np.float64)[:, None, None]
+    latitudes = np.asarray(latitudes)[None, :, None]
+    longitudes = np.asarray(longitudes)[None, None, :]
+    days = np.array([calendar.monthrange(year, month)[1] for month in range(1, 13)], dtype=np.float64)
+    months = np.repeat(np.arange(12), days.astype(np.int64))
+    monthly = np.zeros((12, latitudes.shape[1], longitudes.shape[2]))
+    for day_of_year, month in enumerate(months, start=1):
+        hourly = extraterrestrial_irradiance_array(latitudes, longitudes, day_of_year, hours)
+        monthly[month] += hourly.sum(axis=0)
+    # Wh/m² summed over each month, as mean kWh/m² per day
+    annual = monthly.sum(axis=0) / days.sum()
+    return np.concatenate([annual[None], monthly / days[:, None, None]]) / 1000
+
+
+def model_climatology(latitudes, longitudes, year=REFERENCE_YEAR):
+    """
+    Mean daily irradiation of the solar model per period on the grid, from
+    hourly values over `year`; rows are computed on the CPU pool.
+    """
+    from cpu_pool import run_parts, split
+
+    parts = run_parts(_model_part, [(latitudes[first:stop], longitudes, year)
+                                    for first, stop in split(len(latitudes), 8)])
+    return np.concatenate(parts, axis=1)
+
+
+def nasa_climatology(latitudes, longitudes, feature_store, min_days=MIN_NASA_DAYS):
+    """
+    Mean daily NASA POWER GHI per period on the grid, from every day in the
+    feature store. Each raster cell takes the NASA grid cell its centre is
+    in. A month needs min_days days of data; the annual value needs all
+    twelve months, so missing seasons do not bias it. NaN elsewhere.
+    """
+    from NASA import NASAPowerProducts
+    from rf_model import NASA_FILL_VALUE, NASA_GRID_LAT_DEG, NASA_GRID_LON_DEG
+
+    # The same NASA values are stored once per CAMS point; keep one per NASA cell and day
+    daily = {}
+    for cell, day, value in feature_store.column_values(NASAPowerProducts.GHI.value):
+        if value is None or value == NASA_FILL_VALUE or value < 0:
+            continue
+        row, col = (int(index) for index in cell.split('|')[0].split(','))
+        daily[(row, col, day)] = value
+
+    totals, counts = {}, {}
+    for (row, col, day), value in daily.items():
+        month = int(day[5:7]) - 1
+        totals.setdefault((row, col), np.zeros(12))[month] += value
+        counts.setdefault((row, col), np.zeros(12))[month] += 1
+
+    out = np.full((len(PERIODS), len(latitudes), len(longitudes)), np.nan)
+    if not totals:
+        return out
+    cells = list(totals)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        monthly = np.array([np.where(counts[cell] >= min_days, totals[cell] / counts[cell], np.nan)
+                            for cell in cells])
+    table = np.concatenate([monthly.mean(axis=1, keepdims=True), monthly], axis=1)
+
+    # NASA cells of the raster cell centres, as in grid_cell(), looked up by sorted key
+    span = 1 << 20
+    keys = np.array([row * span + col for row, col in cells], dtype=np.int64)
+    order = np.argsort(keys)
+    keys, table = keys[order], table[order]
+    rows = np.rint(latitudes / NASA_GRID_LAT_DEG).astype(np.int64)
+    cols = np.rint(longitudes / NASA_GRID_LON_DEG).astype(np.int64)
+    wanted = (rows[:, None] * span + cols[None, :]).ravel()
+    position = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    found = keys[position] == wanted
+    flat = out.reshape(len(PERIODS), -1)
+    flat[:, found] = table[position[found]].T
+    logger.info("NASA climatology from %d days in %d grid cells.", len(daily), len(cells))
+    return out
+
+
+def build_climatology(index_dir=CLIMATOLOGY_DIR, cellsize=DEFAULT_CELLSIZE, bounds=WORLD_BOUNDS,
+                      year=REFERENCE_YEAR, feature_store_path=None, min_days=MIN_NASA_DAYS):
+    """
+    Compute the climatology raster and write it to index_dir. The files are
+    replaced atomically, so workers with the previous raster open keep
+    reading it until they reopen.
+    """
+    from feature_store import FEATURE_STORE_PATH, FeatureStore
+
+    latitudes, longitudes = _grid(bounds, cellsize)
+    values = np.full((len(SOURCES), len(PERIODS), len(latitudes), len(longitudes)), np.nan, dtype=np.float32)
+    values[SOURCES.index('model')] = model_climatology(latitudes, longitudes, year)
+
+    feature_store_path = feature_store_path or FEATURE_STORE_PATH
+    if os.path.exists(feature_store_path):
+        values[SOURCES.index('nasa')] = nasa_climatology(latitudes, longitudes, FeatureStore(feature_store_path),
+                                                         min_days)
+    else:
+        logger.warning("No feature store at %s; the NASA climatology is empty.", feature_store_path)
+
+    ranges = {}
+    for source, planes in zip(SOURCES, values):
+        high = np.nanmax(planes) if np.isfinite(planes).any() else 1.0
+        ranges[source] = [0.0, float(np.ceil(high))]
+
+    os.makedirs(index_dir, exist_ok=True)
+    values_path = os.path.join(index_dir, VALUES_FILENAME)
+    np.save(values_path + '.tmp.npy', values)
+    os.replace(values_path + '.tmp.npy', values_path)
+
+    header = {
+        'lat_top': float(latitudes[0]),
+        'lon_left': float(longitudes[0]),
+        'cellsize': cellsize,
+        'nrows': len(latitudes),
+        'ncols': len(longitudes),
+        'sources': SOURCES,
+        'periods': PERIODS,
+        'units': UNITS,
+        'ranges': ranges,
+        'reference_year': year,
+        'nasa_cells': int(np.isfinite(values[SOURCES.index('nasa')]).any(axis=0).sum()),
+        'version': datetime.now(timezone.utc).strftime('%Y%m%d%H%M%S'),
+    }
+    header_path = os.path.join(index_dir, HEADER_FILENAME)
+    with open(header_path + '.tmp', 'w') as f:
+        json.dump(header, f, indent=2)
+    os.replace(header_path + '.tmp', header_path)
+    return header
+
+
+_shared_climatology = None
+
+
+def get_climatology(index_dir=CLIMATOLOGY_DIR):
+    """
+    Process-wide Climatology, opened on first use. Returns None when no
+    raster has been built at index_dir.
+    """
+    global _shared_climatology
+    if _shared_climatology is None or _shared_climatology.index_dir != index_dir:
+        if not os.path.exists(os.path.join(index_dir, HEADER_FILENAME)):
+            return None
+        _shared_climatology = Climatology(index_dir)
+    return _shared_climatology
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Build or query the irradiance climatology raster.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Compute the raster from the solar model and the feature store")
+    build.add_argument('--index-dir', default=CLIMATOLOGY_DIR)
+    build.add_argument('--cellsize', type=float, default=DEFAULT_CELLSIZE, help="Grid spacing in degrees")
+    build.add_argument('--bounds', type=float, nargs=4, metavar=('SOUTH', 'WEST', 'NORTH', 'EAST'),
+                       default=WORLD_BOUNDS)
+    build.add_argument('--year', type=int, default=REFERENCE_YEAR, help="Year the solar model is evaluated over")
+    build.add_argument('--feature-store', help="Feature store to read NASA GHI from")
+    build.add_argument('--min-days', type=int, default=MIN_NASA_DAYS)
+
+    query = subparsers.add_parser('query', help="Look up the climatology of a point")
+    query.add_argument('latitude', type=float)
+    query.add_argument('longitude', type=float)
+    query.add_argument('--index-dir', default=CLIMATOLOGY_DIR)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        header = build_climatology(args.index_dir, args.cellsize, tuple(args.bounds), args.year,
+                                   args.feature_store, args.min_days)
+        print(f"Built {header['nrows']}x{header['ncols']} climatology in {args.index_dir}"
+              f" ({header['nasa_cells']} cells with NASA data)")
+    else:
+        values = Climatology(args.index_dir).point(args.latitude, args.longitude)
+        if values is None:
+            print("Outside the climatology grid")
+        else:
+            for source, periods in values.items():
+                print(f"{source}: " + ", ".join(f"{period} {value}" for period, value in periods.items()))
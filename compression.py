@@ -0,0 +1,69 @@
+"""
+Response compression for the API.
+
+Hourly JSON from the data routes is repetitive and compresses ten times or
+more. The encoding is negotiated from Accept-Encoding, preferring brotli when
+the optional `brotli` package is installed and falling back to gzip. Bodies
+smaller than COMPRESS_MIN_BYTES are sent as they are, since compressing them
+saves less than it costs.
+
+The result cache stores each large body already compressed (see
+cache.TieredResultCache.put), so cache hits skip compression as well as
+serialization.
+"""
+import gzip
+import os
+
+from tracing import span
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+# Supported encodings, preferred first
+ENCODINGS = ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def should_compress(body):
+    return len(body) >= COMPRESS_MIN_BYTES
+
+
+def choose_encoding(accept_encoding, available=ENCODINGS):
+    """
+    The first encoding of `available` (supported ones by default) that an
+    Accept-Encoding header allows with the highest quality, or None for identity.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name.strip().lower()] = quality
+    best, best_quality = None, 0.0
+    for encoding in available:
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    """body compressed with `encoding` ('br' or 'gzip'); the output is deterministic."""
+    with span('compress', len(body)):
+        if encoding == 'br':
+            return brotli.compress(body, quality=BROTLI_QUALITY)
+        # mtime=0 so the same body always yields the same bytes, and ETag
+        return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
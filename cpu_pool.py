@@ -0,0 +1,177 @@
+"""
+Process pool for CPU-bound work.
+
+The solar model and the predictor are Python and NumPy code holding the GIL,
+so run on a request thread a decades-long model range or a large prediction
+batch keeps one core busy while the others idle. Each server worker gets one
+ProcessPoolExecutor of cpu_workers() processes, created on first use, and large
+workloads are split by time range or by rows into parts that run on it.
+
+Big arrays do not travel through pickling: the caller places inputs and
+allocates outputs in shared memory (SharedArray), and each part attaches to
+them by name and reads or writes only its own rows, so only the block names
+and row bounds are sent to the pool.
+
+Work submitted from inside a pool process runs inline, so parts never fan
+out again.
+"""
+import atexit
+import logging
+import math
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker, shared_memory
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+logger = logging.getLogger(__name__)
+
+# Processes per server worker. By default the cores are divided among the
+# SERVER_WORKERS server worker processes, which gunicorn.conf.py sets to
+# gunicorn's worker count, so a host runs about one pool process per core.
+CPU_WORKERS = int(os.getenv('CPU_WORKERS', '0'))
+# Hours of model series per part; shorter ranges run inline
+PARALLEL_MIN_HOURS = int(os.getenv('PARALLEL_MIN_HOURS', str(24 * 92)))
+# Feature rows per prediction part; smaller batches run inline
+PARALLEL_MIN_ROWS = int(os.getenv('PARALLEL_MIN_ROWS', '50000'))
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_pool = False
+
+
+def _mark_pool_process():
+    global _in_pool
+    _in_pool = True
+
+
+def cpu_workers():
+    """CPU_WORKERS, or else this worker's share of the host's cores (at least 1)."""
+    if CPU_WORKERS > 0:
+        return CPU_WORKERS
+    server_workers = max(1, int(os.getenv('SERVER_WORKERS') or 1))
+    return max(1, (os.cpu_count() or 1) // server_workers)
+
+
+def get_cpu_pool():
+    """
+    This process's pool, created on first use; None inside a pool process or
+    when cpu_workers() is 1, where work runs inline.
+    """
+    global _pool
+    if _in_pool or cpu_workers() <= 1:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            if sys.version_info < (3, 13):
+                # Start the shared memory tracker before forking, so the pool
+                # processes share it instead of each starting one that would
+                # unlink the blocks they attached to when it exits
+                resource_tracker.ensure_running()
+            _pool = ProcessPoolExecutor(max_workers=cpu_workers(), initializer=_mark_pool_process)
+            logger.info("Started a pool of %d processes for CPU-bound work.", cpu_workers())
+        return _pool
+
+
+def shutdown_cpu_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _forget_pool():
+    # A process forked from one that had a pool (e.g. a gunicorn worker forked
+    # from a master that ran requests) must start its own
+    global _pool, _pool_lock
+    _pool, _pool_lock = None, threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pool)
+atexit.register(shutdown_cpu_pool)
+
+
+def split(total, min_size, parts=None):
+    """
+    (start, stop) bounds splitting range(total) into at most `parts` (the pool
+    size by default) nearly equal parts of at least min_size each.
+    """
+    parts = max(1, min(parts or cpu_workers(), total // max(min_size, 1)))
+    edges = [round(total * i / parts) for i in range(parts + 1)]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def run_parts(func, arguments):
+    """
+    [func(*args) for args in arguments], run on the pool when there is more
+    than one part and a pool is available. Results keep the order of
+    `arguments`; the first failing part raises.
+    """
+    pool = get_cpu_pool() if len(arguments) > 1 else None
+    if pool is None:
+        return [func(*args) for args in arguments]
+    futures = [pool.submit(func, *args) for args in arguments]
+    try:
+        return [future.result() for future in futures]
+    finally:
+        for future in futures:
+            future.cancel()
+
+
+class SharedArray:
+    """
+    A numpy array in a shared memory block. The creating process passes
+    `spec` to the parts, which open it with SharedArray.attach(spec); the
+    creator unlinks the block when leaving the `with` block.
+    """
+
+    def __init__(self, block, shape, dtype, owner):
+        self.block = block
+        self.owner = owner
+        self.array = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+    @classmethod
+    def create(cls, shape, dtype='float64'):
+        size = max(1, math.prod(shape) * np.dtype(dtype).itemsize)
+        return cls(shared_memory.SharedMemory(create=True, size=size), shape, dtype, owner=True)
+
+    @classmethod
+    def from_array(cls, values):
+        """A shared copy of `values`."""
+        values = np.ascontiguousarray(values)
+        shared = cls.create(values.shape, values.dtype)
+        shared.array[...] = values
+        return shared
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        if sys.version_info >= (3, 13):
+            # The creator owns the block; a part exiting must not unlink it
+            block = shared_memory.SharedMemory(name=name, track=False)
+        else:
+            # Pool processes share the creator's resource tracker (started
+            # before the pool was forked), where registering again is a no-op
+            block = shared_memory.SharedMemory(name=name)
+        return cls(block, shape, dtype, owner=False)
+
+    @property
+    def spec(self):
+        return self.block.name, self.array.shape, self.array.dtype.str
+
+    def close(self):
+        self.array = None
+        self.block.close()
+        if self.owner:
+            self.block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,70 @@
+"""
+Downsampling of chart-bound time series.
+
+A multi-year hourly series has far more points than the chart has pixels.
+Largest-Triangle-Three-Buckets keeps the first and last points and, from
+each of the buckets in between, the point forming the largest triangle with
+the point kept from the previous bucket and the mean of the next one. Peaks
+and troughs survive, so the downsampled line looks like the full one.
+
+Series here are evenly spaced, so point positions stand in for time.
+Several series sharing a time axis (GHI, DHI and DNI, or the sources of a
+comparison) are downsampled together: each point is scored by the sum of
+its triangles over every series, scaled to the series' range, so the rows
+kept stay aligned.
+"""
+import warnings
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+MIN_POINTS = 3
+
+
+def lttb_indices(values, max_points):
+    """
+    Sorted indices of the rows LTTB keeps from `values`, an n-point series or
+    an n×k array of k series. NaNs (missing values) are never preferred.
+    """
+    y = np.asarray(values, dtype=float)
+    if y.ndim == 1:
+        y = y[:, None]
+    n = len(y)
+    if max_points >= n or max_points < MIN_POINTS:
+        return np.arange(n)
+
+    with warnings.catch_warnings():
+        # All-NaN series
+        warnings.simplefilter('ignore', RuntimeWarning)
+        low, high = np.nanmin(y, axis=0), np.nanmax(y, axis=0)
+    low = np.nan_to_num(low)
+    scale = np.where(high > low, high - low, 1.0)
+    y = (y - low) / scale
+    present = ~np.isnan(y)
+    filled = np.where(present, y, 0.0)
+
+    # max_points - 2 buckets between the first and last points
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    counts = np.add.reduceat(present, edges[:-1], axis=0)
+    means = np.add.reduceat(filled, edges[:-1], axis=0) / np.maximum(counts, 1)
+    centers = (edges[:-1] + edges[1:] - 1) / 2
+    # The next bucket's mean for each bucket; the last one looks at the last point
+    next_x = np.append(centers[1:], n - 1)
+    next_y = np.vstack([means[1:], filled[-1:]])
+
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(max_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        ax, ay = previous, filled[previous]
+        cx, cy = next_x[bucket], next_y[bucket]
+        xs = np.arange(start, stop)[:, None]
+        # Twice the triangle areas, per series
+        areas = np.abs((ax - cx) * (y[start:stop] - ay) - (ax - xs) * (cy - ay))
+        scores = np.where(present[start:stop], areas, 0.0).sum(axis=1)
+        scores[~present[start:stop].any(axis=1)] = -1.0
+        previous = start + int(np.argmax(scores))
+        keep[bucket + 1] = previous
+    return keep
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+
+import numpy as np
+
+ELEVATION_INDEX_DIR = os.getenv('ELEVATION_INDEX_DIR', os.path.join('data', 'elevation'))
+
+HEADER_FILENAME = 'header.json'
+TILES_FILENAME = 'tiles.npy'
+DEFAULT_TILE_SIZE = 256
+NODATA = {'int16': -32768, 'float32': np.nan}
+
+
+class ElevationIndex:
+    """
+    Read-only elevation lookup over a tiled, memory-mapped DEM raster.
+
+    The raster is stored as an array of shape (tile_rows, tile_cols, tile, tile)
+    so that points close to each other fall in the same few pages. The file is
+    opened with mmap, so every worker process shares one copy of it through the
+    OS page cache and only the pages that are actually touched are read.
+
+    Parameters:
+    index_dir (str): Directory written by build_elevation_index()
+    """
+
+    def __init__(self, index_dir=ELEVATION_INDEX_DIR):
+        with open(os.path.join(index_dir, HEADER_FILENAME)) as f:
+            header = json.load(f)
+
+        self.index_dir = index_dir
+        self.lat_top = header['lat_top']
+        self.lon_left = header['lon_left']
+        self.cellsize = header['cellsize']
+        self.nrows = header['nrows']
+        self.ncols = header['ncols']
+        self.tile_size = header['tile_size']
+        self.nodata = header['nodata']
+        self._tiles = np.load(os.path.join(index_dir, TILES_FILENAME), mmap_mode='r')
+
+    @property
+    def bounds(self):
+        """(south, west, north, east) of the pixel centres covered by the index."""
+        return (self.lat_top - (self.nrows - 1) * self.cellsize, self.lon_left,
+                self.lat_top, self.lon_left + (self.ncols - 1) * self.cellsize)
+
+    def _pixels(self, rows, cols):
+        """Gather pixels by raster (row, col) through the tile layout, as float64 with NaN for nodata."""
+        t = self.tile_size
+        values = np.asarray(self._tiles[rows // t, cols // t, rows % t, cols % t], dtype=np.float64)
+        if self.nodata is not None:
+            values[values == self.nodata] = np.nan
+        return values
+
+    def elevations(self, latitudes, longitudes):
+        """
+        Bilinearly interpolated elevation in metres for arrays of points.
+
+        Points outside the raster, or whose surrounding pixels are all nodata,
+        come back as NaN. When only some of the four surrounding pixels are
+        nodata the remaining ones are re-weighted.
+        """
+        lat = np.atleast_1d(np.asarray(latitudes, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(longitudes, dtype=np.float64))
+        lat, lon = np.broadcast_arrays(lat, lon)
+
+        row_f = (self.lat_top - lat) / self.cellsize
+        col_f = (lon - self.lon_left) / self.cellsize
+        inside = (row_f >= 0) & (row_f <= self.nrows - 1) & (col_f >= 0) & (col_f <= self.ncols - 1)
+
+        result = np.full(lat.shape, np.nan)
+        if not inside.any():
+            return result
+
+        row_f = row_f[inside]
+        col_f = col_f[inside]
+        r0 = np.floor(row_f).astype(np.int64)
+        c0 = np.floor(col_f).astype(np.int64)
+        r1 = np.minimum(r0 + 1, self.nrows - 1)
+        c1 = np.minimum(c0 + 1, self.ncols - 1)
+        dr = row_f - r0
+        dc = col_f - c0
+
+        corners = np.stack([
+            self._pixels(r0, c0), self._pixels(r0, c1),
+            self._pixels(r1, c0), self._pixels(r1, c1),
+        ])
+        weights = np.stack([
+            (1 - dr) * (1 - dc), (1 - dr) * dc,
+            dr * (1 - dc), dr * dc,
+        ])
+        valid = ~np.isnan(corners)
+        weights = np.where(valid, weights, 0.0)
+        total = weights.sum(axis=0)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            values = (np.where(valid, corners, 0.0) * weights).sum(axis=0) / total
+        values[total <= 0] = np.nan
+
+        result[inside] = values
+        return result
+
+    def elevation(self, latitude, longitude):
+        """Bilinearly interpolated elevation in metres for one point, NaN outside the raster."""
+        return float(self.elevations(latitude, longitude)[0])
+
+
+def _read_esri_ascii(dem_path):
+    """Stream an ESRI ASCII grid (.asc) into (header, row iterator)."""
+    f = open(dem_path)
+    header = {}
+    while len(header) < 6:
+        pos = f.tell()
+        line = f.readline()
+        # Keys and values are separated by any run of spaces or tabs
+        fields = line.split(None, 1)
+        if len(fields) < 2 or fields[0][0].isdigit() or fields[0][0] == '-':
+            f.seek(pos)
+            break
+        key, value = fields
+        header[key.lower()] = float(value)
+
+    cellsize = header['cellsize']
+    nrows, ncols = int(header['nrows']), int(header['ncols'])
+    if 'xllcenter' in header:
+        lon_left = header['xllcenter']
+        lat_bottom = header['yllcenter']
+    else:
+        lon_left = header['xllcorner'] + cellsize / 2
+        lat_bottom = header['yllcorner'] + cellsize / 2
+
+    grid = {
+        'lat_top': lat_bottom + (nrows - 1) * cellsize,
+        'lon_left': lon_left,
+        'cellsize': cellsize,
+        'nrows': nrows,
+        'ncols': ncols,
+        'source_nodata': header.get('nodata_value'),
+    }
+
+    def rows():
+        with f:
+            for line in f:
+                values = np.array(line.split(), dtype=np.float64)
+                if values.size:
+                    yield values
+
+    return grid, rows()
+
+
+def _read_geotiff(dem_path):
+    """Read a north-up GeoTIFF with rasterio, which is only needed for this format."""
+    import rasterio
+
+    with rasterio.open(dem_path) as src:
+        transform = src.transform
+        if abs(abs(transform.a) - abs(transform.e)) > 1e-12 or transform.b or transform.d:
+            raise ValueError("Only north-up DEMs with square pixels are supported.")
+        data = src.read(1)
+        grid = {
+            'lat_top': transform.f + transform.e / 2,
+            'lon_left': transform.c + transform.a / 2,
+            'cellsize': transform.a,
+            'nrows': src.height,
+            'ncols': src.width,
+            'source_nodata': src.nodata,
+        }
+    return grid, iter(data.astype(np.float64))
+
+
+def build_elevation_index(dem_path, index_dir=ELEVATION_INDEX_DIR, tile_size=DEFAULT_TILE_SIZE, dtype='int16'):
+    """
+    Convert a DEM file into the tiled raster read by ElevationIndex.
+
+    ESRI ASCII grids (.asc) are streamed row by row with NumPy only; GeoTIFFs
+    require rasterio. Coordinates must be geographic (degrees, WGS84).
+    """
+    if dtype not in NODATA:
+        raise ValueError(f"Unsupported dtype: {dtype}. Use one of {list(NODATA)}.")
+
+    if dem_path.lower().endswith(('.tif', '.tiff')):
+        grid, rows = _read_geotiff(dem_path)
+    else:
+        grid, rows = _read_esri_ascii(dem_path)
+
+    nrows, ncols = grid['nrows'], grid['ncols']
+    tile_rows = -(-nrows // tile_size)
+    tile_cols = -(-ncols // tile_size)
+    nodata = NODATA[dtype]
+    padded_cols = tile_cols * tile_size
+
+    os.makedirs(index_dir, exist_ok=True)
+    tiles = np.lib.format.open_memmap(
+        os.path.join(index_dir, TILES_FILENAME), mode='w+', dtype=dtype,
+        shape=(tile_rows, tile_cols, tile_size, tile_size)
+    )
+    tiles[:] = nodata
+
+    count = 0
+    for r, values in enumerate(rows):
+        if values.size != ncols:
+            raise ValueError(f"Row {r} of {dem_path} has {values.size} values, expected {ncols}.")
+        if grid['source_nodata'] is not None:
+            values[values == grid['source_nodata']] = np.nan
+        if dtype == 'int16':
+            values = np.where(np.isnan(values), nodata, np.round(values))
+        row = np.full(padded_cols, nodata, dtype=dtype)
+        row[:ncols] = values
+        tiles[r // tile_size, :, r % tile_size, :] = row.reshape(tile_cols, tile_size)
+        count += 1
+    if count != nrows:
+        raise ValueError(f"{dem_path} has {count} rows, expected {nrows}.")
+    tiles.flush()
+    del tiles
+
+    header = {
+        'lat_top': grid['lat_top'],
+        'lon_left': grid['lon_left'],
+        'cellsize': grid['cellsize'],
+        'nrows': nrows,
+        'ncols': ncols,
+        'tile_size': tile_size,
+        'dtype': dtype,
+        'nodata': None if dtype == 'float32' else nodata,
+        'source': os.path.basename(dem_path),
+    }
+    with open(os.path.join(index_dir, HEADER_FILENAME), 'w') as f:
+        json.dump(header, f, indent=2)
+    return header
+
+
+_shared_index = None
+
+
+def get_elevation_index(index_dir=ELEVATION_INDEX_DIR):
+    """
+    Process-wide ElevationIndex, opened on first use. Returns None when no
+    index has been built at index_dir.
+    """
+    global _shared_index
+    if _shared_index is None or _shared_index.index_dir != index_dir:
+        if not os.path.exists(os.path.join(index_dir, HEADER_FILENAME)):
+            return None
+        _shared_index = ElevationIndex(index_dir)
+    return _shared_index
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Build or query the offline elevation index.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Convert a DEM (.asc or GeoTIFF) into a tiled index")
+    build.add_argument('dem_path')
+    build.add_argument('--index-dir', default=ELEVATION_INDEX_DIR)
+    build.add_argument('--tile-size', type=int, default=DEFAULT_TILE_SIZE)
+    build.add_argument('--dtype', choices=list(NODATA), default='int16')
+
+    query = subparsers.add_parser('query', help="Look up the elevation of a point")
+    query.add_argument('latitude', type=float)
+    query.add_argument('longitude', type=float)
+    query.add_argument('--index-dir', default=ELEVATION_INDEX_DIR)
+
+    args = parser.parse_args()
+    if args.command == 'build':
+        header = build_elevation_index(args.dem_path, args.index_dir, args.tile_size, args.dtype)
+        print(f"Built {header['nrows']}x{header['ncols']} elevation index in {args.index_dir}")
+    else:
+        index = ElevationIndex(args.index_dir)
+        print(f"{index.elevation(args.latitude, args.longitude):.1f} m")
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics import count_cache
+from sqlite_store import SQLiteStore
+
+FEATURE_STORE_PATH = os.getenv('FEATURE_STORE_PATH', os.path.join('cache', 'features.sqlite'))
+
+
+def feature_schema_hash(feature_cols, est_ghi_col, version):
+    """
+    Hash of everything that determines the shape and meaning of a stored row.
+    Rows written under a different schema are never returned, so changing the
+    model's feature_cols invalidates the store automatically.
+    """
+    schema = {
+        'feature_cols': sorted(feature_cols),
+        'est_ghi_col': est_ghi_col,
+        'version': version,
+    }
+    return hashlib.sha1(json.dumps(schema, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+class FeatureStore(SQLiteStore):
+    """
+    Persistent store of engineered predictor feature rows.
+
+    Rows are keyed by grid cell, UTC day and feature-schema hash, and are
+    stored as JSON objects so that a schema change never requires a migration.
+    The store is a single SQLite file shared by all worker processes.
+    """
+
+    def __init__(self, path=FEATURE_STORE_PATH):
+        super().__init__(path, """
+            CREATE TABLE IF NOT EXISTS features (
+                cell TEXT NOT NULL,
+                schema TEXT NOT NULL,
+                day TEXT NOT NULL,
+                row TEXT NOT NULL,
+                PRIMARY KEY (cell, schema, day)
+            );
+        """)
+
+    def get_rows(self, cell, schema, days):
+        """
+        Return the stored rows for the given days as a DataFrame indexed by
+        UTC day. Days that are not in the store are simply absent.
+        """
+        days = pd.DatetimeIndex(days)
+        if days.empty:
+            return pd.DataFrame()
+
+        day_keys = [d.strftime('%Y-%m-%d') for d in days]
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT day, row FROM features"
+            " WHERE cell = ? AND schema = ? AND day BETWEEN ? AND ?",
+            (cell, schema, min(day_keys), max(day_keys))
+        ).fetchall()
+
+        wanted = set(day_keys)
+        records = {day: json.loads(row) for day, row in rows if day in wanted}
+        count_cache('feature_store', len(records), len(wanted) - len(records))
+        if not records:
+            return pd.DataFrame()
+
+        df = pd.DataFrame.from_dict(records, orient='index').astype(float)
+        df.index = pd.to_datetime(df.index).tz_localize('UTC')
+        df.index.name = 'datetime'
+        return df.sort_index()
+
+    def put_rows(self, cell, schema, df):
+        """Store every row of df, which must be indexed by UTC day."""
+        if df.empty:
+            return
+
+        values = df.astype(float).replace({np.nan: None})
+        payload = [
+            (cell, schema, day.strftime('%Y-%m-%d'), json.dumps(row))
+            for day, row in zip(values.index, values.to_dict(orient='records'))
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO features (cell, schema, day, row) VALUES (?, ?, ?, ?)",
+                payload
+            )
+
+    def column_values(self, column):
+        """
+        Cursor over (cell, day, value) of one feature in every stored row,
+        whatever its schema; value is None where a row lacks the feature.
+        """
+        conn = self._connect()
+        return conn.execute("SELECT cell, day, json_extract(row, ?) FROM features", (f'$."{column}"',))
+
+    def prune(self, keep_schema):
+        """Delete rows written under any schema other than keep_schema."""
+        conn = self._connect()
+        with conn:
+            return conn.execute("DELETE FROM features WHERE schema != ?", (keep_schema,)).rowcount
@@ -0,0 +1,99 @@
+"""
+Plane-of-array (tilted) irradiance from GHI, DHI and DNI.
+
+Every function works on whole arrays: the solar geometry is computed once
+for the series, pvlib's transposition models run vectorized over time, and
+the orientation sweep broadcasts a column of (tilt, azimuth) pairs against
+the daylight hours, so a year of hourly data is evaluated for hundreds of
+orientations in one call rather than in a Python loop.
+
+Azimuths follow pvlib: degrees clockwise from north, 180 facing south.
+"""
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+pvlib = lazy_import('pvlib')
+
+TRANSPOSITION_MODELS = ['isotropic', 'haydavies', 'perez']
+DEFAULT_ALBEDO = 0.25
+# Orientations x hours evaluated per pvlib call by the sweep. pvlib builds a
+# dozen temporaries of that size, so blocks of about a hundred orientations
+# over a year of daylight hours keep the peak near 30 MiB, and run faster
+# than one call over the whole grid
+SWEEP_BLOCK_ELEMENTS = 500_000
+
+
+def solar_geometry(index, latitude, longitude, offset=0):
+    """
+    Solar position and extraterrestrial irradiance at UTC epoch seconds
+    `index`, shifted by `offset` seconds (half an interval puts interval
+    means at their midpoint). Returns a dict of numpy arrays.
+    """
+    times = pd.to_datetime(np.asarray(index, dtype=np.int64) + offset, unit='s', utc=True)
+    position = pvlib.solarposition.get_solarposition(times, latitude, longitude, method='nrel_numpy')
+    zenith = position['apparent_zenith'].to_numpy()
+    return {
+        'zenith': zenith,
+        'azimuth': position['azimuth'].to_numpy(),
+        'dni_extra': pvlib.irradiance.get_extra_radiation(times).to_numpy(),
+        'airmass': pvlib.atmosphere.get_relative_airmass(zenith),
+    }
+
+
+def beam_only(ghi, geometry):
+    """
+    (DHI, DNI) for a GHI with no diffuse part, such as the extraterrestrial
+    model: all of it is beam, capped at the extraterrestrial normal irradiance.
+    """
+    ghi = np.asarray(ghi, dtype=float)
+    cos_zenith = np.cos(np.radians(geometry['zenith']))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dni = np.where(cos_zenith > 0, np.minimum(ghi / cos_zenith, geometry['dni_extra']), 0.0)
+    return np.zeros_like(ghi), dni
+
+
+def _transpose(geometry, ghi, dhi, dni, tilt, azimuth, model, albedo):
+    return pvlib.irradiance.get_total_irradiance(
+        tilt, azimuth, geometry['zenith'], geometry['azimuth'], dni, ghi, dhi,
+        dni_extra=geometry['dni_extra'], airmass=geometry['airmass'], albedo=albedo, model=model,
+    )['poa_global']
+
+
+def poa_global(geometry, ghi, dhi, dni, tilt, azimuth, model='perez', albedo=DEFAULT_ALBEDO):
+    """Plane-of-array global irradiance of one orientation; zero at night, NaN where an input is missing."""
+    ghi, dhi, dni = (np.asarray(values, dtype=float) for values in (ghi, dhi, dni))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        poa = np.asarray(_transpose(geometry, ghi, dhi, dni, tilt, azimuth, model, albedo), dtype=float)
+    # pvlib leaves night and grazing-sun terms NaN (0/0); the plane sees nothing then
+    poa = np.where(geometry['zenith'] < 90, np.nan_to_num(poa, nan=0.0), 0.0)
+    return np.where(np.isfinite(ghi) & np.isfinite(dhi) & np.isfinite(dni), poa, np.nan)
+
+
+def orientation_yield(geometry, ghi, dhi, dni, tilts, azimuths, model='perez', albedo=DEFAULT_ALBEDO,
+                      hours=1.0):
+    """
+    Plane-of-array energy in kWh/m² for every combination of `tilts` and
+    `azimuths`, as a (len(tilts), len(azimuths)) array, with the number of
+    intervals it sums. Each value is an interval mean in W/m² lasting
+    `hours`. Night hours and hours missing any input are left out.
+    """
+    ghi, dhi, dni = (np.asarray(values, dtype=float) for values in (ghi, dhi, dni))
+    keep = (geometry['zenith'] < 90) & np.isfinite(ghi) & np.isfinite(dhi) & np.isfinite(dni)
+    day = {name: values[keep] for name, values in geometry.items()}
+    ghi, dhi, dni = ghi[keep], dhi[keep], dni[keep]
+
+    tilt_grid, azimuth_grid = np.meshgrid(np.asarray(tilts, dtype=float), np.asarray(azimuths, dtype=float),
+                                          indexing='ij')
+    # One row per orientation, broadcast against the daylight hours
+    tilt_column = tilt_grid.reshape(-1, 1)
+    azimuth_column = azimuth_grid.reshape(-1, 1)
+    totals = np.zeros(len(tilt_column))
+    block = max(1, SWEEP_BLOCK_ELEMENTS // max(len(ghi), 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for first in range(0, len(tilt_column), block):
+            rows = slice(first, first + block)
+            poa = np.asarray(_transpose(day, ghi, dhi, dni, tilt_column[rows], azimuth_column[rows],
+                                        model, albedo), dtype=float)
+            totals[rows] = np.nansum(np.broadcast_to(poa, (len(tilt_column[rows]), len(ghi))), axis=1)
+    return totals.reshape(tilt_grid.shape) * hours / 1000, int(keep.sum())
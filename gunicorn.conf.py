@@ -0,0 +1,33 @@
+"""Gunicorn settings, loaded automatically from the working directory."""
+import os
+
+# Workers merge their metrics through files in this directory (see metrics.py).
+# Set before anything imports prometheus_client, which picks its storage then.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join('cache', 'metrics'))
+os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'], exist_ok=True)
+
+from lazy_imports import preload  # noqa: E402
+from metrics import clear_multiprocess_dir, mark_process_dead  # noqa: E402
+
+
+def on_starting(server):
+    # Samples from a previous run would otherwise be merged into /metrics
+    clear_multiprocess_dir()
+    # Workers, forked after this, share the cores among their CPU pools (see cpu_pool.py)
+    os.environ.setdefault('SERVER_WORKERS', str(server.cfg.workers))
+    if server.cfg.preload_app:
+        # Workers are forked from the master, so they start with these
+        # already imported and share the memory they occupy
+        preload()
+
+
+def post_worker_init(worker):
+    import warm
+    if warm.WARM_ENABLED:
+        # Every worker polls; the first to claim a day's run does the warming
+        warm.start_warmer()
+
+
+def child_exit(server, worker):
+    # Drop the exited worker's in-flight gauges from the live totals
+    mark_process_dead(worker.pid)
@@ -0,0 +1,279 @@
+"""
+Background jobs for long-running data requests.
+
+Submitting a job stores it in a SQLite table and returns its ID immediately.
+Every web worker process runs a dispatcher thread that claims queued jobs
+(from any worker) while it has a free slot in its bounded thread pool, so
+the total number of concurrent jobs per process never exceeds JOB_WORKERS.
+Results are written to the result cache, and a job whose request is already
+cached completes at submission without recomputation.
+"""
+import importlib
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+
+from cache import get_result_cache
+from services import ServiceError, PAYLOADS, SOURCE_LABELS, dump_payload, error_body, full_request, request_key
+from sqlite_store import SQLiteStore
+
+JOBS_PATH = os.getenv('JOBS_PATH', os.path.join('cache', 'jobs.sqlite'))
+# Jobs running concurrently in each worker process.
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# How often the dispatcher looks for jobs queued by other worker processes.
+JOB_POLL_SECONDS = 2.0
+# Finished jobs older than this are removed.
+JOB_RETENTION_DAYS = 7
+
+# Sources whose date ranges are whole inclusive days, so yearly chunks join
+# back into exactly the single-request result. The model treats its end date
+# as a single midnight hour, so it always runs in one piece.
+CHUNKED_SOURCES = {'nasa', 'cams', 'predict'}
+# Job sources run by a function of another module, imported when one of
+# their jobs runs: function(request_data, progress) returns the result key.
+# Their jobs are always queued; the function returns early when its result
+# already exists.
+JOB_RUNNERS = {'bulk': ('bulk', 'run_bulk_job')}
+
+
+def split_request_by_year(request_data):
+    """
+    Split a date-range request into consecutive sub-requests of at most one
+    calendar year each, so a multi-year pull runs as several upstream calls
+    and can report progress. Requests that cannot be split are returned
+    unchanged.
+    """
+    try:
+        start = datetime.strptime(request_data['startDate'], "%Y-%m-%d").date()
+        end = datetime.strptime(request_data['endDate'], "%Y-%m-%d").date()
+    except (KeyError, TypeError, ValueError):
+        return [request_data]
+    if end < start:
+        return [request_data]
+
+    chunks = []
+    chunk_start = start
+    while chunk_start <= end:
+        chunk_end = min(date(chunk_start.year, 12, 31), end)
+        chunks.append(dict(request_data,
+                           startDate=chunk_start.strftime("%Y-%m-%d"),
+                           endDate=chunk_end.strftime("%Y-%m-%d")))
+        chunk_start = chunk_end + timedelta(days=1)
+    return chunks
+
+
+def run_chunked(source, request_data, progress=None):
+    """
+    Compute the payload for `source` one yearly chunk at a time and join the
+    chunks into the payload a single request would have produced.
+    """
+    compute = PAYLOADS[source]
+    chunks = split_request_by_year(request_data) if source in CHUNKED_SOURCES else [request_data]
+    if len(chunks) == 1:
+        payload = compute(request_data)
+        if progress:
+            progress(1.0)
+        return payload
+
+    payload = None
+    for i, chunk in enumerate(chunks):
+        part = compute(chunk)
+        if payload is None:
+            payload = part
+        else:
+            payload['data'].extend(part['data'])
+        if progress:
+            progress((i + 1) / len(chunks))
+
+    payload['start_date'] = request_data['startDate']
+    payload['end_date'] = request_data['endDate']
+    payload['num_points'] = len(payload['data'])
+    return payload
+
+
+class JobQueue(SQLiteStore):
+    """
+    SQLite-backed job table plus the dispatcher that runs queued jobs on a
+    bounded thread pool in this process.
+    """
+
+    def __init__(self, path=JOBS_PATH, workers=JOB_WORKERS):
+        super().__init__(path, """
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                result_key TEXT,
+                error TEXT,
+                error_status INTEGER,
+                owner TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+        """)
+        self.workers = workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='job')
+        self._slots = threading.Semaphore(workers)
+        self._wakeup = threading.Event()
+        self._requeue_orphans()
+        self._purge()
+        self._dispatcher = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, source, request_data):
+        """Queue a job and return its ID. Cached requests complete immediately."""
+        if source not in PAYLOADS and source not in JOB_RUNNERS:
+            raise ServiceError(f"Unsupported job source: {source}")
+
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        if source in JOB_RUNNERS:
+            key, done = None, False
+        else:
+            # Jobs produce full-resolution results, for export
+            request_data = full_request(request_data)
+            key = request_key(source, request_data)
+            done = get_result_cache().get(key) is not None
+
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT INTO jobs (id, source, params, status, progress, result_key, created_at, started_at, finished_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, source, json.dumps(request_data), 'done' if done else 'queued',
+                 1.0 if done else 0.0, key if done else None, now,
+                 now if done else None, now if done else None)
+            )
+        if not done:
+            self._wakeup.set()
+        return job_id
+
+    def get(self, job_id):
+        """Job row as a dict, or None."""
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT id, source, params, status, progress, result_key, error, error_status,"
+            " created_at, started_at, finished_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        keys = ['id', 'source', 'params', 'status', 'progress', 'result_key', 'error', 'error_status',
+                'created_at', 'started_at', 'finished_at']
+        job = dict(zip(keys, row))
+        job['params'] = json.loads(job['params'])
+        return job
+
+    def _claim(self):
+        """Atomically move the oldest queued job to running; returns (id, source, params) or None."""
+        conn = self._connect()
+        with conn:
+            row = conn.execute(
+                "SELECT id, source, params FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+            ).fetchone()
+            if row is None:
+                return None
+            claimed = conn.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, started_at = ? WHERE id = ? AND status = 'queued'",
+                (self.owner, time.time(), row[0])
+            ).rowcount
+        return row if claimed else None
+
+    def _set_progress(self, job_id, progress):
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (round(progress, 4), job_id))
+
+    def _finish(self, job_id, status, result_key=None, error=None, error_status=None):
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, progress = CASE WHEN ? = 'done' THEN 1.0 ELSE progress END,"
+                " result_key = ?, error = ?, error_status = ?, finished_at = ? WHERE id = ?",
+                (status, status, result_key, error, error_status, time.time(), job_id)
+            )
+
+    def _run(self, job_id, source, params):
+        try:
+            request_data = json.loads(params)
+            progress = lambda p: self._set_progress(job_id, p)
+            if source in JOB_RUNNERS:
+                module, name = JOB_RUNNERS[source]
+                key = getattr(importlib.import_module(module), name)(request_data, progress)
+            else:
+                key = request_key(source, request_data)
+                result_cache = get_result_cache()
+                if result_cache.get(key) is None:
+                    payload = run_chunked(source, request_data, progress=progress)
+                    result_cache.put(key, source, dump_payload(payload))
+            self._finish(job_id, 'done', result_key=key)
+        except Exception as e:
+            body, status = error_body(e, SOURCE_LABELS.get(source, source))
+            self._finish(job_id, 'failed', error=body['error'], error_status=status)
+        finally:
+            self._slots.release()
+            self._wakeup.set()
+
+    def _dispatch(self):
+        while True:
+            self._slots.acquire()
+            job = self._claim()
+            if job is None:
+                self._slots.release()
+                self._wakeup.wait(JOB_POLL_SECONDS)
+                self._wakeup.clear()
+                continue
+            self._pool.submit(self._run, *job)
+
+    def _requeue_orphans(self):
+        """Requeue jobs left running by a process on this host that no longer exists."""
+        host = socket.gethostname()
+        conn = self._connect()
+        rows = conn.execute("SELECT id, owner FROM jobs WHERE status = 'running'").fetchall()
+        for job_id, owner in rows:
+            owner_host, _, pid = (owner or '').rpartition(':')
+            if owner_host != host or not pid.isdigit():
+                continue
+            try:
+                os.kill(int(pid), 0)
+                continue
+            except ProcessLookupError:
+                pass
+            except PermissionError:
+                continue
+            with conn:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', owner = NULL, progress = 0 WHERE id = ? AND status = 'running'",
+                    (job_id,)
+                )
+
+    def _purge(self):
+        cutoff = time.time() - JOB_RETENTION_DAYS * 86400
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM jobs WHERE status IN ('done', 'failed') AND finished_at < ?", (cutoff,))
+
+
+_job_queue = None
+_job_queue_lock = threading.Lock()
+
+
+def get_job_queue():
+    """
+    Process-wide JobQueue, created on first use so that its threads start in
+    the worker process rather than in a pre-forking parent.
+    """
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue()
+    return _job_queue
@@ -0,0 +1,55 @@
+"""
+Deferred imports of heavy dependencies.
+
+pandas, numpy, pvlib and geopy account for most of a worker's start-up time
+but are only needed by the data routes. Modules bind them with
+lazy_import(), which returns a stand-in that imports the real module on its
+first attribute access, so pages like / and /help never load them.
+
+preload() imports all of them at once. gunicorn.conf.py calls it in the
+master process when the server runs with --preload, so the workers forked
+from it start with everything loaded and share those pages.
+"""
+import importlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Heavy modules only imported inside functions, loaded by preload() along
+# with every module bound through lazy_import()
+PRELOAD_MODULES = ['model', 'rf_model']
+
+_registered = []
+
+
+class LazyModule:
+    """Imports `name` on first attribute access and forwards to it."""
+
+    def __init__(self, name):
+        self._lazy_name = name
+
+    def __getattr__(self, attr):
+        # import_module serializes concurrent first imports on the import lock
+        value = getattr(importlib.import_module(self._lazy_name), attr)
+        # Later lookups of the same attribute no longer come through here
+        setattr(self, attr, value)
+        return value
+
+    def __repr__(self):
+        return f"<lazy module '{self._lazy_name}'>"
+
+
+def lazy_import(name):
+    """Module `name`, imported on first use; `np = lazy_import('numpy')`."""
+    if name not in _registered:
+        _registered.append(name)
+    return LazyModule(name)
+
+
+def preload():
+    """Import every deferred module now."""
+    for name in _registered + PRELOAD_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            logger.warning("Could not preload %s: %s", name, e)
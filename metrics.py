@@ -0,0 +1,138 @@
+"""
+Prometheus metrics for the portal.
+
+Under gunicorn, metrics are collected in multiprocess mode: gunicorn.conf.py
+sets PROMETHEUS_MULTIPROC_DIR before this module is imported, every worker
+process writes its samples to memory-mapped files there, and /metrics merges
+the files of all workers, so counters and histograms add up across gunicorn
+workers. The gunicorn hooks clear the directory when the server starts and
+drop the in-flight gauges of workers that exit.
+
+Anywhere else (python app.py, flask run, the command-line tools) the variable
+is unset and samples stay in the process's own registry, leaving no files
+behind.
+"""
+import contextlib
+import glob
+import os
+import time
+
+# prometheus_client picks its storage backend when imported, so the server
+# must set PROMETHEUS_MULTIPROC_DIR before anything imports this module
+METRICS_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+from prometheus_client import (  # noqa: E402
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+# Upstream calls can take up to the CAMS timeout (180 s)
+UPSTREAM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 180)
+BYTES_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+REQUEST_SECONDS = Histogram(
+    'portal_request_duration_seconds', 'Time spent serving a request.',
+    ['route', 'method', 'status'])
+RESPONSE_BYTES = Histogram(
+    'portal_response_bytes', 'Size of response bodies.',
+    ['route'], buckets=BYTES_BUCKETS)
+UPSTREAM_SECONDS = Histogram(
+    'portal_upstream_duration_seconds', 'Time spent waiting for an upstream API.',
+    ['upstream', 'outcome'], buckets=UPSTREAM_BUCKETS)
+UPSTREAM_IN_FLIGHT = Gauge(
+    'portal_upstream_in_flight', 'Upstream API calls currently in progress.',
+    ['upstream'], multiprocess_mode='livesum')
+STAGE_SECONDS = Histogram(
+    'portal_stage_duration_seconds', 'Time spent in a pipeline stage.',
+    ['stage'])
+MODEL_SECONDS = Histogram(
+    'portal_model_inference_seconds', 'Time spent computing model outputs.',
+    ['model'])
+CACHE_LOOKUPS = Counter(
+    'portal_cache_lookups_total', 'Cache lookups by cache and result (hit or miss).',
+    ['cache', 'result'])
+WARM_PREFETCHES = Counter(
+    'portal_warm_prefetch_total', 'Requests handled by the cache warmer, by source and outcome.',
+    ['source', 'outcome'])
+
+
+def observe_request(route, method, status, seconds, nbytes=None):
+    REQUEST_SECONDS.labels(route, method, str(status)).observe(seconds)
+    if nbytes is not None:
+        RESPONSE_BYTES.labels(route).observe(nbytes)
+
+
+def count_cache(cache, hits, misses=0):
+    """Record cache lookups; hits and misses are counts (rows, days or requests)."""
+    if hits:
+        CACHE_LOOKUPS.labels(cache, 'hit').inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, 'miss').inc(misses)
+
+
+@contextlib.contextmanager
+def time_model(model):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        MODEL_SECONDS.labels(model).observe(time.perf_counter() - start)
+
+
+class UpstreamCall:
+    """
+    Times one upstream API call and tracks it as in flight. The outcome is
+    'error' when the block raises or mark_error() is called, else 'ok'.
+    Usable as a sync or async context manager.
+    """
+
+    def __init__(self, upstream):
+        self.upstream = upstream
+        self.outcome = 'ok'
+
+    def mark_error(self):
+        self.outcome = 'error'
+
+    def __enter__(self):
+        UPSTREAM_IN_FLIGHT.labels(self.upstream).inc()
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.outcome = 'error'
+        UPSTREAM_SECONDS.labels(self.upstream, self.outcome).observe(time.perf_counter() - self._start)
+        UPSTREAM_IN_FLIGHT.labels(self.upstream).dec()
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+def upstream_call(upstream):
+    return UpstreamCall(upstream)
+
+
+def render():
+    """(body, content type) for /metrics, merged across all worker processes."""
+    if METRICS_DIR is None:
+        return generate_latest(), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def clear_multiprocess_dir():
+    """Remove samples left by a previous server run; call before workers start."""
+    if METRICS_DIR is None:
+        return
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.db')):
+        os.remove(path)
+
+
+def mark_process_dead(pid):
+    if METRICS_DIR is not None:
+        multiprocess.mark_process_dead(pid)
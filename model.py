@@ -4,6 +4,10 @@ from typing import Dict, List
 from math import modf
 import pandas as pd
 
+from tracing import span
+from cpu_pool import PARALLEL_MIN_HOURS, SharedArray, get_cpu_pool, run_parts, split
+from TOOLS.aggregate import PeriodStats, period_mean_std
+
 class SolarIrradianceCalculator:
     """
     A class to calculate extraterrestrial solar irradiance using Spencer's formula.
@@ -108,6 +112,7 @@ class SolarIrradianceCalculator:
             return 0.0
 
 
+    @span('model.hourly_series')
     def generate_hourly_series(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[Dict]:
         """
         Generate hourly extraterrestrial irradiance values between two dates
@@ -119,24 +124,37 @@ class SolarIrradianceCalculator:
         Returns:
             List of dictionaries with 'datetime' and 'irradiance' keys
             """
-        hourly_data = []
-        current = start_date
-        delta = datetime.timedelta(hours=1)
+        values = self.hourly_irradiance(start_date, end_date)
+        return [{'datetime': start_date + i * HOUR, 'irradiance': value} for i, value in enumerate(values)]
 
+    def hourly_irradiance(self, start_date: datetime.datetime, end_date: datetime.datetime) -> List[float]:
+        """
+        Hourly extraterrestrial irradiance values from start_date to end_date
+        (inclusive). Long ranges are split into parts computed on the CPU
+        pool, which write their values straight into a shared array.
+        """
+        parts = split(hour_count(start_date, end_date), PARALLEL_MIN_HOURS)
+        if len(parts) == 1 or get_cpu_pool() is None:
+            return self._irradiance_values(start_date, end_date)
+        with SharedArray.create((parts[-1][1],)) as out:
+            run_parts(_irradiance_part, [(self.latitude, self.longitude, start_date, first, stop, out.spec)
+                                         for first, stop in parts])
+            return out.array.tolist()
+
+    def _irradiance_values(self, start_date, end_date):
+        values = []
+        current = start_date
         while current <= end_date:
             model = SolarIrradianceCalculator(
                 self.latitude,
                 self.longitude,
                 current
             )
-            hourly_data.append({
-                'datetime': current,
-                'irradiance': model.extraterrestrial_irradiance()
-            })
-            current += delta
-
-        return hourly_data
+            values.append(model.extraterrestrial_irradiance())
+            current += HOUR
+        return values
 
+    @span('model.resample')
     def resample_daily(self, hourly_data: List[Dict]) -> List[Dict]:
         """
         Resample hourly data to daily averages
@@ -154,6 +172,7 @@ class SolarIrradianceCalculator:
 
         return daily[['datetime', 'irradiance']].to_dict('records')
 
+    @span('model.resample')
     def resample_monthly(self, hourly_data: List[Dict]) -> List[Dict]:
         """
         Resample hourly data to monthly averages
@@ -175,16 +194,101 @@ class SolarIrradianceCalculator:
 
     def meanGHI(self, df, resample='D'):
         """
-        Calculate the mean Global Horizontal Irradiance (GHI) from a DataFrame.
+        Calculate the mean Global Horizontal Irradiance (GHI) from a DataFrame,
+        per period of `resample`, with upper and lower bands of one standard
+        deviation. The DataFrame is left unchanged.
         """
-        df['datetime'] = pd.to_datetime(df['datetime'])
-        df.set_index('datetime', inplace=True)
+        return band_records(*period_mean_std(pd.to_datetime(df['datetime']).to_numpy(),
+                                             df['irradiance'].to_numpy(), resample))
+
+    @span('model.period_stats')
+    def period_stats(self, start_date: datetime.datetime, end_date: datetime.datetime,
+                     freq: str = 'D') -> PeriodStats:
+        """
+        PeriodStats of the hourly series between two dates (inclusive). Long
+        ranges are split into parts aggregated on the CPU pool and merged;
+        each part generates and aggregates its series a year at a time, so
+        memory stays bounded however long the range is.
+        """
+        parts = split(hour_count(start_date, end_date), PARALLEL_MIN_HOURS)
+        stats = PeriodStats(freq)
+        for part in run_parts(_period_stats_part, [
+                (self.latitude, self.longitude, start_date + first * HOUR, start_date + (stop - 1) * HOUR, freq)
+                for first, stop in parts]):
+            stats.merge(part)
+        return stats
+
+
+HOUR = datetime.timedelta(hours=1)
+
+
+def hour_count(start_date: datetime.datetime, end_date: datetime.datetime) -> int:
+    """Number of hourly steps from start_date to end_date, both included."""
+    return max(0, (end_date - start_date) // HOUR + 1)
+
+
+def extraterrestrial_irradiance_array(latitude, longitude, day_of_year, hour):
+    """
+    SolarIrradianceCalculator.extraterrestrial_irradiance() over arrays, for
+    grids of sites and times: the arguments broadcast against each other,
+    `hour` being decimal hours of the (naive) wall-clock time. Returns W/m²,
+    0 where the sun is below the horizon.
+    """
+    declination = np.deg2rad(23.45 * np.sin(np.deg2rad(360 * (284 + day_of_year) / 365)))
+    B = np.deg2rad((day_of_year - 1) * 360 / 365)
+    equation_of_time = 9.87 * np.cos(2*B) - 7.53 * np.sin(B) - 1.5 * np.sin(B)
+    solar_time = (hour + equation_of_time / 60 + np.asarray(longitude) / 15) % 24
+    hour_angle = np.deg2rad(15 * (solar_time - 12))
+    lat_rad = np.deg2rad(latitude)
+    sin_elevation = (np.sin(declination) * np.sin(lat_rad) +
+                     np.cos(declination) * np.cos(lat_rad) * np.cos(hour_angle))
+    correction_factor = (
+        1.000110 +
+        0.034221 * np.cos(B) +
+        0.001280 * np.sin(B) +
+        0.000719 * np.cos(2*B) +
+        0.000077 * np.sin(2*B)
+    )
+    irradiance = SolarIrradianceCalculator.SOLAR_CONSTANT * correction_factor * sin_elevation
+    return np.round(np.maximum(irradiance, 0.0), 2)
+
+
+def _irradiance_part(latitude, longitude, start_date, first, stop, out_spec):
+    """Fills rows first:stop of a shared hourly_irradiance() output, in a pool process."""
+    model = SolarIrradianceCalculator(latitude, longitude, start_date)
+    values = model._irradiance_values(start_date + first * HOUR, start_date + (stop - 1) * HOUR)
+    with SharedArray.attach(out_spec) as out:
+        out.array[first:stop] = values
+
+
+def _period_stats_part(latitude, longitude, start_date, end_date, freq):
+    """PeriodStats of one part of a period_stats() range, streamed a year at a time."""
+    model = SolarIrradianceCalculator(latitude, longitude, start_date)
+    stats = PeriodStats(freq)
+    current = start_date
+    while current <= end_date:
+        chunk_end = min(end_date, datetime.datetime(current.year + 1, 1, 1) - HOUR)
+        values = model.hourly_irradiance(current, chunk_end)
+        timestamps = np.datetime64(current, 's') + np.arange(len(values)) * np.timedelta64(1, 'h')
+        stats.update(timestamps, values)
+        current = chunk_end + HOUR
+    return stats
+
+
+def mean_bands(stats: PeriodStats) -> List[Dict]:
+    """
+    Records of 'datetime', 'mean', 'upper' and 'lower' (mean ± one standard
+    deviation) for every period from the first to the last in `stats`; NaN
+    where a period has too few values.
+    """
+    columns = stats.result(fill=True)
+    return band_records(columns['period'], columns['mean'], columns['std'])
 
-        # Resample by calendar day: compute mean and std of the 24 hourly values
-        daily_stats = df['irradiance'].resample(resample).agg(['mean', 'std']).reset_index()
 
-        # compute upper & lower for quick inspection
-        daily_stats['upper'] = daily_stats['mean'] + daily_stats['std']
-        daily_stats['lower'] = daily_stats['mean'] - daily_stats['std'] 
-        return daily_stats[['datetime', 'mean', 'upper', 'lower']].to_dict('records')
+def band_records(periods, mean, std) -> List[Dict]:
+    """Records as mean_bands() returns them, from period labels and their mean and standard deviation."""
+    rows = zip(np.asarray(periods).astype('datetime64[s]').tolist(),
+               mean.tolist(), (mean + std).tolist(), (mean - std).tolist())
+    return [{'datetime': start, 'mean': average, 'upper': upper, 'lower': lower}
+            for start, average, upper, lower in rows]
 
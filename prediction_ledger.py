@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from metrics import count_cache
+from sqlite_store import SQLiteStore
+
+PREDICTION_LEDGER_PATH = os.getenv('PREDICTION_LEDGER_PATH', os.path.join('cache', 'predictions.sqlite'))
+
+
+def site_key(latitude, longitude):
+    """Ledger key for a site; ~10 m precision is plenty to tell sites apart."""
+    return f"{float(latitude):.4f},{float(longitude):.4f}"
+
+
+class PredictionLedger(SQLiteStore):
+    """
+    Per-site record of daily corrected GHI predictions.
+
+    Every row carries the model version that produced it, a hash of the
+    feature row it was predicted from, and whether those inputs were final
+    (settled) at the time. Rows from another model version are never
+    returned, so deploying a new model starts a fresh ledger.
+    """
+
+    def __init__(self, path=PREDICTION_LEDGER_PATH):
+        super().__init__(path, """
+            CREATE TABLE IF NOT EXISTS predictions (
+                site TEXT NOT NULL,
+                model_version TEXT NOT NULL,
+                day TEXT NOT NULL,
+                value REAL,
+                input_hash TEXT NOT NULL,
+                settled INTEGER NOT NULL,
+                PRIMARY KEY (site, model_version, day)
+            );
+        """)
+
+    def get_rows(self, site, model_version, days):
+        """
+        Return the ledger rows for the given days as a DataFrame indexed by UTC
+        day with columns value, input_hash and settled.
+        """
+        days = pd.DatetimeIndex(days)
+        columns = ['value', 'input_hash', 'settled']
+        if days.empty:
+            return pd.DataFrame(columns=columns)
+
+        day_keys = [d.strftime('%Y-%m-%d') for d in days]
+        rows = self._connect().execute(
+            "SELECT day, value, input_hash, settled FROM predictions"
+            " WHERE site = ? AND model_version = ? AND day BETWEEN ? AND ?",
+            (site, model_version, min(day_keys), max(day_keys))
+        ).fetchall()
+
+        df = pd.DataFrame(rows, columns=['day'] + columns)
+        df = df[df['day'].isin(day_keys)]
+        count_cache('prediction_ledger', len(df), len(set(day_keys)) - len(df))
+        df.index = pd.to_datetime(df.pop('day')).dt.tz_localize('UTC')
+        df.index.name = 'datetime'
+        df['value'] = df['value'].astype(float)
+        df['settled'] = df['settled'].astype(bool)
+        return df.sort_index()
+
+    def put_rows(self, site, model_version, df):
+        """Upsert rows of a DataFrame shaped like get_rows() output."""
+        if df.empty:
+            return
+
+        values = df['value'].astype(float).replace({np.nan: None})
+        payload = [
+            (site, model_version, day.strftime('%Y-%m-%d'), value, str(input_hash), int(bool(settled)))
+            for day, value, input_hash, settled in zip(df.index, values, df['input_hash'], df['settled'])
+        ]
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO predictions"
+                " (site, model_version, day, value, input_hash, settled) VALUES (?, ?, ?, ?, ?, ?)",
+                payload
+            )
+
+    def prune(self, keep_model_version):
+        """Delete rows produced by any model version other than keep_model_version."""
+        conn = self._connect()
+        with conn:
+            return conn.execute(
+                "DELETE FROM predictions WHERE model_version != ?", (keep_model_version,)
+            ).rowcount
@@ -0,0 +1,195 @@
+"""
+On-demand profiling of single requests.
+
+A request sent with ?profile=1 (deterministic, cProfile) or ?profile=sample
+(sampling) and a valid X-Profile-Token header is run under a profiler, and
+the result is stored under PROFILE_DIR for download from /admin/profiles:
+
+    cProfile    <id>.prof  pstats file (snakeviz, `python -m pstats`, gprof2dot)
+    sample      <id>.txt   collapsed stacks, one "frame;frame;... count" per
+                           line (flamegraph.pl, speedscope, inferno)
+
+The cProfile mode records every call in the handler's thread but slows it
+down several times; the sampling mode reads the handler thread's stack every
+PROFILE_SAMPLE_INTERVAL seconds from a helper thread and costs little.
+Neither sees work the handler hands to other threads or processes.
+
+Profiling is disabled unless PROFILE_TOKEN is set. Each worker process
+profiles at most one request at a time and at most PROFILE_MAX_PER_HOUR per
+hour; requests over the cap run normally, unprofiled.
+"""
+import collections
+import cProfile
+import glob
+import hmac
+import os
+import sys
+import threading
+import time
+import uuid
+
+PROFILE_DIR = os.getenv('PROFILE_DIR', os.path.join('cache', 'profiles'))
+PROFILE_TOKEN = os.getenv('PROFILE_TOKEN')
+PROFILE_MAX_PER_HOUR = int(os.getenv('PROFILE_MAX_PER_HOUR', '6'))
+PROFILE_SAMPLE_INTERVAL = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+# Older artifacts are deleted once there are more than this many
+PROFILE_KEEP = 50
+
+MODES = {'1': 'cprofile', 'cprofile': 'cprofile', 'sample': 'sample'}
+EXTENSIONS = {'cprofile': '.prof', 'sample': '.txt'}
+
+
+def enabled():
+    return bool(PROFILE_TOKEN)
+
+
+def authorized(token):
+    return enabled() and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+class RateCap:
+    """At most one active profile per process and `per_hour` started per rolling hour."""
+
+    def __init__(self, per_hour):
+        self.per_hour = per_hour
+        self._started = collections.deque()
+        self._active = False
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._started and now - self._started[0] > 3600:
+                self._started.popleft()
+            if self._active or len(self._started) >= self.per_hour:
+                return False
+            self._started.append(now)
+            self._active = True
+            return True
+
+    def release(self):
+        with self._lock:
+            self._active = False
+
+
+_cap = RateCap(PROFILE_MAX_PER_HOUR)
+
+
+class _StackSampler(threading.Thread):
+    """Counts the stacks of one thread, sampled at a fixed interval."""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = collections.Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class RequestProfiler:
+    """Profiles the calling thread between start() and stop()."""
+
+    def __init__(self, mode, label):
+        self.mode = mode
+        self.id = f"{time.strftime('%Y%m%dT%H%M%S')}-{label.strip('/').replace('/', '_') or 'root'}-{uuid.uuid4().hex[:8]}"
+        self._profile = None
+        self._sampler = None
+
+    @property
+    def filename(self):
+        return self.id + EXTENSIONS[self.mode]
+
+    def start(self):
+        if self.mode == 'cprofile':
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = _StackSampler(threading.get_ident(), PROFILE_SAMPLE_INTERVAL)
+            self._sampler.start()
+
+    def stop(self):
+        """Stop profiling and write the artifact; returns its file name."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, self.filename)
+        if self.mode == 'cprofile':
+            self._profile.disable()
+            self._profile.dump_stats(path)
+        else:
+            self._sampler.stop()
+            with open(path, 'w') as f:
+                for stack, count in self._sampler.counts.most_common():
+                    f.write(f"{stack} {count}\n")
+        _prune()
+        return self.filename
+
+
+def start_profile(mode_arg, token, label):
+    """
+    Start profiling the current request if it asked for it, is authorized
+    and is within the rate cap. Returns (profiler or None, reason) where
+    reason explains a skipped profile.
+    """
+    mode = MODES.get(mode_arg)
+    if mode is None:
+        return None, f"unknown profile mode '{mode_arg}'"
+    if not authorized(token):
+        return None, "not authorized"
+    if not _cap.acquire():
+        return None, "rate limited"
+    profiler = RequestProfiler(mode, label)
+    try:
+        profiler.start()
+    except Exception:
+        _cap.release()
+        raise
+    return profiler, None
+
+
+def finish_profile(profiler):
+    try:
+        return profiler.stop()
+    finally:
+        _cap.release()
+
+
+def list_profiles():
+    """Stored artifacts, newest first."""
+    paths = [p for ext in EXTENSIONS.values() for p in glob.glob(os.path.join(PROFILE_DIR, '*' + ext))]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    return [{
+        'name': os.path.basename(p),
+        'mode': 'cprofile' if p.endswith('.prof') else 'sample',
+        'bytes': os.path.getsize(p),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(os.path.getmtime(p))),
+    } for p in paths]
+
+
+def profile_path(name):
+    """Path of a stored artifact, or None for unknown or unsafe names."""
+    if os.path.basename(name) != name or not name.endswith(tuple(EXTENSIONS.values())):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+def _prune():
+    for profile in list_profiles()[PROFILE_KEEP:]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, profile['name']))
+        except OSError:
+            pass
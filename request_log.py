@@ -0,0 +1,178 @@
+"""
+Log of data requests, for the cache warmer.
+
+Every model, NASA, CAMS and predictor request served through the result
+cache is counted per day under its normalized full-resolution parameters,
+the fields its cache key is built from, so the warmer can replay the most
+requested ones. Counts are buffered in each process and written at most
+every REQUEST_LOG_FLUSH_SECONDS, so logging costs no database write per
+request.
+
+The log also holds the keys the warmer has prefetched. Lookups of those
+keys are counted as hits or misses of the 'warm' cache in
+portal_cache_lookups_total, which gives the hit rate of warmed results.
+"""
+import atexit
+import collections
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from metrics import count_cache
+from sqlite_store import SQLiteStore
+
+REQUEST_LOG_PATH = os.getenv('REQUEST_LOG_PATH', os.path.join('cache', 'requests.sqlite'))
+REQUEST_LOG_ENABLED = os.getenv('REQUEST_LOG_ENABLED', '1') == '1'
+REQUEST_LOG_FLUSH_SECONDS = 30.0
+# How often each process reloads the set of warmed keys
+WARMED_RELOAD_SECONDS = 60.0
+# Logged days kept
+REQUEST_LOG_RETENTION_DAYS = 30
+
+
+class RequestLog(SQLiteStore):
+    """Daily request counts by source and parameters, and the keys the warmer has prefetched."""
+
+    def __init__(self, path=REQUEST_LOG_PATH):
+        super().__init__(path, """
+            CREATE TABLE IF NOT EXISTS requests (
+                source TEXT NOT NULL,
+                params TEXT NOT NULL,
+                day TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                PRIMARY KEY (source, params, day)
+            );
+            CREATE TABLE IF NOT EXISTS warmed (
+                key TEXT PRIMARY KEY,
+                source TEXT NOT NULL,
+                warmed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS warm_runs (
+                day TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                summary TEXT
+            );
+        """)
+
+    def add_counts(self, counts, day):
+        """Add {(source, params JSON): count} to the counts of `day` (YYYY-MM-DD)."""
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO requests (source, params, day, count) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT (source, params, day) DO UPDATE SET count = count + excluded.count",
+                [(source, params, day, count) for (source, params), count in counts.items()]
+            )
+
+    def top(self, sources, days, limit):
+        """[(source, params dict, count)] of the most requested parameters over the last `days` days."""
+        since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+        marks = ','.join('?' * len(sources))
+        conn = self._connect()
+        rows = conn.execute(
+            f"SELECT source, params, SUM(count) AS total FROM requests"
+            f" WHERE day >= ? AND source IN ({marks}) GROUP BY source, params ORDER BY total DESC LIMIT ?",
+            (since, *sources, limit)
+        ).fetchall()
+        return [(source, json.loads(params), total) for source, params, total in rows]
+
+    def mark_warmed(self, key, source):
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO warmed (key, source, warmed_at) VALUES (?, ?, ?)",
+                         (key, source, time.time()))
+
+    def warmed_keys(self, max_age_days=REQUEST_LOG_RETENTION_DAYS):
+        cutoff = time.time() - max_age_days * 86400
+        conn = self._connect()
+        return {key for key, in conn.execute("SELECT key FROM warmed WHERE warmed_at >= ?", (cutoff,))}
+
+    def claim_run(self, day, owner):
+        """Claim the warm run of `day`; True for the one process on this host that gets it."""
+        conn = self._connect()
+        with conn:
+            conn.execute("INSERT OR IGNORE INTO warm_runs (day, owner, started_at) VALUES (?, ?, ?)",
+                         (day, owner, time.time()))
+            row = conn.execute("SELECT owner FROM warm_runs WHERE day = ?", (day,)).fetchone()
+        return row[0] == owner
+
+    def finish_run(self, day, summary):
+        conn = self._connect()
+        with conn:
+            conn.execute("UPDATE warm_runs SET finished_at = ?, summary = ? WHERE day = ?",
+                         (time.time(), json.dumps(summary), day))
+
+    def purge(self, days=REQUEST_LOG_RETENTION_DAYS):
+        cutoff = (datetime.now(timezone.utc).date() - timedelta(days=days)).isoformat()
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM requests WHERE day < ?", (cutoff,))
+            conn.execute("DELETE FROM warm_runs WHERE day < ?", (cutoff,))
+            conn.execute("DELETE FROM warmed WHERE warmed_at < ?", (time.time() - days * 86400,))
+
+
+class RequestCounter:
+    """
+    This process's request counts not yet written to the RequestLog, and
+    its copy of the warmed keys.
+    """
+
+    def __init__(self, log):
+        self.log = log
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        self._warmed = set()
+        self._warmed_at = None
+        atexit.register(self.flush)
+
+    def record(self, source, params, key, hit):
+        """Count one lookup of a data request and, for warmed keys, whether it hit."""
+        if key in self.warmed():
+            count_cache('warm', int(hit), int(not hit))
+        entry = (source, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            self._counts[entry] += 1
+            due = time.monotonic() - self._flushed_at >= REQUEST_LOG_FLUSH_SECONDS
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, collections.Counter()
+            self._flushed_at = time.monotonic()
+        if counts:
+            self.log.add_counts(counts, datetime.now(timezone.utc).date().isoformat())
+
+    def warmed(self):
+        if self._warmed_at is None or time.monotonic() - self._warmed_at >= WARMED_RELOAD_SECONDS:
+            self._warmed_at = time.monotonic()
+            self._warmed = self.log.warmed_keys()
+        return self._warmed
+
+
+_counter = None
+_counter_lock = threading.Lock()
+
+
+def get_request_counter():
+    """Process-wide RequestCounter, opened on first use; None when request logging is off."""
+    global _counter
+    if not REQUEST_LOG_ENABLED:
+        return None
+    if _counter is None:
+        with _counter_lock:
+            if _counter is None:
+                _counter = RequestCounter(RequestLog())
+    return _counter
+
+
+def log_request(source, params, key, hit):
+    """Record a result-cache lookup of a data request (see RequestCounter.record)."""
+    counter = get_request_counter()
+    if counter is not None:
+        counter.record(source, params, key, hit)
@@ -2,21 +2,86 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timezone
 import joblib
+import hashlib
 import os
+import logging
 import traceback
 from geopy import Point # For NASA location
 
 from NASA import NASAPowerProducts, NASAPowerFetchData, TemporalResolution
 from CAMS import get_cams_data
+from TOOLS import cell_centre, grid_cell
+from timeseries import TimeSeries
+from feature_store import FeatureStore, FEATURE_STORE_PATH, feature_schema_hash
+from elevation import get_elevation_index, ELEVATION_INDEX_DIR
+from prediction_ledger import PredictionLedger, PREDICTION_LEDGER_PATH, site_key
+from cpu_pool import PARALLEL_MIN_ROWS, SharedArray, get_cpu_pool, run_parts, split
+from metrics import time_model
+from tracing import span
+
+logger = logging.getLogger(__name__)
 
 NASA_MAX_PARAMS_PER_REQUEST = 20 
 
+# Daily NASA POWER inputs of the model, aligned with its feature names; more
+# than NASA_MAX_PARAMS_PER_REQUEST, so each fetch takes several requests
+NASA_FEATURE_PRODUCTS = [
+    NASAPowerProducts.TEMPERATURE,
+    NASAPowerProducts.AEROSOL_OPTICAL_DEPTH_550nm_ADJ,
+    NASAPowerProducts.CLOUD_AMOUNT,
+    NASAPowerProducts.RELATIVE_HUMIDITY,
+    NASAPowerProducts.PRECIPITABLE_WATER,
+    NASAPowerProducts.PRECIPITATION_CORRECTED,
+    NASAPowerProducts.SURFACE_ROUGHNESS,
+    NASAPowerProducts.NORTHERN_WIND,
+    NASAPowerProducts.ARIMASS,
+    NASAPowerProducts.ZERO_PLANE_DISPLACEMENT,
+    NASAPowerProducts.EVAPOTRANSPIRATION_ENERGY,
+    NASAPowerProducts.PLANETARY_BOUNDARY,
+    NASAPowerProducts.TOTAL_COLUMN_OZONE,
+    NASAPowerProducts.SURFACE_AIR_DENSITY,
+    NASAPowerProducts.EVAPORATION_LAND,
+    NASAPowerProducts.SURFACE_SOIL_WETNESS,
+    NASAPowerProducts.CLEARNESS_INDEX,
+    NASAPowerProducts.TEMPERATURE_RANGE,
+    NASAPowerProducts.GHI,
+    NASAPowerProducts.DHI,
+    NASAPowerProducts.DNI,
+    NASAPowerProducts.LONGWAVE_DOWNARD_IRR,
+    NASAPowerProducts.SURFACE_PRESSURE,
+    NASAPowerProducts.WIND_SPEED,
+    NASAPowerProducts.SURFACE_ALBEDO
+]
+
+# NASA POWER meteorology is served on the MERRA-2 0.5° x 0.625° grid, so every
+# site inside one of those cells gets the same NASA inputs. CAMS radiation is
+# resolved per point: the predictor fetches it at the site, deduping sites
+# whose coordinates agree to CAMS_POINT_DECIMALS places, while bulk runs fetch
+# CAMS series once per CAMS_GRID_DEG cell.
+NASA_GRID_LAT_DEG = 0.5
+NASA_GRID_LON_DEG = 0.625
+CAMS_GRID_DEG = 0.05
+CAMS_POINT_DECIMALS = 6
+
+# Columns that vary between sites of one grid cell; everything else is cached
+# per cell in the feature store.
+SITE_FEATURE_COLS = ['longitude', 'altitude']
+# Bump when the feature engineering below changes, to invalidate stored rows.
+FEATURE_ENGINEERING_VERSION = 1
+# Days younger than this may still be revised upstream and are not persisted.
+FEATURE_SETTLED_DAYS = 7
+NASA_FILL_VALUE = -999
+# Used for the altitude feature when no elevation index is available or a site
+# falls outside it.
+FALLBACK_ALTITUDE_M = 1200
+
 class GHIPredictor:
     """
     Loads a pre-trained GHI correction model and uses it to make predictions.
     It fetches data from NASA and CAMS, preprocesses it, and applies the model.
     """
-    def __init__(self, model_base_dir, model_type='random_forest'):
+    def __init__(self, model_base_dir, model_type='random_forest', feature_store_path=FEATURE_STORE_PATH,
+                 elevation_index_dir=ELEVATION_INDEX_DIR, ledger_path=PREDICTION_LEDGER_PATH):
         """
         Initializes the predictor by loading model artifacts.
 
@@ -25,13 +90,25 @@ class GHIPredictor:
                                   scaler.joblib (if used), and metadata.joblib.
             model_type (str): The type of model (e.g., 'random_forest'), 
                               used for constructing filenames.
+            feature_store_path (str): SQLite file caching engineered feature rows.
+                                  Pass None to always fetch and engineer afresh.
+            elevation_index_dir (str): Directory of the index built by elevation.py,
+                                  used for the altitude feature.
+            ledger_path (str): SQLite file recording past daily predictions per site,
+                                  used by predict_ghi_window(). Pass None to disable.
         """
         self.model_base_dir = model_base_dir
         self.model_type = model_type
         self.model = None
+        self.model_path = None
         self.scaler = None
         self.metadata = None
         self.is_loaded = False
+        self.feature_store = None
+        self.feature_schema = None
+        self.elevation_index = None
+        self.ledger = None
+        self.model_version = None
 
         if not os.path.isdir(self.model_base_dir):
             raise FileNotFoundError(f"Model base directory not found: {self.model_base_dir}")
@@ -39,10 +116,33 @@ class GHIPredictor:
         try:
             self._load_artifacts()
         except FileNotFoundError as e:
-            print(f"Error during GHIPredictor initialization: {e}")
-            print("Please ensure model_base_dir and model_type are correct and all artifacts exist.")
+            logger.error("Error during GHIPredictor initialization: %s. Please ensure model_base_dir "
+                         "and model_type are correct and all artifacts exist.", e)
             raise # Re-raise the exception to halt if loading fails
 
+        self.feature_schema = feature_schema_hash(
+            self.metadata.get('feature_cols', []),
+            self.metadata.get('est_ghi_col'),
+            FEATURE_ENGINEERING_VERSION
+        )
+        # Rows of other feature schemas and model versions are never read again
+        if feature_store_path:
+            self.feature_store = FeatureStore(feature_store_path)
+            pruned = self.feature_store.prune(self.feature_schema)
+            if pruned:
+                logger.info("Pruned %d feature rows of other schemas.", pruned)
+        if ledger_path:
+            self.ledger = PredictionLedger(ledger_path)
+            pruned = self.ledger.prune(self.model_version)
+            if pruned:
+                logger.info("Pruned %d ledger rows of other model versions.", pruned)
+
+        if elevation_index_dir:
+            self.elevation_index = get_elevation_index(elevation_index_dir)
+        if self.elevation_index is None and 'altitude' in self.metadata.get('feature_cols', []):
+            logger.warning("No elevation index found in '%s'. Altitude will default to %sm; "
+                           "build one with 'python elevation.py build <DEM>'.", elevation_index_dir, FALLBACK_ALTITUDE_M)
+
     def _load_artifacts(self):
         """Loads the model, scaler, and metadata from disk."""
         model_filename = f"{self.model_type}_model.joblib"
@@ -52,44 +152,58 @@ class GHIPredictor:
         model_path = os.path.join(self.model_base_dir, model_filename)
         metadata_path = os.path.join(self.model_base_dir, metadata_filename)
         
-        print(f"Attempting to load metadata from: {metadata_path}")
+        logger.debug("Attempting to load metadata from: %s", metadata_path)
         if not os.path.exists(metadata_path):
             raise FileNotFoundError(f"Metadata file not found: {metadata_path}")
         self.metadata = joblib.load(metadata_path)
-        print("Metadata loaded successfully.")
+        logger.debug("Metadata loaded successfully.")
 
-        print(f"Attempting to load model from: {model_path}")
+        logger.debug("Attempting to load model from: %s", model_path)
         if not os.path.exists(model_path):
             raise FileNotFoundError(f"Model file not found: {model_path}")
         self.model = joblib.load(model_path)
-        print("Model loaded successfully.")
+        self.model_path = model_path
+        logger.debug("Model loaded successfully.")
 
         scaler_used = self.metadata.get('scaler_used', False)
         if scaler_used:
             scaler_path = os.path.join(self.model_base_dir, scaler_filename)
-            print(f"Attempting to load scaler from: {scaler_path}")
+            logger.debug("Attempting to load scaler from: %s", scaler_path)
             if not os.path.exists(scaler_path):
                 raise FileNotFoundError(f"Scaler file ({scaler_path}) not found, but metadata indicates it was used.")
             self.scaler = joblib.load(scaler_path)
-            print("Scaler loaded successfully.")
+            logger.debug("Scaler loaded successfully.")
         else:
             self.scaler = None
-            print("No scaler was used during training (or not specified in metadata).")
+            logger.debug("No scaler was used during training (or not specified in metadata).")
         
+        # Identify the artifacts by a version field of the metadata, or else by
+        # their contents, so redeploying identical files keeps the version and
+        # with it the prediction ledger.
+        version_hash = hashlib.sha1(self.model_type.encode('utf-8'))
+        if self.metadata.get('model_version') is not None:
+            version_hash.update(str(self.metadata['model_version']).encode('utf-8'))
+        else:
+            for path in [model_path, metadata_path] + ([scaler_path] if scaler_used else []):
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        version_hash.update(block)
+        self.model_version = version_hash.hexdigest()[:16]
+
         self.is_loaded = True
-        print(f"Model '{self.model_type}' and associated artifacts loaded.")
-        print(f"  Features expected by model: {len(self.metadata.get('feature_cols', []))}")
-        print(f"  Satellite GHI column to be corrected: {self.metadata.get('est_ghi_col')}")
+        logger.info("Model '%s' (version %s) loaded: %d features, correcting %s.",
+                    self.model_type, self.model_version, len(self.metadata.get('feature_cols', [])),
+                    self.metadata.get('est_ghi_col'))
 
 
     def _fetch_nasa_data_in_chunks(self, nasa_fetcher, temporal_resolution, start_dt_utc, end_dt_utc, location, products_to_fetch):
-        """Fetches NASA data in chunks if the number of products exceeds the limit."""
+        """Fetches NASA data in chunks if the number of products exceeds the limit, joined into one TimeSeries."""
         all_nasa_data = []
         product_list = list(products_to_fetch) # Convert set to list for slicing
 
         for i in range(0, len(product_list), NASA_MAX_PARAMS_PER_REQUEST):
             chunk = product_list[i:i + NASA_MAX_PARAMS_PER_REQUEST]
-            print(f"Fetching NASA chunk {i // NASA_MAX_PARAMS_PER_REQUEST + 1}: {len(chunk)} products")
+            logger.debug("Fetching NASA chunk %d: %d products", i // NASA_MAX_PARAMS_PER_REQUEST + 1, len(chunk))
             try:
                 nasa_raw_chunk = nasa_fetcher.fetch_multiple_parameters(
                     temporal_resolution=temporal_resolution,
@@ -98,174 +212,116 @@ class GHIPredictor:
                     location=location,
                     products=chunk
                 )
-                if nasa_raw_chunk is not None and not pd.DataFrame(nasa_raw_chunk).empty:
-                    all_nasa_data.append(pd.DataFrame(nasa_raw_chunk))
+                # Fill values are kept: feature rows carrying them are not persisted
+                chunk_series = TimeSeries.from_nasa(nasa_raw_chunk or {}, fill_value=None)
+                if len(chunk_series):
+                    all_nasa_data.append(chunk_series)
                 else:
-                    print(f"Warning: NASA chunk {i // NASA_MAX_PARAMS_PER_REQUEST + 1} returned empty or None.")
+                    logger.warning("NASA chunk %d returned empty or None.", i // NASA_MAX_PARAMS_PER_REQUEST + 1)
             except Exception as e:
-                print(f"Error fetching NASA chunk {i // NASA_MAX_PARAMS_PER_REQUEST + 1}: {e}")
+                logger.error("Error fetching NASA chunk %d: %s", i // NASA_MAX_PARAMS_PER_REQUEST + 1, e)
                 # Decide if you want to continue or raise error
         
         if not all_nasa_data:
-            print("Warning: No data fetched from NASA after chunking.")
-            return pd.DataFrame()
-        
-        
-        nasa_df_combined = pd.concat(all_nasa_data, axis=1)
-        
-        nasa_df_combined = nasa_df_combined.loc[:, ~nasa_df_combined.columns.duplicated()]
-        return nasa_df_combined
+            logger.warning("No data fetched from NASA after chunking.")
+        return TimeSeries.join(all_nasa_data)
 
 
 
 
-    def _prepare_features_for_prediction(self, latitude, longitude, start_dt_utc, end_dt_utc):
+    def _fetch_nasa_frame(self, latitude, longitude, start_dt_utc, end_dt_utc):
         """
-        Fetches raw data from NASA & CAMS, merges, and preprocesses it 
-        to match the feature set required by the loaded model.
-        This method MUST replicate the feature engineering from the training script.
+        Fetches the daily NASA POWER inputs for one location and returns them
+        with a UTC DatetimeIndex named 'datetime'.
         """
-        if not self.is_loaded:
-            raise RuntimeError("Predictor is not loaded. Cannot prepare features.")
 
-        print(f"Preparing features for Lat/Lon: {latitude:.2f}/{longitude:.2f}, Period: {start_dt_utc} to {end_dt_utc}")
-        
+        nasa_fetcher = NASAPowerFetchData()
+        nasa_series = self._fetch_nasa_data_in_chunks(
+            nasa_fetcher,
+            TemporalResolution.DAILY,
+            start_dt_utc,
+            end_dt_utc,
+            Point(latitude=latitude, longitude=longitude),
+            NASA_FEATURE_PRODUCTS)
+
+        # Localize NASA times to UTC so they’re timezone-aware
+        nasa_df = nasa_series.to_frame(tz="UTC")
+        logger.debug("NASA data fetched. Shape: %s", nasa_df.shape)
+        return nasa_df
+
+    def _fetch_cams_frame(self, latitude, longitude, start_dt_utc, end_dt_utc):
+        """
+        Fetches the daily CAMS radiation inputs for one location, converted to
+        the units used in training. Returns an empty DataFrame when the model
+        needs no CAMS features or the request fails.
+        """
         feature_cols_from_meta = self.metadata.get('feature_cols')
-        est_ghi_col_from_meta = self.metadata.get('est_ghi_col') # e.g., 'ghi_nasa'
-
-        if not feature_cols_from_meta or not est_ghi_col_from_meta:
-            raise ValueError("Essential metadata (feature_cols, est_ghi_col) not found in loaded metadata.")
-
-        # 1. Fetch NASA Data
-        # This map aligns model feature names with NASAPowerProducts enums/values
-        nasa_features = [
-            NASAPowerProducts.TEMPERATURE,
-            NASAPowerProducts.AEROSOL_OPTICAL_DEPTH_550nm_ADJ,
-            NASAPowerProducts.CLOUD_AMOUNT,
-            NASAPowerProducts.RELATIVE_HUMIDITY,
-            NASAPowerProducts.PRECIPITABLE_WATER,
-            NASAPowerProducts.PRECIPITATION_CORRECTED,
-            NASAPowerProducts.SURFACE_ROUGHNESS,
-            NASAPowerProducts.NORTHERN_WIND,
-            NASAPowerProducts.ARIMASS,
-            NASAPowerProducts.ZERO_PLANE_DISPLACEMENT,
-            NASAPowerProducts.EVAPOTRANSPIRATION_ENERGY,
-            NASAPowerProducts.PLANETARY_BOUNDARY,
-            NASAPowerProducts.TOTAL_COLUMN_OZONE,
-            NASAPowerProducts.SURFACE_AIR_DENSITY,
-            NASAPowerProducts.EVAPORATION_LAND,
-            NASAPowerProducts.SURFACE_SOIL_WETNESS,
-            NASAPowerProducts.CLEARNESS_INDEX,
-            NASAPowerProducts.TEMPERATURE_RANGE,
-            NASAPowerProducts.GHI,
-            NASAPowerProducts.DHI,
-            NASAPowerProducts.DNI,
-            NASAPowerProducts.LONGWAVE_DOWNARD_IRR,
-            NASAPowerProducts.SURFACE_PRESSURE,
-            NASAPowerProducts.WIND_SPEED,
-            NASAPowerProducts.SURFACE_ALBEDO
-        ]
-        
-        
-        if nasa_features:
-            nasa_fetcher = NASAPowerFetchData()
-            nasa_df = self._fetch_nasa_data_in_chunks(
-                nasa_fetcher,
-                TemporalResolution.DAILY, 
-                start_dt_utc, 
-                end_dt_utc,
-                Point(latitude=latitude, longitude=longitude), 
-                nasa_features)
-
-            print(f"NASA data fetched. Shape: {nasa_df.shape}")
-        else:
-            print("No NASA products identified for fetching based on model features.")
-
-
-
-        # 2. Fetch CAMS Data
 
         cams_model_features_prefixes = ['ghi_cams', 'bhi_cams', 'dhi_cams', 'dni_cams','ghi_clear_cams', 'bhi_clear_cams', 'dhi_clear_cams', 'dni_clear_cams']
         cams_needed = any(f.startswith(tuple(cams_model_features_prefixes)) or f == 'kt_cams' for f in feature_cols_from_meta)
-        
+
         cams_df = pd.DataFrame()
         if cams_needed:
-            print("Fetching CAMS data...")
+            logger.debug("Fetching CAMS data...")
             cams_raw_result = get_cams_data(
                 latitude=latitude, longitude=longitude,
-                start_date=start_dt_utc.strftime("%Y-%m-%d"), 
+                start_date=start_dt_utc.strftime("%Y-%m-%d"),
                 end_date=end_dt_utc.strftime("%Y-%m-%d"),
                 email = os.getenv('CAMS_EMAIL'),
-                time_step='1d' 
+                time_step='1d'
             )
-            if cams_raw_result and not cams_raw_result.get('error') and isinstance(cams_raw_result.get('data'), list) and cams_raw_result.get('data'):
-                temp_cams_list = []
-                for item in cams_raw_result['data']:
-                    temp_cams_list.append({
-                        "datetime": item.get('timestamp'), 
-                        "ghi_cams": item.get('ghi'),       
-                        "dhi_cams": item.get('dhi'),
-                        "dni_cams": item.get('dni'),
-                        "bhi_cams": item.get('bhi'), 
-                        "ghi_clear_cams": item.get('ghi_clear'),
-                        "dhi_clear_cams": item.get('dhi_clear'),
-                        "dni_clear_cams": item.get('dni_clear'),
-                        "bhi_clear_cams": item.get('bhi_clear'),
-                    })
-                cams_df = pd.DataFrame(temp_cams_list)
-                if not cams_df.empty and 'datetime' in cams_df.columns:
-                    cams_df['datetime'] = pd.to_datetime(cams_df['datetime'])
-                    cams_df.set_index('datetime', inplace=True)
-                
-                if not cams_df.empty:
-                    if cams_df.index.tz is None: cams_df = cams_df.tz_localize('UTC')
-                    else: cams_df = cams_df.tz_convert('UTC')
- 
-                    # Unit conversion (Wh/m2 to W/m2 average, or kW if model trained on kW)
-                    # Training script divides by 1000.
-                    cams_cols_to_convert = [col for col in cams_df.columns if col.endswith('_cams')]
-                    for col in cams_cols_to_convert:
-                        if col in cams_df: cams_df[col] = pd.to_numeric(cams_df[col], errors='coerce') / 1000.0
-                print(f"CAMS data fetched and processed. Shape: {cams_df.shape}")
+            if cams_raw_result and not cams_raw_result.get('error') and cams_raw_result.get('series'):
+                cams_columns = ['ghi', 'dhi', 'dni', 'bhi', 'ghi_clear', 'dhi_clear', 'dni_clear', 'bhi_clear']
+                cams_series = cams_raw_result['series'].select({f"{name}_cams": name for name in cams_columns})
+                # Unit conversion (Wh/m2 to W/m2 average, or kW if model trained on kW)
+                # Training script divides by 1000.
+                cams_df = cams_series.to_frame(tz='UTC') / 1000.0
+                logger.debug("CAMS data fetched and processed. Shape: %s", cams_df.shape)
 
             elif cams_raw_result and cams_raw_result.get('error'):
-                 print(f"Warning: CAMS API Error: {cams_raw_result.get('error')}")
+                 logger.warning("CAMS API Error: %s", cams_raw_result.get('error'))
             else:
-                print("Warning: CAMS data not fetched or in unexpected format.")
+                logger.warning("CAMS data not fetched or in unexpected format.")
         else:
-            print("No CAMS-specific features required by the model.")
-        
-        # 3. Merge DataFrames
-        nasa_df = nasa_df.copy()
-        nasa_df.index = pd.to_datetime(nasa_df.index, format="%Y%m%d")
+            logger.debug("No CAMS-specific features required by the model.")
 
-        # 2. Localize NASA times to UTC so they’re timezone-aware
-        nasa_df.index = nasa_df.index.tz_localize("UTC")
-
-        # 3. Make sure both indices have the same name
-        nasa_df.index.name = "datetime"
         cams_df.index.name = "datetime"
+        return cams_df
 
-        # 4. Now do your outer merge
+    @staticmethod
+    def _merge_sources(nasa_df, cams_df):
+        """Outer-joins the NASA and CAMS frames on their UTC day index."""
         merged_df = pd.merge(
             nasa_df, cams_df,
             left_index=True, right_index=True,
             how="outer"
         )
 
-        # 4. Feature Engineering (Must match training script `preprocess_data` and subsequent steps)
-        # Ensure index is datetime (should be from reindex)
+        # Ensure index is datetime
         if not isinstance(merged_df.index, pd.DatetimeIndex):
             merged_df.index = pd.to_datetime(merged_df.index)
             if merged_df.index.tz is None: merged_df.index = merged_df.index.tz_localize('UTC')
             else: merged_df.index = merged_df.index.tz_convert('UTC')
+        return merged_df
+
+    def _required_columns(self):
+        """Model features plus the satellite GHI column, without duplicates."""
+        return list(dict.fromkeys(self.metadata['feature_cols'] + [self.metadata['est_ghi_col']]))
 
+    def _engineer_cell_features(self, merged_df):
+        """
+        Adds the engineered columns that depend only on the upstream data and
+        the day, so the result is shared by every site in the same grid cell.
+        This method MUST replicate the feature engineering from the training script.
+        """
+        feature_cols_from_meta = self.metadata.get('feature_cols')
+        est_ghi_col_from_meta = self.metadata.get('est_ghi_col') # e.g., 'ghi_nasa'
 
+        merged_df = merged_df.copy()
         merged_df['day_of_year'] = merged_df.index.dayofyear
         merged_df['dayofyear_sin'] = np.sin(2 * np.pi * merged_df['day_of_year'] / 365.25)
         merged_df['dayofyear_cos'] = np.cos(2 * np.pi * merged_df['day_of_year'] / 365.25)
         merged_df['Month'] = merged_df.index.month
-        merged_df['longitude'] = longitude
 
         # Engineer kt_cams (if CAMS data is available and columns exist)
         if 'ghi_cams' in merged_df.columns and 'ghi_clear_cams' in merged_df.columns:
@@ -284,142 +340,454 @@ class GHIPredictor:
                 0
             ).clip(0, 1.2)
         elif 'kt_nasa' in feature_cols_from_meta: merged_df['kt_nasa'] = np.nan
-        
-        # --- User Action Required: Altitude ---
-        if 'altitude' in feature_cols_from_meta:
-            # Replace this with actual altitude lookup for (latitude, longitude)
-            # e.g., using a DEM library or a pre-computed lookup table.
-            actual_altitude = 1200 # Dummy value
-            merged_df['altitude'] = actual_altitude 
-            if actual_altitude == 1200: # Check if it's still the dummy
-                 print(f"Warning: Using DUMMY altitude: {actual_altitude}m. Replace with actual lookup.")
-        
-        # Ensure all model features and the est_ghi_col are present before returning
-        all_needed_cols = list(set(feature_cols_from_meta + [est_ghi_col_from_meta])) # Unique columns
-        
-        missing_final_cols = [col for col in all_needed_cols if col not in merged_df.columns]
+
+        # Ensure all cell-level columns are present before returning
+        cell_cols = [col for col in self._required_columns() if col not in SITE_FEATURE_COLS]
+
+        missing_final_cols = [col for col in cell_cols if col not in merged_df.columns]
         if missing_final_cols:
-            print(f"Warning: After all processing, the following required columns are STILL missing: {missing_final_cols}")
-            print("These will be filled with NaN, which will likely cause issues if they are features for the model.")
+            logger.warning("After all processing, the following required columns are STILL missing: %s. These will be "
+                           "filled with NaN, which will likely cause issues if they are features for the model.", missing_final_cols)
             for mc in missing_final_cols:
                 merged_df[mc] = np.nan
-        
-        return merged_df[all_needed_cols]
 
-    def predict_ghi(self, latitude, longitude, start_date_str, end_date_str):
+        return merged_df[cell_cols]
+
+    def _site_altitudes(self, sites):
         """
-        Predicts corrected GHI for a given location and time period.
+        Altitude in metres for each (latitude, longitude) site, looked up in one
+        vectorized call to the elevation index.
+        """
+        altitudes = np.full(len(sites), np.nan)
+        if self.elevation_index is not None and sites:
+            latitudes, longitudes = zip(*sites)
+            altitudes = self.elevation_index.elevations(latitudes, longitudes)
+
+        outside = np.isnan(altitudes)
+        if outside.any() and 'altitude' in self.metadata.get('feature_cols'):
+            logger.warning("No elevation for %d/%d sites. Using %sm.", outside.sum(), len(sites), FALLBACK_ALTITUDE_M)
+        altitudes[outside] = FALLBACK_ALTITUDE_M
+        return altitudes
+
+    def _add_site_features(self, cell_df, latitude, longitude, altitude=None):
+        """Adds the per-site columns to a cell-level frame and returns the model's columns."""
+        feature_cols_from_meta = self.metadata.get('feature_cols')
 
-        Args:
-            latitude (float): Latitude of the location.
-            longitude (float): Longitude of the location.
-            start_date_str (str): Start date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
-            end_date_str (str): End date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+        site_df = cell_df.copy()
+        site_df['longitude'] = longitude
 
-        Returns:
-            pd.Series: Corrected GHI values, or an empty Series if prediction fails.
+        if 'altitude' in feature_cols_from_meta:
+            if altitude is None:
+                altitude = self._site_altitudes([(latitude, longitude)])[0]
+            site_df['altitude'] = altitude
+
+        for col in self._required_columns():
+            if col not in site_df.columns:
+                site_df[col] = np.nan
+        return site_df[self._required_columns()]
+
+    def _engineer_features(self, merged_df, latitude, longitude):
+        """
+        Adds the engineered columns to a merged NASA+CAMS frame and returns
+        the columns required by the model.
         """
+        return self._add_site_features(self._engineer_cell_features(merged_df), latitude, longitude)
+
+    def _check_metadata(self):
+        """Raises if the loaded metadata lacks the columns prediction depends on."""
         if not self.is_loaded:
-            raise RuntimeError("Model artifacts not loaded. Initialize GHIPredictor correctly.")
+            raise RuntimeError("Predictor is not loaded. Cannot prepare features.")
+        if not self.metadata.get('feature_cols') or not self.metadata.get('est_ghi_col'):
+            raise ValueError("Essential metadata (feature_cols, est_ghi_col) not found in loaded metadata.")
 
-        try:
-            # Parse dates and ensure they are timezone-aware (UTC)
-            try:
-                start_dt_utc = pd.to_datetime(start_date_str)
-                if start_dt_utc.tzinfo is None: start_dt_utc = start_dt_utc.tz_localize('UTC')
-                else: start_dt_utc = start_dt_utc.tz_convert('UTC')
-
-                end_dt_utc = pd.to_datetime(end_date_str)
-                if end_dt_utc.tzinfo is None: end_dt_utc = end_dt_utc.tz_localize('UTC')
-                else: end_dt_utc = end_dt_utc.tz_convert('UTC')
-            except ValueError: # Fallback for "YYYY-MM-DD"
-                start_dt_utc = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-                # For daily, ensure end_date covers the full day for range operations
-                temp_end_dt = datetime.strptime(end_date_str, "%Y-%m-%d")
-                end_dt_utc = datetime(temp_end_dt.year, temp_end_dt.month, temp_end_dt.day, 23, 59, 59, tzinfo=timezone.utc)
+    def _prepare_features_for_prediction(self, latitude, longitude, start_dt_utc, end_dt_utc):
+        """
+        Fetches raw data from NASA & CAMS, merges, and preprocesses it 
+        to match the feature set required by the loaded model.
+        """
+        logger.debug("Preparing features for Lat/Lon: %.2f/%.2f, Period: %s to %s", latitude, longitude, start_dt_utc, end_dt_utc)
+        return self._prepare_features_for_sites([(latitude, longitude)], start_dt_utc, end_dt_utc)[0]
 
-        except Exception as e:
-            print(f"Error parsing input dates ('{start_date_str}', '{end_date_str}'): {e}")
-            return pd.Series(dtype=float, name='corrected_ghi')
+    @staticmethod
+    def _day_runs(days):
+        """Splits a sorted DatetimeIndex of days into (first, last) pairs of consecutive days."""
+        day_series = days.to_series()
+        run_ids = (day_series.diff() != pd.Timedelta(days=1)).cumsum().to_numpy()
+        return [(run.iloc[0], run.iloc[-1]) for _, run in day_series.groupby(run_ids)]
 
-        df_prepared = self._prepare_features_for_prediction(latitude, longitude, start_dt_utc, end_dt_utc)
+    def _fetch_days(self, fetch, latitude, longitude, days, start_ts, end_ts):
+        """
+        Fetches `days` from one upstream with one request per run of
+        consecutive days, clipped to the period, and returns them as one frame.
+        """
+        frames = [fetch(latitude, longitude, max(first, start_ts), min(last + pd.Timedelta(days=1, seconds=-1), end_ts))
+                  for first, last in self._day_runs(days)]
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(frames).sort_index()
+
+    @staticmethod
+    def _cell_id(nasa_key, cams_key):
+        return f"{nasa_key[0]},{nasa_key[1]}|{cams_key[0]},{cams_key[1]}"
+
+    def _stored_cell_features(self, cell_id, days):
+        """(rows of `days` held in the feature store, days still missing) of a cell."""
+        cached = pd.DataFrame()
+        if self.feature_store is not None:
+            cached = self.feature_store.get_rows(cell_id, self.feature_schema, days)
+        missing = days.difference(cached.index) if not cached.empty else days
+        return cached, missing
+
+    def _cell_features(self, cell_id, cached, missing, nasa_df, cams_df):
+        """
+        Returns the cell-level feature rows for every day of the period.
 
-        print(df_prepared)
+        The `missing` days are engineered from the upstream frames, which may
+        cover more days than the cell lacks, and written to the store once they
+        are old enough for the upstream values to be final.
+        """
+        merged_df = self._merge_sources(nasa_df, cams_df)
+        fresh = self._engineer_cell_features(merged_df)
+        fresh = fresh[fresh.index.isin(missing)]
+
+        if self.feature_store is not None and not fresh.empty:
+            # Only persist days whose upstream values are final: old enough, and
+            # with every upstream column present and not a NASA fill value.
+            upstream_cols = [col for col in fresh.columns if col in merged_df.columns]
+            upstream = fresh[upstream_cols].apply(pd.to_numeric, errors='coerce')
+            cutoff = pd.Timestamp.now(tz='UTC').normalize() - pd.Timedelta(days=FEATURE_SETTLED_DAYS)
+            settled = (fresh.index < cutoff) & upstream.notna().all(axis=1) & ~(upstream == NASA_FILL_VALUE).any(axis=1)
+            self.feature_store.put_rows(cell_id, self.feature_schema, fresh[settled])
+
+        logger.debug("Cell %s: %d days from feature store, %d fetched.", cell_id, len(cached), len(missing))
+        if cached.empty:
+            return fresh
+        return pd.concat([cached, fresh]).sort_index()
+
+    @span('predictor.features')
+    def _prepare_features_for_sites(self, sites, start_dt_utc, end_dt_utc):
+        """
+        Prepares one feature frame per site, fetching upstream data once per
+        grid cell rather than once per site.
+
+        NASA POWER values are constant over a grid cell, so every site in a
+        NASA cell shares one request, made at the cell centre as bulk jobs do.
+        CAMS is resolved per point and is fetched at the site itself, once per
+        distinct point. Days already in the feature store are read back, and
+        each NASA cell and CAMS point is fetched once, over the runs of days
+        any site using it is missing.
+        """
+        self._check_metadata()
+
+        start_ts, end_ts = pd.Timestamp(start_dt_utc), pd.Timestamp(end_dt_utc)
+        days = pd.date_range(start_ts.normalize(), end_ts.normalize(), freq='D')
+        site_cells = [(grid_cell(latitude, longitude, NASA_GRID_LAT_DEG, NASA_GRID_LON_DEG),
+                       (round(float(latitude), CAMS_POINT_DECIMALS), round(float(longitude), CAMS_POINT_DECIMALS)))
+                      for latitude, longitude in sites]
+
+        stored = {}
+        for cell in site_cells:
+            if cell not in stored:
+                stored[cell] = self._stored_cell_features(self._cell_id(*cell), days)
+
+        # Days each NASA cell and CAMS point must provide
+        needed = ({}, {})
+        for cell, (_, missing) in stored.items():
+            for part, key in enumerate(cell):
+                if not missing.empty:
+                    needed[part][key] = needed[part][key].union(missing) if key in needed[part] else missing
+
+        # NASA cells are fetched at their centre, so their values do not depend
+        # on which site of the batch came first
+        nasa_frames = {key: self._fetch_days(self._fetch_nasa_frame,
+                                             *cell_centre(key, NASA_GRID_LAT_DEG, NASA_GRID_LON_DEG),
+                                             key_days, start_ts, end_ts)
+                       for key, key_days in needed[0].items()}
+        cams_frames = {point: self._fetch_days(self._fetch_cams_frame, *point, point_days, start_ts, end_ts)
+                       for point, point_days in needed[1].items()}
+
+        cell_frames = {}
+        for (nasa_key, cams_key), (cached, missing) in stored.items():
+            if missing.empty:
+                cell_frames[(nasa_key, cams_key)] = cached
+            else:
+                cell_frames[(nasa_key, cams_key)] = self._cell_features(
+                    self._cell_id(nasa_key, cams_key), cached, missing, nasa_frames[nasa_key], cams_frames[cams_key])
 
-        if df_prepared.empty:
-            print("Feature preparation resulted in an empty DataFrame. Cannot predict.")
-            return pd.Series(dtype=float, name='corrected_ghi')
+        altitudes = self._site_altitudes(sites)
+        prepared = [self._add_site_features(cell_frames[cell], latitude, longitude, altitude)
+                    for cell, (latitude, longitude), altitude in zip(site_cells, sites, altitudes)]
 
+        logger.debug("Prepared features for %d sites from %d grid cells.", len(prepared), len(cell_frames))
+        return prepared
+
+    @staticmethod
+    def _parse_period(start_date_str, end_date_str):
+        """Parses the period bounds into timezone-aware (UTC) datetimes."""
+        try:
+            start_dt_utc = pd.to_datetime(start_date_str)
+            if start_dt_utc.tzinfo is None: start_dt_utc = start_dt_utc.tz_localize('UTC')
+            else: start_dt_utc = start_dt_utc.tz_convert('UTC')
+
+            end_dt_utc = pd.to_datetime(end_date_str)
+            if end_dt_utc.tzinfo is None: end_dt_utc = end_dt_utc.tz_localize('UTC')
+            else: end_dt_utc = end_dt_utc.tz_convert('UTC')
+        except ValueError: # Fallback for "YYYY-MM-DD"
+            start_dt_utc = datetime.strptime(start_date_str, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            # For daily, ensure end_date covers the full day for range operations
+            temp_end_dt = datetime.strptime(end_date_str, "%Y-%m-%d")
+            end_dt_utc = datetime(temp_end_dt.year, temp_end_dt.month, temp_end_dt.day, 23, 59, 59, tzinfo=timezone.utc)
+        return start_dt_utc, end_dt_utc
+
+    @span('predictor.predict')
+    def _predict_prepared(self, prepared_frames):
+        """
+        Runs the scaler and model once over the stacked feature rows of every
+        frame and returns one corrected GHI Series per input frame.
+        """
         feature_cols = self.metadata['feature_cols']
         est_ghi_col = self.metadata['est_ghi_col']
-        
-        # Ensure all feature columns and est_ghi_col are actually in df_prepared
-        missing_in_prepared = [col for col in feature_cols + [est_ghi_col] if col not in df_prepared.columns]
-        if missing_in_prepared:
-            print(f"Error: DataFrame prepared for prediction is missing critical columns: {missing_in_prepared}")
-            return pd.Series(np.nan, index=df_prepared.index, name='corrected_ghi')
 
-        X_predict_df = df_prepared[feature_cols].copy() # Use .copy() to avoid SettingWithCopyWarning
-        original_satellite_ghi = df_prepared[est_ghi_col].copy()
+        def all_nan(frame):
+            return pd.Series(np.nan, index=frame.index, name='corrected_ghi')
 
-        print(X_predict_df)
+        results = [None] * len(prepared_frames)
+        usable = {}
+        for i, df_prepared in enumerate(prepared_frames):
+            if df_prepared.empty:
+                logger.warning("Feature preparation resulted in an empty DataFrame. Cannot predict.")
+                results[i] = pd.Series(dtype=float, name='corrected_ghi')
+                continue
+
+            # Ensure all feature columns and est_ghi_col are actually in df_prepared
+            missing_in_prepared = [col for col in feature_cols + [est_ghi_col] if col not in df_prepared.columns]
+            if missing_in_prepared:
+                logger.error("DataFrame prepared for prediction is missing critical columns: %s", missing_in_prepared)
+                results[i] = all_nan(df_prepared)
+                continue
+            usable[i] = df_prepared
+
+        if not usable:
+            return results
+
+        # Stack every site's rows under a (site, datetime) index so the scaler
+        # and model each run once for the whole batch.
+        stacked = pd.concat({i: frame for i, frame in usable.items()}, names=['site', 'datetime'])
 
         # Handle rows with NaNs in features before scaling/prediction
         # Convert to numeric, coercing errors, then check for nulls
-        for col in X_predict_df.columns:
-            X_predict_df[col] = pd.to_numeric(X_predict_df[col], errors='coerce')
-        
+        X_predict_df = stacked[feature_cols].apply(pd.to_numeric, errors='coerce')
         nan_in_features_mask = X_predict_df.isnull().any(axis=1)
-        
-        # Store the original full index for reindexing later
-        original_full_index = df_prepared.index
-        
         X_predict_clean = X_predict_df[~nan_in_features_mask]
 
-        print(X_predict_clean)
-        
         if X_predict_clean.empty:
-            print("No data available for prediction after removing rows with NaN features.")
-            return pd.Series(np.nan, index=original_full_index, name='corrected_ghi')
+            logger.warning("No data available for prediction after removing rows with NaN features.")
+            for i, frame in usable.items():
+                results[i] = all_nan(frame)
+            return results
 
         if self.scaler:
             try:
                 X_scaled = self.scaler.transform(X_predict_clean)
             except Exception as e:
-                print(f"Error during scaling: {e}. Check feature consistency.")
+                logger.error("Error during scaling: %s. Check feature consistency.", e)
                 # Fallback: return NaNs for all, aligned with original index
-                return pd.Series(np.nan, index=original_full_index, name='corrected_ghi')
+                for i, frame in usable.items():
+                    results[i] = all_nan(frame)
+                return results
         else:
             X_scaled = X_predict_clean.values # .values for numpy array
 
         try:
-            predicted_bias_values = self.model.predict(X_scaled)
+            with time_model(self.model_type), span('predictor.inference'):
+                predicted_bias_values = self._predict_rows(X_scaled)
         except Exception as e:
-            print(f"Error during model prediction: {e}")
-            return pd.Series(np.nan, index=original_full_index, name='corrected_ghi')
-        
+            logger.error("Error during model prediction: %s", e)
+            for i, frame in usable.items():
+                results[i] = all_nan(frame)
+            return results
+
         predicted_bias_series = pd.Series(predicted_bias_values, index=X_predict_clean.index)
-        
+
         # Add bias only to the non-NaN satellite GHI values that had features for prediction
-        # Ensure original_satellite_ghi is numeric for addition
-        original_satellite_ghi_clean = pd.to_numeric(original_satellite_ghi[~nan_in_features_mask], errors='coerce')
-        
-        # Perform addition where both series are valid
+        original_satellite_ghi_clean = pd.to_numeric(stacked.loc[~nan_in_features_mask, est_ghi_col], errors='coerce')
         corrected_ghi_calculated = original_satellite_ghi_clean + predicted_bias_series
-        
-        # Reindex to the full original index, filling NaNs where prediction wasn't possible
-        corrected_ghi_final = corrected_ghi_calculated.reindex(original_full_index)
-        corrected_ghi_final.name = 'corrected_ghi'
-        
-        num_predicted = corrected_ghi_final.notna().sum()
-        num_total = len(corrected_ghi_final)
-        if num_predicted < num_total:
-            print(f"Warning: Predictions generated for {num_predicted}/{num_total} timestamps. Others are NaN due to missing inputs or feature NaNs.")
 
-        return corrected_ghi_final
+        for i, frame in usable.items():
+            # Reindex to the full original index, filling NaNs where prediction wasn't possible
+            if i in corrected_ghi_calculated.index.get_level_values('site'):
+                site_ghi = corrected_ghi_calculated.xs(i, level='site')
+            else:
+                site_ghi = pd.Series(dtype=float)
+            corrected_ghi_final = site_ghi.reindex(frame.index)
+            corrected_ghi_final.name = 'corrected_ghi'
+
+            num_predicted = corrected_ghi_final.notna().sum()
+            num_total = len(corrected_ghi_final)
+            if num_predicted < num_total:
+                logger.debug("Predictions generated for %d/%d timestamps. Others are NaN due to missing inputs or feature NaNs.",
+                             num_predicted, num_total)
+            results[i] = corrected_ghi_final
+
+        return results
+
+    def _predict_rows(self, X):
+        """
+        model.predict(X). Large batches are split by rows across the CPU pool:
+        X and the predictions are passed through shared memory, and each pool
+        process loads the model once.
+        """
+        parts = split(len(X), PARALLEL_MIN_ROWS)
+        if len(parts) == 1 or get_cpu_pool() is None:
+            return self.model.predict(X)
+        with SharedArray.from_array(np.asarray(X, dtype=float)) as shared_X, \
+                SharedArray.create((len(X),)) as predictions:
+            run_parts(_predict_part, [(self.model_path, self.model_version, shared_X.spec, predictions.spec,
+                                       first, stop) for first, stop in parts])
+            return predictions.array.copy()
+
+    def predict_ghi(self, latitude, longitude, start_date_str, end_date_str):
+        """
+        Predicts corrected GHI for a given location and time period.
+
+        Args:
+            latitude (float): Latitude of the location.
+            longitude (float): Longitude of the location.
+            start_date_str (str): Start date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+            end_date_str (str): End date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+
+        Returns:
+            pd.Series: Corrected GHI values, or an empty Series if prediction fails.
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model artifacts not loaded. Initialize GHIPredictor correctly.")
+
+        try:
+            start_dt_utc, end_dt_utc = self._parse_period(start_date_str, end_date_str)
+        except Exception as e:
+            logger.error("Error parsing input dates ('%s', '%s'): %s", start_date_str, end_date_str, e)
+            return pd.Series(dtype=float, name='corrected_ghi')
+
+        df_prepared = self._prepare_features_for_prediction(latitude, longitude, start_dt_utc, end_dt_utc)
+        return self._predict_prepared([df_prepared])[0]
+
+    def predict_ghi_many(self, sites, start_date_str, end_date_str):
+        """
+        Predicts corrected GHI for many locations over one shared period.
+
+        Upstream data is fetched once per grid cell and the scaler and model
+        are each invoked once for the whole batch.
+
+        Args:
+            sites (iterable): (latitude, longitude) pairs.
+            start_date_str (str): Start date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+            end_date_str (str): End date ('YYYY-MM-DD' or 'YYYY-MM-DD HH:MM:SS').
+
+        Returns:
+            list[pd.Series]: Corrected GHI values per site, in input order.
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model artifacts not loaded. Initialize GHIPredictor correctly.")
+
+        sites = [(float(lat), float(lon)) for lat, lon in sites]
+        if not sites:
+            return []
+
+        try:
+            start_dt_utc, end_dt_utc = self._parse_period(start_date_str, end_date_str)
+        except Exception as e:
+            logger.error("Error parsing input dates ('%s', '%s'): %s", start_date_str, end_date_str, e)
+            return [pd.Series(dtype=float, name='corrected_ghi') for _ in sites]
+
+        prepared_frames = self._prepare_features_for_sites(sites, start_dt_utc, end_dt_utc)
+        return self._predict_prepared(prepared_frames)
+
+    def predict_ghi_window(self, latitude, longitude, window_days, end_date_str=None):
+        """
+        Predicts daily corrected GHI for the `window_days` days ending on
+        end_date_str (today, UTC, by default), reusing the prediction ledger.
+
+        Days whose ledger entry was predicted from settled inputs are returned
+        as stored. Only new days and days whose inputs were still unsettled are
+        re-fetched, and of those only the ones whose feature row changed are
+        re-predicted, so the cost depends on how many days changed, not on the
+        window length.
+
+        Args:
+            latitude (float): Latitude of the location.
+            longitude (float): Longitude of the location.
+            window_days (int): Number of days in the window, including the end date.
+            end_date_str (str): Last day of the window ('YYYY-MM-DD').
+
+        Returns:
+            pd.Series: Corrected GHI for every day of the window (NaN where no
+            prediction was possible).
+        """
+        if not self.is_loaded:
+            raise RuntimeError("Model artifacts not loaded. Initialize GHIPredictor correctly.")
+
+        end_day = pd.Timestamp(end_date_str) if end_date_str else pd.Timestamp.now(tz='UTC')
+        if end_day.tzinfo is None: end_day = end_day.tz_localize('UTC')
+        else: end_day = end_day.tz_convert('UTC')
+        days = pd.date_range(end=end_day.normalize(), periods=int(window_days), freq='D', name='datetime')
+
+        if self.ledger is None:
+            corrected_ghi = self.predict_ghi(latitude, longitude, days[0].strftime("%Y-%m-%d"), days[-1].strftime("%Y-%m-%d"))
+            return corrected_ghi.reindex(days)
+
+        site = site_key(latitude, longitude)
+        ledger_df = self.ledger.get_rows(site, self.model_version, days)
+        recheck = days.difference(ledger_df.index[ledger_df['settled']])
+
+        corrected_ghi = ledger_df['value'].reindex(days)
+        corrected_ghi.name = 'corrected_ghi'
+        if recheck.empty:
+            return corrected_ghi
+
+        features = self._prepare_features_for_sites(
+            [(latitude, longitude)], recheck.min(), recheck.max() + pd.Timedelta(days=1, seconds=-1))[0]
+        features = features[features.index.isin(recheck)]
+
+        numeric = features.apply(pd.to_numeric, errors='coerce').astype(float)
+        input_hash = pd.util.hash_pandas_object(numeric, index=False).astype(str)
+        changed = input_hash != ledger_df['input_hash'].reindex(features.index)
+
+        values = ledger_df['value'].reindex(features.index)
+        if changed.any():
+            predicted = self._predict_prepared([features[changed]])[0]
+            values = values.where(~changed, predicted.reindex(features.index))
+
+        cutoff = pd.Timestamp.now(tz='UTC').normalize() - pd.Timedelta(days=FEATURE_SETTLED_DAYS)
+        updates = pd.DataFrame({
+            'value': values,
+            'input_hash': input_hash,
+            'settled': (features.index < cutoff) & values.notna(),
+        }, index=features.index)
+        self.ledger.put_rows(site, self.model_version, updates)
+
+        logger.debug("Window of %d days: %d from ledger, %d re-checked, %d predicted.",
+                     len(days), len(days) - len(recheck), len(features), int(changed.sum()))
+
+        corrected_ghi.loc[updates.index] = updates['value']
+        return corrected_ghi
+
+
+# Models loaded in this pool process, by artifact version
+_pool_models = {}
+
+
+def _predict_part(model_path, model_version, X_spec, predictions_spec, first, stop):
+    """Predicts rows first:stop of a shared feature matrix, in a pool process."""
+    if model_version not in _pool_models:
+        _pool_models.clear()
+        _pool_models[model_version] = joblib.load(model_path)
+    with SharedArray.attach(X_spec) as X, SharedArray.attach(predictions_spec) as predictions:
+        predictions.array[first:stop] = _pool_models[model_version].predict(X.array[first:stop])
+
 
 # --- Main Execution Example ---
 if __name__ == '__main__':
+    logging.basicConfig(level=logging.DEBUG, format='%(levelname)s %(name)s: %(message)s')
     print("--- Running GHI Correction Model Prediction Script ---")
 
     # --- User Configuration ---
@@ -473,3 +841,4 @@ if __name__ == '__main__':
         traceback.print_exc()
 
     print("\n--- Prediction Script Finished ---")
+
@@ -0,0 +1,1175 @@
+"""
+Request handling shared by the Flask (WSGI) and ASGI front ends.
+
+Each data source is split into parameter validation, the upstream fetch and
+payload formatting, so the ASGI app can await the fetch on an async client
+while reusing the validation and formatting unchanged.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+from datetime import date, datetime, timedelta, timezone
+import json
+import os
+
+from flask import json as flask_json
+
+from assets import IMMUTABLE_CACHE_CONTROL
+from cache import CachedResult, body_etag, cache_key, get_result_cache
+from climatology import MAX_TILE_ZOOM, SOURCE_LABELS as CLIMATOLOGY_LABELS, get_climatology, render_tile
+from compression import compress, should_compress
+from downsample import MIN_POINTS, lttb_indices
+from gti import DEFAULT_ALBEDO, TRANSPOSITION_MODELS, beam_only, orientation_yield, poa_global, solar_geometry
+from lazy_imports import lazy_import
+from metrics import time_model
+from request_log import log_request
+from timeseries import TimeSeries, epoch_seconds, json_values, to_epoch
+from tracing import span
+from NASA import NASAPowerFetchData, NASAPowerProducts, TemporalResolution
+from CAMS import get_cams_data, get_cams_data_async
+
+np = lazy_import('numpy')
+pd = lazy_import('pandas')
+geopy = lazy_import('geopy')
+
+
+class ServiceError(Exception):
+    """A request that cannot be served, with the message and HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def error_body(exc, source):
+    """
+    Map an exception raised while serving `source` to (body, status), matching
+    the error responses the API has always returned.
+    """
+    if isinstance(exc, ServiceError):
+        return {"error": exc.message}, exc.status
+    if isinstance(exc, ValueError):
+        return {"error": f"Invalid parameter format: {str(exc)}"}, 400
+    if isinstance(exc, AttributeError) and source == 'NASA':
+        return {"error": f"Data processing error for NASA data: {str(exc)}"}, 500
+    return {"error": f"Server error processing {source} request: {str(exc)}"}, 500
+
+
+# --- Downsampling ---
+
+def max_points(request_data):
+    """The request's maxPoints as an int, or None when it asks for every point."""
+    value = request_data.get('maxPoints') if isinstance(request_data, dict) else None
+    if value is None or value == '':
+        return None
+    try:
+        points = float(value)
+    except (TypeError, ValueError):
+        points = None
+    if points is None or not points.is_integer():
+        raise ServiceError("maxPoints must be an integer")
+    points = int(points)
+    if points < MIN_POINTS:
+        raise ServiceError(f"maxPoints must be at least {MIN_POINTS}")
+    return points
+
+
+def full_request(request_data):
+    """request_data without maxPoints, i.e. asking for the full-resolution series."""
+    if not isinstance(request_data, dict):
+        return request_data
+    return {field: value for field, value in request_data.items() if field != 'maxPoints'}
+
+
+@span('downsample')
+def downsample_payload(payload, points):
+    """
+    A data payload (records under "data", or the columnar /api/compare form)
+    reduced to at most `points` rows by LTTB; unchanged when points is None
+    or the payload is already that small.
+    """
+    total = payload.get('num_points', 0)
+    if points is None or total <= points:
+        return payload
+    if 'series' in payload:
+        columns = list(payload['series'].values())
+        values = np.array(columns, dtype=float).T if columns else np.zeros(total)
+        keep = lttb_indices(values, points)
+        payload['datetime'] = [payload['datetime'][i] for i in keep]
+        payload['series'] = {source: [column[i] for i in keep]
+                             for source, column in payload['series'].items()}
+    else:
+        records = payload['data']
+        fields = [field for field, value in records[0].items()
+                  if field != 'datetime' and (value is None or isinstance(value, (int, float)))]
+        values = np.array([[record.get(field) for field in fields] for record in records], dtype=float)
+        keep = lttb_indices(values if fields else np.zeros(total), points)
+        payload['data'] = [records[i] for i in keep]
+    payload['num_points'] = len(keep)
+    payload['downsampled'] = {"method": "lttb", "max_points": points, "original_points": total}
+    return payload
+
+
+# --- Model ---
+
+def model_payload(data):
+    """Compute the /api/model response for a request payload."""
+    from model import SolarIrradianceCalculator, mean_bands
+
+    if not data:
+        raise ServiceError("Invalid JSON payload")
+
+    mode = data.get('mode')
+    latitude = data.get('latitude')
+    longitude = data.get('longitude')
+
+    if latitude is None or longitude is None:
+        raise ServiceError("Missing latitude or longitude")
+
+    try:
+        latitude = float(latitude)
+        longitude = float(longitude)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Invalid coordinate range")
+    except ValueError as e:
+        raise ServiceError(f"Invalid latitude/longitude: {e}")
+
+    if mode == 'year':
+        start_year_str = data.get('startyear')
+        end_year_str = data.get('endyear')
+
+        if not start_year_str or not end_year_str:
+            raise ServiceError("Missing startyear or endyear for 'year' mode")
+        try:
+            start_year = int(start_year_str)
+            end_year = int(end_year_str)
+            # Add reasonable year validation if needed, e.g.,
+            # if not (1900 < start_year < 2100 and 1900 < end_year < 2100 and start_year <= end_year):
+            #     raise ValueError("Invalid year range")
+        except ValueError:
+            raise ServiceError("Invalid year format")
+
+        start_date_str = f"{start_year}-01-01"
+        end_date_str = f"{end_year}-12-31"
+
+        try:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+        except ValueError:
+            raise ServiceError("Internal error generating dates from years", 500)
+
+        # start_date might not be used by constructor
+        model = SolarIrradianceCalculator(latitude, longitude, start_date)
+        with time_model('extraterrestrial'):
+            # Daily statistics streamed a year at a time, never the whole hourly series
+            daily_stats = model.period_stats(start_date, end_date, 'D')
+
+        # Records of 'datetime', 'mean', 'upper', 'lower', with None for NaN
+        stats_list = [{key: None if isinstance(value, float) and value != value else value
+                       for key, value in row.items()}
+                      for row in mean_bands(daily_stats)]
+
+        return {
+            "latitude":   latitude,
+            "longitude":  longitude,
+            "start_date": start_date_str,  # For consistency, though start/end year were inputs
+            "end_date":   end_date_str,
+            "num_points": len(stats_list),
+            # Expected by avgChart: [{datetime (label), mean, upper, lower}, ...]
+            "data":       stats_list,
+        }
+
+    elif mode == 'date':
+        start_date_str = data.get('startDate')
+        end_date_str = data.get('endDate')
+        time_granularity = data.get('timeGranularity', 'Daily')
+
+        if not start_date_str or not end_date_str:
+            raise ServiceError("Invalid or missing start/end date for 'date' mode")
+
+        try:
+            start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+            end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+        except ValueError:
+            raise ServiceError("Dates must be in YYYY-MM-DD format")
+        if end_date < start_date:
+            raise ServiceError("End date cannot be before start date")
+
+        if time_granularity not in ('Hourly', 'Daily', 'Monthly'):
+            raise ServiceError("Invalid timeGranularity for 'date' mode")
+
+        # start_date might not be used by constructor
+        model = SolarIrradianceCalculator(latitude, longitude, start_date)
+        with time_model('extraterrestrial'):
+            hourly_series = model.generate_hourly_series(start_date, end_date)
+
+        results = []
+        if time_granularity == 'Hourly':
+            series_to_process = hourly_series  # Already hourly
+            for h in series_to_process:
+                results.append({
+                    "datetime": h['datetime'].isoformat() if isinstance(h['datetime'], datetime) else h['datetime'],
+                    "GHI": h.get('irradiance'),  # Use .get for safety
+                    "DHI": None,
+                    "DNI": None
+                })
+        elif time_granularity == 'Daily':
+            daily_series = model.resample_daily(hourly_series)
+            for d in daily_series:
+                results.append({
+                    "datetime": d['datetime'].isoformat() if isinstance(d['datetime'], datetime) else d['datetime'],
+                    "GHI": d.get('irradiance'),
+                    "DHI": None,
+                    "DNI": None
+                })
+        else:
+            monthly_series = model.resample_monthly(hourly_series)
+            for m in monthly_series:
+                # Construct a datetime object for the first day of the month
+                month_dt = datetime(int(m['year']), int(
+                    m['month']), 1, tzinfo=timezone.utc)
+                results.append({
+                    "datetime": month_dt.isoformat(),
+                    "GHI": m.get('irradiance'),
+                    "DHI": None,
+                    "DNI": None
+                })
+
+        return {
+            "latitude": latitude,
+            "longitude": longitude,
+            "start_date": start_date_str,
+            "end_date": end_date_str,
+            "time_granularity": time_granularity,
+            "num_points": len(results),
+            # Standardized data: [{"datetime":..., "GHI":..., "DHI":null, "DNI":null}, ...]
+            "data": results,
+        }
+    else:
+        raise ServiceError("Invalid mode selected")
+
+
+# --- CAMS ---
+
+# Response column of each CAMS column
+CAMS_COLUMNS = {'GHI': 'ghi', 'DHI': 'dhi', 'DNI': 'dni'}
+
+
+@span('cams.validate')
+def cams_params(request_data):
+    """Validate a /api/cams payload and return the keyword arguments for get_cams_data."""
+    if not request_data:
+        raise ServiceError("Invalid JSON payload")
+
+    required_fields = ['latitude', 'longitude',
+                       'startDate', 'endDate', 'mode']
+    for field in required_fields:
+        if field not in request_data:
+            raise ServiceError(f"Missing required field: {field}")
+
+    # CAMS typically provides time series, so 'mode' should usually be 'date'
+    if request_data['mode'] != 'date':
+        raise ServiceError("CAMS API currently only supports 'date' mode for time series.")
+
+    # Map frontend timeGranularity to CAMS expected time_step
+    cams_time_step_map = {
+        "Hourly": "1h",
+        "Daily": "1d",
+        "Monthly": "1M"
+    }
+    params = {
+        'latitude': float(request_data['latitude']),
+        'longitude': float(request_data['longitude']),
+        'start_date': request_data['startDate'],
+        'end_date': request_data['endDate'],
+        'time_step': cams_time_step_map.get(
+            request_data.get('timeGranularity', 'Hourly'), '1h'),
+        'email': os.getenv('CAMS_EMAIL', 'default@example.com')
+    }
+
+    if not (-90 <= params['latitude'] <= 90) or not (-180 <= params['longitude'] <= 180):
+        raise ServiceError("Invalid coordinates")
+
+    # Validate dates
+    datetime.strptime(params['start_date'], "%Y-%m-%d")
+    datetime.strptime(params['end_date'], "%Y-%m-%d")
+    return params
+
+
+def fetch_cams(params):
+    """Fetch CAMS data for validated params (blocking)."""
+    return get_cams_data(**params)
+
+
+async def fetch_cams_async(params, client=None):
+    """Fetch CAMS data for validated params on an async HTTP client."""
+    return await get_cams_data_async(**params, client=client)
+
+
+@span('cams.format')
+def format_cams(request_data, params, cams_result):
+    """Standardize a get_cams_data result into the /api/cams response."""
+    if cams_result.get('error'):
+        raise ServiceError(f"CAMS API Error: {cams_result['error']}", 500)
+
+    if not cams_result.get('series'):
+        raise ServiceError("CAMS API returned no data or invalid data format", 500)
+
+    # Standardize the output for the frontend; CAMS times are UTC
+    formatted_data = cams_result['series'].to_records(CAMS_COLUMNS, time_suffix='Z')
+
+    return {
+        "latitude": params['latitude'],
+        "longitude": params['longitude'],
+        "start_date": params['start_date'],
+        "end_date": params['end_date'],
+        "time_granularity": request_data.get('timeGranularity', 'Hourly'),
+        "num_points": len(formatted_data),
+        "data": formatted_data,  # Standardized data
+        # Optional: pass along CAMS specific metadata
+        "metadata_cams": cams_result.get('metadata')
+    }
+
+
+def cams_payload(request_data):
+    """Compute the /api/cams response for a request payload."""
+    params = cams_params(request_data)
+    return format_cams(request_data, params, fetch_cams(params))
+
+
+# --- NASA ---
+
+NASA_PRODUCTS = [NASAPowerProducts.GHI, NASAPowerProducts.DHI, NASAPowerProducts.DNI]
+# Response column of each NASA POWER parameter
+NASA_COLUMNS = {NASAPowerProducts.GHI.value: 'GHI', NASAPowerProducts.DHI.value: 'DHI', NASAPowerProducts.DNI.value: 'DNI'}
+
+
+@span('nasa.validate')
+def nasa_params(request_data):
+    """Validate a /api/nasa payload and return the arguments for the NASA fetcher."""
+    if not request_data:
+        raise ServiceError("Invalid JSON payload")
+
+    required_fields = ['latitude', 'longitude',
+                       'startDate', 'endDate', 'mode']
+    for field in required_fields:
+        if field not in request_data:
+            raise ServiceError(f"Missing required field: {field}")
+
+    # NASA POWER API typically provides time series, so 'mode' should usually be 'date'
+    if request_data['mode'] != 'date':
+        raise ServiceError("NASA API currently only supports 'date' mode for time series.")
+
+    start_date_str = request_data['startDate']
+    end_date_str = request_data['endDate']
+
+    try:
+        start_date = datetime.strptime(start_date_str, "%Y-%m-%d")
+        end_date = datetime.strptime(end_date_str, "%Y-%m-%d")
+    except ValueError:
+        raise ServiceError("Dates must be in YYYY-MM-DD format")
+    if end_date < start_date:
+        raise ServiceError("End date cannot be before start date")
+
+    location = geopy.Point(
+        latitude=float(request_data['latitude']),
+        longitude=float(request_data['longitude'])
+    )
+    if not (-90 <= location.latitude <= 90 and -180 <= location.longitude <= 180):
+        raise ServiceError("Invalid coordinates")
+
+    # Determine temporal resolution for NASA API from frontend's timeGranularity
+    nasa_temporal_resolution_map = {
+        "Hourly": TemporalResolution.HOURLY,
+        "Daily": TemporalResolution.DAILY,
+        "Monthly": TemporalResolution.MONTHLY
+    }
+    time_granularity_frontend = request_data.get('timeGranularity', 'Hourly')
+    nasa_temporal_res = nasa_temporal_resolution_map.get(time_granularity_frontend)
+
+    if not nasa_temporal_res:
+        raise ServiceError(f"Unsupported timeGranularity for NASA: {time_granularity_frontend}")
+
+    return {
+        'temporal_resolution': nasa_temporal_res,
+        'start_date': start_date,
+        'end_date': end_date,
+        'location': location,
+        'products': NASA_PRODUCTS,
+        'start_date_str': start_date_str,
+        'end_date_str': end_date_str,
+        'time_granularity': time_granularity_frontend,
+    }
+
+
+def _nasa_fetch_args(params):
+    args = {key: params[key] for key in ('temporal_resolution', 'start_date', 'end_date', 'location', 'products')}
+    if params.get('time_standard'):
+        args['time_standard'] = params['time_standard']
+    return args
+
+
+def fetch_nasa(params):
+    """Fetch GHI, DHI and DNI from NASA POWER for validated params (blocking)."""
+    return NASAPowerFetchData().fetch_multiple_parameters(**_nasa_fetch_args(params))
+
+
+async def fetch_nasa_async(params, client=None):
+    """Fetch GHI, DHI and DNI from NASA POWER on an async HTTP client."""
+    return await NASAPowerFetchData().fetch_multiple_parameters_async(**_nasa_fetch_args(params), client=client)
+
+
+@span('nasa.format')
+def format_nasa(params, nasa_api_result, logger=None):
+    """Standardize the raw NASA POWER parameter dict into the /api/nasa response."""
+    # Missing values (-999) become null; products missing from the response are null throughout
+    series = TimeSeries.from_nasa(nasa_api_result, NASA_COLUMNS)
+    formatted_data = series.to_records(list(NASA_COLUMNS.values()))
+
+    return {
+        "latitude":   params['location'].latitude,
+        "longitude":  params['location'].longitude,
+        "time_granularity": params['time_granularity'],
+        "start_date": params['start_date_str'],
+        "end_date":   params['end_date_str'],
+        "num_points": len(formatted_data),
+        "data":       formatted_data,
+    }
+
+
+def nasa_payload(request_data, logger=None):
+    """Compute the /api/nasa response for a request payload."""
+    params = nasa_params(request_data)
+    return format_nasa(params, fetch_nasa(params), logger=logger)
+
+
+# --- Corrected GHI (random forest) ---
+
+RF_MODEL_DIR = os.getenv('RF_MODEL_DIR', 'RF_MODEL')
+
+_predictor = None
+
+
+def get_predictor():
+    """Process-wide GHIPredictor, loaded on first use."""
+    global _predictor
+    if _predictor is None:
+        from rf_model import GHIPredictor
+        try:
+            _predictor = GHIPredictor(model_base_dir=RF_MODEL_DIR)
+        except FileNotFoundError as e:
+            raise ServiceError(f"Corrected GHI model is not available: {e}", 503)
+    return _predictor
+
+
+def predict_corrected_ghi(latitude, longitude, start_date_str, end_date_str):
+    """
+    Daily corrected GHI Series for a period. Periods reaching into the last
+    FEATURE_SETTLED_DAYS days, such as "the last 30 days", go through the
+    prediction ledger, which only re-predicts the days whose inputs changed
+    since the site was last asked for.
+    """
+    from rf_model import FEATURE_SETTLED_DAYS
+
+    predictor = get_predictor()
+    start = datetime.strptime(start_date_str, "%Y-%m-%d").date()
+    end = datetime.strptime(end_date_str, "%Y-%m-%d").date()
+    if end >= datetime.now(timezone.utc).date() - timedelta(days=FEATURE_SETTLED_DAYS):
+        return predictor.predict_ghi_window(latitude, longitude, (end - start).days + 1, end_date_str)
+    return predictor.predict_ghi(latitude, longitude, start_date_str, end_date_str)
+
+
+def predict_payload(request_data):
+    """Compute daily RF-corrected GHI for one site and period."""
+    if not request_data:
+        raise ServiceError("Invalid JSON payload")
+
+    for field in ['latitude', 'longitude', 'startDate', 'endDate']:
+        if field not in request_data:
+            raise ServiceError(f"Missing required field: {field}")
+
+    latitude = float(request_data['latitude'])
+    longitude = float(request_data['longitude'])
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ServiceError("Invalid coordinates")
+    try:
+        start_date = datetime.strptime(request_data['startDate'], "%Y-%m-%d")
+        end_date = datetime.strptime(request_data['endDate'], "%Y-%m-%d")
+    except ValueError:
+        raise ServiceError("Dates must be in YYYY-MM-DD format")
+    if end_date < start_date:
+        raise ServiceError("End date cannot be before start date")
+
+    corrected_ghi = predict_corrected_ghi(latitude, longitude, request_data['startDate'], request_data['endDate'])
+    results = predict_records(corrected_ghi)
+
+    return {
+        "latitude": latitude,
+        "longitude": longitude,
+        "start_date": request_data['startDate'],
+        "end_date": request_data['endDate'],
+        "time_granularity": "Daily",
+        "num_points": len(results),
+        "data": results,
+    }
+
+
+def predict_records(corrected_ghi):
+    """The response rows of a corrected GHI Series."""
+    return [{
+        "datetime": ts.isoformat(),
+        "GHI": None if pd.isna(value) else float(value),
+        "DHI": None,
+        "DNI": None
+    } for ts, value in corrected_ghi.items()]
+
+
+# --- Climatology map ---
+
+# Leaflet URL template of the climatology tiles; {v} is the raster version
+TILE_URL_TEMPLATE = "/tiles/{z}/{x}/{y}.png?source={source}&period={period}&v={v}"
+
+
+def require_climatology():
+    """The climatology raster, or a 404 ServiceError when it has not been built."""
+    raster = get_climatology()
+    if raster is None:
+        raise ServiceError("The climatology raster has not been built", 404)
+    return raster
+
+
+def climatology_info():
+    """What the map needs to show the climatology overlays."""
+    raster = require_climatology()
+    return {
+        'sources': raster.sources,
+        'labels': {source: CLIMATOLOGY_LABELS.get(source, source) for source in raster.sources},
+        'periods': raster.periods,
+        'units': raster.header['units'],
+        'ranges': raster.header['ranges'],
+        'bounds': list(raster.bounds),
+        'cellsize': raster.cellsize,
+        'reference_year': raster.header['reference_year'],
+        'version': raster.version,
+        'tile_url': TILE_URL_TEMPLATE,
+        'max_zoom': MAX_TILE_ZOOM,
+    }
+
+
+def climatology_point_payload(request_data):
+    """Monthly and annual climatology of the grid cell containing a point."""
+    raster = require_climatology()
+    if not request_data:
+        raise ServiceError("Missing latitude or longitude")
+    try:
+        latitude = float(request_data['latitude'])
+        longitude = float(request_data['longitude'])
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError("Invalid coordinate range")
+    except KeyError:
+        raise ServiceError("Missing latitude or longitude")
+    except (TypeError, ValueError) as e:
+        raise ServiceError(f"Invalid latitude/longitude: {e}")
+
+    values = raster.point(latitude, longitude)
+    if values is None:
+        raise ServiceError("The point is outside the climatology grid", 404)
+    cell_latitude, cell_longitude = raster.cell_center(latitude, longitude)
+    return {
+        'latitude': latitude,
+        'longitude': longitude,
+        'cell': {'latitude': cell_latitude, 'longitude': cell_longitude, 'size': raster.cellsize},
+        'units': raster.header['units'],
+        'version': raster.version,
+        'values': values,
+    }
+
+
+def tile_params(request_data, z, x, y):
+    """Validated source, period and tile coordinates of a tile request."""
+    raster = require_climatology()
+    source = request_data.get('source', 'model')
+    period = request_data.get('period', 'annual')
+    if source not in raster.sources:
+        raise ServiceError(f"Unknown climatology source: {source}")
+    if period not in raster.periods:
+        raise ServiceError(f"Unknown climatology period: {period}")
+    if not (0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise ServiceError("Tile out of range", 404)
+    return {'source': source, 'period': period, 'z': z, 'x': x, 'y': y}
+
+
+def tile_result(request_data, z, x, y):
+    """
+    CachedResult of a climatology tile PNG. Tiles are rendered once per
+    raster version and then served from the result cache.
+    """
+    raster = require_climatology()
+    params = tile_params(request_data, z, x, y)
+    key = cache_key('tiles', dict(params, version=raster.version))
+    cache = get_result_cache()
+    result = cache.get_entry(key)
+    if result is None:
+        with span('climatology.tile'):
+            body = render_tile(raster, params['source'], params['period'], z, x, y)
+        result = cache.put(key, 'tiles', body, compressible=False)
+    return result
+
+
+def tile_cache_control(request_data):
+    """Tiles requested for the current raster version never change; others revalidate."""
+    raster = get_climatology()
+    if raster is not None and request_data.get('v') == raster.version:
+        return IMMUTABLE_CACHE_CONTROL
+    return CACHE_CONTROL_REVALIDATE
+
+
+# --- Comparison ---
+
+COMPARE_SOURCES = ['model', 'nasa', 'cams', 'predict']
+# datetime64 unit of each comparison granularity
+COMPARE_UNITS = {'Hourly': 'h', 'Daily': 'D', 'Monthly': 'M'}
+# NASA POWER reports daily and monthly GHI in kWh/m²/day; hourly values are
+# Wh/m² per hour, i.e. already a mean W/m².
+NASA_KWH_PER_DAY_TO_W = 1000 / 24
+
+
+@span('compare.validate')
+def compare_params(request_data):
+    """
+    Validate a /api/compare payload. Returns the shared site and period plus
+    the validated per-source parameters.
+    """
+    if not request_data:
+        raise ServiceError("Invalid JSON payload")
+
+    for field in ['latitude', 'longitude', 'startDate', 'endDate']:
+        if field not in request_data:
+            raise ServiceError(f"Missing required field: {field}")
+
+    time_granularity = request_data.get('timeGranularity', 'Daily')
+    if time_granularity not in COMPARE_UNITS:
+        raise ServiceError("Invalid timeGranularity for comparison")
+
+    reference = request_data.get('reference', 'cams')
+    if reference not in COMPARE_SOURCES:
+        raise ServiceError(f"Unsupported reference source: {reference}")
+
+    source_request = dict(request_data, mode='date', timeGranularity=time_granularity)
+    nasa = nasa_params(source_request)
+    if time_granularity == 'Hourly':
+        nasa['time_standard'] = 'UTC'
+
+    return {
+        'latitude': nasa['location'].latitude,
+        'longitude': nasa['location'].longitude,
+        'start_date': nasa['start_date'],
+        'end_date': nasa['end_date'],
+        'start_date_str': nasa['start_date_str'],
+        'end_date_str': nasa['end_date_str'],
+        'time_granularity': time_granularity,
+        'reference': reference,
+        'max_points': max_points(request_data),
+        'nasa': nasa,
+        'cams': cams_params(source_request),
+    }
+
+
+def compare_index(params):
+    """UTC epoch seconds covering every whole day of the period at the requested granularity."""
+    unit = COMPARE_UNITS[params['time_granularity']]
+    start = np.datetime64(params['start_date'], unit)
+    end = np.datetime64(params['end_date'] + timedelta(days=1), 'D')
+    # Every interval starting before the end of the last day
+    starts = np.arange(start, end.astype(f'datetime64[{unit}]') + 1)
+    return starts[starts < end].astype('datetime64[s]').astype(np.int64)
+
+
+def model_series(params):
+    """Model GHI as mean W/m² per interval, covering whole days."""
+    from model import SolarIrradianceCalculator
+
+    start = params['start_date']
+    end = params['end_date'] + timedelta(hours=23)
+    model = SolarIrradianceCalculator(params['latitude'], params['longitude'], start)
+    unit = COMPARE_UNITS[params['time_granularity']]
+    with time_model('extraterrestrial'):
+        if unit == 'h':
+            values = model.hourly_irradiance(start, end)
+            return TimeSeries(epoch_seconds(start) + 3600 * np.arange(len(values)), {'GHI': values})
+        stats = model.period_stats(start, end, unit).result()
+    return TimeSeries(to_epoch(stats['period']), {'GHI': stats['mean']})
+
+
+def nasa_series(params, nasa_api_result):
+    """NASA POWER GHI as mean W/m² per interval."""
+    # Monthly responses also carry an annual value under month 13, which is dropped
+    series = TimeSeries.from_nasa(nasa_api_result, {NASAPowerProducts.GHI.value: 'GHI'})
+    if params['time_granularity'] != 'Hourly':
+        series = TimeSeries(series.index, {'GHI': series['GHI'] * NASA_KWH_PER_DAY_TO_W})
+    return series
+
+
+def cams_series(params, cams_result):
+    """CAMS GHI, already a mean W/m² per interval."""
+    if cams_result.get('error'):
+        raise ServiceError(f"CAMS API Error: {cams_result['error']}", 500)
+    series = cams_result.get('series')
+    return series.select({'GHI': 'ghi'}) if series else TimeSeries(np.empty(0, dtype=np.int64), {'GHI': []})
+
+
+def predict_series(params):
+    """RF-corrected GHI as mean W/m² per day; only daily predictions exist."""
+    if params['time_granularity'] != 'Daily':
+        raise ServiceError("Corrected GHI is only available at Daily granularity", 422)
+    corrected_ghi = predict_corrected_ghi(
+        params['latitude'], params['longitude'], params['start_date_str'], params['end_date_str'])
+    return TimeSeries.from_series(corrected_ghi.astype(float) * NASA_KWH_PER_DAY_TO_W, 'GHI')
+
+
+@span('compare.align')
+def format_compare(params, results):
+    """
+    Align every source on one UTC index and build the columnar /api/compare
+    response. `results` maps each source to its GHI TimeSeries, or to the
+    exception that source raised. The summary is computed before any
+    downsampling.
+    """
+    index = compare_index(params)
+    unit = COMPARE_UNITS[params['time_granularity']]
+    columns, sources = {}, {}
+    for source in COMPARE_SOURCES:
+        result = results.get(source)
+        if isinstance(result, Exception):
+            body, status = error_body(result, SOURCE_LABELS[source])
+            sources[source] = {"status": "unavailable" if status in (422, 503) else "error",
+                               "error": body['error']}
+            continue
+        # Label each value with the UTC start of its interval
+        columns[source] = result.floor(unit).reindex(index)['GHI']
+        sources[source] = {"status": "ok"}
+
+    summary = {}
+    reference = params['reference']
+    if reference in columns:
+        for source, values in columns.items():
+            if source == reference:
+                continue
+            diff = values - columns[reference]
+            n = int(np.count_nonzero(~np.isnan(diff)))
+            summary[source] = {
+                "n": n,
+                "bias": float(np.nanmean(diff)) if n else None,
+                "rmse": float(np.sqrt(np.nanmean(diff ** 2))) if n else None,
+            }
+
+    return downsample_payload({
+        "latitude": params['latitude'],
+        "longitude": params['longitude'],
+        "start_date": params['start_date_str'],
+        "end_date": params['end_date_str'],
+        "time_granularity": params['time_granularity'],
+        "units": "W/m²",
+        "reference": reference,
+        "num_points": len(index),
+        "datetime": TimeSeries(index).time_strings('+00:00'),
+        "series": {source: json_values(values) for source, values in columns.items()},
+        "summary": summary,
+        "sources": sources,
+    }, params['max_points'])
+
+
+def _capture(fn, *args):
+    try:
+        return fn(*args)
+    except Exception as e:
+        return e
+
+
+_compare_pool = ThreadPoolExecutor(max_workers=len(COMPARE_SOURCES) * 4, thread_name_prefix='compare')
+
+
+def compare_payload(request_data):
+    """Compute the /api/compare response, fetching every source concurrently."""
+    params = compare_params(request_data)
+    tasks = {
+        'model': lambda: model_series(params),
+        'nasa': lambda: nasa_series(params, fetch_nasa(params['nasa'])),
+        'cams': lambda: cams_series(params, fetch_cams(params['cams'])),
+        'predict': lambda: predict_series(params),
+    }
+    # Run each source in a copy of this context so its spans join the request trace
+    futures = {source: _compare_pool.submit(contextvars.copy_context().run, _capture, task)
+               for source, task in tasks.items()}
+    return format_compare(params, {source: future.result() for source, future in futures.items()})
+
+
+
+# --- Plane-of-array irradiance (GTI) ---
+
+GTI_SOURCES = ['model', 'nasa', 'cams']
+# Seconds from each source's hourly timestamps to the moment its value
+# describes: the model is instantaneous at the hour, NASA POWER and CAMS are
+# means over the hour starting at the timestamp
+GTI_TIME_OFFSETS = {'model': 0, 'nasa': 1800, 'cams': 1800}
+
+
+def _bounded(value, field, default, low, high):
+    """A request field as a float within [low, high], or `default` when absent."""
+    if value is None or value == '':
+        return default
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ServiceError(f"{field} must be a number")
+    if not low <= number <= high:
+        raise ServiceError(f"{field} must be between {low:g} and {high:g}")
+    return number
+
+
+@span('gti.validate')
+def gti_params(request_data):
+    """
+    Validate a /api/gti payload: the site, period and source, the plane's
+    tilt and azimuth (pvlib convention, 180 facing south) and the
+    transposition model. The source is always fetched hourly in UTC.
+    """
+    if not request_data:
+        raise ServiceError("Invalid JSON payload")
+
+    for field in ['latitude', 'longitude', 'startDate', 'endDate']:
+        if field not in request_data:
+            raise ServiceError(f"Missing required field: {field}")
+
+    source = request_data.get('source', 'nasa')
+    if source not in GTI_SOURCES:
+        raise ServiceError(f"Unsupported GTI source: {source}")
+    time_granularity = request_data.get('timeGranularity', 'Hourly')
+    if time_granularity not in COMPARE_UNITS:
+        raise ServiceError("Invalid timeGranularity for GTI")
+    transposition = request_data.get('transposition', 'perez')
+    if transposition not in TRANSPOSITION_MODELS:
+        raise ServiceError(f"Unsupported transposition model: {transposition}")
+
+    # Transposition needs the hourly components, whatever granularity is returned
+    source_request = dict(request_data, mode='date', timeGranularity='Hourly')
+    nasa = nasa_params(source_request)
+    nasa['time_standard'] = 'UTC'
+    latitude = nasa['location'].latitude
+
+    return {
+        'latitude': latitude,
+        'longitude': nasa['location'].longitude,
+        'start_date': nasa['start_date'],
+        'end_date': nasa['end_date'],
+        'start_date_str': nasa['start_date_str'],
+        'end_date_str': nasa['end_date_str'],
+        'time_granularity': time_granularity,
+        'source': source,
+        'tilt': _bounded(request_data.get('tilt', request_data.get('tiltAngle')), 'tilt', 30.0, 0, 90),
+        # Facing the equator unless asked otherwise
+        'azimuth': _bounded(request_data.get('azimuth'), 'azimuth', 180.0 if latitude >= 0 else 0.0, 0, 360),
+        'transposition': transposition,
+        'albedo': _bounded(request_data.get('albedo'), 'albedo', DEFAULT_ALBEDO, 0, 1),
+        'max_points': max_points(request_data),
+        'nasa': nasa,
+        'cams': cams_params(source_request),
+    }
+
+
+@span('gti.inputs')
+def gti_components(params):
+    """
+    Hourly GHI, DHI and DNI of the requested source on every UTC hour of the
+    period, and the solar geometry of those hours. The model has no diffuse
+    part, so all of its GHI is taken as beam.
+    """
+    hourly = dict(params, time_granularity='Hourly')
+    source = params['source']
+    if source == 'model':
+        series = model_series(hourly)
+    elif source == 'nasa':
+        series = TimeSeries.from_nasa(fetch_nasa(params['nasa']), NASA_COLUMNS)
+    else:
+        cams_result = fetch_cams(params['cams'])
+        if cams_result.get('error'):
+            raise ServiceError(f"CAMS API Error: {cams_result['error']}", 500)
+        if not cams_result.get('series'):
+            raise ServiceError("CAMS API returned no data or invalid data format", 500)
+        series = cams_result['series'].select(CAMS_COLUMNS)
+    series = series.reindex(compare_index(hourly))
+
+    geometry = solar_geometry(series.index, params['latitude'], params['longitude'], GTI_TIME_OFFSETS[source])
+    if source == 'model':
+        dhi, dni = beam_only(series['GHI'], geometry)
+        series = TimeSeries(series.index, {'GHI': series['GHI'], 'DHI': dhi, 'DNI': dni})
+    return series, geometry
+
+
+def period_means(series, params):
+    """An hourly series as mean W/m² per interval of the requested granularity."""
+    from TOOLS.aggregate import PeriodStats
+
+    unit = COMPARE_UNITS[params['time_granularity']]
+    if unit == 'h':
+        return series
+    index = compare_index(params)
+    columns = {}
+    for name, values in series.columns.items():
+        stats = PeriodStats(unit).update(series.datetimes(), values).result()
+        columns[name] = TimeSeries(to_epoch(stats['period']), {name: stats['mean']}).reindex(index)[name]
+    return TimeSeries(index, columns)
+
+
+def gti_payload(request_data):
+    """
+    Compute the /api/gti response: plane-of-array global irradiance (GTI)
+    with the GHI, DHI and DNI it was transposed from, and the energy on the
+    plane against the horizontal over the whole period.
+    """
+    params = gti_params(request_data)
+    series, geometry = gti_components(params)
+    with time_model('transposition'), span('gti.transpose'):
+        poa = poa_global(geometry, series['GHI'], series['DHI'], series['DNI'],
+                         params['tilt'], params['azimuth'], params['transposition'], params['albedo'])
+
+    # Hourly means in W/m² sum to Wh/m²; only hours with every input count
+    valid = ~np.isnan(poa)
+    gti_kwh = float(poa[valid].sum() / 1000)
+    ghi_kwh = float(series['GHI'][valid].sum() / 1000)
+    out = period_means(TimeSeries(series.index, {'GTI': poa, **series.columns}), params)
+    data = out.to_records(['GTI', 'GHI', 'DHI', 'DNI'], time_suffix='+00:00')
+
+    return downsample_payload({
+        "latitude": params['latitude'],
+        "longitude": params['longitude'],
+        "start_date": params['start_date_str'],
+        "end_date": params['end_date_str'],
+        "time_granularity": params['time_granularity'],
+        "source": params['source'],
+        "tilt": params['tilt'],
+        "azimuth": params['azimuth'],
+        "transposition": params['transposition'],
+        "albedo": params['albedo'],
+        "units": "W/m²",
+        "summary": {
+            "hours": int(valid.sum()),
+            "gti_kwh": round(gti_kwh, 2),
+            "ghi_kwh": round(ghi_kwh, 2),
+            "gain": round(gti_kwh / ghi_kwh - 1, 4) if ghi_kwh > 0 else None,
+        },
+        "num_points": len(data),
+        "data": data,
+    }, params['max_points'])
+
+
+def gti_optimum_payload(request_data):
+    """
+    Compute the /api/gti/optimum response: the yearly plane-of-array energy
+    of every orientation on a tilt x azimuth grid (tiltStep, azimuthStep in
+    degrees), evaluated in one broadcast sweep, and the best of them.
+    Energies over periods other than a year are scaled to a year.
+    """
+    params = gti_params(request_data)
+    tilt_step = _bounded(request_data.get('tiltStep'), 'tiltStep', 5.0, 1, 45)
+    azimuth_step = _bounded(request_data.get('azimuthStep'), 'azimuthStep', 10.0, 1, 90)
+    tilts = np.arange(0, 90 + tilt_step / 2, tilt_step).clip(max=90)
+    azimuths = np.arange(0, 360 - azimuth_step / 2, azimuth_step)
+
+    series, geometry = gti_components(params)
+    with time_model('transposition'), span('gti.sweep'):
+        energy, hours = orientation_yield(geometry, series['GHI'], series['DHI'], series['DNI'], tilts, azimuths,
+                                          params['transposition'], params['albedo'])
+
+    days = (params['end_date'] - params['start_date']).days + 1
+    annual = energy * 365.25 / days
+    best = np.unravel_index(np.argmax(annual), annual.shape)
+    # Every azimuth of a flat plane is the horizontal
+    horizontal = float(annual[0, 0]) if tilts[0] == 0 else None
+    optimum = float(annual[best])
+    return {
+        "latitude": params['latitude'],
+        "longitude": params['longitude'],
+        "start_date": params['start_date_str'],
+        "end_date": params['end_date_str'],
+        "source": params['source'],
+        "transposition": params['transposition'],
+        "albedo": params['albedo'],
+        "units": "kWh/m²/year",
+        "days": days,
+        "hours": hours,
+        "tilts": tilts.tolist(),
+        "azimuths": azimuths.tolist(),
+        "annual_yield": annual.round(1).tolist(),
+        "horizontal": round(horizontal, 1) if horizontal is not None else None,
+        "optimum": {
+            "tilt": float(tilts[best[0]]),
+            "azimuth": float(azimuths[best[1]]),
+            "annual_yield": round(optimum, 1),
+            "gain": round(optimum / horizontal - 1, 4) if horizontal else None,
+        },
+    }
+
+
+PAYLOADS = {
+    'model': model_payload,
+    'nasa': nasa_payload,
+    'cams': cams_payload,
+    'predict': predict_payload,
+}
+SOURCE_LABELS = {'model': 'model', 'nasa': 'NASA', 'cams': 'CAMS', 'predict': 'prediction'}
+
+# Request fields each source reads, with the value it assumes when a field is
+# absent. Required fields have no default, so a request missing one still
+# fails validation instead of matching a complete request's cache entry.
+REQUEST_FIELDS = {
+    'model': {'mode': None, 'latitude': None, 'longitude': None, 'startDate': None, 'endDate': None,
+              'timeGranularity': 'Daily', 'startyear': None, 'endyear': None, 'maxPoints': None},
+    'nasa': {'mode': None, 'latitude': None, 'longitude': None, 'startDate': None, 'endDate': None,
+             'timeGranularity': 'Hourly', 'maxPoints': None},
+    'cams': {'mode': None, 'latitude': None, 'longitude': None, 'startDate': None, 'endDate': None,
+             'timeGranularity': 'Hourly', 'maxPoints': None},
+    'predict': {'latitude': None, 'longitude': None, 'startDate': None, 'endDate': None},
+}
+# Parsed as numbers, so 45, 45.0 and "45" are the same request
+NUMERIC_FIELDS = {'latitude', 'longitude', 'maxPoints'}
+
+
+def request_key(source, request_data):
+    """
+    Result-cache key for a request: only the fields the source reads, with
+    defaults filled in and coordinates as floats, so requests that produce
+    the same response share one entry.
+    """
+    return cache_key(source, normalized_request(source, request_data))
+
+
+def normalized_request(source, request_data):
+    """The fields of request_data that request_key() is built from."""
+    fields = REQUEST_FIELDS.get(source)
+    if fields is None or not isinstance(request_data, dict):
+        return request_data
+    normalized = {}
+    for field, default in fields.items():
+        value = request_data.get(field, default)
+        if value is None:
+            continue
+        if field in NUMERIC_FIELDS:
+            try:
+                value = float(value)
+            except (TypeError, ValueError):
+                pass
+        normalized[field] = value
+    return normalized
+
+
+def dump_payload(payload):
+    """Serialize a payload exactly as the API sends it (Flask's compact, key-sorted JSON)."""
+    with span('serialize') as serialize:
+        body = (flask_json.dumps(payload, separators=(",", ":"), sort_keys=True) + "\n").encode('utf-8')
+        serialize.add_bytes(len(body))
+    return body
+
+
+def cached_result(source, request_data, compute=None, encoding=None):
+    """
+    CachedResult (body, ETag and encoding) for a request, from the result
+    cache when present, compressed with `encoding` when the body is large
+    enough. `compute` overrides how the payload is produced on a miss.
+    """
+    key = request_key(source, request_data)
+    result = get_result_cache().get_entry(key, encoding)
+    points = None if result is not None else max_points(request_data)
+    if points is None:
+        log_lookup(source, request_data, result is not None)
+    if result is None:
+        if points is None:
+            payload = (compute or PAYLOADS[source])(request_data)
+        else:
+            # Downsampled from the full-resolution result, which is cached
+            # too; that lookup is the one logged
+            full = cached_body(source, full_request(request_data), compute)
+            payload = downsample_payload(json.loads(full), points)
+        result = store_payload(source, key, payload, encoding)
+    return encode_result(result, encoding)
+
+
+def log_lookup(source, request_data, hit):
+    """
+    Log a data request for the cache warmer (see request_log.py), under its
+    full-resolution parameters; `hit` is whether it was served from cache.
+    """
+    if source in REQUEST_FIELDS and isinstance(request_data, dict):
+        full = full_request(request_data)
+        log_request(source, normalized_request(source, full), request_key(source, full), hit)
+
+
+def cached_body(source, request_data, compute=None):
+    """Serialized payload for a request, from the result cache when present."""
+    return cached_result(source, request_data, compute).body
+
+
+def store_payload(source, key, payload, encoding=None):
+    """
+    Serialize a payload, store it in the result cache under key and return
+    its CachedResult in `encoding`.
+    """
+    return get_result_cache().put(key, source, dump_payload(payload), encoding)
+
+
+def encode_result(result, encoding):
+    """
+    result compressed with `encoding`, for bodies the result cache did not
+    compress, such as uncached responses.
+    """
+    if encoding is None or result.encoding is not None or not should_compress(result.body):
+        return result
+    body = compress(result.body, encoding)
+    return CachedResult(body, body_etag(body), encoding)
+
+
+# --- HTTP caching ---
+
+# Upstream data for days older than this is final; more recent days may
+# still be revised, so clients must revalidate those responses.
+UPSTREAM_SETTLED_DAYS = 7
+CACHE_CONTROL_SETTLED = f"public, max-age={24 * 3600}"
+CACHE_CONTROL_REVALIDATE = "no-cache"
+CACHE_CONTROL_ERROR = "no-store"
+
+
+def period_end(request_data):
+    """Last day a request covers, or None when it cannot be read."""
+    try:
+        if request_data.get('mode') == 'year':
+            return date(int(request_data['endyear']), 12, 31)
+        return datetime.strptime(request_data['endDate'], "%Y-%m-%d").date()
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+
+def period_settled(request_data):
+    """Whether every day a request covers is older than UPSTREAM_SETTLED_DAYS."""
+    end = period_end(request_data)
+    settled = datetime.now(timezone.utc).date() - timedelta(days=UPSTREAM_SETTLED_DAYS)
+    return end is not None and end < settled
+
+
+def cache_control(source, request_data):
+    """
+    Cache-Control for a successful response. Model output is a pure function
+    of the request, and upstream data is too once its period has settled.
+    """
+    if source == 'model':
+        return CACHE_CONTROL_SETTLED
+    if source in ('nasa', 'cams') and period_settled(request_data):
+        return CACHE_CONTROL_SETTLED
+    return CACHE_CONTROL_REVALIDATE
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header value matches etag (weak comparison)."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in tags or any(tag.removeprefix('W/') == etag for tag in tags)
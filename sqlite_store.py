@@ -0,0 +1,35 @@
+import os
+import sqlite3
+import threading
+
+
+class SQLiteStore:
+    """
+    Base class for the local SQLite-backed stores.
+
+    Each thread gets its own connection, and the database runs in WAL mode so
+    several gunicorn workers can read while one of them writes.
+
+    Parameters:
+    path (str): Database file; its directory is created if needed
+    schema (str): SQL script run once to create tables and indexes
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.executescript(schema)
+
+    def _connect(self):
+        """One connection per thread; sqlite3 connections are not thread-safe."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
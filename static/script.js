@@ -2,6 +2,7 @@
 let map = null;
 let clickedMarker = null;
 let irradianceChart = null; // Ensure this global variable is used
+let climatology = null; // Overlay metadata from /api/climatology; null when no raster is built
 
 document.addEventListener("DOMContentLoaded", function () {
   // --- Initialize Map ---
@@ -35,6 +36,8 @@ function initializeMap() {
       '&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors',
   }).addTo(map);
 
+  setupClimatologyOverlay();
+
   const cursorCoords = document.getElementById("cursorCoords");
   map.on("mousemove", function (e) {
     const lat = e.latlng.lat.toFixed(4);
@@ -55,10 +58,74 @@ function initializeMap() {
       map.removeLayer(clickedMarker);
     }
     clickedMarker = L.marker(e.latlng).addTo(map);
+    showClimatology(clickedMarker, e.latlng.lat, e.latlng.lng);
     validateAndToggleButton();
   });
 }
 
+// --- Climatology overlay ---
+
+function setupClimatologyOverlay() {
+  fetch("/api/climatology")
+    .then((response) => (response.ok ? response.json() : null))
+    .then((info) => {
+      if (!info) return; // No climatology raster has been built
+      climatology = info;
+      const overlays = {};
+      info.sources.forEach((source) => {
+        overlays[`${info.labels[source]} (${info.units})`] = L.tileLayer(info.tile_url, {
+          source: source,
+          period: "annual",
+          v: info.version,
+          maxZoom: 19,
+          maxNativeZoom: info.max_zoom,
+        });
+      });
+      L.control.layers(null, overlays, { collapsed: false }).addTo(map);
+      addClimatologyPeriodControl(Object.values(overlays));
+    })
+    .catch((error) => console.error("Error loading climatology overlay:", error));
+}
+
+function addClimatologyPeriodControl(layers) {
+  const control = L.control({ position: "bottomleft" });
+  control.onAdd = function () {
+    const container = L.DomUtil.create("div", "leaflet-bar bg-white p-1");
+    const select = L.DomUtil.create("select", "form-select form-select-sm", container);
+    select.title = "Climatology period";
+    climatology.periods.forEach((period) => {
+      const option = L.DomUtil.create("option", "", select);
+      option.value = period;
+      option.textContent = period === "annual" ? "Annual mean" : period.charAt(0).toUpperCase() + period.slice(1);
+    });
+    L.DomEvent.disableClickPropagation(container);
+    select.addEventListener("change", () => {
+      layers.forEach((layer) => {
+        layer.options.period = select.value;
+        layer.redraw();
+      });
+    });
+    return container;
+  };
+  control.addTo(map);
+}
+
+function showClimatology(marker, lat, lng) {
+  // Annual means at the clicked point, read from the precomputed raster
+  if (!climatology) return;
+  fetch(`/api/climatology/point?latitude=${lat}&longitude=${lng}`)
+    .then((response) => (response.ok ? response.json() : null))
+    .then((point) => {
+      if (!point || marker !== clickedMarker) return;
+      const lines = climatology.sources.map((source) => {
+        const value = point.values[source].annual;
+        return `${climatology.labels[source]}: ${value === null ? "no data" : value.toFixed(2)}`;
+      });
+      marker.bindPopup(`<strong>Annual mean (${point.units})</strong><br>${lines.join("<br>")}`).openPopup();
+    })
+    .catch((error) => console.error("Error fetching climatology:", error));
+}
+
 function initializeChart() {
   // This function initializes the chart object with basic configuration.
   // updateChart will be responsible for populating datasets.
@@ -196,6 +263,7 @@ function searchLocation() {
           map.removeLayer(clickedMarker);
         }
         clickedMarker = L.marker([lat, lon]).addTo(map);
+        showClimatology(clickedMarker, lat, lon);
         validateAndToggleButton();
       } else {
         alert("Location not found.");
@@ -234,6 +302,13 @@ async function handleVisualize() {
       return;
   }
 
+  // Tilted irradiance is transposed on the server from the selected source's GHI/DHI/DNI
+  const gtiParams = {};
+  if (params.gti && mode === "date") {
+    apiUrl = "/api/gti";
+    gtiParams.source = { model: "model", CAMS_RAD: "cams", NASA: "nasa" }[dataSource];
+  }
+
   setLoadingState(visualizeBtn, true, "Processing...");
 
   const controller = new AbortController();
@@ -249,10 +324,9 @@ async function handleVisualize() {
   }, 60000);
 
   try {
-    const response = await fetch(apiUrl, {
-      method: "POST",
-      headers: { "Content-Type": "application/json" },
-      body: JSON.stringify(params),
+    // GET, so the browser caches responses and revalidates them with If-None-Match
+    const query = new URLSearchParams({ ...params, ...gtiParams, maxPoints: chartMaxPoints() });
+    const response = await fetch(`${apiUrl}?${query}`, {
       signal: controller.signal,
     });
 
@@ -325,7 +399,7 @@ async function handleVisualize() {
 /**
  * Updates the chart with new data, dynamically handling GHI, DHI, DNI.
  * Assumes dataPoints is an array of objects, where each object has a 'datetime' field (ISO string)
- * and potentially 'GHI', 'DHI', 'DNI' fields.
+ * and potentially 'GHI', 'DHI', 'DNI' fields, plus 'GTI' for tilted irradiance.
  * If only 'irradiance' is present (for backward compatibility with old model API), it will be used as GHI.
  * @param {Array<Object>} dataPoints - Array of data points from the API.
  * @param {string} granularity - Temporal granularity ('Hourly', 'Daily', 'Monthly').
@@ -375,6 +449,7 @@ function updateChart(dataPoints, granularity, dataSource) {
 
   // Define dataset configurations (colors, labels)
   const datasetConfigs = {
+    GTI: { label: 'GTI', borderColor: '#e74a3b', backgroundColor: 'rgba(231, 74, 59, 0.1)', fill: false },
     GHI: { label: 'GHI', borderColor: '#4e73df', backgroundColor: 'rgba(78, 115, 223, 0.1)', fill: true },
     DHI: { label: 'DHI', borderColor: '#1cc88a', backgroundColor: 'rgba(28, 200, 138, 0.1)', fill: true },
     DNI: { label: 'DNI', borderColor: '#f6c23e', backgroundColor: 'rgba(246, 194, 62, 0.1)', fill: true },
@@ -382,7 +457,7 @@ function updateChart(dataPoints, granularity, dataSource) {
     irradiance: { label: 'Irradiance', borderColor: '#4e73df', backgroundColor: 'rgba(78, 115, 223, 0.1)', fill: true }
   };
 
-  const availableDataKeys = ['GHI', 'DHI', 'DNI'];
+  const availableDataKeys = ['GTI', 'GHI', 'DHI', 'DNI'];
   let dataPlotted = false;
 
   availableDataKeys.forEach(key => {
@@ -598,8 +673,8 @@ function validateInputs() {
   const gtiChecked = document.getElementById("gti")?.checked;
   if (gtiChecked) {
     const tiltAngle = parseFloat(document.getElementById("tiltangle").value);
-    if (isNaN(tiltAngle) || tiltAngle < -90 || tiltAngle > 90) {
-      errors.push("Tilt angle must be a number between -90 and 90 when GTI is selected.");
+    if (isNaN(tiltAngle) || tiltAngle < 0 || tiltAngle > 90) {
+      errors.push("Tilt angle must be a number between 0 and 90 when GTI is selected.");
     }
   }
 
@@ -627,6 +702,13 @@ function validateAndToggleButton() {
 }
 
 
+// Points worth plotting at the chart's width; the server downsamples longer
+// series. Rounded up so similar screens share cached responses.
+function chartMaxPoints() {
+  const width = document.getElementById("irradianceChart").clientWidth || 1000;
+  return Math.ceil((width * (window.devicePixelRatio || 1)) / 500) * 500;
+}
+
 function getFormData() {
   return {
     latitude: parseFloat(document.getElementById("latitudeInput").value),
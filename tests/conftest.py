@@ -0,0 +1,71 @@
+import os
+import shutil
+
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CAMS_COLUMNS = ['ghi_cams', 'dhi_cams', 'dni_cams', 'bhi_cams',
+                'ghi_clear_cams', 'dhi_clear_cams', 'dni_clear_cams', 'bhi_clear_cams']
+
+
+@pytest.fixture(scope='session')
+def model_dir(tmp_path_factory):
+    """The shipped metadata and scaler with a small linear model fitted in their place of the forest."""
+    from sklearn.linear_model import LinearRegression
+
+    directory = tmp_path_factory.mktemp('model')
+    for name in ('random_forest_metadata.joblib', 'random_forest_scaler.joblib'):
+        shutil.copy(os.path.join(REPO_DIR, 'RF_MODEL', name), directory)
+    features = len(joblib.load(directory / 'random_forest_metadata.joblib')['feature_cols'])
+    rng = np.random.default_rng(0)
+    model = LinearRegression().fit(rng.random((50, features)), rng.random(50))
+    joblib.dump(model, directory / 'random_forest_model.joblib')
+    return str(directory)
+
+
+def daily_frame(columns, latitude, longitude, start, end):
+    """Deterministic daily values that vary with the day and the location."""
+    index = pd.date_range(pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize(), freq='D', name='datetime')
+    day = index.dayofyear.to_numpy()[:, None]
+    values = (day % 7 + np.arange(len(columns))[None, :] + latitude + longitude / 10) / 4
+    return pd.DataFrame(values, index=index, columns=columns)
+
+
+@pytest.fixture
+def upstream(monkeypatch, model_dir):
+    """
+    Replaces the predictor's NASA and CAMS fetches with daily_frame(); the
+    returned dict lists the (latitude, longitude, start day, end day) of
+    every fetch per source.
+    """
+    import rf_model
+
+    metadata = joblib.load(os.path.join(model_dir, 'random_forest_metadata.joblib'))
+    nasa_columns = [column for column in metadata['feature_cols'] if column.isupper()]
+    calls = {'nasa': [], 'cams': []}
+
+    def fetch(source, columns):
+        def fetch_frame(self, latitude, longitude, start, end):
+            calls[source].append((latitude, longitude, str(start.date()), str(end.date())))
+            return daily_frame(columns, latitude, longitude, start, end)
+        return fetch_frame
+
+    monkeypatch.setattr(rf_model.GHIPredictor, '_fetch_nasa_frame', fetch('nasa', nasa_columns))
+    monkeypatch.setattr(rf_model.GHIPredictor, '_fetch_cams_frame', fetch('cams', CAMS_COLUMNS))
+    return calls
+
+
+@pytest.fixture
+def make_predictor(model_dir, upstream, tmp_path):
+    """GHIPredictor factory on the test model, storing features and predictions under tmp_path by default."""
+    from rf_model import GHIPredictor
+
+    def make(model_base_dir=model_dir, **kwargs):
+        options = dict(feature_store_path=str(tmp_path / 'features.sqlite'), elevation_index_dir=None,
+                       ledger_path=str(tmp_path / 'ledger.sqlite'))
+        options.update(kwargs)
+        return GHIPredictor(model_base_dir, **options)
+    return make
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from TOOLS.aggregate import PeriodStats
+
+
+def hourly_series(seed=0, years=3):
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2019-01-01', periods=24 * 365 * years, freq='h')
+    values = rng.normal(500.0, 200.0, len(times))
+    values[rng.random(len(times)) < 0.1] = np.nan
+    return times, values
+
+
+@pytest.mark.parametrize('freq, rule', [('D', 'D'), ('M', 'MS'), ('Y', 'YS')])
+def test_shuffled_chunks_merge_to_pandas_statistics(freq, rule):
+    times, values = hourly_series()
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(times))
+
+    stats = PeriodStats(freq)
+    for chunk in np.array_split(order, 17):
+        stats.update(times.values[chunk], values[chunk])
+
+    expected = pd.Series(values, index=times).resample(rule).agg(['count', 'sum', 'mean', 'std', 'min', 'max'])
+    result = stats.result()
+    np.testing.assert_array_equal(result['period'].astype('datetime64[ns]'), expected.index.values)
+    np.testing.assert_array_equal(result['count'], expected['count'])
+    for name in ('sum', 'mean', 'std', 'min', 'max'):
+        np.testing.assert_allclose(result[name], expected[name], rtol=1e-9, err_msg=name)
+
+
+def test_merging_partial_stats_matches_one_pass():
+    times, values = hourly_series(seed=2, years=1)
+    halves = np.array_split(np.random.default_rng(3).permutation(len(times)), 2)
+    parts = [PeriodStats('D', percentiles=(50,)).update(times.values[half], values[half]) for half in halves]
+
+    merged = parts[0].merge(parts[1]).result()
+    whole = PeriodStats('D', percentiles=(50,)).update(times.values, values).result()
+    for name, column in whole.items():
+        if name == 'period':
+            np.testing.assert_array_equal(merged[name], column)
+        else:
+            np.testing.assert_allclose(merged[name], column, rtol=1e-9, err_msg=name)
+
+
+def test_fill_adds_empty_periods_between_data():
+    times = np.array(['2020-01-01T06', '2020-01-04T06'], dtype='datetime64[ns]')
+    result = PeriodStats('D').update(times, [1.0, 3.0]).result(fill=True)
+    assert result['count'].tolist() == [1, 0, 0, 1]
+    assert result['sum'].tolist() == [1.0, 0.0, 0.0, 3.0]
+    assert np.isnan(result['mean'][1:3]).all()
+
+
+def test_all_nan_chunk_adds_nothing():
+    times = np.array(['2020-01-01T06', '2020-01-01T07'], dtype='datetime64[ns]')
+    stats = PeriodStats('D').update(times, [np.nan, np.nan])
+    assert len(stats) == 0
+
+
+def test_merge_rejects_other_frequency():
+    with pytest.raises(ValueError):
+        PeriodStats('D').merge(PeriodStats('M'))
+
+
+@pytest.mark.parametrize('rule', ['h', 'D', 'MS', 'W', 'ME', 'YE', '6h'])
+def test_mean_ghi_matches_pandas_resample(rule):
+    from TOOLS import meanGHI
+
+    times, values = hourly_series(seed=4, years=1)
+    frame = pd.DataFrame({'datetime': times, 'Irradiance': values})
+    expected = frame.set_index('datetime')['Irradiance'].resample(rule).agg(['mean', 'std'])
+
+    result = meanGHI(frame, rule)
+    np.testing.assert_array_equal(result['datetime'].to_numpy(), expected.index.to_numpy())
+    np.testing.assert_allclose(result['mean'], expected['mean'], rtol=1e-9)
+    np.testing.assert_allclose(result['std'], expected['std'], rtol=1e-9)
+    np.testing.assert_allclose(result['upper'], expected['mean'] + expected['std'], rtol=1e-9)
@@ -0,0 +1,74 @@
+import csv
+import json
+import zipfile
+
+import pytest
+
+import bulk
+from services import ServiceError
+
+REQUEST = {'startDate': '2023-01-01', 'endDate': '2023-01-03', 'timeGranularity': 'Daily',
+           'sources': 'cams,model', 'format': 'csv'}
+
+
+def test_read_sites_accepts_header_aliases_and_delimiters():
+    sites = bulk.read_sites('\ufeffName;LAT;lng\nBern;46.95;7.45\n;0.31;32.58\n')
+    assert sites == [{'site_id': 1, 'name': 'Bern', 'latitude': 46.95, 'longitude': 7.45},
+                     {'site_id': 2, 'name': '', 'latitude': 0.31, 'longitude': 32.58}]
+
+
+@pytest.mark.parametrize('rows, message', [
+    ([[46.9, 7.4]], "Site 1 must be an object"),
+    ([{'name': 'x'}], "needs a latitude and a longitude"),
+    ([{'lat': 'north', 'lon': 7}], "Invalid coordinates for site 1"),
+    ([{'lat': 1, 'lon': 2}, {'lat': 91, 'lon': 7}], "out of range for site 2"),
+    ([], "no sites"),
+])
+def test_sites_from_rows_rejects_invalid_lists(rows, message):
+    with pytest.raises(ServiceError, match=message):
+        bulk.sites_from_rows(rows)
+
+
+def test_bulk_request_orders_sources_and_validates_fields():
+    assert bulk.bulk_request(REQUEST)['sources'] == ['model', 'cams']
+    for changes in ({'sources': 'model,sun'}, {'endDate': '2022-12-31'}, {'format': 'xlsx'},
+                    {'timeGranularity': 'Weekly'}, {'startDate': None}):
+        with pytest.raises(ServiceError):
+            bulk.bulk_request(dict(REQUEST, **changes))
+
+
+def test_cell_request_is_the_cell_centre():
+    site = {'site_id': 1, 'name': '', 'latitude': 46.91, 'longitude': 7.41}
+    request = bulk.bulk_request(REQUEST)
+    assert bulk.cell_request('nasa', site, request)['latitude'] == 47.0
+    assert (bulk.cell_request('cams', site, request)['latitude'],
+            bulk.cell_request('cams', site, request)['longitude']) == (46.9, 7.4)
+
+
+def test_run_writes_parts_once_per_cell_and_bundles_them(tmp_path, monkeypatch):
+    fetched = []
+
+    def cached_body(source, request_data, compute=None):
+        fetched.append((request_data['latitude'], request_data['longitude']))
+        return json.dumps({'data': [{'datetime': '2023-01-01T00:00:00', 'GHI': request_data['latitude']}]})
+
+    monkeypatch.setattr(bulk, 'cached_body', cached_body)
+    monkeypatch.setattr(bulk, 'BULK_PART_SITES', 2)
+    sites = bulk.sites_from_rows([{'lat': 46.91, 'lon': 7.41}, {'lat': 46.92, 'lon': 7.42}, {'lat': 0.31, 'lon': 32.58}])
+    run = bulk.BulkRun.create(sites, bulk.bulk_request(REQUEST), root=str(tmp_path))
+    progress = []
+    run.run(progress.append)
+
+    # The first two sites share a CAMS cell
+    assert sorted(fetched) == [(0.3, 32.6), (46.9, 7.4)]
+    assert progress == [0.5, 1.0]
+    with open(run.part_path('cams', 0, 'csv'), newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert [(row['site_id'], row['GHI']) for row in rows] == [('1', '46.9'), ('2', '46.9')]
+    with zipfile.ZipFile(run.bundle_path) as bundle:
+        assert {'manifest.json', 'sites.csv', 'source=model/part-00001.csv'} <= set(bundle.namelist())
+    assert run.progress()['sites_done'] == 3
+
+    # Submitting the same list again resumes the completed run
+    again = bulk.BulkRun.create(sites, bulk.bulk_request(REQUEST), root=str(tmp_path))
+    assert again.bulk_id == run.bulk_id and again.complete
@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+import cache
+from cache import CachedResult, MemoryLRU, ResultCache, TieredResultCache
+
+
+def result(body):
+    return CachedResult(body, cache.body_etag(body), None)
+
+
+def test_memory_lru_drops_least_recently_used_beyond_max_bytes():
+    memory = MemoryLRU(max_bytes=10)
+    memory.put('a', result(b'aaaa'), None)
+    memory.put('b', result(b'bbbb'), None)
+    assert memory.get('a') is not None
+    memory.put('c', result(b'cccc'), None)
+    assert memory.get('b') is None
+    assert memory.get('a').body == b'aaaa' and memory.get('c').body == b'cccc'
+    assert memory.size == 8
+
+
+def test_memory_lru_skips_bodies_larger_than_the_tier():
+    memory = MemoryLRU(max_bytes=4)
+    memory.put('a', result(b'too large'), None)
+    assert memory.get('a') is None and memory.size == 0
+
+
+def test_memory_lru_expires_entries():
+    memory = MemoryLRU()
+    memory.put('a', result(b'body'), time.time() - 1)
+    assert memory.get('a') is None and memory.size == 0
+
+
+@pytest.fixture
+def tiered(tmp_path):
+    return TieredResultCache(ResultCache(str(tmp_path / 'results.sqlite')), MemoryLRU())
+
+
+def test_tiered_cache_serves_shared_entries_through_a_fresh_memory_tier(tiered):
+    tiered.put('key', 'model', b'body')
+    other_worker = TieredResultCache(tiered.shared, MemoryLRU())
+    entry = other_worker.get_entry('key')
+    assert entry == result(b'body')
+    assert other_worker.memory.get('key') == entry
+
+
+def test_tiered_cache_expires_entries_by_source_ttl(tiered, monkeypatch):
+    monkeypatch.setenv('RESULT_TTL_NASA', '0.05')
+    tiered.put('key', 'nasa', b'body')
+    assert tiered.get('key') == b'body'
+    time.sleep(0.1)
+    assert tiered.get('key') is None
+    assert tiered.shared.get('key') is None
+
+
+def test_shared_store_evicts_least_recently_used_to_below_its_limit(tmp_path):
+    store = ResultCache(str(tmp_path / 'results.sqlite'), max_bytes=100)
+    for i in range(5):
+        store.put(f'key{i}', 'model', b'x' * 30)
+    store.evict()
+    kept = [i for i in range(5) if store.get(f'key{i}') is not None]
+    assert kept == [2, 3, 4]
+
+
+def test_tiered_cache_compresses_large_bodies_on_first_request_for_an_encoding(tiered):
+    body = b'{"data": [' + b'1.0, ' * 2000 + b'1.0]}'
+    stored = tiered.put('key', 'model', body)
+    assert stored.encoding is None
+    for name in cache.ENCODINGS:
+        assert tiered.shared.get(cache.encoded_key('key', name)) is None
+        entry = tiered.get_entry('key', name)
+        assert entry.encoding == name and entry.body == cache.compress(body, name)
+        assert tiered.shared.get(cache.encoded_key('key', name))[0] == entry.body
+
+
+def test_tiered_cache_leaves_small_and_incompressible_bodies_uncompressed(tiered):
+    tiered.put('small', 'model', b'{}')
+    tiered.put('png', 'tiles', b'\x89PNG' * 1000, compressible=False)
+    for name in cache.ENCODINGS:
+        assert tiered.get_entry('small', name).encoding is None
+        assert tiered.put('png', 'tiles', b'\x89PNG' * 1000, name, compressible=False).encoding is None
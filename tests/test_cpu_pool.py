@@ -0,0 +1,37 @@
+import numpy as np
+
+import cpu_pool
+
+
+def test_cores_are_shared_among_server_workers(monkeypatch):
+    monkeypatch.setattr(cpu_pool, 'CPU_WORKERS', 0)
+    monkeypatch.setattr(cpu_pool.os, 'cpu_count', lambda: 8)
+    monkeypatch.delenv('SERVER_WORKERS', raising=False)
+    assert cpu_pool.cpu_workers() == 8
+    monkeypatch.setenv('SERVER_WORKERS', '3')
+    assert cpu_pool.cpu_workers() == 2
+    monkeypatch.setenv('SERVER_WORKERS', '16')
+    assert cpu_pool.cpu_workers() == 1
+    monkeypatch.setattr(cpu_pool, 'CPU_WORKERS', 5)
+    assert cpu_pool.cpu_workers() == 5
+
+
+def test_split_covers_the_range_in_parts_of_at_least_min_size():
+    assert cpu_pool.split(10, 4, parts=4) == [(0, 5), (5, 10)]
+    assert cpu_pool.split(3, 4, parts=4) == [(0, 3)]
+    bounds = cpu_pool.split(1000, 1, parts=7)
+    assert len(bounds) == 7 and bounds[0][0] == 0 and bounds[-1][1] == 1000
+    assert all(stop == start for (_, stop), (start, _) in zip(bounds, bounds[1:]))
+
+
+def _fill(spec, first, stop):
+    with cpu_pool.SharedArray.attach(spec) as shared:
+        shared.array[first:stop] = np.arange(first, stop)
+
+
+def test_parts_write_their_rows_of_a_shared_array(monkeypatch):
+    monkeypatch.setattr(cpu_pool, 'CPU_WORKERS', 2)
+    with cpu_pool.SharedArray.create((100,)) as shared:
+        cpu_pool.run_parts(_fill, [(shared.spec, first, stop) for first, stop in cpu_pool.split(100, 10)])
+        np.testing.assert_array_equal(shared.array, np.arange(100))
+    cpu_pool.shutdown_cpu_pool()
@@ -0,0 +1,34 @@
+import numpy as np
+
+from downsample import MIN_POINTS, lttb_indices
+
+
+def test_short_series_and_tiny_budgets_keep_every_point():
+    values = np.arange(10.0)
+    np.testing.assert_array_equal(lttb_indices(values, 10), np.arange(10))
+    np.testing.assert_array_equal(lttb_indices(values, 50), np.arange(10))
+    np.testing.assert_array_equal(lttb_indices(values, MIN_POINTS - 1), np.arange(10))
+
+
+def test_keeps_first_last_and_peaks_in_sorted_order():
+    values = np.zeros(1000)
+    values[[137, 612]] = [50.0, -40.0]
+    keep = lttb_indices(values, 20)
+    assert len(keep) == 20
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+    assert {137, 612} <= set(keep.tolist())
+
+
+def test_never_prefers_missing_values():
+    values = np.sin(np.linspace(0, 20, 500))
+    values[::3] = np.nan
+    keep = lttb_indices(values, 40)
+    assert not np.isnan(values[keep[1:-1]]).any()
+
+
+def test_rows_stay_aligned_across_series_including_an_all_nan_one():
+    rng = np.random.default_rng(0)
+    values = np.column_stack([rng.random(300), np.full(300, np.nan), rng.random(300)])
+    keep = lttb_indices(values, 30)
+    assert len(keep) == 30 and keep[0] == 0 and keep[-1] == 299
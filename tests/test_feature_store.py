@@ -0,0 +1,69 @@
+import numpy as np
+import pandas as pd
+
+import rf_model
+from feature_store import FeatureStore, feature_schema_hash
+
+
+def test_rows_round_trip_under_their_schema_only(tmp_path):
+    store = FeatureStore(str(tmp_path / 'features.sqlite'))
+    days = pd.date_range('2023-01-01', periods=3, freq='D', tz='UTC', name='datetime')
+    rows = pd.DataFrame({'a': [1.0, np.nan, 3.0], 'b': [4.0, 5.0, 6.0]}, index=days)
+    store.put_rows('cell', 'schema-1', rows)
+
+    pd.testing.assert_frame_equal(store.get_rows('cell', 'schema-1', days), rows, check_freq=False)
+    assert store.get_rows('cell', 'schema-2', days).empty
+    assert store.get_rows('other', 'schema-1', days).empty
+    assert len(store.get_rows('cell', 'schema-1', days[1:])) == 2
+
+
+def test_schema_hash_follows_features_and_version_but_not_their_order():
+    assert feature_schema_hash(['a', 'b'], 'GHI', 1) == feature_schema_hash(['b', 'a'], 'GHI', 1)
+    assert feature_schema_hash(['a', 'b'], 'GHI', 1) != feature_schema_hash(['a', 'c'], 'GHI', 1)
+    assert feature_schema_hash(['a', 'b'], 'GHI', 1) != feature_schema_hash(['a', 'b'], 'GHI', 2)
+
+
+def test_stored_days_are_not_fetched_again(make_predictor, upstream):
+    predictor = make_predictor()
+    first = predictor.predict_ghi(46.91, 7.41, '2023-02-05', '2023-02-10')
+    upstream['nasa'].clear()
+    upstream['cams'].clear()
+
+    again = predictor.predict_ghi(46.91, 7.41, '2023-02-01', '2023-02-15')
+    # Only the runs of days around the stored ones are fetched
+    assert upstream['nasa'] == [(47.0, 7.5, '2023-02-01', '2023-02-04'), (47.0, 7.5, '2023-02-11', '2023-02-15')]
+    assert [call[2:] for call in upstream['cams']] == [('2023-02-01', '2023-02-04'), ('2023-02-11', '2023-02-15')]
+    pd.testing.assert_series_equal(again.loc[first.index], first, check_freq=False)
+
+
+def test_schema_change_invalidates_stored_rows(make_predictor, upstream, monkeypatch):
+    make_predictor().predict_ghi(46.91, 7.41, '2023-02-01', '2023-02-10')
+    make_predictor().predict_ghi(46.91, 7.41, '2023-02-01', '2023-02-10')
+    assert len(upstream['nasa']) == 1
+
+    monkeypatch.setattr(rf_model, 'FEATURE_ENGINEERING_VERSION', rf_model.FEATURE_ENGINEERING_VERSION + 1)
+    make_predictor().predict_ghi(46.91, 7.41, '2023-02-01', '2023-02-10')
+    assert len(upstream['nasa']) == 2
+
+
+def test_recent_days_are_not_stored(make_predictor, upstream):
+    today = pd.Timestamp.now(tz='UTC').normalize()
+    start, end = (today - pd.Timedelta(days=10)).strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d')
+    predictor = make_predictor()
+    predictor.predict_ghi(46.91, 7.41, start, end)
+    upstream['nasa'].clear()
+
+    predictor.predict_ghi(46.91, 7.41, start, end)
+    settled_end = (today - pd.Timedelta(days=rf_model.FEATURE_SETTLED_DAYS)).strftime('%Y-%m-%d')
+    assert [call[2:] for call in upstream['nasa']] == [(settled_end, end)]
+
+
+def test_loading_prunes_rows_of_other_schemas(make_predictor, tmp_path):
+    store = FeatureStore(str(tmp_path / 'features.sqlite'))
+    days = pd.date_range('2023-01-01', periods=2, freq='D', tz='UTC', name='datetime')
+    store.put_rows('cell', 'retired', pd.DataFrame({'a': [1.0, 2.0]}, index=days))
+
+    predictor = make_predictor()
+    assert store.get_rows('cell', 'retired', days).empty
+    predictor.predict_ghi(46.91, 7.41, '2023-01-01', '2023-01-02')
+    assert make_predictor().feature_store.get_rows('94,12|46.91,7.41', predictor.feature_schema, days).shape[0] == 2
@@ -0,0 +1,59 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import gti
+
+LATITUDE, LONGITUDE = 46.95, 7.45
+
+
+@pytest.fixture(scope='module')
+def year():
+    """Hourly clear-sky GHI, DHI and DNI at Bern over a year, with the geometry at mid-interval."""
+    import pvlib
+
+    times = pd.date_range('2023-01-01', periods=24 * 365, freq='h', tz='UTC')
+    clear = pvlib.location.Location(LATITUDE, LONGITUDE).get_clearsky(times + pd.Timedelta(minutes=30))
+    index = times.as_unit('s').asi8
+    geometry = gti.solar_geometry(index, LATITUDE, LONGITUDE, offset=1800)
+    return geometry, clear['ghi'].to_numpy(), clear['dhi'].to_numpy(), clear['dni'].to_numpy()
+
+
+def test_horizontal_plane_receives_the_beam_only_ghi(year):
+    geometry, ghi, _, _ = year
+    dhi, dni = gti.beam_only(ghi, geometry)
+    poa = gti.poa_global(geometry, ghi, dhi, dni, 0, 180, model='isotropic')
+    np.testing.assert_allclose(poa[geometry['zenith'] < 85], ghi[geometry['zenith'] < 85], rtol=1e-6, atol=1e-6)
+
+
+def test_poa_is_zero_at_night_and_nan_where_an_input_is_missing(year):
+    geometry, ghi, dhi, dni = year
+    ghi = ghi.copy()
+    ghi[12] = np.nan
+    poa = gti.poa_global(geometry, ghi, dhi, dni, 35, 180)
+    assert (poa[geometry['zenith'] >= 90] == 0).all()
+    assert np.isnan(poa[12]) and np.isfinite(np.delete(poa, 12)).all()
+
+
+@pytest.mark.parametrize('model', gti.TRANSPOSITION_MODELS)
+def test_sweep_matches_one_orientation_at_a_time(year, model, monkeypatch):
+    geometry, ghi, dhi, dni = year
+    # Several blocks, to cover the edges between them
+    monkeypatch.setattr(gti, 'SWEEP_BLOCK_ELEMENTS', 3 * 4500)
+    tilts, azimuths = [0, 30, 60, 90], [90, 180, 270]
+    energy, hours = gti.orientation_yield(geometry, ghi, dhi, dni, tilts, azimuths, model=model)
+
+    assert energy.shape == (4, 3) and hours == int((geometry['zenith'] < 90).sum())
+    for i, tilt in enumerate(tilts):
+        for j, azimuth in enumerate(azimuths):
+            poa = gti.poa_global(geometry, ghi, dhi, dni, tilt, azimuth, model=model)
+            assert energy[i, j] == pytest.approx(np.nansum(poa) / 1000, rel=1e-9)
+
+
+def test_optimum_faces_south_at_about_the_latitude(year):
+    geometry, ghi, dhi, dni = year
+    tilts, azimuths = np.arange(0, 91, 5), np.arange(90, 271, 10)
+    energy, _ = gti.orientation_yield(geometry, ghi, dhi, dni, tilts, azimuths)
+    best_tilt, best_azimuth = np.unravel_index(np.argmax(energy), energy.shape)
+    assert azimuths[best_azimuth] == 180
+    assert 30 <= tilts[best_tilt] <= 50
@@ -0,0 +1,47 @@
+import pandas as pd
+
+import jobs
+
+
+def test_split_request_by_year_covers_the_range_in_calendar_years():
+    chunks = jobs.split_request_by_year({'startDate': '2019-06-15', 'endDate': '2021-02-01', 'latitude': 1})
+    assert [(chunk['startDate'], chunk['endDate']) for chunk in chunks] == [
+        ('2019-06-15', '2019-12-31'), ('2020-01-01', '2020-12-31'), ('2021-01-01', '2021-02-01')]
+    assert all(chunk['latitude'] == 1 for chunk in chunks)
+
+
+def test_split_request_by_year_leaves_unsplittable_requests():
+    for request_data in ({'startDate': '2021-01-02', 'endDate': '2021-01-01'}, {'startDate': '2021-01-01'},
+                         {'startDate': '01/01/2021', 'endDate': '2021-12-31'}):
+        assert jobs.split_request_by_year(request_data) == [request_data]
+
+
+def daily_payload(request_data):
+    days = [str(day.date()) for day in pd.date_range(request_data['startDate'], request_data['endDate'])]
+    return {'source': 'nasa', 'start_date': request_data['startDate'], 'end_date': request_data['endDate'],
+            'num_points': len(days), 'data': [{'datetime': day} for day in days]}
+
+
+def test_run_chunked_joins_yearly_chunks_into_the_single_request_payload(monkeypatch):
+    calls = []
+
+    def compute(request_data):
+        calls.append((request_data['startDate'], request_data['endDate']))
+        return daily_payload(request_data)
+
+    monkeypatch.setitem(jobs.PAYLOADS, 'nasa', compute)
+    progress = []
+    request_data = {'startDate': '2019-12-30', 'endDate': '2021-01-02'}
+    payload = jobs.run_chunked('nasa', request_data, progress.append)
+
+    assert calls == [('2019-12-30', '2019-12-31'), ('2020-01-01', '2020-12-31'), ('2021-01-01', '2021-01-02')]
+    assert payload == daily_payload(request_data)
+    assert progress == [1 / 3, 2 / 3, 1.0]
+
+
+def test_run_chunked_runs_unchunked_sources_in_one_piece(monkeypatch):
+    calls = []
+    monkeypatch.setitem(jobs.PAYLOADS, 'model', lambda request_data: calls.append(request_data) or {'data': []})
+    request_data = {'startDate': '2019-01-01', 'endDate': '2021-12-31'}
+    jobs.run_chunked('model', request_data)
+    assert calls == [request_data]
@@ -0,0 +1,74 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import rf_model
+from prediction_ledger import PredictionLedger, site_key
+
+
+@pytest.fixture
+def predicted_rows(monkeypatch):
+    """Number of feature rows passed to the model, per call."""
+    rows = []
+    predict_rows = rf_model.GHIPredictor._predict_rows
+
+    def counting(self, X):
+        rows.append(len(X))
+        return predict_rows(self, X)
+
+    monkeypatch.setattr(rf_model.GHIPredictor, '_predict_rows', counting)
+    return rows
+
+
+def test_window_re_predicts_only_days_whose_inputs_changed(make_predictor, upstream, predicted_rows, monkeypatch):
+    predictor = make_predictor()
+    first = predictor.predict_ghi_window(46.91, 7.41, 30)
+    assert predicted_rows == [30]
+
+    # Unsettled days are re-fetched, but unchanged inputs are not predicted again
+    upstream['nasa'].clear()
+    again = predictor.predict_ghi_window(46.91, 7.41, 30)
+    assert len(upstream['nasa']) == 1 and predicted_rows == [30]
+    pd.testing.assert_series_equal(again, first)
+
+    # A revision of one recent day re-predicts that day only
+    revised_day = first.index[-2]
+    fetch_nasa = rf_model.GHIPredictor._fetch_nasa_frame
+
+    def revised(self, latitude, longitude, start, end):
+        frame = fetch_nasa(self, latitude, longitude, start, end)
+        frame.loc[frame.index == revised_day] += 1.0
+        return frame
+
+    monkeypatch.setattr(rf_model.GHIPredictor, '_fetch_nasa_frame', revised)
+    updated = predictor.predict_ghi_window(46.91, 7.41, 30)
+    assert predicted_rows == [30, 1]
+    pd.testing.assert_series_equal(updated.drop(revised_day), first.drop(revised_day))
+
+
+def test_window_matches_predicting_the_range(make_predictor):
+    predictor = make_predictor()
+    window = predictor.predict_ghi_window(46.91, 7.41, 10, '2023-03-10')
+    expected = make_predictor(feature_store_path=None, ledger_path=None).predict_ghi(
+        46.91, 7.41, '2023-03-01', '2023-03-10')
+    assert window.to_numpy() == pytest.approx(expected.to_numpy())
+
+
+def test_model_version_survives_a_redeploy_of_identical_artifacts(make_predictor, model_dir, tmp_path):
+    redeployed = tmp_path / 'redeployed'
+    shutil.copytree(model_dir, redeployed)
+    for name in os.listdir(redeployed):
+        os.utime(redeployed / name, ns=(0, 0))
+    assert make_predictor().model_version == make_predictor(model_base_dir=str(redeployed)).model_version
+
+
+def test_loading_prunes_rows_of_other_model_versions(make_predictor, tmp_path):
+    ledger = PredictionLedger(str(tmp_path / 'ledger.sqlite'))
+    day = pd.DatetimeIndex(['2023-03-01'], tz='UTC')
+    ledger.put_rows(site_key(46.91, 7.41), 'retired', pd.DataFrame(
+        {'value': [1.0], 'input_hash': ['x'], 'settled': [True]}, index=day))
+
+    make_predictor()
+    assert ledger.get_rows(site_key(46.91, 7.41), 'retired', day).empty
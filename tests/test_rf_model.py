@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+
+SITES = [(46.91, 7.41), (46.93, 7.38), (0.31, 32.58), (46.91, 7.41)]
+
+
+def test_predict_ghi_many_matches_predicting_each_site(make_predictor):
+    batch = make_predictor(feature_store_path=None).predict_ghi_many(SITES, '2023-02-01', '2023-02-10')
+    single = make_predictor(feature_store_path=None)
+    for (latitude, longitude), predictions in zip(SITES, batch):
+        expected = single.predict_ghi(latitude, longitude, '2023-02-01', '2023-02-10')
+        pd.testing.assert_series_equal(predictions, expected)
+
+
+def test_predict_ghi_many_does_not_depend_on_site_order(make_predictor):
+    predictor = make_predictor(feature_store_path=None)
+    forward = predictor.predict_ghi_many(SITES, '2023-02-01', '2023-02-05')
+    backward = predictor.predict_ghi_many(SITES[::-1], '2023-02-01', '2023-02-05')
+    for predictions, expected in zip(forward, backward[::-1]):
+        pd.testing.assert_series_equal(predictions, expected)
+
+
+def test_batch_fetches_nasa_once_per_cell_and_cams_at_each_site(make_predictor, upstream):
+    make_predictor(feature_store_path=None).predict_ghi_many(SITES, '2023-02-01', '2023-02-10')
+    # The two Bern sites share a NASA cell, fetched at its centre
+    assert sorted(upstream['nasa']) == [(0.5, 32.5, '2023-02-01', '2023-02-10'),
+                                        (47.0, 7.5, '2023-02-01', '2023-02-10')]
+    assert sorted(upstream['cams']) == sorted((latitude, longitude, '2023-02-01', '2023-02-10')
+                                              for latitude, longitude in set(SITES))
+
+
+def test_predictions_cover_every_day_with_finite_values(make_predictor):
+    predictions = make_predictor(feature_store_path=None).predict_ghi(46.91, 7.41, '2023-02-01', '2023-02-10')
+    assert len(predictions) == 10
+    assert np.isfinite(predictions.to_numpy(dtype=float)).all()
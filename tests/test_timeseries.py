@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from timeseries import TimeSeries, epoch_seconds
+
+DAY = 86400
+
+
+def series(days, **columns):
+    return TimeSeries(np.asarray(days) * DAY, columns)
+
+
+def test_epoch_seconds_reads_every_time_form():
+    expected = 1_700_000_000
+    for time in ('2023-11-14T22:13:20', '2023-11-14T22:13:20Z', np.datetime64('2023-11-14T22:13:20'),
+                 pd.Timestamp('2023-11-14 23:13:20', tz='Europe/Paris').to_pydatetime(), expected):
+        assert epoch_seconds(time) == expected
+
+
+def test_slice_shares_the_arrays():
+    ts = series([0, 1, 2, 3], a=[1.0, 2.0, 3.0, 4.0])
+    part = ts.slice('1970-01-02', '1970-01-04')
+    assert part.index.tolist() == [DAY, 2 * DAY]
+    assert np.shares_memory(part['a'], ts['a'])
+
+
+def test_constructor_rejects_misaligned_columns():
+    with pytest.raises(ValueError):
+        series([0, 1], a=[1.0])
+
+
+def test_join_aligns_on_the_union_or_intersection():
+    left, right = series([0, 1, 2], a=[1.0, 2.0, 3.0]), series([1, 2, 3], b=[5.0, 6.0, 7.0])
+    outer = TimeSeries.join([left, right])
+    assert outer.index.tolist() == [0, DAY, 2 * DAY, 3 * DAY]
+    np.testing.assert_array_equal(outer['a'], [1.0, 2.0, 3.0, np.nan])
+    np.testing.assert_array_equal(outer['b'], [np.nan, 5.0, 6.0, 7.0])
+    assert TimeSeries.join([left, right], how='inner').index.tolist() == [DAY, 2 * DAY]
+
+
+def test_concat_sorts_chunks_and_lets_later_ones_win():
+    joined = TimeSeries.concat([series([2, 3], a=[3.0, 4.0]), series([0, 1, 2], a=[1.0, 2.0, 30.0], b=[1.0] * 3)])
+    assert joined.index.tolist() == [0, DAY, 2 * DAY, 3 * DAY]
+    np.testing.assert_array_equal(joined['a'], [1.0, 2.0, 30.0, 4.0])
+    np.testing.assert_array_equal(joined['b'], [1.0, 1.0, 1.0, np.nan])
+
+
+def test_from_nasa_parses_keys_and_drops_fill_and_annual_values():
+    ts = TimeSeries.from_nasa({'T2M': {'202301': 1.0, '202302': -999.0, '202313': 5.0}}, {'T2M': 'temp'})
+    assert ts.time_strings() == ['2023-01-01T00:00:00', '2023-02-01T00:00:00']
+    np.testing.assert_array_equal(ts['temp'], [1.0, np.nan])
+    hourly = TimeSeries.from_nasa({'GHI': {'2023010105': 2.0}})
+    assert hourly.time_strings() == ['2023-01-01T05:00:00']
+
+
+def test_round_trips_through_pandas():
+    frame = pd.DataFrame({'a': [1.0, np.nan, 3.0]},
+                         index=pd.date_range('2023-01-01', periods=3, freq='D', tz='UTC', name='datetime'))
+    pd.testing.assert_frame_equal(TimeSeries.from_frame(frame).to_frame(), frame, check_freq=False)
+
+
+def test_records_hold_none_for_missing_values():
+    ts = series([0, 1], a=[1.5, np.nan])
+    assert ts.to_records({'value': 'a', 'other': 'b'}, time_suffix='Z') == [
+        {'datetime': '1970-01-01T00:00:00Z', 'value': 1.5, 'other': None},
+        {'datetime': '1970-01-02T00:00:00Z', 'value': None, 'other': None}]
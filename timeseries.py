@@ -0,0 +1,298 @@
+"""
+Columnar time series.
+
+On their way to a response, upstream payloads and model output used to pass
+through several shapes: NASA POWER's {parameter: {timestamp: value}} dicts,
+CAMS DataFrames, lists of per-row dicts, and frames with object columns once
+missing values were swapped for None. Each step copied the data and boxed
+every value. A TimeSeries holds a series once, as an int64 index of epoch
+seconds and one float64 (or float32) array per column with NaN for missing
+values. It converts to the other shapes only at the edges: from upstream
+payloads, and to JSON records or pandas objects.
+
+Sources with naive timestamps (NASA POWER, the solar model) keep their
+wall-clock times in the index, as if they were UTC.
+
+Slicing by time returns views of the same arrays. Aligning series on an
+index and concatenating chunks copy each value once.
+"""
+from datetime import datetime, timezone
+
+from lazy_imports import lazy_import
+
+np = lazy_import('numpy')
+
+# NASA POWER's marker for missing values
+NASA_FILL_VALUE = -999.0
+
+
+def epoch_seconds(time):
+    """
+    Epoch seconds of one time: a datetime (naive ones read as UTC), a
+    numpy datetime64, an ISO 8601 string or a number of seconds.
+    """
+    if isinstance(time, datetime):
+        if time.tzinfo is not None:
+            time = time.astimezone(timezone.utc).replace(tzinfo=None)
+        time = np.datetime64(time.replace(tzinfo=None), 's')
+    elif isinstance(time, str):
+        time = np.datetime64(time.rstrip('Z'), 's')
+    if isinstance(time, np.datetime64):
+        return int(time.astype('datetime64[s]').astype(np.int64))
+    return int(time)
+
+
+def to_epoch(times):
+    """
+    int64 epoch seconds of an array of times: datetime64 values, datetimes,
+    or a pandas DatetimeIndex (tz-aware ones are converted to UTC).
+    """
+    if getattr(times, 'tz', None) is not None:
+        times = times.tz_convert('UTC').tz_localize(None)
+    times = np.asarray(times)
+    if times.dtype.kind in 'iu':
+        return times.astype(np.int64, copy=False)
+    if times.dtype.kind == 'M':
+        return times.astype('datetime64[s]').astype(np.int64)
+    return np.array([epoch_seconds(time) for time in times], dtype=np.int64)
+
+
+def _sorted_unique(index, columns):
+    """index and columns sorted by time, keeping the last row of repeated times."""
+    if len(index) < 2 or np.all(index[1:] > index[:-1]):
+        return index, columns
+    order = np.argsort(index, kind='stable')
+    index = index[order]
+    last = np.r_[index[1:] != index[:-1], True]
+    keep = order[last]
+    return index[last], {name: values[keep] for name, values in columns.items()}
+
+
+class TimeSeries:
+    """
+    Float columns over a strictly increasing int64 index of epoch seconds.
+    Columns that are not float32 or float64 are converted to float64.
+    """
+
+    __slots__ = ('index', 'columns')
+
+    def __init__(self, index, columns=None):
+        self.index = np.asarray(index, dtype=np.int64)
+        self.columns = {}
+        for name, values in (columns or {}).items():
+            values = np.asarray(values)
+            if values.dtype not in (np.float32, np.float64):
+                values = values.astype(np.float64)
+            if values.shape != self.index.shape:
+                raise ValueError(f"Column {name!r} has {len(values)} values for {len(self.index)} times")
+            self.columns[name] = values
+
+    def __len__(self):
+        return len(self.index)
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __repr__(self):
+        span = f", {self.datetimes()[0]} to {self.datetimes()[-1]}" if len(self) else ""
+        return f"<TimeSeries {len(self)} rows{span}, columns {list(self.columns)}>"
+
+    @property
+    def names(self):
+        return list(self.columns)
+
+    @property
+    def nbytes(self):
+        return self.index.nbytes + sum(values.nbytes for values in self.columns.values())
+
+    def datetimes(self):
+        """The index as datetime64[s]; a view, not a copy."""
+        return self.index.view('datetime64[s]')
+
+    # --- Selection and alignment ---
+
+    def slice(self, start=None, stop=None):
+        """Rows with start <= time < stop, sharing this series' arrays."""
+        first = 0 if start is None else np.searchsorted(self.index, epoch_seconds(start))
+        last = len(self) if stop is None else np.searchsorted(self.index, epoch_seconds(stop))
+        return TimeSeries(self.index[first:last],
+                          {name: values[first:last] for name, values in self.columns.items()})
+
+    def select(self, names):
+        """
+        The given columns, sharing this series' arrays; `names` is a list, or
+        a mapping of new names to existing ones. Missing columns are all NaN.
+        """
+        if not isinstance(names, dict):
+            names = {name: name for name in names}
+        return TimeSeries(self.index, {new: self.columns[old] if old in self.columns else np.full(len(self), np.nan)
+                                       for new, old in names.items()})
+
+    def reindex(self, index):
+        """The rows at `index` (epoch seconds), NaN where this series has no row."""
+        index = np.asarray(index, dtype=np.int64)
+        if len(index) == len(self) and np.array_equal(index, self.index):
+            return self
+        positions = np.minimum(np.searchsorted(self.index, index), max(len(self) - 1, 0))
+        found = (self.index[positions] == index) if len(self) else np.zeros(len(index), dtype=bool)
+        columns = {}
+        for name, values in self.columns.items():
+            aligned = np.full(len(index), np.nan, dtype=values.dtype)
+            aligned[found] = values[positions[found]]
+            columns[name] = aligned
+        return TimeSeries(index, columns)
+
+    def floor(self, unit):
+        """
+        Times floored to the start of their datetime64 `unit` ('h', 'D',
+        'M', ...), keeping the first row of each period.
+        """
+        index = self.datetimes().astype(f'datetime64[{unit}]').astype('datetime64[s]').view(np.int64)
+        first = np.r_[True, index[1:] != index[:-1]]
+        if first.all():
+            return TimeSeries(index, self.columns)
+        return TimeSeries(index[first], {name: values[first] for name, values in self.columns.items()})
+
+    def astype(self, dtype):
+        """A copy with every column converted to `dtype` (float32 halves the memory)."""
+        return TimeSeries(self.index, {name: values.astype(dtype) for name, values in self.columns.items()})
+
+    @classmethod
+    def join(cls, series, how='outer'):
+        """
+        The columns of every series on the union ('outer') or intersection
+        ('inner') of their indexes. A column name repeated in a later series
+        replaces the earlier one.
+        """
+        series = list(series)
+        if not series:
+            return cls(np.empty(0, dtype=np.int64))
+        combine = np.union1d if how == 'outer' else np.intersect1d
+        index = series[0].index
+        for other in series[1:]:
+            if not np.array_equal(other.index, index):
+                index = combine(index, other.index)
+        columns = {}
+        for other in series:
+            columns.update(other.reindex(index).columns)
+        return cls(index, columns)
+
+    @classmethod
+    def concat(cls, parts):
+        """
+        Chunks of a series joined end to end, e.g. consecutive upstream
+        requests. Where chunks overlap the later one wins; columns missing
+        from a chunk are NaN there.
+        """
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls(np.empty(0, dtype=np.int64))
+        names = list(dict.fromkeys(name for part in parts for name in part.columns))
+        index = np.concatenate([part.index for part in parts])
+        columns = {name: np.concatenate([part.columns[name] if name in part.columns
+                                         else np.full(len(part), np.nan) for part in parts])
+                   for name in names}
+        return cls(*_sorted_unique(index, columns))
+
+    # --- Conversions ---
+
+    @classmethod
+    def from_nasa(cls, parameters, names=None, fill_value=NASA_FILL_VALUE):
+        """
+        From NASA POWER's {parameter: {timestamp: value}} dict, with keys
+        YYYYMMDDHH, YYYYMMDD or YYYYMM. The annual values of monthly responses
+        (month 13) are dropped. `names` maps parameters to column names (by
+        default every parameter keeps its name); parameters missing from the
+        response become all-NaN columns. Values equal to `fill_value` become
+        NaN; pass None to keep them.
+        """
+        names = names or {parameter: parameter for parameter in parameters}
+        data = {column: parameters.get(parameter) or {} for parameter, column in names.items()}
+        keys = next((list(values) for values in data.values() if values), [])
+        if any(values and len(values) != len(keys) for values in data.values()):
+            keys = sorted(set().union(*data.values()))
+
+        codes = np.array(keys).astype(np.int64) if keys else np.empty(0, dtype=np.int64)
+        width = len(keys[0]) if keys else 8
+        hours = codes % 100 if width == 10 else 0
+        codes = codes // 100 if width == 10 else codes
+        days = codes % 100 if width >= 8 else 1
+        codes = codes // 100 if width >= 8 else codes
+        months, years = codes % 100, codes // 100
+        valid = (months >= 1) & (months <= 12)
+        dates = ((years - 1970) * 12 + months - 1).astype('datetime64[M]').astype('datetime64[D]') + (days - 1)
+        index = (dates.astype('datetime64[s]').astype(np.int64) + hours * 3600)[valid]
+
+        columns = {}
+        for column, values in data.items():
+            column_values = np.array([values.get(key, np.nan) for key in keys], dtype=np.float64)[valid]
+            if fill_value is not None:
+                column_values[column_values == fill_value] = np.nan
+            columns[column] = column_values
+        return cls(*_sorted_unique(index, columns))
+
+    @classmethod
+    def from_frame(cls, frame, names=None):
+        """
+        From a DataFrame with a DatetimeIndex: the columns in `names`, or every
+        numeric column. Float columns are shared with the frame where pandas
+        allows it.
+        """
+        if names is None:
+            names = [name for name in frame.columns if frame[name].dtype.kind in 'fiub']
+        columns = {name: frame[name].to_numpy(dtype=np.float64, na_value=np.nan) for name in names}
+        return cls(*_sorted_unique(to_epoch(frame.index), columns))
+
+    @classmethod
+    def from_series(cls, series, name):
+        """From a pandas Series with a DatetimeIndex, as column `name`."""
+        return cls(*_sorted_unique(to_epoch(series.index),
+                                   {name: series.to_numpy(dtype=np.float64, na_value=np.nan)}))
+
+    def _pandas_index(self, tz, name):
+        import pandas as pd
+        # Nanoseconds, the unit pandas builds its own indexes in, so frames join and compare with them
+        index = pd.DatetimeIndex(self.datetimes().astype('datetime64[ns]'), name=name)
+        return index.tz_localize(tz) if tz else index
+
+    def to_frame(self, tz='UTC', index_name='datetime'):
+        """A DataFrame indexed by time, tz-aware in `tz` unless tz is None."""
+        import pandas as pd
+        return pd.DataFrame(self.columns, index=self._pandas_index(tz, index_name))
+
+    def to_series(self, name, tz='UTC', index_name='datetime'):
+        """One column as a pandas Series indexed by time."""
+        import pandas as pd
+        return pd.Series(self.columns[name], index=self._pandas_index(tz, index_name), name=name)
+
+    def time_strings(self, suffix=''):
+        """ISO 8601 times to the second, e.g. '2024-01-31T13:00:00' + suffix."""
+        strings = np.datetime_as_string(self.datetimes(), unit='s').tolist()
+        return [string + suffix for string in strings] if suffix else strings
+
+    def to_records(self, names=None, time_key='datetime', time_suffix=''):
+        """
+        JSON-ready rows: {time_key: ISO time, column: value or None for NaN}.
+        `names` is a list of columns, or a mapping of output keys to columns;
+        columns this series lacks are None throughout.
+        """
+        if names is None:
+            names = self.names
+        if not isinstance(names, dict):
+            names = {name: name for name in names}
+        keys = [time_key, *names]
+        values = [self.time_strings(time_suffix)]
+        values += [json_values(self.columns[column]) if column in self.columns else [None] * len(self)
+                   for column in names.values()]
+        return [dict(zip(keys, row)) for row in zip(*values)]
+
+
+def json_values(values):
+    """values as a list of Python floats, with None for NaN."""
+    out = values.tolist()
+    for i in np.flatnonzero(np.isnan(values)).tolist():
+        out[i] = None
+    return out
@@ -0,0 +1,141 @@
+"""
+Per-request stage timing.
+
+Each request handled by the portal gets a Trace. Code anywhere below the
+handler wraps its stages in span(...), optionally recording byte counts.
+When the request finishes, the stage totals are returned in a Server-Timing
+header and written as one JSON line to the 'portal.trace' logger. Every span
+is also observed in the stage-duration histogram served on /metrics, so a
+span costs one histogram update when no request is being traced.
+
+Nested spans overlap: a 'predictor.features' span includes the 'nasa.fetch'
+spans run inside it.
+"""
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+
+from metrics import STAGE_SECONDS
+
+logger = logging.getLogger('portal.trace')
+if not logger.handlers:
+    # The trace line is the whole record, so it stays parseable as JSON
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.propagate = False
+logger.setLevel(os.getenv('TRACE_LOG_LEVEL', 'INFO'))
+
+_current = contextvars.ContextVar('portal_trace', default=None)
+
+
+class Trace:
+    """Spans recorded while serving one request; safe to add to from several threads."""
+
+    def __init__(self, route, method):
+        self.id = uuid.uuid4().hex[:16]
+        self.route = route
+        self.method = method
+        self.started = time.perf_counter()
+        self._spans = []
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds, nbytes=None):
+        with self._lock:
+            self._spans.append((name, seconds, nbytes))
+
+    def stages(self):
+        """Span totals by name, in the order each name was first seen."""
+        stages = {}
+        with self._lock:
+            spans = list(self._spans)
+        for name, seconds, nbytes in spans:
+            stage = stages.setdefault(name, {'ms': 0.0, 'count': 0})
+            stage['ms'] += seconds * 1000
+            stage['count'] += 1
+            if nbytes is not None:
+                stage['bytes'] = stage.get('bytes', 0) + nbytes
+        for stage in stages.values():
+            stage['ms'] = round(stage['ms'], 3)
+        return stages
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def server_timing(self):
+        """Value for the Server-Timing response header."""
+        parts = [f"{name};dur={stage['ms']:.1f}" for name, stage in self.stages().items()]
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ', '.join(parts)
+
+    def log(self, status, response_bytes=None):
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        logger.info(json.dumps({
+            'trace_id': self.id,
+            'route': self.route,
+            'method': self.method,
+            'status': status,
+            'duration_ms': round(self.elapsed() * 1000, 3),
+            'response_bytes': response_bytes,
+            'stages': self.stages(),
+        }))
+
+
+class Span(contextlib.ContextDecorator):
+    """
+    Times one stage. Use as `with span('nasa.fetch') as s: ... s.add_bytes(n)`
+    or as a function decorator, `@span('nasa.format')`.
+    """
+    __slots__ = ('name', 'nbytes', '_start')
+
+    def __init__(self, name, nbytes=None):
+        self.name = name
+        self.nbytes = nbytes
+
+    def add_bytes(self, nbytes):
+        if nbytes is not None:
+            self.nbytes = (self.nbytes or 0) + nbytes
+
+    def _recreate_cm(self):
+        # A decorated function may run in several threads at once
+        return Span(self.name)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self._start
+        STAGE_SECONDS.labels(self.name).observe(seconds)
+        trace = _current.get()
+        if trace is not None:
+            trace.add(self.name, seconds, self.nbytes)
+        return False
+
+
+def span(name, nbytes=None):
+    return Span(name, nbytes)
+
+
+def start_trace(route, method):
+    """Start tracing the current request; returns (trace, token for end_trace)."""
+    trace = Trace(route, method)
+    return trace, _current.set(trace)
+
+
+def end_trace(token):
+    try:
+        _current.reset(token)
+    except ValueError:
+        # Token created in another context; just stop tracing here
+        _current.set(None)
+
+
+def current_trace():
+    return _current.get()
@@ -0,0 +1,266 @@
+"""
+Cache warmer: prefetches popular NASA, CAMS and predictor requests into the
+result cache off-peak, so the first visitor of the day does not wait for the
+upstream APIs.
+
+Targets come from two places:
+
+- the hot-site file (WARM_SITES_PATH), a JSON object listing sites and the
+  date ranges to warm for each, relative to yesterday (UTC):
+
+      {"sites": [{"name": "Bern", "latitude": 46.95, "longitude": 7.45}],
+       "ranges": [{"days": 30, "timeGranularity": "Daily"},
+                  {"days": 7, "timeGranularity": "Hourly", "sources": ["nasa"]}]}
+
+- the WARM_TOP_REQUESTS requests logged most often over the last
+  WARM_LOG_DAYS days (see request_log.py).
+
+A cached target whose period has settled is left alone. Every other target
+is fetched (one upstream call per yearly chunk, as jobs do) and stored in
+the persistent result cache; targets that end within UPSTREAM_SETTLED_DAYS
+are refetched on every run, so recent days are refreshed as the upstream
+APIs publish or revise them. Calls to each upstream are spaced to stay
+within WARM_<UPSTREAM>_PER_MINUTE.
+
+With WARM_ENABLED=1 every gunicorn worker starts a warmer thread, and the
+first worker to claim a day's run in the request log warms the cache inside
+the daily WARM_HOURS window (UTC, e.g. "2-5"; "22-4" wraps past midnight).
+`python -m warm run` warms the cache right away.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from cache import get_result_cache
+from jobs import run_chunked, split_request_by_year
+from metrics import WARM_PREFETCHES
+from request_log import RequestLog, get_request_counter
+from services import ServiceError, dump_payload, normalized_request, period_settled, request_key
+
+logger = logging.getLogger(__name__)
+
+WARM_ENABLED = os.getenv('WARM_ENABLED', '0') == '1'
+WARM_SITES_PATH = os.getenv('WARM_SITES_PATH', os.path.join('data', 'hot_sites.json'))
+WARM_HOURS = os.getenv('WARM_HOURS', '2-5')
+WARM_TOP_REQUESTS = int(os.getenv('WARM_TOP_REQUESTS', '50'))
+WARM_LOG_DAYS = int(os.getenv('WARM_LOG_DAYS', '7'))
+# Self-imposed limits on upstream calls while warming, well below what
+# visitors need in the same minute
+WARM_RATE_LIMITS = {
+    'nasa': float(os.getenv('WARM_NASA_PER_MINUTE', '10')),
+    'cams': float(os.getenv('WARM_CAMS_PER_MINUTE', '4')),
+}
+# How often the warmer thread checks whether a run is due
+WARM_POLL_SECONDS = 300.0
+
+WARM_SOURCES = ['nasa', 'cams', 'predict']
+DEFAULT_RANGES = [{'days': 30, 'timeGranularity': 'Daily'}, {'days': 7, 'timeGranularity': 'Hourly'}]
+
+
+class RateLimit:
+    """Spaces calls to one upstream API evenly at `per_minute` calls a minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = time.monotonic()
+
+    def acquire(self, calls=1, deadline=None):
+        """
+        Wait until `calls` more calls are allowed. Returns False, without
+        waiting, when that would take past `deadline` (a time.time() value).
+        """
+        now = time.monotonic()
+        start = max(now, self._next)
+        if deadline is not None and time.time() + (start - now) > deadline:
+            return False
+        # The calls run back to back; the ones after them wait their share
+        self._next = start + calls * self.interval
+        time.sleep(start - now)
+        return True
+
+
+def load_sites(path=WARM_SITES_PATH):
+    """The hot-site file as (sites, ranges); no sites when the file is missing."""
+    try:
+        with open(path) as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        return [], DEFAULT_RANGES
+    return config.get('sites', []), config.get('ranges', DEFAULT_RANGES)
+
+
+def site_targets(sites, ranges, today=None):
+    """(source, request) for every site and range, each range ending yesterday (UTC)."""
+    end = (today or datetime.now(timezone.utc).date()) - timedelta(days=1)
+    targets = []
+    for site in sites:
+        for spec in ranges:
+            request_data = {
+                'mode': 'date',
+                'latitude': site['latitude'],
+                'longitude': site['longitude'],
+                'startDate': (end - timedelta(days=int(spec['days']) - 1)).isoformat(),
+                'endDate': end.isoformat(),
+                'timeGranularity': spec.get('timeGranularity', 'Daily'),
+            }
+            for source in spec.get('sources', WARM_SOURCES):
+                targets.append((source, normalized_request(source, request_data)))
+    return targets
+
+
+def warm_targets(log, sites_path=WARM_SITES_PATH):
+    """Hot-site targets followed by the most requested ones, without repeats."""
+    targets = site_targets(*load_sites(sites_path))
+    if WARM_TOP_REQUESTS > 0:
+        targets += [(source, params) for source, params, _ in log.top(WARM_SOURCES, WARM_LOG_DAYS, WARM_TOP_REQUESTS)]
+    unique = {}
+    for source, request_data in targets:
+        unique.setdefault(request_key(source, request_data), (source, request_data))
+    return list(unique.items())
+
+
+def chunk_calls(source):
+    """{upstream: calls} that one yearly chunk of `source` makes."""
+    if source == 'predict':
+        from rf_model import NASA_FEATURE_PRODUCTS, NASA_MAX_PARAMS_PER_REQUEST
+
+        # The predictor's NASA POWER inputs are requested NASA_MAX_PARAMS_PER_REQUEST
+        # products at a time, next to one CAMS radiation call
+        nasa_calls = -(-len(NASA_FEATURE_PRODUCTS) // NASA_MAX_PARAMS_PER_REQUEST)
+        return {'nasa': nasa_calls, 'cams': 1}
+    return {source: 1}
+
+
+def warm_one(source, key, request_data, limits, log, deadline=None, dry_run=False):
+    """Warm one target and return its outcome: fresh, planned, fetched, refreshed or deferred."""
+    cache = get_result_cache()
+    cached = cache.get(key) is not None
+    if cached and period_settled(request_data):
+        return 'fresh'
+    if dry_run:
+        return 'planned'
+    chunks = len(split_request_by_year(request_data))
+    for upstream, calls in chunk_calls(source).items():
+        if not limits[upstream].acquire(chunks * calls, deadline):
+            return 'deferred'
+    payload = run_chunked(source, request_data)
+    cache.put(key, source, dump_payload(payload))
+    log.mark_warmed(key, source)
+    return 'refreshed' if cached else 'fetched'
+
+
+def warm(log, deadline=None, sites_path=WARM_SITES_PATH, dry_run=False):
+    """
+    Warm every target, in order, until `deadline` (a time.time() value).
+    Returns the count of each outcome, keyed 'source.outcome'.
+    """
+    limits = {upstream: RateLimit(rate) for upstream, rate in WARM_RATE_LIMITS.items()}
+    summary = collections.Counter()
+    unavailable = set()
+    for key, (source, request_data) in warm_targets(log, sites_path):
+        if source in unavailable:
+            outcome = 'skipped'
+        elif deadline is not None and time.time() >= deadline:
+            outcome = 'deferred'
+        else:
+            try:
+                outcome = warm_one(source, key, request_data, limits, log, deadline, dry_run)
+            except ServiceError as e:
+                logger.warning("Warming %s %s failed: %s", source, request_data, e)
+                outcome = 'error'
+                if e.status == 503:
+                    # The source is down or not configured; retry on the next run
+                    unavailable.add(source)
+            except Exception:
+                logger.exception("Warming %s %s failed", source, request_data)
+                outcome = 'error'
+        if not dry_run:
+            WARM_PREFETCHES.labels(source, outcome).inc()
+        summary[f"{source}.{outcome}"] += 1
+    return dict(summary)
+
+
+def warm_window(now, hours=WARM_HOURS):
+    """(start, end) datetimes of the WARM_HOURS window `now` falls in, or None."""
+    first, last = (int(hour) for hour in hours.split('-'))
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if first < last:
+        return (today + timedelta(hours=first), today + timedelta(hours=last)) if first <= now.hour < last else None
+    if now.hour >= first:
+        return today + timedelta(hours=first), today + timedelta(days=1, hours=last)
+    if now.hour < last:
+        return today - timedelta(days=1) + timedelta(hours=first), today + timedelta(hours=last)
+    return None
+
+
+def _run_scheduled(log, owner):
+    window = warm_window(datetime.now(timezone.utc))
+    if window is None:
+        return
+    start, end = window
+    day = start.date().isoformat()
+    if not log.claim_run(day, owner):
+        return
+    # Counts still buffered in this worker would miss this run's ranking
+    counter = get_request_counter()
+    if counter is not None:
+        counter.flush()
+    logger.info("Warming the result cache until %s", end.isoformat())
+    summary = warm(log, deadline=end.timestamp())
+    log.finish_run(day, summary)
+    log.purge()
+    logger.info("Warmed the result cache: %s", summary)
+
+
+def _warm_loop():
+    log = RequestLog()
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            _run_scheduled(log, owner)
+        except Exception:
+            logger.exception("Cache warmer run failed")
+        time.sleep(WARM_POLL_SECONDS)
+
+
+_warmer = None
+_warmer_lock = threading.Lock()
+
+
+def start_warmer():
+    """Start this process's warmer thread, once."""
+    global _warmer
+    with _warmer_lock:
+        if _warmer is None:
+            _warmer = threading.Thread(target=_warm_loop, name='cache-warmer', daemon=True)
+            _warmer.start()
+    return _warmer
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+    parser = argparse.ArgumentParser(description="Prefetch popular requests into the result cache.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run = subparsers.add_parser('run', help="Warm the cache now, outside the scheduled window")
+    run.add_argument('--sites', default=WARM_SITES_PATH, help="Hot-site file")
+    run.add_argument('--dry-run', action='store_true', help="List what would be fetched without fetching it")
+
+    top = subparsers.add_parser('top', help="List the most requested NASA, CAMS and predictor requests")
+    top.add_argument('--limit', type=int, default=WARM_TOP_REQUESTS)
+    top.add_argument('--days', type=int, default=WARM_LOG_DAYS)
+
+    args = parser.parse_args()
+    if args.command == 'run':
+        summary = warm(RequestLog(), sites_path=args.sites, dry_run=args.dry_run)
+        for outcome, count in sorted(summary.items()):
+            print(f"{outcome}: {count}")
+    else:
+        for source, params, count in RequestLog().top(WARM_SOURCES, args.days, args.limit):
+            print(f"{count:8d}  {source:8s}{json.dumps(params, sort_keys=True)}")